@@ -0,0 +1,232 @@
+"""Admission control for order submission and reports under load.
+
+Views opt in with ``admission_class`` ("order" or "report"). An order is
+classed "cashier" when rung up by an employee and "kiosk" when placed by a
+customer (``clerk_user_id``). Every class has its own concurrency limit, and
+all admitted requests share ``capacity`` slots, sized to this worker's DB pool.
+When a slot frees up, waiters are woken in priority order (cashier, kiosk,
+report), so a flood of kiosk orders queues behind the register instead of in
+front of it.
+
+Reports are shed rather than queued once the system is under pressure: when
+the pool the report would read from (the replica's or its store's shard's,
+see ``ShardRouter.read_engine``) is saturated, or when the recent queue wait
+of orders crosses ``ADMISSION_SHED_WAIT_MS``. Shed reports get ``429`` with
+``Retry-After``. Orders that wait longer than their queue timeout get ``503``
+with ``Retry-After``.
+
+Limits are per worker process; with gthread workers (``GUNICORN_THREADS``)
+they bound the threads of one worker that may hold DB connections at once.
+"""
+
+import math
+import threading
+import time
+
+from flask import current_app, g, jsonify, request
+from sqlalchemy.pool import NullPool
+
+from shards import request_store_id
+
+ADMISSION_CLASSES = ("cashier", "kiosk", "report")
+PRIORITY = {"cashier": 0, "kiosk": 1, "report": 2}
+
+
+def admission_class(name):
+    """Mark a view as admitted under ``name`` ("order" or "report")."""
+    if name not in ("order", "report"):
+        raise ValueError(f"unknown admission class {name!r}")
+
+    def decorator(view):
+        view.admission_class = name
+        return view
+
+    return decorator
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, traffic_class, status, retry_after, reason):
+        super().__init__(reason)
+        self.traffic_class = traffic_class
+        self.status = status
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class AdmissionControl:
+    def __init__(self, db, shards=None):
+        self.db = db
+        self.shards = shards
+        self.enabled = True
+        self.capacity = 15
+        self.limits = {"cashier": 15, "kiosk": 10, "report": 2}
+        self.queue_timeouts = {"cashier": 10.0, "kiosk": 5.0, "report": 2.0}
+        self.shed_wait_ms = 250.0
+        self.ewma_alpha = 0.2
+        self.ewma_half_life = 10.0
+        self.pool_capacity = 15
+        self._cond = threading.Condition()
+        self._active = dict.fromkeys(ADMISSION_CLASSES, 0)
+        self._waiting = dict.fromkeys(ADMISSION_CLASSES, 0)
+        self._admitted = dict.fromkeys(ADMISSION_CLASSES, 0)
+        self._rejected = dict.fromkeys(ADMISSION_CLASSES, 0)
+        self._wait_ewma_ms = dict.fromkeys(ADMISSION_CLASSES, 0.0)
+        self._wait_updated = dict.fromkeys(ADMISSION_CLASSES, 0.0)
+
+    def init_app(self, app):
+        self.enabled = bool(app.config.get("ADMISSION_ENABLED", True))
+        self.pool_capacity = (app.config.get("DB_POOL_SIZE") or 5) + app.config.get(
+            "DB_MAX_OVERFLOW", 10
+        )
+        self.capacity = int(app.config.get("ADMISSION_CAPACITY") or self.pool_capacity)
+        self.limits = {
+            "cashier": self.capacity,
+            "kiosk": max(1, self.capacity * 2 // 3),
+            "report": max(1, self.capacity // 5),
+        }
+        self.limits.update(app.config.get("ADMISSION_LIMITS") or {})
+        self.queue_timeouts.update(app.config.get("ADMISSION_QUEUE_TIMEOUTS") or {})
+        self.shed_wait_ms = float(app.config.get("ADMISSION_SHED_WAIT_MS", 250))
+        if self.enabled:
+            app.before_request(self._admit_request)
+            app.teardown_request(self._release_request)
+
+    def classify(self):
+        view = current_app.view_functions.get(request.endpoint)
+        name = getattr(view, "admission_class", None)
+        if name == "order":
+            data = request.get_json(silent=True)
+            if isinstance(data, dict) and data.get("employee_id"):
+                return "cashier"
+            return "kiosk"
+        return name
+
+    def pool_saturated(self, engine=None):
+        pool = (engine or self.db.engine).pool
+        if isinstance(pool, NullPool):
+            return False
+        return pool.checkedout() >= self.pool_capacity
+
+    def _report_engine(self):
+        if self.shards is None:
+            return self.db.engine
+        try:
+            store_id = request_store_id((request.view_args or {}).get("store_id"))
+            return self.shards.read_engine(store_id)
+        except (KeyError, ValueError):
+            # A bad store id; the view answers that
+            return self.db.engine
+
+    def _wait_ms(self, traffic_class):
+        # Decays while a class sees no traffic, so an old spike doesn't keep
+        # shedding reports after the rush is over
+        idle = time.monotonic() - self._wait_updated[traffic_class]
+        return self._wait_ewma_ms[traffic_class] * 0.5 ** (idle / self.ewma_half_life)
+
+    def under_pressure(self, engine=None):
+        with self._cond:
+            order_wait = max(self._wait_ms("cashier"), self._wait_ms("kiosk"))
+        return order_wait > self.shed_wait_ms or self.pool_saturated(engine)
+
+    def _blocked(self, traffic_class):
+        if self._active[traffic_class] >= self.limits[traffic_class]:
+            return True
+        if sum(self._active.values()) >= self.capacity:
+            return True
+        # Leave the next free slot to a waiting higher-priority class
+        rank = PRIORITY[traffic_class]
+        return any(
+            self._waiting[other]
+            and PRIORITY[other] < rank
+            and self._active[other] < self.limits[other]
+            for other in ADMISSION_CLASSES
+        )
+
+    def _retry_after(self, traffic_class):
+        # Roughly how long the current queue needs to drain, in whole seconds
+        wait_s = self._wait_ms(traffic_class) / 1000.0
+        return max(1, math.ceil(wait_s * (self._waiting[traffic_class] + 1)))
+
+    def acquire(self, traffic_class, engine=None):
+        """Block until ``traffic_class`` may run; raise ``AdmissionRejected``.
+
+        ``engine`` is the one a report will read from; the primary by default.
+        """
+        if traffic_class == "report" and self.under_pressure(engine):
+            with self._cond:
+                self._rejected["report"] += 1
+                retry_after = self._retry_after("kiosk")
+            raise AdmissionRejected("report", 429, retry_after, "server busy with orders")
+        started = time.monotonic()
+        deadline = started + self.queue_timeouts[traffic_class]
+        with self._cond:
+            self._waiting[traffic_class] += 1
+            try:
+                while self._blocked(traffic_class):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._rejected[traffic_class] += 1
+                        status = 429 if traffic_class == "report" else 503
+                        raise AdmissionRejected(
+                            traffic_class,
+                            status,
+                            self._retry_after(traffic_class),
+                            "queue timeout",
+                        )
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting[traffic_class] -= 1
+            waited_ms = (time.monotonic() - started) * 1000.0
+            previous = self._wait_ms(traffic_class)
+            self._wait_ewma_ms[traffic_class] = previous + self.ewma_alpha * (
+                waited_ms - previous
+            )
+            self._wait_updated[traffic_class] = time.monotonic()
+            self._active[traffic_class] += 1
+            self._admitted[traffic_class] += 1
+
+    def release(self, traffic_class):
+        with self._cond:
+            self._active[traffic_class] -= 1
+            self._cond.notify_all()
+
+    def _admit_request(self):
+        traffic_class = self.classify()
+        if traffic_class is None:
+            return None
+        engine = self._report_engine() if traffic_class == "report" else None
+        try:
+            self.acquire(traffic_class, engine)
+        except AdmissionRejected as e:
+            response = jsonify({"error": e.reason, "class": e.traffic_class})
+            response.status_code = e.status
+            response.headers["Retry-After"] = str(e.retry_after)
+            return response
+        g.admission_class = traffic_class
+        return None
+
+    def _release_request(self, exc):
+        traffic_class = g.pop("admission_class", None)
+        if traffic_class is not None:
+            self.release(traffic_class)
+
+    def status(self):
+        with self._cond:
+            classes = {
+                c: {
+                    "active": self._active[c],
+                    "waiting": self._waiting[c],
+                    "limit": self.limits[c],
+                    "admitted": self._admitted[c],
+                    "rejected": self._rejected[c],
+                    "wait_ewma_ms": round(self._wait_ms(c), 2),
+                }
+                for c in ADMISSION_CLASSES
+            }
+        return {
+            "enabled": self.enabled,
+            "capacity": self.capacity,
+            "shed_wait_ms": self.shed_wait_ms,
+            "pool_saturated": self.pool_saturated(),
+            "classes": classes,
+        }
@@ -0,0 +1,150 @@
+"""Market-basket analytics: which products and add-ons are bought together.
+
+For each day an ``orders x items`` incidence matrix is built with SciPy, where
+an item is a product (``p:<product_id>``) or an add-on (``a:<ingredient_id>``).
+``X.T @ X`` then gives every pair's co-occurrence count, with item counts on
+the diagonal. A day's partial keeps those counts in sparse form. Partials for
+a date range are merged by summing sparse matrices, and support, confidence
+and lift are computed over the merged nonzeros without a Python loop over
+pairs.
+"""
+
+from collections import defaultdict
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import text
+
+from models import DEFAULT_STORE_ID
+from report_cache import day_span
+
+# Products and add-ons of each order, per day
+BASKETS_SQL = """
+    SELECT DATE(o.order_date) AS day, o.order_id, 'p:' || oi.product_id AS item
+    FROM orders o
+    JOIN order_items oi ON oi.order_id = o.order_id
+    WHERE o.store_id = :store_id
+      AND o.order_date >= :since AND o.order_date < :until
+    UNION ALL
+    SELECT DATE(o.order_date) AS day, o.order_id, 'a:' || m.ingredient_id AS item
+    FROM orders o
+    JOIN order_items oi ON oi.order_id = o.order_id
+    JOIN modifications m ON m.order_item_id = oi.order_item_id
+    JOIN inventory i ON i.store_id = o.store_id AND i.ingredient_id = m.ingredient_id
+    WHERE o.store_id = :store_id
+      AND o.order_date >= :since AND o.order_date < :until
+      AND i.is_add_on AND m.modification_type IN ('ADD', 'EXTRA')
+"""
+
+
+def empty_partial():
+    return {"orders": 0, "keys": [], "pair_i": [], "pair_j": [], "pair_n": []}
+
+
+def build_partial(rows):
+    """Partial for one day from ``(order_id, item)`` rows.
+
+    ``pair_i``/``pair_j`` index into ``keys``; ``i == j`` entries hold the
+    number of orders containing that item.
+    """
+    if not rows:
+        return empty_partial()
+    order_index, orders = np.unique(
+        np.array([r[0] for r in rows]), return_inverse=True
+    )
+    keys, items = np.unique(np.array([r[1] for r in rows]), return_inverse=True)
+    incidence = sparse.csr_matrix(
+        (np.ones(len(rows)), (orders, items)), shape=(len(order_index), len(keys))
+    )
+    # An order with two of the same drink still counts once
+    incidence.sum_duplicates()
+    incidence.data[:] = 1.0
+    co = sparse.triu(incidence.T @ incidence).tocoo()
+    return {
+        "orders": int(len(order_index)),
+        "keys": keys.tolist(),
+        "pair_i": co.row.tolist(),
+        "pair_j": co.col.tolist(),
+        "pair_n": co.data.astype(int).tolist(),
+    }
+
+
+def compute_partials(conn, days, store_id=DEFAULT_STORE_ID):
+    """Partials for ``days`` from one query over their overall span."""
+    rows_by_day = defaultdict(list)
+    since, until = day_span(days)
+    wanted = set(days)
+    for day, order_id, item in conn.execute(
+        text(BASKETS_SQL), {"since": since, "until": until, "store_id": store_id}
+    ):
+        if day in wanted:
+            rows_by_day[day].append((order_id, item))
+    return {day: build_partial(rows_by_day.get(day, [])) for day in days}
+
+
+def merge_partials(partials):
+    """Sum partials into ``(keys, orders, counts matrix)`` in one sparse op."""
+    index = {}
+    rows, cols, data = [], [], []
+    orders = 0
+    for partial in partials:
+        orders += partial["orders"]
+        if not partial["keys"]:
+            continue
+        remap = np.array([index.setdefault(k, len(index)) for k in partial["keys"]])
+        rows.append(remap[np.asarray(partial["pair_i"], dtype=np.int64)])
+        cols.append(remap[np.asarray(partial["pair_j"], dtype=np.int64)])
+        data.append(np.asarray(partial["pair_n"], dtype=float))
+    keys = list(index)
+    n = len(keys)
+    if not rows:
+        return keys, orders, sparse.csr_matrix((n, n))
+    r = np.concatenate(rows)
+    c = np.concatenate(cols)
+    # Keys were renumbered, so put every pair back into the upper triangle
+    lo, hi = np.minimum(r, c), np.maximum(r, c)
+    counts = sparse.coo_matrix((np.concatenate(data), (lo, hi)), shape=(n, n)).tocsr()
+    return keys, orders, counts
+
+
+def top_pairs(keys, orders, counts, k=20, sort="lift", min_count=3, include_addons=True):
+    """Top-``k`` pairs with support, both confidences and lift."""
+    if orders == 0 or not keys:
+        return []
+    item_counts = counts.diagonal()
+    pairs = sparse.triu(counts, k=1).tocoo()
+    i, j, n_ij = pairs.row, pairs.col, pairs.data
+
+    keep = n_ij >= min_count
+    if not include_addons:
+        is_product = np.array([key.startswith("p:") for key in keys])
+        keep &= is_product[i] & is_product[j]
+    i, j, n_ij = i[keep], j[keep], n_ij[keep]
+    if not len(n_ij):
+        return []
+
+    n_i, n_j = item_counts[i], item_counts[j]
+    support = n_ij / orders
+    confidence_ij = n_ij / n_i
+    confidence_ji = n_ij / n_j
+    lift = n_ij * orders / (n_i * n_j)
+    score = {
+        "lift": lift,
+        "count": n_ij,
+        "support": support,
+        "confidence": np.maximum(confidence_ij, confidence_ji),
+    }[sort]
+    order = np.lexsort((-n_ij, -score))[:k]
+
+    return [
+        {
+            "a": keys[i[x]],
+            "b": keys[j[x]],
+            "count": int(n_ij[x]),
+            "support": round(float(support[x]), 4),
+            "confidence_a_to_b": round(float(confidence_ij[x]), 4),
+            "confidence_b_to_a": round(float(confidence_ji[x]), 4),
+            "lift": round(float(lift[x]), 4),
+        }
+        for x in order
+    ]
@@ -1,89 +1,76 @@
+import json
+import logging
 import os
-import requests
-from datetime import datetime, date
+import time
+import weakref
+from datetime import datetime, date, timedelta
 from decimal import Decimal
 
-from flask import Flask, jsonify, request, session, redirect
-from flask_sqlalchemy import SQLAlchemy
-from flask_cors import CORS
-from dotenv import load_dotenv
-
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
-
-from sqlalchemy import (
-    Boolean,
-    Column,
-    Integer,
-    String,
-    DateTime,
-    Numeric,
-    ForeignKey,
-    PrimaryKeyConstraint,
-    Enum as SAEnum,
-    text,
-)
-from sqlalchemy.orm import declarative_base, relationship
-from sqlalchemy.exc import SQLAlchemyError
-
-# Load .env from parent directory
-load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env"))
-
-frontend_url = os.getenv("REACT_APP_FRONTEND_URL")
-
-app = Flask(__name__)
-CORS(app)
-app.config.update(
-    SESSION_COOKIE_SAMESITE="None",
-    SESSION_COOKIE_SECURE=True,
-    SESSION_COOKIE_HTTPONLY=True,
-)
-
-API_BASE_URL = os.getenv(
-    "REACT_APP_BACKEND_URL", "https://project-3-group-11.onrender.com"
+from flask import (
+    Blueprint,
+    Flask,
+    current_app,
+    jsonify,
+    request,
+    session,
+    redirect,
 )
-app.secret_key = os.getenv("FLASK_KEY")
-GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
-GOOGLE_CLIENT_SECRET = os.getenv("CLIENT_SECRET")
-GOOGLE_REDIRECT_URI = f"{API_BASE_URL}/api/oauth2/callback"
-
-app.config["SQLALCHEMY_DATABASE_URI"] = (
-    "postgresql://"
-    + os.getenv("PSQL_USER")
-    + ":"
-    + os.getenv("PSQL_PASSWORD")
-    + "@"
-    + os.getenv("PSQL_HOST")
-    + ":"
-    + os.getenv("PSQL_PORT")
-    + "/"
-    + os.getenv("PSQL_DATABASE")
-)
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-
-db = SQLAlchemy(app)
+from flask_cors import CORS
+import click
 
-Base = declarative_base()
+from sqlalchemy import bindparam, text
+from sqlalchemy.exc import SQLAlchemyError
 
-EmployeeRole = SAEnum("Cashier", "Manager", name="employee_role", native_enum=True)
-ModificationType = SAEnum(
-    "ADD", "REMOVE", "LESS", "EXTRA", name="modification_type", native_enum=True
-)
-SugarLevel = SAEnum(
-    "200%",
-    "150%",
-    "100%",
-    "80%",
-    "50%",
-    "30%",
-    "0%",
-    name="sugar_level",
-    native_enum=True,
-)
-SizeLevel = SAEnum("small", "normal", "large", name="size_level", native_enum=True)
-IceLevel = SAEnum(
-    "no_ice", "less", "regular", "hot", name="ice_level", native_enum=True
+from admission import AdmissionControl, admission_class
+from availability import Availability
+from barista import BaristaScheduler
+from bulk_inventory import BulkInventoryError, apply_rows, parse_rows, rows_from_csv
+from catalog import Catalog
+from checkout import pipelined, write_order_pipelined
+from menu_import import MenuImportError, import_menu, load_import
+from config import load_config
+from costs import CostModel
+from google_oauth import (
+    CREATE_USER_SQL,
+    FIND_USER_SQL,
+    new_user_params,
+    session_fields,
+    token_form,
 )
+from http_cache import ResponseCache
+from models import db, CUP_INGREDIENTS, DEFAULT_STORE_ID, Inventory, Order, OrderItem, Modification, Product
+from order_book import OrderBook
+from pooling import PoolHealth, StatementTimeouts, engine_options, statement_timeout
+from replicas import ReplicaRouter
+from search import SearchIndex
+from receipts import SUBJECT as RECEIPT_SUBJECT, receipt_html, sign_receipt
+from range_reports import merge_sales, merge_usage, sales_partials, usage_partials
+from report_cache import DayPartialCache, split_days
+from shards import ShardRouter, request_store_id as _store_id, shard_binds
+from usuals import Usuals, config_key
+from request_log import LogPipeline, bind as bind_log
+from traffic_capture import TrafficCapture
+from z_reports import ZReportCloser, close_day, close_missed_days, get_report
+
+api = Blueprint("api", __name__, cli_group=None)
+log = logging.getLogger(__name__)
+replicas = ReplicaRouter(db)
+catalog = Catalog()
+timeouts = StatementTimeouts(db)
+pool_health = PoolHealth(db)
+baristas = BaristaScheduler()
+costs = CostModel()
+search_index = SearchIndex()
+availability = Availability()
+usuals = Usuals()
+logs = LogPipeline()
+capture = TrafficCapture()
+responses = ResponseCache()
+shards = ShardRouter(db, replicas)
+admission = AdmissionControl(db, shards)
+day_partials = DayPartialCache(db, shards)
+z_closer = ZReportCloser(db, shards)
+order_book = OrderBook(db, shards)
 
 ALLOWED_ROLES = {"Cashier", "Manager"}
 
@@ -104,129 +91,7 @@ def _maprow(m):
     return {k: _ser(v) for k, v in dict(m).items()}
 
 
-class Employee(Base):
-    __tablename__ = "employees"
-
-    employee_id = Column(Integer, primary_key=True)
-    name = Column(String, nullable=False)
-    role = Column("role", EmployeeRole, nullable=False)
-    email = Column(String, nullable=True)
-
-    orders = relationship("Order", back_populates="employee")
-
-
-class Order(Base):
-    __tablename__ = "orders"
-
-    order_id = Column(Integer, primary_key=True)
-    order_date = Column(DateTime, nullable=False)
-    total_amount = Column(Numeric(10, 2), nullable=False)
-    employee_id = Column(Integer, ForeignKey("employees.employee_id"), nullable=True)
-    user_id = Column(Integer, ForeignKey("users.user_id"), nullable=True)
-
-    employee = relationship("Employee", back_populates="orders")
-    user = relationship("User", back_populates="orders")
-    items = relationship(
-        "OrderItem", back_populates="order", cascade="all, delete-orphan"
-    )
-
-
-class Product(Base):
-    __tablename__ = "products"
-
-    product_id = Column(Integer, primary_key=True)
-    product_name = Column(String, nullable=False)
-    unit_price = Column(Numeric(10, 2), nullable=False)
-    vegan = Column(Boolean, nullable=False, default=True)
-    category = Column(String, nullable=True)
-
-    recipe = relationship("ProductRecipe", back_populates="product")
-    order_items = relationship("OrderItem", back_populates="product")
-
-
-class Inventory(Base):
-    __tablename__ = "inventory"
-
-    ingredient_id = Column(Integer, primary_key=True)
-    ingredient_name = Column(String, nullable=False)
-    on_hand_quantity = Column(Numeric(10, 1), nullable=False)
-    is_add_on = Column(Boolean, nullable=False, default=False)
-    price_per_unit = Column(Numeric(10, 2), nullable=True)
-
-    recipe_entries = relationship("ProductRecipe", back_populates="ingredient")
-    modifications = relationship("Modification", back_populates="ingredient")
-
-
-class ProductRecipe(Base):
-    __tablename__ = "product_recipe"
-
-    product_id = Column(Integer, ForeignKey("products.product_id"), nullable=False)
-    ingredient_id = Column(
-        Integer, ForeignKey("inventory.ingredient_id"), nullable=False
-    )
-    quantity_per_unit = Column(Numeric(10, 1), nullable=False)
-
-    __table_args__ = (
-        PrimaryKeyConstraint("product_id", "ingredient_id", name="pk_product_recipe"),
-    )
-
-    product = relationship("Product", back_populates="recipe")
-    ingredient = relationship("Inventory", back_populates="recipe_entries")
-
-
-class OrderItem(Base):
-    __tablename__ = "order_items"
-
-    order_item_id = Column(Integer, primary_key=True)
-    order_id = Column(Integer, ForeignKey("orders.order_id"), nullable=False)
-    product_id = Column(Integer, ForeignKey("products.product_id"), nullable=False)
-    quantity = Column(Integer, nullable=False)
-    unit_price_at_sale = Column(Numeric(10, 2), nullable=False)
-    sugar_level = Column(SugarLevel, nullable=False, default="100%")
-    size_level = Column(SizeLevel, nullable=False, default="normal")
-    ice_level = Column(IceLevel, nullable=False, default="regular")
-
-    order = relationship("Order", back_populates="items")
-    product = relationship("Product", back_populates="order_items")
-    modifications = relationship(
-        "Modification", back_populates="order_item", cascade="all, delete-orphan"
-    )
-
-
-class Modification(Base):
-    __tablename__ = "modifications"
-
-    modification_id = Column(Integer, primary_key=True)
-    order_item_id = Column(
-        Integer, ForeignKey("order_items.order_item_id"), nullable=False
-    )
-    ingredient_id = Column(
-        Integer, ForeignKey("inventory.ingredient_id"), nullable=False
-    )
-    modification_type = Column(ModificationType, nullable=False)
-    quantity_change = Column(Numeric(10, 1), nullable=True)
-    price_change = Column(Numeric(10, 2), nullable=True)
-
-    order_item = relationship("OrderItem", back_populates="modifications")
-    ingredient = relationship("Inventory", back_populates="modifications")
-
-
-class User(Base):
-    __tablename__ = "users"
-
-    user_id = Column(Integer, primary_key=True)
-    google_sub = Column(
-        String, unique=True, nullable=True
-    )  # Made nullable for Clerk users
-    clerk_user_id = Column(String, unique=True, nullable=True)  # New Clerk ID
-    email = Column(String, nullable=True)
-    name = Column(String, nullable=True)
-    role = Column(String, nullable=False, default="Customer")
-
-    orders = relationship("Order", back_populates="user")
-
-
-@app.route("/", methods=["GET"])
+@api.route("/", methods=["GET"])
 def root():
     return jsonify(
         {
@@ -239,7 +104,10 @@ def root():
                 "api/product_categories",
                 "/api/postOrder (supports both employee and customer orders)",
                 "/api/inventory",
+                "/api/inventory/bulk",
+                "/api/search",
                 "/api/employees",
+                "/api/stores/summary",
                 "/api/login",
                 "/api/oauth2/callback",
             ],
@@ -247,34 +115,33 @@ def root():
     )
 
 
-@app.route("/api/login")
+@api.route("/api/login")
 def login():
+    config = current_app.config
     google_auth_url = (
         "https://accounts.google.com/o/oauth2/v2/auth"
         "?response_type=code"
         "&client_id="
-        + GOOGLE_CLIENT_ID
+        + config["GOOGLE_CLIENT_ID"]
         + "&redirect_uri="
-        + GOOGLE_REDIRECT_URI
+        + config["GOOGLE_REDIRECT_URI"]
         + "&scope=openid%20email%20profile"
     )
     return redirect(google_auth_url)
 
 
-@app.route("/api/oauth2/callback")
+@api.route("/api/oauth2/callback")
 def oauth_callback():
+    # Imported lazily so workers that never serve a login don't pay for it
+    import requests
+
+    config = current_app.config
     code = request.args.get("code")
+    timeout = config.get("EXTERNAL_HTTP_TIMEOUT", 10.0)
 
     try:
         token_res = requests.post(
-            "https://oauth2.googleapis.com/token",
-            data={
-                "code": code,
-                "client_id": GOOGLE_CLIENT_ID,
-                "client_secret": GOOGLE_CLIENT_SECRET,
-                "redirect_uri": GOOGLE_REDIRECT_URI,
-                "grant_type": "authorization_code",
-            },
+            config["GOOGLE_TOKEN_URL"], data=token_form(config, code), timeout=timeout
         ).json()
 
         access_token = token_res.get("access_token")
@@ -282,51 +149,29 @@ def oauth_callback():
             return "Failed to get access token", 400
 
         userinfo = requests.get(
-            "https://openidconnect.googleapis.com/v1/userinfo",
+            config["GOOGLE_USERINFO_URL"],
             headers={"Authorization": f"Bearer {access_token}"},
+            timeout=timeout,
         ).json()
 
-        google_sub = userinfo["sub"]
-        email = userinfo.get("email")
-        name = userinfo.get("name")
-
-        user = db.session.execute(
-            text(
-                "SELECT user_id, google_sub, email, name, role FROM users WHERE google_sub = :sub"
-            ),
-            {"sub": google_sub},
-        ).first()
+        user = db.session.execute(text(FIND_USER_SQL), {"sub": userinfo["sub"]}).first()
 
         if not user:
-            result = db.session.execute(
-                text(
-                    """
-                    WITH next AS (
-                        SELECT COALESCE(MAX(user_id), 0) + 1 AS id FROM users
-                    )
-                    INSERT INTO users (user_id, google_sub, email, name, role)
-                    SELECT next.id, :sub, :email, :name, :role FROM next
-                    RETURNING user_id, google_sub, email, name, role
-                """
-                ),
-                {"sub": google_sub, "email": email, "name": name, "role": "Customer"},
-            )
-            user = result.first()
+            user = db.session.execute(
+                text(CREATE_USER_SQL), new_user_params(userinfo)
+            ).first()
             db.session.commit()
 
-        session["google_sub"] = user[1]
-        session["user_id"] = user[0]
-        session["role"] = user[4]
-        session["name"] = user[3]
+        session.update(session_fields(user))
 
-        return redirect(frontend_url)
+        return redirect(config["FRONTEND_URL"])
 
     except Exception as e:
-        print(f"OAuth error: {e}")
+        log.exception("OAuth callback failed", extra={"event": "oauth.error"})
         return f"Authentication failed: {str(e)}", 500
 
 
-@app.route("/api/me")
+@api.route("/api/me")
 def me():
     if "google_sub" not in session:
         return jsonify({"logged_in": False})
@@ -341,76 +186,89 @@ def me():
     )
 
 
-@app.route("/api/logout", methods=["POST"])
+@api.route("/api/logout", methods=["POST"])
 def logout():
     session.clear()
     return jsonify({"ok": True})
 
 
-@app.route("/api/health", methods=["GET"])
+@api.route("/api/health", methods=["GET"])
 def health():
-    try:
-        db.session.execute(text("SELECT 1"))
-        return jsonify({"status": "ok", "db": "up"}), 200
-    except Exception as e:
-        return jsonify({"status": "error", "db": "down", "error": str(e)}), 500
+    ok, error = pool_health.check()
+    if not ok:
+        return jsonify({"status": "error", "db": "down", "error": error}), 500
+    return (
+        jsonify(
+            {
+                "status": "ok",
+                "db": "up",
+                "pool": pool_health.pool_status(),
+                "replica": replicas.status(),
+                "shards": shards.status(),
+                "logging": logs.status(),
+                "http_cache": responses.status(),
+                "capture": capture.status(),
+                "order_book": order_book.status(),
+            }
+        ),
+        200,
+    )
 
 
-@app.route("/api/fetchProducts", methods=["GET"])
+@api.route("/api/admin/admission", methods=["GET"])
+def admission_status():
+    """Queue depths and limits of the admission-control classes"""
+    return jsonify({"admission": admission.status(), "pool": pool_health.pool_status()})
+
+
+def _menu_version():
+    store_id = _store_id()
+    catalog.get(db.session)
+    return (catalog.version, availability.version(shards.session(store_id), store_id))
+
+
+@api.route("/api/fetchProducts", methods=["GET"])
+@responses.conditional(_menu_version)
 def fetchProducts():
-    rows = (
-        db.session.execute(text("SELECT * FROM products ORDER BY product_id"))
-        .mappings()
-        .all()
-    )
-    return jsonify([_maprow(r) for r in rows])
+    store_id = _store_id()
+    products = catalog.get(db.session)["products"]
+    products = availability.annotate_products(shards.session(store_id), products, store_id)
+    return jsonify([_maprow(r) for r in products])
 
 
-@app.route("/api/modifications", methods=["GET"])
+@api.route("/api/modifications", methods=["GET"])
+@responses.conditional(_menu_version)
 def get_modifications():
     # Only get addon ingredients
-    all_ingredients = db.session.query(Inventory).filter_by(is_add_on=True).all()
-
-    modifications = []
-    for ingredient in all_ingredients:
-        modifications.append(
-            {
-                "ingredient_id": ingredient.ingredient_id,
-                "ingredient_name": ingredient.ingredient_name,
-                "price_per_unit": (
-                    float(ingredient.price_per_unit)
-                    if ingredient.price_per_unit
-                    else 0.0
-                ),
-                "possible_modification": "ADD",
-            }
-        )
-
-    return jsonify(modifications)
+    store_id = _store_id()
+    modifications = catalog.get(db.session)["modifications"]
+    return jsonify(
+        availability.annotate_add_ons(shards.session(store_id), modifications, store_id)
+    )
 
 
-@app.route("/api/product_categories", methods=["GET"])
+@api.route("/api/product_categories", methods=["GET"])
 def get_product_categories():
-    all_categories = [c[0] for c in db.session.query(Product.category).distinct().all()]
-
-    return jsonify(all_categories)
+    return jsonify(catalog.get(db.session)["categories"])
 
 
-@app.route("/api/products/<int:product_id>/recipe", methods=["GET"])
+@api.route("/api/products/<int:product_id>/recipe", methods=["GET"])
 def get_product_recipe(product_id):
+    store_id = _store_id()
     try:
         rows = (
-            db.session.execute(
+            shards.session(store_id).execute(
                 text(
                     """
             SELECT pr.ingredient_id, i.ingredient_name, pr.quantity_per_unit
             FROM product_recipe pr
-            JOIN inventory i ON pr.ingredient_id = i.ingredient_id
+            JOIN inventory i
+              ON i.store_id = :store_id AND pr.ingredient_id = i.ingredient_id
             WHERE pr.product_id = :pid
             ORDER BY i.ingredient_name
         """
                 ),
-                {"pid": product_id},
+                {"pid": product_id, "store_id": store_id},
             )
             .mappings()
             .all()
@@ -420,7 +278,7 @@ def get_product_recipe(product_id):
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/api/products/<int:product_id>/price", methods=["PUT"])
+@api.route("/api/products/<int:product_id>/price", methods=["PUT"])
 def update_product_price(product_id):
     try:
         body = request.get_json(force=True) or {}
@@ -444,6 +302,7 @@ def update_product_price(product_id):
             return jsonify({"error": "Product not found"}), 404
 
         db.session.commit()
+        catalog.invalidate()
         return (
             jsonify(
                 {
@@ -465,96 +324,50 @@ def send_order_receipt(user_email, user_name, order_id, items, total_amount):
     """Send order receipt email using SendGrid API."""
 
     try:
-        api_key = os.getenv("SENDGRID_API_KEY")
-        sender_email = os.getenv("SENDER_EMAIL")
+        api_key = current_app.config.get("SENDGRID_API_KEY")
+        sender_email = current_app.config.get("SENDER_EMAIL")
 
         if not api_key or not sender_email:
-            print("SendGrid environment variables missing")
+            log.warning(
+                "SendGrid environment variables missing",
+                extra={"event": "receipt.skipped", "order_id": order_id},
+            )
             return False
 
-        html_content = f"""
-        <html>
-            <body style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-                <div style="background-color: #f8f9fa; padding: 20px; border-radius: 10px;">
-                    <h2 style="color: #333;">Order Confirmation</h2>
-                    <p>Hi {user_name},</p>
-                    <p>Thank you for your order! Here are your order details:</p>
-                    
-                    <div style="background-color: white; padding: 15px; border-radius: 5px; margin: 20px 0;">
-                        <h3 style="color: #666; margin-top: 0;">Order #{order_id}</h3>
-                        <table style="width: 100%; border-collapse: collapse;">
-                            <thead>
-                                <tr style="border-bottom: 2px solid #ddd;">
-                                    <th style="text-align: left; padding: 10px;">Item</th>
-                                    <th style="text-align: center; padding: 10px;">Qty</th>
-                                    <th style="text-align: right; padding: 10px;">Price</th>
-                                </tr>
-                            </thead>
-                            <tbody>
-        """
-
-        for item in items:
-            item_total = float(item["quantity"]) * float(item["unit_price_at_sale"])
-            html_content += f"""
-                <tr style="border-bottom: 1px solid #eee;">
-                    <td style="padding: 10px;">{item.get('product_name', 'Item')}</td>
-                    <td style="text-align: center; padding: 10px;">{item['quantity']}</td>
-                    <td style="text-align: right; padding: 10px;">${item_total:.2f}</td>
-                </tr>
-            """
+        html_content = receipt_html(user_name, order_id, items, total_amount)
 
-            # Add customizations if any
-            customizations = []
-            if item.get("sugar_level"):
-                customizations.append(f"Sugar: {item['sugar_level']}")
-            if item.get("size_level"):
-                customizations.append(f"Size: {item['size_level']}")
-            if item.get("ice_level"):
-                customizations.append(f"Ice: {item['ice_level']}")
-
-            if customizations:
-                for customization in customizations:
-                    html_content += f"""
-                                <tr>
-                                    <td colspan="3" style="padding: 5px 10px 5px 30px; font-size: 0.9em; color: #666;">
-                                        • {customization}
-                                    </td>
-                                </tr>
-            """
+        service_url = current_app.config.get("RECEIPT_SERVICE_URL")
+        if service_url:
+            # Queued on the async sender, so this worker never waits on SendGrid
+            import requests
 
-            # Add modifications if any
-            if item.get("modifications"):
-                for mod in item["modifications"]:
-                    html_content += f"""
-                        <tr>
-                            <td colspan="3" style="padding: 5px 10px 5px 30px; font-size: 0.9em; color: #666;">
-                                • {mod.get('modification_type', '')}: {mod.get('ingredient_name', '')}
-                            </td>
-                        </tr>
-                    """
+            response = requests.post(
+                service_url.rstrip("/") + "/internal/receipts",
+                data=sign_receipt(
+                    current_app.config["SECRET_KEY"],
+                    {"to": user_email, "order_id": order_id, "html": html_content},
+                ),
+                timeout=current_app.config.get("RECEIPT_HANDOFF_TIMEOUT", 2.0),
+            )
+            if response.status_code != 202:
+                log.warning(
+                    "Receipt service returned status %s",
+                    response.status_code,
+                    extra={"event": "receipt.status", "order_id": order_id},
+                )
+                return False
+            log.info(
+                "Receipt queued", extra={"event": "receipt.queued", "order_id": order_id}
+            )
+            return True
 
-        html_content += f"""
-                            </tbody>
-                        </table>
-
-                        <div style="margin-top: 20px; padding-top: 15px; border-top: 2px solid #333;">
-                            <h3 style="text-align: right; margin: 0;">Total: ${float(total_amount):.2f}</h3>
-                        </div>
-                    </div>
-                    
-                    <p style="color: #666; font-size: 0.9em;">
-                        Thank you for your business! If you have any questions about your order,
-                        please don't hesitate to contact us.
-                    </p>
-                </div>
-            </body>
-        </html>
-        """
+        from sendgrid import SendGridAPIClient
+        from sendgrid.helpers.mail import Mail
 
         message = Mail(
             from_email=sender_email,
             to_emails=user_email,
-            subject=f"Order Confirmation - #{order_id}",
+            subject=RECEIPT_SUBJECT.format(order_id=order_id),
             html_content=html_content,
         )
 
@@ -562,21 +375,223 @@ def send_order_receipt(user_email, user_name, order_id, items, total_amount):
         response = sg.send(message)
 
         if response.status_code != 202:
-            print(f"SendGrid returned status {response.status_code}")
+            log.warning(
+                "SendGrid returned status %s",
+                response.status_code,
+                extra={"event": "receipt.status", "order_id": order_id},
+            )
 
-        print(f"SendGrid: email sent to {user_email}")
+        log.info("Receipt sent", extra={"event": "receipt.sent", "order_id": order_id})
         return True
 
-    except Exception as e:
-        print(f"SendGrid email failed: {str(e)}")
+    except Exception:
+        log.exception(
+            "SendGrid email failed", extra={"event": "receipt.error", "order_id": order_id}
+        )
         return False
 
 
-@app.route("/api/postOrder", methods=["POST"])
+def _write_order(session, order, items, store_id):
+    """Insert an order through the ORM, one statement at a time.
+
+    Returns ``(order_id, items_for_email, prep_items, stock_changes)``.
+    """
+    new_order = Order(store_id=store_id, **order)
+    session.add(new_order)
+    session.flush()
+
+    # Store items with product names for email
+    items_for_email = []
+    # Drinks handed to the barista scheduler once the order is committed
+    prep_items = []
+
+    for item_data in items:
+        # Get product name for email
+        product = session.get(Product, item_data["product_id"])
+
+        item = OrderItem(
+            order_id=new_order.order_id,
+            product_id=item_data["product_id"],
+            quantity=item_data["quantity"],
+            unit_price_at_sale=Decimal(str(item_data["unit_price_at_sale"])),
+            sugar_level=item_data.get("sugar_level", "100%"),
+            size_level=item_data.get("size_level", "normal"),
+            ice_level=item_data.get("ice_level", "regular"),
+        )
+        session.add(item)
+        session.flush()
+
+        # Prepare item data for email
+        email_item = {
+            "product_name": product.product_name if product else "Unknown Product",
+            "quantity": item_data["quantity"],
+            "unit_price_at_sale": item_data["unit_price_at_sale"],
+            "sugar_level": item_data.get("sugar_level", "100%"),
+            "size_level": item_data.get("size_level", "normal"),
+            "ice_level": item_data.get("ice_level", "regular"),
+            "modifications": [],
+        }
+
+        for mod_data in item_data.get("modifications", []):
+            # Get ingredient name for email
+            ingredient = session.get(
+                Inventory, (store_id, mod_data["ingredient_id"])
+            )
+
+            # Map possible_modification to modification_type
+            mod_type = mod_data.get("modification_type") or mod_data.get(
+                "possible_modification", "ADD"
+            )
+
+            mod = Modification(
+                order_item_id=item.order_item_id,
+                ingredient_id=mod_data["ingredient_id"],
+                modification_type=mod_type,
+                quantity_change=Decimal(str(mod_data.get("quantity_change", 0))),
+                price_change=Decimal(str(mod_data.get("price_change", 0))),
+            )
+            session.add(mod)
+
+            # Add modification info for email
+            email_item["modifications"].append(
+                {
+                    "modification_type": mod_type,
+                    "ingredient_name": (
+                        ingredient.ingredient_name
+                        if ingredient
+                        else "Unknown Ingredient"
+                    ),
+                }
+            )
+
+        items_for_email.append(email_item)
+        prep_items.append(
+            {
+                "order_item_id": item.order_item_id,
+                "product_name": email_item["product_name"],
+                "category": product.category if product else None,
+                "size": email_item["size_level"],
+                "mods": len(email_item["modifications"]),
+                "quantity": item_data["quantity"],
+            }
+        )
+
+    session.flush()
+
+    # Update inventory
+    stock_changes = {}
+    for item_data in items:
+        product = session.get(Product, item_data["product_id"])
+        if not product:
+            continue
+
+        size_level = item_data.get("size_level", "normal")
+        cup_name = CUP_INGREDIENTS.get(size_level, CUP_INGREDIENTS["normal"])
+
+        cup = session.execute(
+            text(
+                "SELECT ingredient_id FROM inventory "
+                "WHERE store_id = :store_id AND ingredient_name = :name LIMIT 1"
+            ),
+            {"store_id": store_id, "name": cup_name},
+        ).first()
+        if cup:
+            cup_inv = session.get(Inventory, (store_id, cup[0]))
+            if cup_inv:
+                cup_inv.on_hand_quantity -= Decimal(item_data["quantity"])
+                stock_changes[cup_inv.ingredient_id] = cup_inv.on_hand_quantity
+
+        for recipe in product.recipe:
+            total_qty = recipe.quantity_per_unit * Decimal(item_data["quantity"])
+
+            inv = session.get(Inventory, (store_id, recipe.ingredient_id))
+            if inv:
+                inv.on_hand_quantity -= total_qty
+                stock_changes[inv.ingredient_id] = inv.on_hand_quantity
+
+        for mod_data in item_data.get("modifications", []):
+            inv = session.get(Inventory, (store_id, mod_data["ingredient_id"]))
+            if inv:
+                mod_type = (
+                    mod_data.get("modification_type")
+                    or mod_data.get("possible_modification", "ADD")
+                ).upper()
+                qty_change = Decimal(
+                    str(mod_data.get("quantity_change", 0))
+                ) * Decimal(item_data["quantity"])
+                if mod_type in ("ADD", "EXTRA"):
+                    inv.on_hand_quantity -= qty_change
+                elif mod_type in ("REMOVE", "LESS"):
+                    inv.on_hand_quantity += qty_change
+                stock_changes[inv.ingredient_id] = inv.on_hand_quantity
+
+    return new_order.order_id, items_for_email, prep_items, stock_changes
+
+
+def _write_order_pipelined(session, order, items, store_id):
+    """``_write_order`` in one pipelined round trip (checkout.py, psycopg 3 only)."""
+    order_id, item_ids, products, stock = write_order_pipelined(
+        session, order, items, store_id
+    )
+    items_for_email = []
+    prep_items = []
+    for item_data, order_item_id in zip(items, item_ids):
+        product_name, category = products.get(
+            item_data["product_id"], ("Unknown Product", None)
+        )
+        email_item = {
+            "product_name": product_name,
+            "quantity": item_data["quantity"],
+            "unit_price_at_sale": item_data["unit_price_at_sale"],
+            "sugar_level": item_data.get("sugar_level", "100%"),
+            "size_level": item_data.get("size_level", "normal"),
+            "ice_level": item_data.get("ice_level", "regular"),
+            "modifications": [
+                {
+                    "modification_type": mod_data.get("modification_type")
+                    or mod_data.get("possible_modification", "ADD"),
+                    "ingredient_name": stock.get(
+                        mod_data["ingredient_id"], ("Unknown Ingredient",)
+                    )[0],
+                }
+                for mod_data in item_data.get("modifications", [])
+            ],
+        }
+        items_for_email.append(email_item)
+        prep_items.append(
+            {
+                "order_item_id": order_item_id,
+                "product_name": product_name,
+                "category": category,
+                "size": email_item["size_level"],
+                "mods": len(email_item["modifications"]),
+                "quantity": item_data["quantity"],
+            }
+        )
+    stock_changes = {iid: qty for iid, (_, qty) in stock.items()}
+    return order_id, items_for_email, prep_items, stock_changes
+
+
+def _after_commit(event, fn, *args):
+    """``fn(*args)``, logging instead of raising: the order is already committed."""
+    try:
+        return fn(*args)
+    except Exception:
+        log.exception("After-commit step failed", extra={"event": event})
+        return None
+
+
+@api.route("/api/postOrder", methods=["POST"])
+@statement_timeout("checkout")
+@admission_class("order")
 def post_order():
     data = request.get_json()
+    started = time.perf_counter()
     try:
-        session = db.session
+        # The order, its customer row and the stock it uses live on the store's shard
+        store_id = _store_id()
+        session = shards.session(store_id)
+        bind_log(store_id=store_id)
 
         employee_id = data.get("employee_id")
         clerk_user_id = data.get("clerk_user_id")
@@ -615,6 +630,7 @@ def post_order():
             user_email = user[1] or user_email
             user_name = user[2] or user_name
 
+        bind_log(user_id=user_id, employee_id=employee_id)
         if not employee_id and not user_id:
             return (
                 jsonify(
@@ -623,121 +639,59 @@ def post_order():
                 400,
             )
 
-        new_order = Order(
-            total_amount=Decimal(str(data["total_amount"])),
-            employee_id=employee_id,
-            user_id=user_id,
-            order_date=datetime.now(),
-        )
-        session.add(new_order)
-        session.flush()
-
-        # Store items with product names for email
-        items_for_email = []
-
-        for item_data in data["items"]:
-            # Get product name for email
-            product = session.get(Product, item_data["product_id"])
-
-            item = OrderItem(
-                order_id=new_order.order_id,
-                product_id=item_data["product_id"],
-                quantity=item_data["quantity"],
-                unit_price_at_sale=Decimal(str(item_data["unit_price_at_sale"])),
-                sugar_level=item_data.get("sugar_level", "100%"),
-                size_level=item_data.get("size_level", "normal"),
-                ice_level=item_data.get("ice_level", "regular"),
-            )
-            session.add(item)
-            session.flush()
-
-            # Prepare item data for email
-            email_item = {
-                "product_name": product.product_name if product else "Unknown Product",
-                "quantity": item_data["quantity"],
-                "unit_price_at_sale": item_data["unit_price_at_sale"],
-                "sugar_level": item_data.get("sugar_level", "100%"),
-                "size_level": item_data.get("size_level", "normal"),
-                "ice_level": item_data.get("ice_level", "regular"),
-                "modifications": [],
-            }
-
-            for mod_data in item_data.get("modifications", []):
-                # Get ingredient name for email
-                ingredient = session.get(Inventory, mod_data["ingredient_id"])
-
-                # Map possible_modification to modification_type
-                mod_type = mod_data.get("modification_type") or mod_data.get(
-                    "possible_modification", "ADD"
+        if availability.enforce:
+            short = availability.check(session, data["items"], store_id)
+            if short:
+                return (
+                    jsonify({"error": "Some items are sold out", "unavailable": short}),
+                    409,
                 )
 
-                mod = Modification(
-                    order_item_id=item.order_item_id,
-                    ingredient_id=mod_data["ingredient_id"],
-                    modification_type=mod_type,
-                    quantity_change=Decimal(str(mod_data.get("quantity_change", 0))),
-                    price_change=Decimal(str(mod_data.get("price_change", 0))),
-                )
-                session.add(mod)
-
-                # Add modification info for email
-                email_item["modifications"].append(
-                    {
-                        "modification_type": mod_type,
-                        "ingredient_name": (
-                            ingredient.ingredient_name
-                            if ingredient
-                            else "Unknown Ingredient"
-                        ),
-                    }
-                )
-
-            items_for_email.append(email_item)
-
-        session.flush()
-
-        # Update inventory
-        for item_data in data["items"]:
-            product = session.get(Product, item_data["product_id"])
-            if not product:
-                continue
-
-            size_level = item_data.get("size_level", "normal")
-            cup_name_map = {"small": "Small Cup", "normal": "Medium Cup", "large": "Large Cup"}
-            cup_name = cup_name_map.get(size_level, "Medium Cup")
-            
-            cup = session.execute(
-                text("SELECT ingredient_id FROM inventory WHERE ingredient_name = :name LIMIT 1"),
-                {"name": cup_name}
-            ).first()
-            if cup:
-                cup_inv = session.get(Inventory, cup[0])
-                if cup_inv:
-                    cup_inv.on_hand_quantity -= Decimal(item_data["quantity"])
-
-            for recipe in product.recipe:
-                total_qty = recipe.quantity_per_unit * Decimal(item_data["quantity"])
-
-                inv = session.get(Inventory, recipe.ingredient_id)
-                if inv:
-                    inv.on_hand_quantity -= total_qty
-
-            for mod_data in item_data.get("modifications", []):
-                inv = session.get(Inventory, mod_data["ingredient_id"])
-                if inv:
-                    mod_type = (
-                        mod_data.get("modification_type")
-                        or mod_data.get("possible_modification", "ADD")
-                    ).upper()
-                    qty_change = Decimal(
-                        str(mod_data.get("quantity_change", 0))
-                    ) * Decimal(item_data["quantity"])
-                    if mod_type in ("ADD", "EXTRA"):
-                        inv.on_hand_quantity -= qty_change
-                    elif mod_type in ("REMOVE", "LESS"):
-                        inv.on_hand_quantity += qty_change
+        order = {
+            "total_amount": Decimal(str(data["total_amount"])),
+            "employee_id": employee_id,
+            "user_id": user_id,
+            "order_date": datetime.now(),
+        }
+        write = _write_order
+        if current_app.config.get("CHECKOUT_PIPELINE") and pipelined(session):
+            write = _write_order_pipelined
+        order_id, items_for_email, prep_items, stock_changes = write(
+            session, order, data["items"], store_id
+        )
+        bind_log(order_id=order_id)
 
         session.commit()
+        committed = time.perf_counter()
+        # Best effort from here on: a retry of a committed order would duplicate it
+        _after_commit("availability.error", availability.apply, store_id, stock_changes)
+        _after_commit(
+            "order_book.error",
+            order_book.record,
+            store_id,
+            order_id,
+            order["order_date"],
+            order["total_amount"],
+            [
+                (item["product_id"], item["quantity"], email_item["product_name"])
+                for item, email_item in zip(data["items"], items_for_email)
+            ],
+        )
+        # Customer's own history should see this order even if the replica lags
+        _after_commit("replicas.error", replicas.pin, clerk_user_id)
+        ready_at = _after_commit(
+            "barista.error", baristas.submit, order_id, prep_items, store_id
+        )
+
+        if user_id:
+            # Best effort: `flask refresh-usuals` rebuilds anything missed here
+            try:
+                usuals.record_order(
+                    session, user_id, order_id, order["order_date"], data["items"]
+                )
+            except Exception:
+                session.rollback()
+                log.exception("Usuals update failed", extra={"event": "usuals.error"})
 
         # Send receipt email to customer
         email_sent = False
@@ -745,17 +699,35 @@ def post_order():
             email_sent = send_order_receipt(
                 user_email=user_email,
                 user_name=user_name or "Customer",
-                order_id=new_order.order_id,
+                order_id=order_id,
                 items=items_for_email,
                 total_amount=data["total_amount"],
             )
 
+        eta = {"ready_at": None, "eta_seconds": None}
+        if ready_at is not None:
+            eta = {
+                "ready_at": datetime.fromtimestamp(ready_at).isoformat(),
+                "eta_seconds": max(0, round(ready_at - baristas.clock())),
+            }
+        log.info(
+            "Order posted",
+            extra={
+                "event": "order.posted",
+                "items": len(data["items"]),
+                "total_amount": data["total_amount"],
+                "db_ms": round((committed - started) * 1000.0, 2),
+                "after_commit_ms": round((time.perf_counter() - committed) * 1000.0, 2),
+                "email_sent": email_sent,
+            },
+        )
         return (
             jsonify(
                 {
                     "message": "Order posted successfully",
-                    "order_id": new_order.order_id,
+                    "order_id": order_id,
                     "email_sent": email_sent,
+                    **eta,
                 }
             ),
             201,
@@ -763,20 +735,109 @@ def post_order():
 
     except SQLAlchemyError as e:
         session.rollback()
+        log.exception("Order failed", extra={"event": "order.error"})
+        return jsonify({"error": str(e)}), 500
+
+
+@api.route("/api/barista/queue", methods=["GET"])
+@api.route("/api/stores/<int:store_id>/barista/queue", methods=["GET"])
+def barista_queue(store_id=None):
+    """Drinks waiting at each barista station, with estimated ready times"""
+    return jsonify(baristas.queue_view(_store_id(store_id)))
+
+
+@api.route("/api/barista/items/<int:order_item_id>/complete", methods=["POST"])
+@api.route(
+    "/api/stores/<int:store_id>/barista/items/<int:order_item_id>/complete",
+    methods=["POST"],
+)
+def complete_barista_item(order_item_id, store_id=None):
+    """Mark a drink as made"""
+    store_id = _store_id(store_id)
+    item = baristas.complete(order_item_id, store_id)
+    if item is None:
+        return jsonify({"error": "Item is not in the barista queue"}), 404
+    return jsonify(
+        {
+            "order_item_id": order_item_id,
+            "order_id": item["order_id"],
+            "prep_seconds": round(item.get("prep_seconds", 0.0), 1),
+            "order_ready": baristas.order_eta(item["order_id"], store_id) is None,
+        }
+    )
+
+
+@api.route("/api/orders/<int:order_id>/eta", methods=["GET"])
+@api.route("/api/stores/<int:store_id>/orders/<int:order_id>/eta", methods=["GET"])
+def get_order_eta(order_id, store_id=None):
+    """Estimated ready time of an order still being made"""
+    ready_at = baristas.order_eta(order_id, _store_id(store_id))
+    if ready_at is None:
+        # Made already, or never queued by this worker
+        return jsonify({"order_id": order_id, "in_queue": False})
+    return jsonify(
+        {
+            "order_id": order_id,
+            "in_queue": True,
+            "ready_at": datetime.fromtimestamp(ready_at).isoformat(),
+            "eta_seconds": max(0, round(ready_at - baristas.clock())),
+        }
+    )
+
+
+@api.route("/api/search", methods=["GET"])
+def search():
+    """Typo-tolerant search over products, categories and ingredients"""
+    query = request.args.get("q", "")
+    kind = request.args.get("kind")
+    if kind not in (None, "product", "ingredient"):
+        return jsonify({"error": "kind must be product or ingredient"}), 400
+    limit = min(max(request.args.get("limit", 10, type=int), 1), 50)
+    try:
+        search_index.ensure(db.session)
+        return jsonify({"query": query, "results": search_index.search(query, limit, kind)})
+    except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/api/inventory", methods=["GET"])
+def _inventory_version():
+    """md5 of the store's inventory rows, computed by the database"""
+    store_id = _store_id()
+    return (
+        shards.session(store_id)
+        .execute(
+            text(
+                """
+        SELECT md5(string_agg(
+                   CONCAT_WS('|', ingredient_id, ingredient_name, on_hand_quantity,
+                             is_add_on, price_per_unit, version),
+                   ',' ORDER BY ingredient_id))
+        FROM inventory
+        WHERE store_id = :store_id
+    """
+            ),
+            {"store_id": store_id},
+        )
+        .scalar()
+    )
+
+
+@api.route("/api/inventory", methods=["GET"])
+@responses.conditional(_inventory_version)
 def get_inventory():
+    store_id = _store_id()
+    session = shards.session(store_id)
     rows = (
-        db.session.execute(
+        session.execute(
             text(
                 """
-        SELECT ingredient_id, ingredient_name, on_hand_quantity, is_add_on, price_per_unit
+        SELECT ingredient_id, ingredient_name, on_hand_quantity, is_add_on, price_per_unit, version
         FROM inventory
+        WHERE store_id = :store_id
         ORDER BY ingredient_id
     """
-            )
+            ),
+            {"store_id": store_id},
         )
         .mappings()
         .all()
@@ -784,62 +845,221 @@ def get_inventory():
     return jsonify([_maprow(r) for r in rows])
 
 
-@app.route("/api/inventory/<int:ingredient_id>", methods=["PUT"])
+@api.route("/api/inventory/<int:ingredient_id>", methods=["PUT"])
 def update_inventory_item(ingredient_id):
-    body = request.get_json(force=True) or {}
-    qty = body.get("on_hand_quantity")
-    db.session.execute(
-        text("UPDATE inventory SET on_hand_quantity = :q WHERE ingredient_id = :id"),
-        {"q": qty, "id": ingredient_id},
-    )
-    db.session.commit()
-    return jsonify(
-        {"ok": True, "ingredient_id": ingredient_id, "on_hand_quantity": qty}
-    )
-
-
-@app.route("/api/inventory/<int:ingredient_id>/restock", methods=["POST"])
-def restock_inventory(ingredient_id):
+    store_id = _store_id()
+    session = shards.session(store_id)
     try:
         body = request.get_json(force=True) or {}
-        delta = body.get("delta")
-
-        if delta is None:
-            return jsonify({"error": "delta is required"}), 400
+        qty = body.get("on_hand_quantity")
+        version = body.get("version")
 
-        delta_decimal = Decimal(str(delta))
-        if delta_decimal <= 0:
-            return jsonify({"error": "delta must be positive"}), 400
+        if qty is None:
+            return jsonify({"error": "on_hand_quantity is required"}), 400
 
-        result = db.session.execute(
+        # With a version, refuse to overwrite a count that changed since it was read
+        row = session.execute(
             text(
-                "UPDATE inventory SET on_hand_quantity = on_hand_quantity + :delta WHERE ingredient_id = :id RETURNING on_hand_quantity"
+                """
+                UPDATE inventory SET on_hand_quantity = :q
+                WHERE store_id = :store_id AND ingredient_id = :id
+                  AND (CAST(:v AS INTEGER) IS NULL OR version = CAST(:v AS INTEGER))
+                RETURNING on_hand_quantity, version
+            """
             ),
-            {"delta": delta_decimal, "id": ingredient_id},
+            {
+                "q": Decimal(str(qty)),
+                "store_id": store_id,
+                "id": ingredient_id,
+                "v": version,
+            },
         ).first()
 
-        if result is None:
-            return jsonify({"error": "Ingredient not found"}), 404
+        if row is None:
+            current = session.execute(
+                text(
+                    "SELECT version FROM inventory "
+                    "WHERE store_id = :store_id AND ingredient_id = :id"
+                ),
+                {"store_id": store_id, "id": ingredient_id},
+            ).first()
+            session.rollback()
+            if current is None:
+                return jsonify({"error": "Ingredient not found"}), 404
+            return (
+                jsonify(
+                    {
+                        "error": "Inventory changed since it was read",
+                        "current_version": current[0],
+                    }
+                ),
+                409,
+            )
 
-        db.session.commit()
-        return (
-            jsonify(
-                {
-                    "ok": True,
-                    "ingredient_id": ingredient_id,
-                    "delta": float(delta_decimal),
-                    "new_quantity": float(result[0]),
-                }
+        session.commit()
+        availability.apply(store_id, {ingredient_id: row[0]})
+        return jsonify(
+            {
+                "ok": True,
+                "ingredient_id": ingredient_id,
+                "on_hand_quantity": float(row[0]),
+                "version": row[1],
+            }
+        )
+
+    except Exception as e:
+        session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+
+@api.route("/api/inventory/bulk", methods=["POST"])
+def bulk_update_inventory():
+    """Apply a delivery receipt or stocktake in one transaction.
+
+    Accepts JSON ``{"items": [...], "all_or_nothing": bool}`` or a CSV upload
+    (multipart field ``file`` or a ``text/csv`` body).
+    """
+    store_id = _store_id()
+    session = shards.session(store_id)
+    try:
+        upload = request.files.get("file")
+        if upload is not None:
+            raw_rows = rows_from_csv(upload.read())
+            all_or_nothing = request.form.get("all_or_nothing", "").lower() == "true"
+        elif request.mimetype == "text/csv":
+            raw_rows = rows_from_csv(request.get_data())
+            all_or_nothing = request.args.get("all_or_nothing", "").lower() == "true"
+        else:
+            body = request.get_json(force=True) or {}
+            if not isinstance(body, dict):
+                raise BulkInventoryError('expected {"items": [...]}')
+            raw_rows = body.get("items") or []
+            all_or_nothing = bool(body.get("all_or_nothing", False))
+        rows = parse_rows(raw_rows)
+    except BulkInventoryError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        results = apply_rows(session, rows, store_id)
+        failed = [r for r in results if r["status"] != "ok"]
+        if failed and all_or_nothing:
+            session.rollback()
+            return jsonify({"ok": False, "applied": 0, "results": results}), 409
+        session.commit()
+        availability.apply(
+            store_id,
+            {r["ingredient_id"]: r["new_quantity"] for r in results if r["status"] == "ok"},
+        )
+        return jsonify(
+            {
+                "ok": not failed,
+                "applied": len(results) - len(failed),
+                "results": results,
+            }
+        )
+
+    except Exception as e:
+        session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+
+@api.route("/api/inventory/<int:ingredient_id>/restock", methods=["POST"])
+def restock_inventory(ingredient_id):
+    store_id = _store_id()
+    session = shards.session(store_id)
+    try:
+        body = request.get_json(force=True) or {}
+        delta = body.get("delta")
+
+        if delta is None:
+            return jsonify({"error": "delta is required"}), 400
+
+        delta_decimal = Decimal(str(delta))
+        if delta_decimal <= 0:
+            return jsonify({"error": "delta must be positive"}), 400
+
+        result = session.execute(
+            text(
+                "UPDATE inventory SET on_hand_quantity = on_hand_quantity + :delta "
+                "WHERE store_id = :store_id AND ingredient_id = :id "
+                "RETURNING on_hand_quantity, version"
+            ),
+            {"delta": delta_decimal, "store_id": store_id, "id": ingredient_id},
+        ).first()
+
+        if result is None:
+            return jsonify({"error": "Ingredient not found"}), 404
+
+        session.commit()
+        availability.apply(store_id, {ingredient_id: result[0]})
+        return (
+            jsonify(
+                {
+                    "ok": True,
+                    "ingredient_id": ingredient_id,
+                    "delta": float(delta_decimal),
+                    "new_quantity": float(result[0]),
+                    "version": result[1],
+                }
             ),
             200,
         )
 
     except Exception as e:
-        db.session.rollback()
+        session.rollback()
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/api/products", methods=["POST"])
+@api.route("/api/inventory/<int:ingredient_id>/price", methods=["PUT"])
+def update_ingredient_price(ingredient_id):
+    """Set what one unit of an ingredient costs the store"""
+    store_id = _store_id()
+    session = shards.session(store_id)
+    try:
+        body = request.get_json(force=True) or {}
+        price = body.get("price_per_unit")
+
+        if price is None:
+            return jsonify({"error": "price_per_unit is required"}), 400
+
+        price_decimal = Decimal(str(price))
+        if price_decimal < 0:
+            return jsonify({"error": "price_per_unit cannot be negative"}), 400
+
+        result = session.execute(
+            text(
+                "UPDATE inventory SET price_per_unit = :price "
+                "WHERE store_id = :store_id AND ingredient_id = :id "
+                "RETURNING ingredient_name, price_per_unit, is_add_on"
+            ),
+            {"price": price_decimal, "store_id": store_id, "id": ingredient_id},
+        ).first()
+
+        if result is None:
+            return jsonify({"error": "Ingredient not found"}), 404
+
+        session.commit()
+        costs.price_changed(store_id, ingredient_id, result[1])
+        if result[2] and store_id == DEFAULT_STORE_ID:
+            catalog.invalidate()
+        return (
+            jsonify(
+                {
+                    "ok": True,
+                    "ingredient_id": ingredient_id,
+                    "ingredient_name": result[0],
+                    "price_per_unit": float(result[1]),
+                }
+            ),
+            200,
+        )
+
+    except Exception as e:
+        session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+
+@api.route("/api/products", methods=["POST"])
 def add_product():
     try:
         body = request.get_json(force=True) or {}
@@ -882,6 +1102,12 @@ def add_product():
             )
 
         db.session.commit()
+        catalog.invalidate()
+        costs.recipe_changed(db.session, [product_id])
+        availability.recipes_changed()
+        search_index.add_product(
+            product_id, body["product_name"], body.get("category", "Uncategorized")
+        )
         return jsonify({"product_id": product_id}), 201
 
     except Exception as e:
@@ -889,8 +1115,89 @@ def add_product():
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/api/inventory", methods=["POST"])
+@api.route("/api/products/import", methods=["POST"])
+def import_products():
+    """Import a full menu with recipes (JSON or CSV) in one transaction.
+
+    Options ``retire_missing`` and ``dry_run`` come from the JSON body or,
+    for CSV uploads, from the query string.
+    """
+    try:
+        upload = request.files.get("file")
+        if upload is not None or request.mimetype == "text/csv":
+            data = upload.read() if upload is not None else request.get_data()
+            products = load_import(csv_data=data)
+            options = request.args
+        else:
+            body = request.get_json(force=True) or {}
+            products = load_import(body)
+            options = body if isinstance(body, dict) else {}
+        retire_missing = str(options.get("retire_missing", "")).lower() == "true"
+        dry_run = str(options.get("dry_run", "")).lower() == "true"
+    except (MenuImportError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        summary = import_menu(
+            db.session, products, retire_missing=retire_missing, dry_run=dry_run
+        )
+        if dry_run:
+            db.session.rollback()
+        else:
+            db.session.commit()
+            catalog.invalidate()
+            costs.recipe_changed(
+                db.session, summary["added"] + summary["recipes_replaced"]
+            )
+            availability.recipes_changed()
+            changed = set(summary["added"] + summary["updated"])
+            for product in products:
+                if product["product_id"] in changed:
+                    search_index.add_product(
+                        product["product_id"], product["product_name"], product["category"]
+                    )
+            for product_id in summary["retired"]:
+                search_index.remove_product(product_id)
+        return jsonify(summary), 200
+    except MenuImportError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+
+@api.cli.command("import-menu")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--retire-missing", is_flag=True, help="Retire products not in the file.")
+@click.option("--dry-run", is_flag=True, help="Print the diff without writing.")
+def import_menu_command(path, retire_missing, dry_run):
+    """Import products and recipes from a JSON or CSV file."""
+    with open(path, "rb") as f:
+        data = f.read()
+    try:
+        if path.lower().endswith(".csv"):
+            products = load_import(csv_data=data)
+        else:
+            products = load_import(data)
+        summary = import_menu(
+            db.session, products, retire_missing=retire_missing, dry_run=dry_run
+        )
+    except MenuImportError as e:
+        db.session.rollback()
+        raise click.ClickException(str(e))
+    if dry_run:
+        db.session.rollback()
+    else:
+        db.session.commit()
+        catalog.invalidate()
+    click.echo(json.dumps(summary, indent=2))
+
+
+@api.route("/api/inventory", methods=["POST"])
 def add_inventory_item():
+    store_id = _store_id()
+    session = shards.session(store_id)
     try:
         body = request.get_json(force=True) or {}
         name = body.get("ingredient_name", "").strip()
@@ -912,19 +1219,29 @@ def add_inventory_item():
         if price_decimal < 0:
             return jsonify({"error": "price_per_unit cannot be negative"}), 400
 
-        # Get next ingredient_id
-        row = db.session.execute(
+        # Recipes on every shard refer to ingredient ids, and MAX + 1 on one
+        # shard can hand out an id another shard already uses
+        if body.get("ingredient_id") is None and shards.sharded:
+            return (
+                jsonify({"error": "ingredient_id is required when stores are sharded"}),
+                400,
+            )
+
+        # Stock a shared ingredient at this store, or create the next ingredient_id
+        row = session.execute(
             text(
                 """
                 WITH next AS (
                     SELECT COALESCE(MAX(ingredient_id), 0) + 1 AS id FROM inventory
                 )
-                INSERT INTO inventory (ingredient_id, ingredient_name, on_hand_quantity, is_add_on, price_per_unit)
-                SELECT next.id, :name, :qty, :is_add_on, :price FROM next
+                INSERT INTO inventory (store_id, ingredient_id, ingredient_name, on_hand_quantity, is_add_on, price_per_unit)
+                SELECT :store_id, COALESCE(CAST(:iid AS INTEGER), next.id), :name, :qty, :is_add_on, :price FROM next
                 RETURNING ingredient_id, ingredient_name, on_hand_quantity, is_add_on, price_per_unit
             """
             ),
             {
+                "store_id": store_id,
+                "iid": body.get("ingredient_id"),
                 "name": name,
                 "qty": qty_decimal,
                 "is_add_on": is_add_on,
@@ -932,7 +1249,12 @@ def add_inventory_item():
             },
         ).first()
 
-        db.session.commit()
+        session.commit()
+        availability.apply(store_id, {row[0]: row[2]})
+        if store_id == DEFAULT_STORE_ID:
+            search_index.add_ingredient(row[0], row[1])
+            if is_add_on:
+                catalog.invalidate()
 
         return (
             jsonify(
@@ -948,166 +1270,289 @@ def add_inventory_item():
         )
 
     except Exception as e:
-        db.session.rollback()
+        session.rollback()
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/api/employees", methods=["GET"])
+@api.route("/api/employees", methods=["GET"])
+@responses.conditional()
 def list_employees():
-    try:
-        rows = (
-            db.session.execute(
+    """Employees of ``store_id``, or of every store when it is not given"""
+    store_id = request.args.get("store_id", type=int)
+
+    def fetch(conn, store_ids):
+        return (
+            conn.execute(
                 text(
                     """
-            SELECT employee_id, name, "role" AS role, email 
+            SELECT employee_id, name, "role" AS role, email, store_id
             FROM employees
+            WHERE store_id IN :stores
             ORDER BY employee_id
         """
-                )
+                ).bindparams(bindparam("stores", expanding=True)),
+                {"stores": store_ids},
             )
             .mappings()
             .all()
         )
+
+    try:
+        stores = [store_id] if store_id is not None else None
+        rows = [r for part in shards.fan_out(fetch, stores).values() for r in part]
+        rows.sort(key=lambda r: (r["store_id"], r["employee_id"]))
         return jsonify([_maprow(r) for r in rows])
     except Exception as e:
-        db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/api/employees", methods=["POST"])
+@api.route("/api/employees", methods=["POST"])
 def add_employee():
+    store_id = _store_id()
+    session = shards.session(store_id)
     body = request.get_json(force=True) or {}
     name = body.get("name")
     role = norm_role(body.get("role"))
     email = body.get("email")
     if role not in ALLOWED_ROLES:
         return jsonify({"error": "invalid role", "allowed": list(ALLOWED_ROLES)}), 400
-    row = db.session.execute(
+    row = session.execute(
         text(
             """
             WITH next AS (
             SELECT COALESCE(MAX(employee_id), 0) + 1 AS id FROM employees
             )
-            INSERT INTO employees(employee_id, name, role, email)
-            SELECT next.id, :n, :r, :e FROM next
+            INSERT INTO employees(employee_id, name, role, email, store_id)
+            SELECT next.id, :n, :r, :e, :s FROM next
             RETURNING employee_id
             """
         ),
-        {"n": name, "r": role, "e": email},
+        {"n": name, "r": role, "e": email, "s": store_id},
     ).first()
-    db.session.commit()
-    return jsonify({"employee_id": row[0], "name": name, "role": role, "email": email}), 201
+    session.commit()
+    return (
+        jsonify(
+            {
+                "employee_id": row[0],
+                "name": name,
+                "role": role,
+                "email": email,
+                "store_id": store_id,
+            }
+        ),
+        201,
+    )
 
 
-@app.route("/api/employees/<int:employee_id>", methods=["PUT"])
+@api.route("/api/employees/<int:employee_id>", methods=["PUT"])
 def update_employee(employee_id):
+    store_id = _store_id()
+    session = shards.session(store_id)
     body = request.get_json(force=True) or {}
     name = body.get("name")
     role = norm_role(body.get("role"))
     email = body.get("email")
     if role not in ALLOWED_ROLES:
         return jsonify({"error": "invalid role", "allowed": list(ALLOWED_ROLES)}), 400
-    db.session.execute(
-        text("UPDATE employees SET name = :n, role = :r, email =:e WHERE employee_id = :id"),
-        {"n": name, "r": role, "e":email, "id": employee_id},
-    )
-    db.session.commit()
+    row = session.execute(
+        text(
+            "UPDATE employees SET name = :n, role = :r, email = :e"
+            " WHERE employee_id = :id AND store_id = :s RETURNING employee_id"
+        ),
+        {"n": name, "r": role, "e": email, "id": employee_id, "s": store_id},
+    ).first()
+    session.commit()
+    if row is None:
+        return jsonify({"error": "Employee not found"}), 404
     return jsonify({"ok": True, "employee_id": employee_id, "name": name, "role": role})
 
 
-@app.route("/api/employees/<int:employee_id>", methods=["DELETE"])
+@api.route("/api/employees/<int:employee_id>", methods=["DELETE"])
 def delete_employee(employee_id):
-    db.session.execute(
-        text("DELETE FROM employees WHERE employee_id = :id"), {"id": employee_id}
-    )
-    db.session.commit()
+    store_id = _store_id()
+    session = shards.session(store_id)
+    row = session.execute(
+        text(
+            "DELETE FROM employees WHERE employee_id = :id AND store_id = :s"
+            " RETURNING employee_id"
+        ),
+        {"id": employee_id, "s": store_id},
+    ).first()
+    session.commit()
+    if row is None:
+        return jsonify({"error": "Employee not found"}), 404
     return jsonify({"ok": True, "employee_id": employee_id})
 
 
-@app.route("/api/reports/sales", methods=["GET"])
-def get_sales_report():
+def _closed_range_version(store_id=None):
+    """Version of a report over closed days only; ``None`` when today is in range.
+
+    Closed days change only through ``day_partials.invalidate`` here, or
+    elsewhere once this worker's cached partials expire, so the version
+    also moves with each ``REPORT_CACHE_LRU_SECONDS`` window.
+    """
+    start_date = request.args.get("start_date")
+    end_date = request.args.get("end_date")
+    if not start_date or not end_date or split_days(start_date, end_date)[1]:
+        return None
+    # Product names come from the catalog tables
+    catalog.get(db.session)
+    window = int(time.monotonic() // max(day_partials.lru_seconds, 1.0))
+    return (catalog.version, day_partials.generation, window)
+
+
+@api.route("/api/reports/sales", methods=["GET"])
+@api.route("/api/stores/<int:store_id>/reports/sales", methods=["GET"])
+@statement_timeout("report")
+@admission_class("report")
+@responses.conditional(_closed_range_version)
+def get_sales_report(store_id=None):
     """Get sales data by date range"""
     try:
+        store_id = _store_id(store_id)
         start_date = request.args.get("start_date")
         end_date = request.args.get("end_date")
 
         if not start_date or not end_date:
             return jsonify({"error": "start_date and end_date are required"}), 400
 
-        # Add one day to end_date to make it inclusive
-        sql = """
-            SELECT p.product_id, p.product_name,
-                   SUM(oi.quantity) AS qty,
-                   SUM(oi.quantity * oi.unit_price_at_sale) AS revenue
+        # Closed days come from cached per-day partials; only today is live
+        closed_days, live_days = split_days(start_date, end_date)
+        with shards.reader(store_id) as conn:
+            partials = day_partials.closed_partials(
+                "sales",
+                closed_days,
+                lambda days: sales_partials(conn, days, store_id),
+                store_id,
+            )
+            if live_days:
+                partials.extend(sales_partials(conn, live_days, store_id).values())
+            rows = merge_sales(conn, partials)
+
+        return jsonify(rows)
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@api.route("/api/stores/summary", methods=["GET"])
+@statement_timeout("report")
+@admission_class("report")
+def get_stores_summary():
+    """Orders, revenue and items sold per store over a date range, all shards"""
+    start_date = request.args.get("start_date")
+    end_date = request.args.get("end_date")
+    if not start_date or not end_date:
+        return jsonify({"error": "start_date and end_date are required"}), 400
+
+    def fetch(conn, store_ids):
+        return (
+            conn.execute(
+                text(
+                    """
+            SELECT o.store_id,
+                   COUNT(*) AS order_count,
+                   COALESCE(SUM(o.total_amount), 0) AS total_revenue,
+                   COALESCE(SUM(items.quantity), 0) AS items_sold
             FROM orders o
-            JOIN order_items oi ON oi.order_id = o.order_id
-            JOIN products p ON p.product_id = oi.product_id
-            WHERE o.order_date >= :start_date 
-              AND o.order_date < DATE(:end_date) + INTERVAL '1 day'
-            GROUP BY p.product_id, p.product_name
-            ORDER BY revenue DESC
+            LEFT JOIN LATERAL (
+                SELECT SUM(oi.quantity) AS quantity
+                FROM order_items oi
+                WHERE oi.order_id = o.order_id
+            ) items ON TRUE
+            WHERE o.store_id IN :stores
+              AND o.order_date >= CAST(:start AS DATE)
+              AND o.order_date < CAST(:end AS DATE) + 1
+            GROUP BY o.store_id
         """
-
-        rows = (
-            db.session.execute(
-                text(sql), {"start_date": start_date, "end_date": end_date}
+                ).bindparams(bindparam("stores", expanding=True)),
+                {"stores": store_ids, "start": start_date, "end": end_date},
             )
             .mappings()
             .all()
         )
 
-        return jsonify([_maprow(r) for r in rows])
-
+    try:
+        rows = [r for part in shards.fan_out(fetch).values() for r in part]
+        stores = sorted((_maprow(r) for r in rows), key=lambda r: r["store_id"])
+        totals = {
+            key: sum(r[key] for r in stores)
+            for key in ("order_count", "total_revenue", "items_sold")
+        }
+        return jsonify({"stores": stores, "totals": totals})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/api/reports/x-report", methods=["GET"])
-def get_x_report():
+@api.route("/api/reports/x-report", methods=["GET"])
+@api.route("/api/stores/<int:store_id>/reports/x-report", methods=["GET"])
+@statement_timeout("report")
+@admission_class("report")
+def get_x_report(store_id=None):
     """Get hourly sales for today (X Report)"""
     try:
+        store_id = _store_id(store_id)
+        if order_book.enabled:
+            return jsonify(order_book.x_report(store_id))
+
         sql = """
             SELECT DATE_TRUNC('hour', order_date) AS hour,
                    SUM(total_amount) AS sales
             FROM orders
-            WHERE DATE(order_date) = CURRENT_DATE
+            WHERE store_id = :store_id AND DATE(order_date) = CURRENT_DATE
             GROUP BY hour
             ORDER BY hour
         """
 
-        rows = db.session.execute(text(sql)).mappings().all()
+        with shards.reader(store_id) as conn:
+            rows = conn.execute(text(sql), {"store_id": store_id}).mappings().all()
         return jsonify([_maprow(r) for r in rows])
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/api/reports/z-report", methods=["GET"])
-def get_z_report():
+@api.route("/api/reports/z-report", methods=["GET"])
+@api.route("/api/stores/<int:store_id>/reports/z-report", methods=["GET"])
+@statement_timeout("report")
+@admission_class("report")
+def get_z_report(store_id=None):
     """Get daily summary report (Z Report) - today only"""
     try:
+        store_id = _store_id(store_id)
+        if order_book.enabled:
+            total_revenue, items = order_book.z_report(store_id)
+            return jsonify(
+                {
+                    "total_revenue": total_revenue,
+                    "items": items,
+                    "date": datetime.now().date().isoformat(),
+                }
+            )
+
         # Get total revenue for today
         total_revenue_sql = """
             SELECT COALESCE(SUM(total_amount), 0) AS total_revenue
             FROM orders
-            WHERE DATE(order_date) = CURRENT_DATE
+            WHERE store_id = :store_id AND DATE(order_date) = CURRENT_DATE
         """
 
-        revenue_result = db.session.execute(text(total_revenue_sql)).first()
-        total_revenue = float(revenue_result[0]) if revenue_result else 0
-
         # Get quantity of each item sold today
         items_sql = """
             SELECT p.product_id, p.product_name, SUM(oi.quantity) AS qty_sold
             FROM orders o
             JOIN order_items oi ON oi.order_id = o.order_id
             JOIN products p ON p.product_id = oi.product_id
-            WHERE DATE(o.order_date) = CURRENT_DATE
+            WHERE o.store_id = :store_id AND DATE(o.order_date) = CURRENT_DATE
             GROUP BY p.product_id, p.product_name
             ORDER BY qty_sold DESC
         """
 
-        items = db.session.execute(text(items_sql)).mappings().all()
+        params = {"store_id": store_id}
+        with shards.reader(store_id) as conn:
+            revenue_result = conn.execute(text(total_revenue_sql), params).first()
+            total_revenue = float(revenue_result[0]) if revenue_result else 0
+            items = conn.execute(text(items_sql), params).mappings().all()
 
         return jsonify(
             {
@@ -1121,111 +1566,614 @@ def get_z_report():
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/api/reports/usage-chart", methods=["GET"])
-def get_usage_chart():
+@api.route("/api/reports/z-report/<day>", methods=["GET"])
+@api.route("/api/stores/<int:store_id>/reports/z-report/<day>", methods=["GET"])
+def get_closed_z_report(day, store_id=None):
+    """Get the stored Z report of a closed day"""
+    store_id = _store_id(store_id)
+    try:
+        with shards.reader(store_id) as conn:
+            report = get_report(conn, day, store_id)
+    except ValueError:
+        return jsonify({"error": "date must be YYYY-MM-DD"}), 400
+    if report is None:
+        return jsonify({"error": f"{day} has not been closed"}), 404
+    return jsonify(report)
+
+
+@api.route("/api/reports/z-report/close", methods=["POST"])
+@api.route("/api/stores/<int:store_id>/reports/z-report/close", methods=["POST"])
+@statement_timeout("report")
+@admission_class("report")
+def close_z_report(store_id=None):
+    """Close a business day (today by default) into a stored Z report"""
+    store_id = _store_id(store_id)
+    session = shards.session(store_id)
+    data = request.get_json(silent=True) or {}
+    try:
+        day = date.fromisoformat(data.get("date") or date.today().isoformat())
+    except ValueError:
+        return jsonify({"error": "date must be YYYY-MM-DD"}), 400
+    if day > date.today():
+        return jsonify({"error": "cannot close a future day"}), 400
+    try:
+        report, created = close_day(session, day, data.get("employee_id"), store_id)
+        session.commit()
+        return jsonify({"created": created, "report": report}), 201 if created else 200
+    except Exception as e:
+        session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+
+@api.cli.command("close-days")
+@click.option("--date", "day", help="Close this day (YYYY-MM-DD) only.")
+@click.option("--store", "store_id", type=int, default=DEFAULT_STORE_ID, show_default=True)
+def close_days_command(day, store_id):
+    """Close the given day, or every store's finished days without a Z report."""
+    if day:
+        session = shards.session(store_id)
+        _, created = close_day(session, day, store_id=store_id)
+        session.commit()
+        click.echo(f"store {store_id} {day}: {'closed' if created else 'already closed'}")
+        return
+    closed = []
+    for engine in shards.engines():
+        closed.extend(close_missed_days(engine, z_closer.lookback_days))
+    for closed_store, d in closed:
+        click.echo(f"store {closed_store} {d.isoformat()}: closed")
+    if not closed:
+        click.echo("No missed days.")
+
+
+@api.cli.command("archive-orders")
+@click.option("--since", help="Ignore days before this one (YYYY-MM-DD).")
+@click.option("--store", "store_id", type=int, help="Only this store.")
+@click.option("--force", is_flag=True, help="Export days that are already archived again.")
+def archive_orders_command(since, store_id, force):
+    """Export closed days of orders to the Parquet archive (run nightly)."""
+    from archive import export_days, pending_days
+
+    root = current_app.config["ARCHIVE_DIR"]
+    since = date.fromisoformat(since) if since else None
+    stores = {store_id} if store_id else None
+    exported = 0
+    for engine in shards.engines():
+        with engine.connect() as conn:
+            pending = pending_days(conn, root, since=since, stores=stores, force=force)
+            for archived_store, days in sorted(pending.items()):
+                if shards.engine(shards.shard_of(archived_store)) is not engine:
+                    continue
+                written = export_days(conn, root, days, archived_store)
+                exported += len(days)
+                click.echo(
+                    f"store {archived_store}: {len(days)} days "
+                    f"({days[0].isoformat()} .. {days[-1].isoformat()}), "
+                    f"{written['orders']} orders, {written['order_items']} items"
+                )
+    if not exported:
+        click.echo("Nothing to archive.")
+
+
+@api.cli.command("refresh-usuals")
+def refresh_usuals_command():
+    """Rebuild every customer's usual drinks on every shard."""
+    for engine in shards.engines():
+        count = usuals.rebuild(engine)
+        click.echo(f"{engine.url.database}: {count} users")
+
+
+@api.route("/api/reports/usage-chart", methods=["GET"])
+@api.route("/api/stores/<int:store_id>/reports/usage-chart", methods=["GET"])
+@statement_timeout("report")
+@admission_class("report")
+# Carries current stock, so only the payload tells whether it changed
+@responses.conditional()
+def get_usage_chart(store_id=None):
     """Get ingredient usage by date range"""
     try:
+        store_id = _store_id(store_id)
         start_date = request.args.get("start_date")
         end_date = request.args.get("end_date")
 
         if not start_date or not end_date:
             return jsonify({"error": "start_date and end_date are required"}), 400
 
-        sql = """
-            SELECT 
-                i.ingredient_id,
-                i.ingredient_name,
-                COALESCE(SUM(oi.quantity * pr.quantity_per_unit), 0) AS total_used,
-                i.on_hand_quantity AS current_stock,
-                COUNT(DISTINCT o.order_id) AS orders_count
-            FROM inventory i
-            LEFT JOIN product_recipe pr ON i.ingredient_id = pr.ingredient_id
-            LEFT JOIN order_items oi ON pr.product_id = oi.product_id
-            LEFT JOIN orders o ON oi.order_id = o.order_id
-                AND o.order_date >= :start_date 
-                AND o.order_date < DATE(:end_date) + INTERVAL '1 day'
-            GROUP BY i.ingredient_id, i.ingredient_name, i.on_hand_quantity
-            ORDER BY total_used DESC
-        """
+        closed_days, live_days = split_days(start_date, end_date)
+        with shards.reader(store_id) as conn:
+            partials = day_partials.closed_partials(
+                "usage",
+                closed_days,
+                lambda days: usage_partials(conn, days, store_id),
+                store_id,
+            )
+            if live_days:
+                partials.extend(usage_partials(conn, live_days, store_id).values())
+            rows = merge_usage(conn, partials, store_id)
 
-        rows = (
-            db.session.execute(
-                text(sql), {"start_date": start_date, "end_date": end_date}
+        return jsonify(rows)
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@api.route("/api/reports/forecast", methods=["GET"])
+@api.route("/api/stores/<int:store_id>/reports/forecast", methods=["GET"])
+@statement_timeout("report")
+@admission_class("report")
+def get_forecast(store_id=None):
+    """Project ingredient usage and days until stockout"""
+    try:
+        store_id = _store_id(store_id)
+        days = min(max(request.args.get("days", 14, type=int), 1), 60)
+        weeks = min(max(request.args.get("weeks", 8, type=int), 1), 52)
+
+        model = _forecast_model(store_id)
+        with shards.reader(store_id) as conn:
+            model.refresh(conn)
+            stock = (
+                conn.execute(
+                    text(
+                        "SELECT ingredient_id, ingredient_name, on_hand_quantity "
+                        "FROM inventory WHERE store_id = :store_id"
+                    ),
+                    {"store_id": store_id},
+                )
+                .mappings()
+                .all()
             )
-            .mappings()
-            .all()
+        forecast = model.forecast(
+            {r["ingredient_id"]: r["on_hand_quantity"] for r in stock},
+            days=days,
+            weeks=weeks,
         )
 
-        return jsonify([_maprow(r) for r in rows])
+        results = []
+        for r in stock:
+            entry = forecast.get(r["ingredient_id"])
+            if entry is None:
+                continue
+            results.append(
+                {
+                    "ingredient_id": r["ingredient_id"],
+                    "ingredient_name": r["ingredient_name"],
+                    "on_hand_quantity": float(r["on_hand_quantity"]),
+                    **entry,
+                }
+            )
+        # Soonest stockouts first, ingredients that last the horizon at the end
+        results.sort(
+            key=lambda e: (
+                e["days_until_stockout"] is None,
+                e["days_until_stockout"] or 0,
+            )
+        )
+        return jsonify({"days": days, "as_of": model.until.isoformat(), "ingredients": results})
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/api/getUserOrders", methods=["POST"])
-def get_user_orders():
-    data = request.get_json()
-    clerk_user_id = data.get("clerk_user_id")
+@api.route("/api/reports/affinity", methods=["GET"])
+@api.route("/api/stores/<int:store_id>/reports/affinity", methods=["GET"])
+@statement_timeout("report")
+@admission_class("report")
+def get_affinity_report(store_id=None):
+    """Get the products and add-ons most often bought together"""
+    try:
+        store_id = _store_id(store_id)
+        start_date = request.args.get("start_date")
+        end_date = request.args.get("end_date")
 
-    if not clerk_user_id:
-        return jsonify({"error": "clerk_user_id required"}), 400
+        if not start_date or not end_date:
+            return jsonify({"error": "start_date and end_date are required"}), 400
 
+        sort = request.args.get("sort", "lift")
+        if sort not in ("lift", "count", "support", "confidence"):
+            return jsonify({"error": "sort must be lift, count, support or confidence"}), 400
+        k = min(max(request.args.get("k", 20, type=int), 1), 200)
+        min_count = max(request.args.get("min_count", 3, type=int), 1)
+        include_addons = request.args.get("include_addons", "true").lower() != "false"
+
+        from affinity import compute_partials, merge_partials, top_pairs
+
+        closed_days, live_days = split_days(start_date, end_date)
+        with shards.reader(store_id) as conn:
+            partials = day_partials.closed_partials(
+                "affinity",
+                closed_days,
+                lambda days: compute_partials(conn, days, store_id),
+                store_id,
+            )
+            if live_days:
+                partials.extend(compute_partials(conn, live_days, store_id).values())
+            names = {
+                f"p:{pid}": name
+                for pid, name in conn.execute(
+                    text("SELECT product_id, product_name FROM products")
+                )
+            }
+            names.update(
+                {
+                    f"a:{iid}": name
+                    for iid, name in conn.execute(
+                        text(
+                            "SELECT ingredient_id, ingredient_name FROM inventory "
+                            "WHERE store_id = :store_id"
+                        ),
+                        {"store_id": store_id},
+                    )
+                }
+            )
+
+        keys, orders, counts = merge_partials(partials)
+        pairs = top_pairs(
+            keys,
+            orders,
+            counts,
+            k=k,
+            sort=sort,
+            min_count=min_count,
+            include_addons=include_addons,
+        )
+        for pair in pairs:
+            pair["a_name"] = names.get(pair["a"], pair["a"])
+            pair["b_name"] = names.get(pair["b"], pair["b"])
+
+        return jsonify({"orders": orders, "pairs": pairs})
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@api.route("/api/reports/heatmap", methods=["GET"])
+@api.route("/api/stores/<int:store_id>/reports/heatmap", methods=["GET"])
+@statement_timeout("report")
+@admission_class("report")
+def get_heatmap_report(store_id=None):
+    """Orders, drinks and revenue by weekday and hour over the last N weeks"""
     try:
-        # Get user's database ID from clerk ID
-        user = db.session.execute(
-            text("SELECT user_id FROM users WHERE clerk_user_id = :clerk_id"),
-            {"clerk_id": clerk_user_id},
-        ).first()
+        store_id = _store_id(store_id)
+        weeks = min(max(request.args.get("weeks", 8, type=int), 1), 104)
+        product_id = request.args.get("product_id", type=int)
+        category = request.args.get("category")
+
+        from heatmap import WEEKDAYS, compute_partials, heatmap, merge_partials
+
+        # Whole weeks of closed days, ending with the last closed day
+        today = date.today()
+        closed_days, _ = split_days(today - timedelta(days=7 * weeks + 1), today)
+        closed_days = closed_days[-7 * weeks :]
+        with shards.reader(store_id) as conn:
+            partials = day_partials.closed_partials(
+                "heatmap",
+                closed_days,
+                lambda days: compute_partials(conn, days, store_id),
+                store_id,
+            )
+            product_ids = None
+            if product_id is not None or category:
+                sql = "SELECT product_id, category FROM products WHERE "
+                if product_id is not None:
+                    sql += "product_id = :pid"
+                else:
+                    sql += "category = :category"
+                products = conn.execute(
+                    text(sql), {"pid": product_id, "category": category}
+                ).all()
+                if not products:
+                    return jsonify({"error": "No matching products"}), 404
+                product_ids = [pid for pid, _ in products]
+                category = category or products[0][1]
+
+        grids = merge_partials(closed_days, partials, product_ids)
+        # Little's law needs the time a drink spends in the making
+        prep_seconds = baristas.model.base_seconds(category, "normal")
+        return jsonify(
+            {
+                "start_date": closed_days[0].isoformat(),
+                "end_date": closed_days[-1].isoformat(),
+                "weeks": weeks,
+                "product_id": product_id,
+                "category": category,
+                "weekdays": WEEKDAYS,
+                "prep_seconds": round(prep_seconds, 1),
+                **heatmap(grids, prep_seconds),
+            }
+        )
 
-        if not user:
-            return jsonify({"orders": []}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        user_id = user[0]
 
-        # Get last 5 orders with items and modifications
-        orders = db.session.execute(
-            text(
-                """
-                SELECT 
-                    o.order_id,
-                    o.order_date,
-                    o.total_amount,
-                    json_agg(
-                        json_build_object(
-                            'product_id', oi.product_id,
-                            'product_name', p.product_name,
-                            'quantity', oi.quantity,
-                            'unit_price', oi.unit_price_at_sale,
-                            'sugar_level', oi.sugar_level,
-                            'ice_level', oi.ice_level,
-                            'size_level', oi.size_level,
-                            'modifications', COALESCE(
-                                (SELECT json_agg(
-                                    json_build_object(
-                                        'ingredient_id', m.ingredient_id,
-                                        'ingredient_name', inv.ingredient_name,
-                                        'modification_type', m.modification_type,
-                                        'price_change', m.price_change
-                                    )
+@api.route("/api/reports/margins", methods=["GET"])
+@api.route("/api/stores/<int:store_id>/reports/margins", methods=["GET"])
+@statement_timeout("report")
+@admission_class("report")
+def get_margins_report(store_id=None):
+    """Get cost per drink by size and gross margins, realised over a date range"""
+    try:
+        store_id = _store_id(store_id)
+        start_date = request.args.get("start_date")
+        end_date = request.args.get("end_date")
+        if bool(start_date) != bool(end_date):
+            return jsonify({"error": "start_date and end_date go together"}), 400
+
+        from costs import SIZES, compute_partials, merge_margins
+
+        with shards.reader(store_id) as conn:
+            product_ids, size_costs = costs.size_costs(conn, store_id)
+            prices = costs.ingredient_prices(conn, store_id)
+            products = {
+                r["product_id"]: r
+                for r in conn.execute(
+                    text(
+                        "SELECT product_id, product_name, category, unit_price, is_active "
+                        "FROM products"
+                    )
+                ).mappings()
+            }
+            realised = None
+            if start_date:
+                closed_days, live_days = split_days(start_date, end_date)
+                partials = day_partials.closed_partials(
+                    "margins",
+                    closed_days,
+                    lambda days: compute_partials(conn, days, store_id),
+                    store_id,
+                )
+                if live_days:
+                    partials.extend(compute_partials(conn, live_days, store_id).values())
+                realised = merge_margins(product_ids, size_costs, prices, partials)
+
+        menu = []
+        for i, pid in enumerate(product_ids):
+            product = products.get(pid)
+            if product is None or not product["is_active"]:
+                continue
+            price = float(product["unit_price"])
+            cost = {size: round(float(size_costs[i, k]), 2) for k, size in enumerate(SIZES)}
+            menu.append(
+                {
+                    "product_id": pid,
+                    "product_name": product["product_name"],
+                    "category": product["category"],
+                    "unit_price": price,
+                    "cost": cost,
+                    "margin": {size: round(price - c, 2) for size, c in cost.items()},
+                    "margin_pct": (
+                        round((price - cost["normal"]) / price * 100, 1) if price else None
+                    ),
+                }
+            )
+        menu.sort(key=lambda r: r["margin_pct"] or 0)
+
+        body = {"products": menu}
+        if realised is not None:
+            for row in realised:
+                row["product_name"] = products.get(row["product_id"], {}).get("product_name")
+            totals = {
+                key: round(sum(r[key] for r in realised), 2)
+                for key in ("revenue", "cogs", "gross_margin")
+            }
+            totals["margin_pct"] = (
+                round(totals["gross_margin"] / totals["revenue"] * 100, 1)
+                if totals["revenue"]
+                else None
+            )
+            body.update({"realised": realised, "totals": totals})
+        return jsonify(body)
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def _usual_cart_line(config, products, add_ons, quantity=None):
+    """Order line for a usual, priced from the current menu, or ``None`` if retired."""
+    product = products.get(config["product_id"])
+    if product is None:
+        return None
+    modifications = []
+    for ingredient_id, mod_type in config["modifications"]:
+        add_on = add_ons.get(ingredient_id)
+        charged = mod_type in ("ADD", "EXTRA")
+        if charged and add_on is None:
+            return None
+        modifications.append(
+            {
+                "ingredient_id": ingredient_id,
+                "ingredient_name": add_on["ingredient_name"] if add_on else None,
+                "modification_type": mod_type,
+                "price_per_unit": add_on["price_per_unit"] if charged else 0.0,
+            }
+        )
+    unit_price = Decimal(str(product["unit_price"])) + sum(
+        Decimal(str(m["price_per_unit"])) for m in modifications
+    )
+    return {
+        "key": config_key(config),
+        "product_id": product["product_id"],
+        "product_name": product["product_name"],
+        "quantity": int(quantity or config.get("quantity") or 1),
+        "unit_price_at_sale": float(unit_price),
+        "size_level": config["size_level"],
+        "sugar_level": config["sugar_level"],
+        "ice_level": config["ice_level"],
+        "modifications": modifications,
+    }
+
+
+def _menu():
+    menu = catalog.get(db.session)
+    products = {p["product_id"]: p for p in menu["products"]}
+    add_ons = {m["ingredient_id"]: m for m in menu["modifications"]}
+    return products, add_ons
+
+
+@api.route("/api/users/<clerk_id>/suggestions", methods=["GET"])
+def get_user_suggestions(clerk_id):
+    """A customer's usual drinks and the products they order together"""
+    try:
+        store_id = _store_id()
+        with shards.reader(store_id, pin_key=clerk_id) as conn:
+            user_id, found = usuals.get(conn, clerk_id)
+        if user_id is None:
+            return jsonify({"error": "User not found"}), 404
+        if found is None:
+            return jsonify({"order_count": 0, "usuals": [], "pairs": []}), 200
+
+        products, add_ons = _menu()
+        session = shards.session(store_id)
+        suggestions = []
+        for config in found["configs"]:
+            line = _usual_cart_line(config, products, add_ons)
+            if line is None:
+                continue
+            line.update(
+                times_ordered=config["count"],
+                last_ordered=config["last"],
+                score=config["score"],
+                available=not availability.check(session, [line], store_id),
+            )
+            suggestions.append(line)
+        pairs = [
+            {
+                "product_ids": [p["a"], p["b"]],
+                "product_names": [products[p["a"]]["product_name"], products[p["b"]]["product_name"]],
+                "times_ordered": p["count"],
+                "score": p["score"],
+            }
+            for p in found["pairs"]
+            if p["a"] in products and p["b"] in products
+        ]
+        return jsonify(
+            {"order_count": found["order_count"], "usuals": suggestions, "pairs": pairs}
+        )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@api.route("/api/users/<clerk_id>/reorder", methods=["POST"])
+def reorder_usual(clerk_id):
+    """Build a validated cart from usuals: body ``{"keys": [...], "quantity": n}``.
+
+    Without ``keys`` the top usual is used. The cart is returned ready to post
+    to ``/api/postOrder``; nothing is ordered here.
+    """
+    body = request.get_json(silent=True) or {}
+    keys = body.get("keys") or ([body["key"]] if body.get("key") else None)
+    try:
+        store_id = _store_id()
+        with shards.reader(store_id, pin_key=clerk_id) as conn:
+            user_id, found = usuals.get(conn, clerk_id)
+        if user_id is None:
+            return jsonify({"error": "User not found"}), 404
+        configs = {config_key(c): c for c in (found or {}).get("configs", [])}
+        if keys is None:
+            keys = list(configs)[:1]
+        if not keys:
+            return jsonify({"error": "No usuals yet"}), 404
+        unknown = [k for k in keys if k not in configs]
+        if unknown:
+            return jsonify({"error": "Unknown usual", "keys": unknown}), 400
+
+        products, add_ons = _menu()
+        items = []
+        for key in keys:
+            line = _usual_cart_line(configs[key], products, add_ons, body.get("quantity"))
+            if line is None:
+                return (
+                    jsonify({"error": "No longer on the menu", "key": key}),
+                    409,
+                )
+            items.append(line)
+        short = availability.check(shards.session(store_id), items, store_id)
+        if short:
+            return jsonify({"error": "Some items are sold out", "unavailable": short}), 409
+
+        total = sum(Decimal(str(i["unit_price_at_sale"])) * i["quantity"] for i in items)
+        return jsonify(
+            {
+                "clerk_user_id": clerk_id,
+                "store_id": store_id,
+                "items": items,
+                "total_amount": float(total),
+            }
+        )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def _recent_user_orders(conn, clerk_user_id):
+    """Last 5 orders of a customer on one shard, with items and modifications."""
+    user = conn.execute(
+        text("SELECT user_id FROM users WHERE clerk_user_id = :clerk_id"),
+        {"clerk_id": clerk_user_id},
+    ).first()
+    if not user:
+        return []
+    return conn.execute(
+        text(
+            """
+            SELECT 
+                o.order_id,
+                o.order_date,
+                o.total_amount,
+                json_agg(
+                    json_build_object(
+                        'product_id', oi.product_id,
+                        'product_name', p.product_name,
+                        'quantity', oi.quantity,
+                        'unit_price', oi.unit_price_at_sale,
+                        'sugar_level', oi.sugar_level,
+                        'ice_level', oi.ice_level,
+                        'size_level', oi.size_level,
+                        'modifications', COALESCE(
+                            (SELECT json_agg(
+                                json_build_object(
+                                    'ingredient_id', m.ingredient_id,
+                                    'ingredient_name', inv.ingredient_name,
+                                    'modification_type', m.modification_type,
+                                    'price_change', m.price_change
                                 )
-                                FROM modifications m
-                                JOIN inventory inv ON m.ingredient_id = inv.ingredient_id
-                                WHERE m.order_item_id = oi.order_item_id),
-                                '[]'::json
                             )
+                            FROM modifications m
+                            JOIN inventory inv ON m.ingredient_id = inv.ingredient_id
+                                AND inv.store_id = o.store_id
+                            WHERE m.order_item_id = oi.order_item_id),
+                            '[]'::json
                         )
-                    ) as items
-                FROM orders o
-                JOIN order_items oi ON o.order_id = oi.order_id
-                JOIN products p ON oi.product_id = p.product_id
-                WHERE o.user_id = :user_id
-                GROUP BY o.order_id, o.order_date, o.total_amount
-                ORDER BY o.order_date DESC
-                LIMIT 5
-            """
-            ),
-            {"user_id": user_id},
-        ).fetchall()
+                    )
+                ) as items
+            FROM orders o
+            JOIN order_items oi ON o.order_id = oi.order_id
+            JOIN products p ON oi.product_id = p.product_id
+            WHERE o.user_id = :user_id
+            GROUP BY o.order_id, o.order_date, o.total_amount
+            ORDER BY o.order_date DESC
+            LIMIT 5
+        """
+        ),
+        {"user_id": user[0]},
+    ).fetchall()
+
+
+@api.route("/api/getUserOrders", methods=["POST"])
+def get_user_orders():
+    data = request.get_json()
+    clerk_user_id = data.get("clerk_user_id")
+
+    if not clerk_user_id:
+        return jsonify({"error": "clerk_user_id required"}), 400
+
+    try:
+        # A customer may have ordered at stores on different shards. Read from
+        # the primary right after this customer's own order.
+        orders = []
+        for store_ids in shards.stores_by_shard().values():
+            with shards.reader(store_ids[0], pin_key=clerk_user_id) as conn:
+                orders.extend(_recent_user_orders(conn, clerk_user_id))
+        orders.sort(key=lambda row: row[1], reverse=True)
+        orders = orders[:5]
 
         orders_list = [
             {
@@ -1243,5 +2191,117 @@ def get_user_orders():
         return jsonify({"error": str(e)}), 500
 
 
+def _forecast_model(store_id):
+    # NumPy is only imported by workers that actually serve a forecast
+    models = current_app.extensions.setdefault("forecast_models", {})
+    model = models.get(store_id)
+    if model is None:
+        from forecast import ForecastModel
+
+        model = models.setdefault(
+            store_id,
+            ForecastModel(
+                history_days=current_app.config["FORECAST_HISTORY_DAYS"],
+                refresh_seconds=current_app.config["FORECAST_REFRESH_SECONDS"],
+                store_id=store_id,
+            ),
+        )
+    return model
+
+
+def _dispose_engines_after_fork(app_ref):
+    # Pooled connections inherited from a --preload parent belong to the
+    # parent's sockets; drop them without closing so the parent stays valid.
+    app = app_ref()
+    if app is None:
+        return
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+def warm_up(app):
+    """Pre-open pool connections and prime the catalog cache and order books."""
+    with app.app_context():
+        conns = []
+        try:
+            for _ in range(app.config.get("WARM_UP_CONNECTIONS", 2)):
+                conn = db.engine.connect()
+                conn.execute(text("SELECT 1"))
+                conns.append(conn)
+        finally:
+            for conn in conns:
+                conn.close()
+        catalog.get(db.session)
+        if order_book.enabled:
+            for store_ids in shards.stores_by_shard().values():
+                for store_id in store_ids:
+                    order_book.x_report(store_id)
+        db.session.remove()
+
+
+def create_app(config=None):
+    """Build the Flask app.
+
+    ``config`` is a dict applied over the environment-derived settings from
+    ``config.load_config``, e.g. ``{"SQLALCHEMY_DATABASE_URI": ...}`` to run
+    against another database. Engines are created here but no connection is
+    opened unless ``WARM_UP`` is set.
+    """
+    app = Flask(__name__)
+    app.config.update(load_config())
+    if config:
+        app.config.update(config)
+    if "SQLALCHEMY_ENGINE_OPTIONS" not in app.config:
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config)
+    if shard_binds(app.config):
+        app.config["SQLALCHEMY_BINDS"] = {
+            **(app.config.get("SQLALCHEMY_BINDS") or {}),
+            **shard_binds(app.config),
+        }
+
+    # First, so requests turned away by later hooks still get an id and a log line
+    logs.init_app(app)
+    capture.init_app(app)
+    CORS(app)
+    db.init_app(app)
+    replicas.init_app(app)
+    shards.init_app(app)
+    catalog.init_app(app)
+    day_partials.init_app(app)
+    z_closer.init_app(app)
+    order_book.init_app(app)
+    timeouts.init_app(app)
+    pool_health.init_app(app)
+    admission.init_app(app)
+    baristas.init_app(app)
+    costs.init_app(app)
+    search_index.init_app(app)
+    availability.init_app(app)
+    usuals.init_app(app)
+    responses.init_app(app)
+    app.register_blueprint(api)
+
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(
+            after_in_child=lambda ref=weakref.ref(app): _dispose_engines_after_fork(
+                ref
+            )
+        )
+
+    if app.config.get("WARM_UP"):
+        warm_up(app)
+
+    return app
+
+
+def __getattr__(name):
+    # ``gunicorn app:app`` keeps working; the app is only built when asked for.
+    if name == "app":
+        globals()["app"] = create_app()
+        return globals()["app"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 if __name__ == "__main__":
-    app.run(debug=True)
+    create_app().run(debug=True)
@@ -0,0 +1,218 @@
+"""Nightly export of closed days to a Parquet archive.
+
+Each closed day of a store is written once per dataset as one zstd-compressed
+Parquet file under a Hive-style layout::
+
+    <ARCHIVE_DIR>/<dataset>/store_id=<id>/day=<YYYY-MM-DD>/part-0.parquet
+
+The datasets are ``orders``, ``order_items`` (with product name and
+category), ``modifications`` (with ingredient name) and ``ingredient_usage``:
+one row per order line and recipe ingredient, from the recipe in force
+when the day was exported. Names are frozen as of the export too, so the
+archive answers "what did we sell" without the live catalog.
+
+``store_id`` and ``day`` live in the directory names only, so a date-range
+query opens just the matching files (see archive_query.py). A day is written
+to a temporary file and renamed into place, so readers never see half a file
+and a re-export replaces a day whole. Days are read a month at a time, in
+one query per dataset.
+"""
+
+import os
+from datetime import datetime, timedelta
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import text
+
+from models import DEFAULT_STORE_ID
+from report_cache import day_span, split_days
+
+# ``orders`` goes last: a day counts as archived once its orders file exists
+DATASETS = ("order_items", "modifications", "ingredient_usage", "orders")
+COMPRESSION = "zstd"
+DAYS_PER_QUERY = 31
+
+MONEY = pa.decimal128(10, 2)
+QUANTITY = pa.decimal128(10, 1)
+
+SCHEMAS = {
+    "orders": pa.schema(
+        [
+            ("order_id", pa.int64()),
+            ("order_date", pa.timestamp("us")),
+            ("total_amount", MONEY),
+            ("employee_id", pa.int32()),
+            ("user_id", pa.int32()),
+        ]
+    ),
+    "order_items": pa.schema(
+        [
+            ("order_item_id", pa.int64()),
+            ("order_id", pa.int64()),
+            ("order_date", pa.timestamp("us")),
+            ("product_id", pa.int32()),
+            ("product_name", pa.string()),
+            ("category", pa.string()),
+            ("quantity", pa.int32()),
+            ("unit_price_at_sale", MONEY),
+            ("size_level", pa.string()),
+            ("sugar_level", pa.string()),
+            ("ice_level", pa.string()),
+        ]
+    ),
+    "modifications": pa.schema(
+        [
+            ("modification_id", pa.int64()),
+            ("order_item_id", pa.int64()),
+            ("order_id", pa.int64()),
+            ("product_id", pa.int32()),
+            ("ingredient_id", pa.int32()),
+            ("ingredient_name", pa.string()),
+            ("modification_type", pa.string()),
+            ("quantity_change", QUANTITY),
+            ("price_change", MONEY),
+        ]
+    ),
+    "ingredient_usage": pa.schema(
+        [
+            ("order_item_id", pa.int64()),
+            ("order_id", pa.int64()),
+            ("order_date", pa.timestamp("us")),
+            ("ingredient_id", pa.int32()),
+            ("ingredient_name", pa.string()),
+            ("quantity_used", QUANTITY),
+        ]
+    ),
+}
+
+# Every query returns the day first, then the dataset's columns in order
+EXPORT_SQL = {
+    "orders": """
+        SELECT DATE(o.order_date), o.order_id, o.order_date, o.total_amount,
+               o.employee_id, o.user_id
+        FROM orders o
+        WHERE o.store_id = :store_id
+          AND o.order_date >= :since AND o.order_date < :until
+        ORDER BY o.order_date, o.order_id
+    """,
+    "order_items": """
+        SELECT DATE(o.order_date), oi.order_item_id, oi.order_id, o.order_date,
+               oi.product_id, p.product_name, p.category, oi.quantity,
+               oi.unit_price_at_sale, CAST(oi.size_level AS TEXT),
+               CAST(oi.sugar_level AS TEXT), CAST(oi.ice_level AS TEXT)
+        FROM orders o
+        JOIN order_items oi ON oi.order_id = o.order_id
+        LEFT JOIN products p ON p.product_id = oi.product_id
+        WHERE o.store_id = :store_id
+          AND o.order_date >= :since AND o.order_date < :until
+        ORDER BY o.order_date, oi.order_item_id
+    """,
+    "modifications": """
+        SELECT DATE(o.order_date), m.modification_id, m.order_item_id, o.order_id,
+               oi.product_id, m.ingredient_id, inv.ingredient_name,
+               CAST(m.modification_type AS TEXT), m.quantity_change, m.price_change
+        FROM orders o
+        JOIN order_items oi ON oi.order_id = o.order_id
+        JOIN modifications m ON m.order_item_id = oi.order_item_id
+        LEFT JOIN inventory inv
+               ON inv.ingredient_id = m.ingredient_id AND inv.store_id = o.store_id
+        WHERE o.store_id = :store_id
+          AND o.order_date >= :since AND o.order_date < :until
+        ORDER BY o.order_date, m.modification_id
+    """,
+    "ingredient_usage": """
+        SELECT DATE(o.order_date), oi.order_item_id, oi.order_id, o.order_date,
+               pr.ingredient_id, inv.ingredient_name,
+               oi.quantity * pr.quantity_per_unit
+        FROM orders o
+        JOIN order_items oi ON oi.order_id = o.order_id
+        JOIN product_recipe pr ON pr.product_id = oi.product_id
+        LEFT JOIN inventory inv
+               ON inv.ingredient_id = pr.ingredient_id AND inv.store_id = o.store_id
+        WHERE o.store_id = :store_id
+          AND o.order_date >= :since AND o.order_date < :until
+        ORDER BY o.order_date, oi.order_item_id, pr.ingredient_id
+    """,
+}
+
+
+def day_dir(root, dataset, store_id, day):
+    return os.path.join(root, dataset, f"store_id={store_id}", f"day={day.isoformat()}")
+
+
+def archived_days(root, store_id, dataset="orders"):
+    """Days of ``store_id`` already in the archive."""
+    base = os.path.join(root, dataset, f"store_id={store_id}")
+    if not os.path.isdir(base):
+        return set()
+    return {
+        datetime.strptime(name[len("day=") :], "%Y-%m-%d").date()
+        for name in os.listdir(base)
+        if name.startswith("day=")
+        and os.path.exists(os.path.join(base, name, "part-0.parquet"))
+    }
+
+
+def _write_day(root, dataset, store_id, day, rows):
+    schema = SCHEMAS[dataset]
+    columns = list(zip(*rows)) if rows else [()] * len(schema)
+    table = pa.Table.from_arrays(
+        [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+        schema=schema,
+    )
+    target = day_dir(root, dataset, store_id, day)
+    os.makedirs(target, exist_ok=True)
+    path = os.path.join(target, "part-0.parquet")
+    tmp = path + ".tmp"
+    pq.write_table(table, tmp, compression=COMPRESSION)
+    os.replace(tmp, path)
+
+
+def export_days(conn, root, days, store_id=DEFAULT_STORE_ID):
+    """Write every dataset of ``days`` for one store; returns the rows written."""
+    written = dict.fromkeys(DATASETS, 0)
+    days = sorted(days)
+    for i in range(0, len(days), DAYS_PER_QUERY):
+        chunk = days[i : i + DAYS_PER_QUERY]
+        since, until = day_span(chunk)
+        params = {"since": since, "until": until, "store_id": store_id}
+        for dataset in DATASETS:
+            by_day = {day: [] for day in chunk}
+            for row in conn.execute(text(EXPORT_SQL[dataset]), params):
+                if row[0] in by_day:
+                    by_day[row[0]].append(tuple(row)[1:])
+            for day, rows in by_day.items():
+                _write_day(root, dataset, store_id, day, rows)
+                written[dataset] += len(rows)
+    return written
+
+
+def pending_days(conn, root, since=None, now=None, stores=None, force=False):
+    """``{store_id: [day, ...]}`` of closed days with orders not archived yet.
+
+    Only ``stores`` are considered when given. With ``force`` days already
+    in the archive are included again.
+    """
+    first = conn.execute(text("SELECT MIN(order_date) FROM orders")).scalar()
+    if first is None:
+        return {}
+    start = max(first.date(), since) if since else first.date()
+    now = now or datetime.now()
+    closed, _ = split_days(start, now.date(), now=now)
+    if not closed:
+        return {}
+    pending = {}
+    for store_id, day in conn.execute(
+        text(
+            "SELECT DISTINCT store_id, DATE(order_date) FROM orders "
+            "WHERE order_date >= :since AND order_date < :until"
+        ),
+        {"since": closed[0], "until": closed[-1] + timedelta(days=1)},
+    ):
+        if stores is None or store_id in stores:
+            pending.setdefault(store_id, []).append(day)
+    for store_id, days in pending.items():
+        done = set() if force else archived_days(root, store_id)
+        pending[store_id] = sorted(day for day in days if day not in done)
+    return {store_id: days for store_id, days in pending.items() if days}
@@ -0,0 +1,256 @@
+"""Offline reports over the Parquet archive written by archive.py.
+
+Nothing here connects to Postgres or imports the app. Every query opens the
+dataset with its ``store_id``/``day`` Hive partitioning and filters on both,
+so only the files of the requested days are read, and only the columns a
+report needs. The aggregation runs as vectorised Arrow group-bys.
+
+The reports mirror the live ones:
+
+* ``sales_by_product``: the sales report rows (``/api/reports/sales``)
+* ``usage_by_ingredient``: the usage chart, without current stock
+* ``hourly``: totals and per-day means for each hour of the day
+* ``trend``: orders, drinks and revenue per month or year, with the change
+  against the same days a year earlier (read even when they fall before
+  ``start``)
+
+It also runs from the command line::
+
+    python archive_query.py sales 2024-01-01 2024-12-31 --store 1
+    python archive_query.py trend 2023-01-01 2025-12-31 --period month
+"""
+
+import argparse
+import json
+import os
+from datetime import date, datetime
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+DEFAULT_ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive")
+
+PARTITIONING = ds.partitioning(
+    pa.schema([("store_id", pa.int32()), ("day", pa.date32())]), flavor="hive"
+)
+
+
+def _day(value):
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def scan(root, dataset, start, end, store_id=None, columns=None):
+    """Rows of ``dataset`` for the inclusive day range as an Arrow table."""
+    path = os.path.join(root, dataset)
+    if not os.path.isdir(path):
+        return None
+    predicate = (ds.field("day") >= _day(start)) & (ds.field("day") <= _day(end))
+    if store_id is not None:
+        predicate &= ds.field("store_id") == int(store_id)
+    return ds.dataset(path, format="parquet", partitioning=PARTITIONING).to_table(
+        columns=columns, filter=predicate
+    )
+
+
+def _year_earlier(day):
+    try:
+        return day.replace(year=day.year - 1)
+    except ValueError:
+        # 29 February
+        return day.replace(year=day.year - 1, day=28)
+
+
+def _revenue(table):
+    quantity = pc.cast(table["quantity"], pa.decimal128(10, 0))
+    return pc.multiply(quantity, table["unit_price_at_sale"])
+
+
+def sales_by_product(root, start, end, store_id=None):
+    """``[{product_id, product_name, qty, revenue}]`` by revenue descending."""
+    items = scan(
+        root,
+        "order_items",
+        start,
+        end,
+        store_id,
+        ["product_id", "product_name", "quantity", "unit_price_at_sale"],
+    )
+    if items is None or items.num_rows == 0:
+        return []
+    items = items.append_column("revenue", _revenue(items))
+    # Names are as of each day's export; a renamed product shows its last name
+    grouped = items.group_by("product_id").aggregate(
+        [("product_name", "max"), ("quantity", "sum"), ("revenue", "sum")]
+    )
+    rows = [
+        {
+            "product_id": r["product_id"],
+            "product_name": r["product_name_max"],
+            "qty": int(r["quantity_sum"]),
+            "revenue": float(r["revenue_sum"]),
+        }
+        for r in grouped.to_pylist()
+    ]
+    rows.sort(key=lambda r: r["revenue"], reverse=True)
+    return rows
+
+
+def usage_by_ingredient(root, start, end, store_id=None):
+    """``[{ingredient_id, ingredient_name, total_used, orders_count}]``."""
+    usage = scan(
+        root,
+        "ingredient_usage",
+        start,
+        end,
+        store_id,
+        ["ingredient_id", "ingredient_name", "store_id", "order_id", "quantity_used"],
+    )
+    if usage is None or usage.num_rows == 0:
+        return []
+    grouped = usage.group_by("ingredient_id").aggregate(
+        [("ingredient_name", "max"), ("quantity_used", "sum")]
+    )
+    # Order ids are only unique within a shard, so an order is (store, id)
+    orders = (
+        usage.group_by(["ingredient_id", "store_id", "order_id"])
+        .aggregate([])
+        .group_by("ingredient_id")
+        .aggregate([("order_id", "count")])
+    )
+    orders_count = dict(
+        zip(orders["ingredient_id"].to_pylist(), orders["order_id_count"].to_pylist())
+    )
+    rows = [
+        {
+            "ingredient_id": r["ingredient_id"],
+            "ingredient_name": r["ingredient_name_max"],
+            "total_used": float(r["quantity_used_sum"]),
+            "orders_count": orders_count[r["ingredient_id"]],
+        }
+        for r in grouped.to_pylist()
+    ]
+    rows.sort(key=lambda r: r["total_used"], reverse=True)
+    return rows
+
+
+def _by_hour(table, value, aggregate):
+    table = table.append_column("hour", pc.hour(table["order_date"]))
+    grouped = table.group_by("hour").aggregate([(value, aggregate)])
+    return dict(zip(grouped["hour"].to_pylist(), grouped[f"{value}_{aggregate}"].to_pylist()))
+
+
+def hourly(root, start, end, store_id=None):
+    """Orders, drinks and revenue per hour of day, in total and per day open."""
+    orders = scan(root, "orders", start, end, store_id, ["order_date", "total_amount", "day"])
+    if orders is None or orders.num_rows == 0:
+        return []
+    items = scan(root, "order_items", start, end, store_id, ["order_date", "quantity"])
+    days = len(pc.unique(orders["day"]))
+    counts = _by_hour(orders, "total_amount", "count")
+    revenue = _by_hour(orders, "total_amount", "sum")
+    drinks = _by_hour(items, "quantity", "sum") if items is not None else {}
+    rows = []
+    for hour in sorted(counts):
+        rows.append(
+            {
+                "hour": hour,
+                "orders": counts[hour],
+                "drinks": int(drinks.get(hour) or 0),
+                "revenue": float(revenue[hour]),
+                "avg_orders": round(counts[hour] / days, 2),
+                "avg_revenue": round(float(revenue[hour]) / days, 2),
+            }
+        )
+    return rows
+
+
+def trend(root, start, end, store_id=None, period="month"):
+    """Orders, drinks and revenue per period, with year-over-year change."""
+    if period not in ("month", "year"):
+        raise ValueError("period must be 'month' or 'year'")
+    fmt = "%Y-%m" if period == "month" else "%Y"
+    start, end = _day(start), _day(end)
+    last_start, last_end = _year_earlier(start), _year_earlier(end)
+    scanned = scan(
+        root, "orders", last_start, end, store_id, ["order_date", "total_amount", "day"]
+    )
+    if scanned is None:
+        return []
+
+    def between(first, last):
+        day = scanned["day"]
+        return scanned.filter(
+            pc.and_(pc.greater_equal(day, first), pc.less_equal(day, last))
+        )
+
+    # A range longer than a year reads some days as both
+    orders = between(start, end)
+    if orders.num_rows == 0:
+        return []
+    items = scan(root, "order_items", start, end, store_id, ["order_date", "quantity"])
+
+    def per_period(table, value, aggregate):
+        table = table.append_column("period", pc.strftime(table["order_date"], format=fmt))
+        grouped = table.group_by("period").aggregate([(value, aggregate)])
+        return dict(
+            zip(grouped["period"].to_pylist(), grouped[f"{value}_{aggregate}"].to_pylist())
+        )
+
+    counts = per_period(orders, "total_amount", "count")
+    revenue = per_period(orders, "total_amount", "sum")
+    drinks = per_period(items, "quantity", "sum") if items is not None else {}
+    # Keyed by the period they are compared with
+    last_year = {}
+    for key, value in per_period(
+        between(last_start, last_end), "total_amount", "sum"
+    ).items():
+        year, _, month = key.partition("-")
+        last_year[f"{int(year) + 1}" + (f"-{month}" if month else "")] = value
+    rows = []
+    for key in sorted(counts):
+        row = {
+            "period": key,
+            "orders": counts[key],
+            "drinks": int(drinks.get(key) or 0),
+            "revenue": float(revenue[key]),
+            "revenue_last_year": None,
+            "revenue_change_pct": None,
+        }
+        if key in last_year:
+            last = float(last_year[key])
+            row["revenue_last_year"] = last
+            if last:
+                row["revenue_change_pct"] = round((row["revenue"] - last) / last * 100, 1)
+        rows.append(row)
+    return rows
+
+
+REPORTS = {
+    "sales": sales_by_product,
+    "usage": usage_by_ingredient,
+    "hourly": hourly,
+    "trend": trend,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("report", choices=sorted(REPORTS))
+    parser.add_argument("start", help="First day (YYYY-MM-DD)")
+    parser.add_argument("end", help="Last day (YYYY-MM-DD), inclusive")
+    parser.add_argument("--store", type=int, help="One store (default: all)")
+    parser.add_argument("--period", choices=("month", "year"), default="month")
+    parser.add_argument(
+        "--dir", default=os.getenv("ARCHIVE_DIR") or DEFAULT_ARCHIVE_DIR
+    )
+    args = parser.parse_args()
+    kwargs = {"period": args.period} if args.report == "trend" else {}
+    rows = REPORTS[args.report](args.dir, args.start, args.end, args.store, **kwargs)
+    print(json.dumps(rows, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+"""ASGI service for the endpoints that mostly wait on other servers.
+
+The Google sign-in callback makes two HTTPS calls and a receipt one call to
+SendGrid. On a sync gunicorn worker each of them holds the whole worker
+until the remote side answers, so a few slow logins can use up the pool.
+Here every process runs one event loop and keeps thousands of such calls in
+flight:
+
+* ``GET /api/oauth2/callback``: the Flask view's flow (google_oauth.py) on
+  aiohttp, with the user lookup on an async SQLAlchemy engine over psycopg 3.
+  It sets the same signed session cookie the Flask app reads.
+* ``POST /internal/receipts``: a receipt signed by ``send_order_receipt``
+  (receipts.py), answered ``202`` once queued and then sent to SendGrid in
+  the background.
+* ``GET /internal/health``
+
+Run it beside the Flask app with a fixed number of processes, have the
+proxy send ``/api/oauth2/callback`` here, and point the Flask workers'
+``RECEIPT_SERVICE_URL`` at it::
+
+    uvicorn async_app:app --port 8001 --workers 2
+
+Each process shares one aiohttp session, pooling up to
+``ASYNC_HTTP_MAX_CONNECTIONS`` connections with ``EXTERNAL_HTTP_TIMEOUT`` per
+call, and ``ASYNC_DB_POOL_SIZE`` database connections,
+waited on for up to ``ASYNC_DB_POOL_TIMEOUT``. Both are opened at lifespan
+startup, inside the worker's own loop.
+"""
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import namedtuple
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+
+import aiohttp
+from flask import Flask
+from itsdangerous import BadSignature
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from werkzeug.http import dump_cookie
+
+from config import load_config
+from google_oauth import (
+    CREATE_USER_SQL,
+    FIND_USER_SQL,
+    new_user_params,
+    session_fields,
+    token_form,
+)
+from receipts import load_receipt, mail_payload
+from request_log import LogPipeline
+
+log = logging.getLogger(__name__)
+
+# Receipts queued but not yet sent; past this the service answers 503
+MAX_PENDING_RECEIPTS = 10000
+
+Request = namedtuple("Request", "method path args headers body request_id")
+
+
+def _json(status, data):
+    return status, [("content-type", "application/json")], json.dumps(data).encode()
+
+
+def _text(status, message):
+    return status, [("content-type", "text/plain; charset=utf-8")], message.encode()
+
+
+class AsyncService:
+    def __init__(self, config=None):
+        # Flask only lends its config, session cookie format and log setup
+        self.flask = Flask(__name__)
+        self.flask.config.update(load_config())
+        if config:
+            self.flask.config.update(config)
+        self.config = self.flask.config
+        self.logs = LogPipeline()
+        self.logs.init_app(self.flask)
+        self.http = None
+        self.engine = None
+        self._sending = set()
+        self.routes = {
+            ("GET", "/api/oauth2/callback"): self.oauth_callback,
+            ("POST", "/internal/receipts"): self.queue_receipt,
+            ("GET", "/internal/health"): self.health,
+        }
+
+    async def startup(self):
+        config = self.config
+        limit = int(config.get("ASYNC_HTTP_MAX_CONNECTIONS", 1000))
+        timeout = float(config.get("EXTERNAL_HTTP_TIMEOUT", 10.0))
+        self.http = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=limit, limit_per_host=limit),
+            timeout=aiohttp.ClientTimeout(total=timeout),
+        )
+        url = make_url(config["SQLALCHEMY_DATABASE_URI"]).set(
+            drivername="postgresql+psycopg"
+        )
+        self.engine = create_async_engine(
+            url,
+            pool_size=int(config.get("ASYNC_DB_POOL_SIZE", 5)),
+            max_overflow=0,
+            pool_timeout=float(config.get("ASYNC_DB_POOL_TIMEOUT", 10.0)),
+            pool_pre_ping=bool(config.get("DB_POOL_PRE_PING", True)),
+            connect_args={
+                "prepare_threshold": (
+                    None
+                    if config.get("PGBOUNCER_MODE")
+                    else config.get("DB_PREPARE_THRESHOLD", 1)
+                )
+            },
+        )
+
+    async def shutdown(self):
+        # Receipts already accepted still go out
+        if self._sending:
+            await asyncio.wait(list(self._sending), timeout=self.http.timeout.total)
+        await self.http.close()
+        await self.engine.dispose()
+        self.logs.stop()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        started = time.perf_counter()
+        headers = {
+            k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]
+        }
+        request_id = headers.get("x-request-id") or uuid.uuid4().hex
+        handler = self.routes.get((scope["method"], scope["path"]))
+        if handler is None:
+            status, out_headers, body = _json(404, {"error": "not found"})
+        else:
+            body = b""
+            while True:
+                message = await receive()
+                body += message.get("body", b"")
+                if not message.get("more_body"):
+                    break
+            args = {
+                k: v[0]
+                for k, v in parse_qs(scope["query_string"].decode("latin-1")).items()
+            }
+            status, out_headers, body = await handler(
+                Request(scope["method"], scope["path"], args, headers, body, request_id)
+            )
+        out_headers = out_headers + [
+            ("content-length", str(len(body))),
+            ("x-request-id", request_id),
+        ]
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [(k.encode("latin-1"), v.encode("latin-1")) for k, v in out_headers],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+        logging.getLogger("request").info(
+            "%s %s %s",
+            scope["method"],
+            scope["path"],
+            status,
+            extra={
+                "event": "request",
+                "request_id": request_id,
+                "method": scope["method"],
+                "route": scope["path"],
+                "status": status,
+                "duration_ms": round((time.perf_counter() - started) * 1000.0, 2),
+            },
+        )
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await self.startup()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def _load_session(self, request):
+        interface = self.flask.session_interface
+        cookie = SimpleCookie(request.headers.get("cookie", "")).get(
+            interface.get_cookie_name(self.flask)
+        )
+        if cookie is None:
+            return {}
+        max_age = int(self.flask.permanent_session_lifetime.total_seconds())
+        try:
+            return dict(
+                interface.get_signing_serializer(self.flask).loads(
+                    cookie.value, max_age=max_age
+                )
+            )
+        except BadSignature:
+            return {}
+
+    def _session_cookie(self, session):
+        app, interface = self.flask, self.flask.session_interface
+        return dump_cookie(
+            interface.get_cookie_name(app),
+            interface.get_signing_serializer(app).dumps(session),
+            domain=interface.get_cookie_domain(app),
+            path=interface.get_cookie_path(app),
+            secure=interface.get_cookie_secure(app),
+            httponly=interface.get_cookie_httponly(app),
+            samesite=interface.get_cookie_samesite(app),
+            partitioned=interface.get_cookie_partitioned(app),
+        )
+
+    async def oauth_callback(self, request):
+        config = self.config
+        code = request.args.get("code")
+
+        try:
+            async with self.http.post(
+                config["GOOGLE_TOKEN_URL"], data=token_form(config, code)
+            ) as response:
+                token_res = await response.json(content_type=None)
+
+            access_token = token_res.get("access_token")
+            if not access_token:
+                return _text(400, "Failed to get access token")
+
+            async with self.http.get(
+                config["GOOGLE_USERINFO_URL"],
+                headers={"Authorization": f"Bearer {access_token}"},
+            ) as response:
+                userinfo = await response.json(content_type=None)
+
+            # A pooled connection is held for the lookup only, not the calls
+            async with self.engine.connect() as conn:
+                user = (
+                    await conn.execute(text(FIND_USER_SQL), {"sub": userinfo["sub"]})
+                ).first()
+                if not user:
+                    user = (
+                        await conn.execute(text(CREATE_USER_SQL), new_user_params(userinfo))
+                    ).first()
+                    await conn.commit()
+
+            session = self._load_session(request)
+            session.update(session_fields(user))
+            return (
+                302,
+                [
+                    ("location", config["FRONTEND_URL"]),
+                    ("set-cookie", self._session_cookie(session)),
+                ],
+                b"",
+            )
+
+        except Exception as e:
+            log.exception(
+                "OAuth callback failed",
+                extra={"event": "oauth.error", "request_id": request.request_id},
+            )
+            return _text(500, f"Authentication failed: {str(e)}")
+
+    async def queue_receipt(self, request):
+        receipt = load_receipt(self.config["SECRET_KEY"], request.body.decode("latin-1"))
+        if receipt is None:
+            return _json(403, {"error": "invalid or expired receipt"})
+        if len(self._sending) >= MAX_PENDING_RECEIPTS:
+            return _json(503, {"error": "too many receipts queued"})
+        task = asyncio.create_task(self._send_receipt(receipt))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+        return _json(202, {"queued": True})
+
+    async def _send_receipt(self, receipt):
+        order_id = receipt["order_id"]
+        try:
+            async with self.http.post(
+                self.config["SENDGRID_API_URL"],
+                json=mail_payload(
+                    self.config["SENDER_EMAIL"], receipt["to"], order_id, receipt["html"]
+                ),
+                headers={"Authorization": f"Bearer {self.config['SENDGRID_API_KEY']}"},
+            ) as response:
+                status = response.status
+            if status != 202:
+                log.warning(
+                    "SendGrid returned status %s",
+                    status,
+                    extra={"event": "receipt.status", "order_id": order_id},
+                )
+            log.info("Receipt sent", extra={"event": "receipt.sent", "order_id": order_id})
+        except Exception:
+            log.exception(
+                "SendGrid email failed", extra={"event": "receipt.error", "order_id": order_id}
+            )
+
+    async def health(self, request):
+        pool = self.engine.pool
+        return _json(
+            200,
+            {
+                "status": "ok",
+                "receipts_pending": len(self._sending),
+                "db_pool": {"size": pool.size(), "checked_out": pool.checkedout()},
+                "logging": self.logs.status(),
+            },
+        )
+
+
+app = AsyncService()
@@ -0,0 +1,248 @@
+"""Menu availability from live stock: how many of each drink can still be made.
+
+For every store the index keeps each ingredient's on-hand quantity and, per
+product, the number of drinks its recipe allows (the minimum of
+``stock / quantity_per_unit`` over the recipe). A size is further capped by
+the stock of its cup, which is looked up at read time. Add-ons are available
+while any stock is left.
+
+Stock writes in this worker feed their new quantities to ``apply``. Only the
+products whose recipe uses a changed ingredient are recomputed, found through
+a reverse ``ingredient -> products`` index, so an order touching five
+ingredients updates a handful of entries rather than re-scanning every
+recipe. Orders taken by other workers show up when the store's copy expires
+after ``AVAILABILITY_TTL_SECONDS``: the store's stock is read again, outside
+the lock, and folded in the same way, so only ingredients whose quantity
+differs are recomputed. This is a fast first check and not a reservation.
+``check`` validates an order against the index in O(items x recipe lines)
+without a query.
+
+Pass the store's session (``ShardRouter.session``): it only connects when
+the store's copy has to be loaded. A store's ``version`` changes only when a
+load, reload or applied write changes its stock or cups; the menu endpoints'
+ETags are built from it.
+"""
+
+import itertools
+import math
+import threading
+import time
+from collections import defaultdict
+
+from sqlalchemy import text
+
+from models import CUP_INGREDIENTS, DEFAULT_STORE_ID
+
+# Versions are unique across stores and reloads, so a reload never repeats one
+_versions = itertools.count(1)
+
+
+class _StoreStock:
+    __slots__ = ("recipes", "stock", "cups", "makeable", "loaded_at", "version")
+
+    def __init__(self, recipes, stock, cups):
+        # Recipes the counts were made with; kept if they are reloaded meanwhile
+        self.recipes = recipes
+        self.stock = stock
+        # Ingredient id of each size's cup, when the store stocks it
+        self.cups = cups
+        self.makeable = {}
+        self.loaded_at = time.monotonic()
+        self.version = next(_versions)
+
+
+class Availability:
+    def __init__(self, ttl_seconds=5.0):
+        self.ttl_seconds = ttl_seconds
+        self.enforce = True
+        self._lock = threading.Lock()
+        self._recipes = None
+        self._used_by = None
+        self._stores = {}
+
+    def init_app(self, app):
+        self.ttl_seconds = float(app.config.get("AVAILABILITY_TTL_SECONDS", 5))
+        self.enforce = bool(app.config.get("AVAILABILITY_ENFORCE", True))
+
+    @staticmethod
+    def _load_recipes(session):
+        recipes = defaultdict(list)
+        used_by = defaultdict(list)
+        for pid, iid, qty in session.execute(
+            text("SELECT product_id, ingredient_id, quantity_per_unit FROM product_recipe")
+        ):
+            if qty and qty > 0:
+                recipes[pid].append((iid, float(qty)))
+                used_by[iid].append(pid)
+        return dict(recipes), dict(used_by)
+
+    @staticmethod
+    def _load_stock(session, store_id):
+        stock, by_name = {}, {}
+        for iid, name, qty in session.execute(
+            text(
+                "SELECT ingredient_id, ingredient_name, on_hand_quantity "
+                "FROM inventory WHERE store_id = :store_id"
+            ),
+            {"store_id": store_id},
+        ):
+            stock[iid] = float(qty)
+            by_name[name] = iid
+        cups = {size: by_name.get(name) for size, name in CUP_INGREDIENTS.items()}
+        return stock, cups
+
+    @staticmethod
+    def _makeable(state, product_id):
+        return min(
+            max(0, math.floor(state.stock.get(iid, 0.0) / qty + 1e-9))
+            for iid, qty in state.recipes[product_id]
+        )
+
+    def _update(self, state, quantities):
+        """Fold new quantities (None: row gone) into ``state``; True if any differ."""
+        changed, touched = False, set()
+        for iid, qty in quantities.items():
+            if state.stock.get(iid) == qty:
+                continue
+            changed = True
+            if qty is None:
+                del state.stock[iid]
+            else:
+                state.stock[iid] = qty
+            touched.update(self._used_by.get(iid, ()))
+        for pid in touched:
+            state.makeable[pid] = self._makeable(state, pid)
+        return changed
+
+    def _state(self, session, store_id):
+        with self._lock:
+            loaded = self._recipes is not None
+            state = self._stores.get(store_id)
+            if state is not None:
+                if time.monotonic() - state.loaded_at <= self.ttl_seconds:
+                    return state
+                # Requests arriving during the reload read the stock as it is
+                state.loaded_at = time.monotonic()
+        # Query outside the lock, which every store and apply() share
+        recipes = None if loaded else self._load_recipes(session)
+        stock, cups = self._load_stock(session, store_id)
+        with self._lock:
+            if self._recipes is None and recipes is not None:
+                self._recipes, self._used_by = recipes
+            if self._recipes is not None:
+                state = self._stores.get(store_id)
+                if state is None:
+                    state = self._stores[store_id] = _StoreStock(
+                        self._recipes, stock, cups
+                    )
+                    for pid in state.recipes:
+                        state.makeable[pid] = self._makeable(state, pid)
+                    return state
+                # Only what changed is recomputed, and only a change is a new version
+                gone = {iid: None for iid in state.stock.keys() - stock.keys()}
+                changed = self._update(state, {**stock, **gone})
+                if changed or cups != state.cups:
+                    state.cups = cups
+                    state.version = next(_versions)
+                state.loaded_at = time.monotonic()
+                return state
+        # The recipes were dropped while this loaded
+        return self._state(session, store_id)
+
+    def apply(self, store_id, quantities):
+        """Fold new on-hand ``{ingredient_id: quantity}`` into the index."""
+        with self._lock:
+            state = self._stores.get(store_id)
+            if state is None or self._recipes is None:
+                return
+            if self._update(state, {iid: float(q) for iid, q in quantities.items()}):
+                state.version = next(_versions)
+
+    def version(self, session, store_id=DEFAULT_STORE_ID):
+        """Changes whenever the store's stock, and so its annotations, may have."""
+        return self._state(session, store_id).version
+
+    def recipes_changed(self):
+        with self._lock:
+            self._recipes = None
+            self._stores = {}
+
+    def _sizes(self, state, product_id):
+        base = state.makeable.get(product_id)
+        sizes = {}
+        for size, cup in state.cups.items():
+            n = base
+            if cup is not None:
+                cups = max(0, math.floor(state.stock.get(cup, 0.0) + 1e-9))
+                n = cups if n is None else min(n, cups)
+            sizes[size] = n
+        return sizes
+
+    def annotate_products(self, session, products, store_id=DEFAULT_STORE_ID):
+        """Copies of catalog ``products`` with ``max_quantity`` per size and ``sold_out``.
+
+        ``None`` means no recipe line limits the product.
+        """
+        state = self._state(session, store_id)
+        with self._lock:
+            annotated = []
+            for product in products:
+                sizes = self._sizes(state, product["product_id"])
+                annotated.append(
+                    {
+                        **product,
+                        "max_quantity": sizes,
+                        "sold_out": all(n == 0 for n in sizes.values()),
+                    }
+                )
+            return annotated
+
+    def annotate_add_ons(self, session, modifications, store_id=DEFAULT_STORE_ID):
+        state = self._state(session, store_id)
+        with self._lock:
+            return [
+                {**m, "sold_out": state.stock.get(m["ingredient_id"], 0.0) <= 0}
+                for m in modifications
+            ]
+
+    def check(self, session, items, store_id=DEFAULT_STORE_ID):
+        """Ingredients ``items`` would need beyond the store's stock.
+
+        ``items`` are order lines as posted to ``/api/postOrder``. Returns a
+        list of ``{ingredient_id, needed, on_hand}``, empty when the order
+        can be made.
+        """
+        state = self._state(session, store_id)
+        needed = defaultdict(float)
+        # An add-on with no stock left is sold out even if the line uses none
+        requested = set()
+        with self._lock:
+            for item in items:
+                quantity = float(item.get("quantity", 1))
+                for iid, per_unit in state.recipes.get(item.get("product_id"), ()):
+                    needed[iid] += per_unit * quantity
+                cup = state.cups.get(item.get("size_level", "normal"))
+                if cup is not None:
+                    needed[cup] += quantity
+                for mod in item.get("modifications", []):
+                    mod_type = (
+                        mod.get("modification_type")
+                        or mod.get("possible_modification", "ADD")
+                    ).upper()
+                    if mod_type in ("ADD", "EXTRA"):
+                        iid = mod["ingredient_id"]
+                        requested.add(iid)
+                        needed[iid] += float(mod.get("quantity_change", 0)) * quantity
+            return [
+                {
+                    "ingredient_id": iid,
+                    "needed": round(qty, 2),
+                    "on_hand": state.stock[iid],
+                }
+                for iid, qty in needed.items()
+                if iid in state.stock
+                and (
+                    qty > state.stock[iid] + 1e-9
+                    or (iid in requested and state.stock[iid] <= 0)
+                )
+            ]
@@ -0,0 +1,377 @@
+"""Barista station scheduling and order-ready estimates.
+
+Committed orders are handed to ``BaristaScheduler.submit``. Each drink (an
+order line, ``quantity`` cups made together) gets a prep-time estimate from
+``PrepTimeModel`` and goes to the station that frees up first. Stations sit in
+a heap keyed by when their queue drains, so assignment is O(log stations) and
+taking an order is O(items log stations), however many drinks are in flight.
+Within an order the longest drinks are placed first (LPT), which keeps the
+order's makespan close to optimal.
+
+Baristas mark drinks done with ``complete``. The time since the station
+started that drink trains the estimator. A station keeps its drinks' estimates
+in a Fenwick tree in queue order, so a drink's ready time is the time the head
+drink started plus a prefix sum. Completing any drink zeroes its slot, so a
+completion and an ETA lookup are both O(log n) in the station's queue.
+Completed drinks are dropped from the queue lazily, once they reach its head.
+
+A drink nobody marks done is dropped ``BARISTA_ITEM_TTL_SECONDS`` after it was
+queued, so a worker's queues stay bounded.
+
+Each store has its own stations and queues; the estimator is shared. The
+scheduler is in memory and per worker. Run the app with a single worker
+process (threads are fine) when baristas rely on the queue view.
+"""
+
+import heapq
+import threading
+import time
+from collections import deque
+
+from models import DEFAULT_STORE_ID
+
+DEFAULT_PREP_SECONDS = 90.0
+SIZE_FACTORS = {"small": 0.85, "normal": 1.0, "large": 1.2}
+
+
+class PrepTimeModel:
+    """Per-(category, size) EWMA of prep seconds, plus a cost per modification.
+
+    Estimates fall back from ``(category, size)`` to ``category`` and then to
+    the overall mean, so a new product gets a sensible first guess.
+    """
+
+    def __init__(self, alpha=0.2, seconds_per_mod=10.0, extra_cup_factor=0.6):
+        self.alpha = alpha
+        self.seconds_per_mod = seconds_per_mod
+        # Cups after the first of the same line are cheaper to make
+        self.extra_cup_factor = extra_cup_factor
+        self._lock = threading.Lock()
+        self._by_key = {}
+        self._by_category = {}
+        self._overall = DEFAULT_PREP_SECONDS
+        self.samples = 0
+
+    def _cups(self, quantity):
+        return 1 + self.extra_cup_factor * max(0, quantity - 1)
+
+    def base_seconds(self, category, size):
+        with self._lock:
+            if (category, size) in self._by_key:
+                return self._by_key[(category, size)]
+            if category in self._by_category:
+                return self._by_category[category] * SIZE_FACTORS.get(size, 1.0)
+            return self._overall * SIZE_FACTORS.get(size, 1.0)
+
+    def estimate(self, category, size, mods=0, quantity=1):
+        base = self.base_seconds(category, size) + self.seconds_per_mod * mods
+        return base * self._cups(quantity)
+
+    def observe(self, category, size, mods, quantity, seconds):
+        """Fold an observed prep time into the estimates."""
+        base = seconds / self._cups(quantity) - self.seconds_per_mod * mods
+        base = max(base, 5.0)
+        per_category = base / SIZE_FACTORS.get(size, 1.0)
+        with self._lock:
+            for table, key, value in (
+                (self._by_key, (category, size), base),
+                (self._by_category, category, per_category),
+            ):
+                old = table.get(key)
+                table[key] = value if old is None else old + self.alpha * (value - old)
+            self._overall += self.alpha * (per_category - self._overall)
+            self.samples += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "samples": self.samples,
+                "overall_seconds": round(self._overall, 1),
+                "by_category": {k: round(v, 1) for k, v in self._by_category.items()},
+            }
+
+
+def _fenwick_add(tree, i, delta):
+    while i < len(tree):
+        tree[i] += delta
+        i += i & -i
+
+
+def _fenwick_sum(tree, i):
+    """Sum of slots ``1..i``."""
+    total = 0.0
+    while i > 0:
+        total += tree[i]
+        i -= i & -i
+    return total
+
+
+def _fenwick_append(tree, value):
+    """Add slot ``len(tree)`` holding ``value``; returns its index."""
+    i = len(tree)
+    # The new node covers slots (i - lowbit(i), i]
+    tree.append(value + _fenwick_sum(tree, i - 1) - _fenwick_sum(tree, i - (i & -i)))
+    return i
+
+
+class _Station:
+    __slots__ = (
+        "station_id",
+        "queue",
+        "tree",
+        "live",
+        "started_at",
+        "free_at",
+        "version",
+    )
+
+    def __init__(self, station_id):
+        self.station_id = station_id
+        # Drinks in order; the head is always one still being made
+        self.queue = deque()
+        # Estimates by queue slot (1-based); zero once a drink is done
+        self.tree = [0.0]
+        self.live = 0
+        # When the barista started the drink at the head of the queue
+        self.started_at = None
+        self.free_at = 0.0
+        self.version = 0
+
+    def reset(self):
+        self.queue.clear()
+        self.tree = [0.0]
+        self.live = 0
+        self.started_at = None
+
+    def renumber(self):
+        """Rebuild the tree over the live drinks only."""
+        self.queue = deque(item for item in self.queue if not item.get("done"))
+        self.tree = [0.0]
+        for item in self.queue:
+            item["slot"] = _fenwick_append(self.tree, item["estimate"])
+
+    def overdue(self, now):
+        # A head drink taking longer than estimated delays everything behind it
+        return max(0.0, now - (self.started_at + self.queue[0]["estimate"]))
+
+    def ready_at(self, item, now):
+        ahead = _fenwick_sum(self.tree, item["slot"])
+        return self.started_at + ahead + self.overdue(now)
+
+    def drain_at(self, now):
+        if not self.live:
+            return now
+        queued = _fenwick_sum(self.tree, len(self.tree) - 1)
+        return self.started_at + queued + self.overdue(now)
+
+
+class _Floor:
+    """One store's stations and the drinks queued at them."""
+
+    def __init__(self, stations):
+        self.stations = [_Station(i) for i in range(stations)]
+        self.heap = [(0.0, 0, i) for i in range(stations)]
+        heapq.heapify(self.heap)
+        self.items = {}
+        self.orders = {}
+        # (queued_at, order_item_id) in submit order, for expiry
+        self.queued = deque()
+
+    def push(self, station):
+        station.version += 1
+        entry = (station.free_at, station.version, station.station_id)
+        heapq.heappush(self.heap, entry)
+        if len(self.heap) > 4 * len(self.stations):
+            # Drop stale entries left behind by completions
+            self.heap = [(s.free_at, s.version, s.station_id) for s in self.stations]
+            heapq.heapify(self.heap)
+
+    def pop_earliest(self):
+        # Entries are invalidated by bumping the station's version
+        while True:
+            free_at, version, sid = heapq.heappop(self.heap)
+            station = self.stations[sid]
+            if version == station.version:
+                return station
+
+    def remove(self, order_item_id, now):
+        """Take a drink out of its station's queue; ``None`` if unknown."""
+        item = self.items.pop(order_item_id, None)
+        if item is None:
+            return None
+        station = self.stations[item["station"]]
+        was_head = station.queue[0] is item
+        item["done"] = True
+        _fenwick_add(station.tree, item["slot"], -item["estimate"])
+        station.live -= 1
+        if was_head:
+            item["prep_seconds"] = now - station.started_at
+            station.started_at = now
+        if not station.live:
+            station.reset()
+        else:
+            while station.queue[0].get("done"):
+                station.queue.popleft()
+            # Completed drinks behind the head pile up until it reaches them
+            if len(station.queue) > 2 * station.live + 64:
+                station.renumber()
+        station.free_at = station.drain_at(now)
+        self.push(station)
+        remaining = self.orders.get(item["order_id"])
+        if remaining is not None:
+            remaining.discard(order_item_id)
+            if not remaining:
+                del self.orders[item["order_id"]]
+        return item
+
+    def expire(self, now, ttl):
+        while self.queued and self.queued[0][0] < now - ttl:
+            _, order_item_id = self.queued.popleft()
+            self.remove(order_item_id, now)
+
+
+class BaristaScheduler:
+    """Barista queues of every store, sharing one prep-time model.
+
+    Order and order item ids are per shard, so every call names its store.
+    """
+
+    def __init__(self, stations=2, model=None, clock=time.time, item_ttl=4 * 3600.0):
+        self.model = model or PrepTimeModel()
+        self.clock = clock
+        self.item_ttl = item_ttl
+        self.stations = stations
+        self._lock = threading.Lock()
+        self._floors = {}
+
+    def init_app(self, app):
+        stations = int(app.config.get("BARISTA_STATIONS", 2))
+        with self._lock:
+            self.stations = stations
+            for store_id, floor in list(self._floors.items()):
+                if stations != len(floor.stations) and not floor.items:
+                    del self._floors[store_id]
+        self.model.seconds_per_mod = float(
+            app.config.get("BARISTA_SECONDS_PER_MOD", self.model.seconds_per_mod)
+        )
+        self.item_ttl = float(app.config.get("BARISTA_ITEM_TTL_SECONDS", self.item_ttl))
+
+    def _floor(self, store_id, now):
+        """The store's floor, with expired drinks dropped; call under the lock."""
+        floor = self._floors.get(store_id)
+        if floor is None:
+            floor = self._floors[store_id] = _Floor(self.stations)
+        floor.expire(now, self.item_ttl)
+        return floor
+
+    def submit(self, order_id, items, store_id=DEFAULT_STORE_ID):
+        """Queue an order's drinks; returns its estimated ready time (epoch s).
+
+        ``items`` are dicts with ``order_item_id``, ``category``, ``size``,
+        ``mods`` (number of modifications) and ``quantity``.
+        """
+        now = self.clock()
+        jobs = []
+        for item in items:
+            estimate = self.model.estimate(
+                item.get("category"),
+                item.get("size", "normal"),
+                item.get("mods", 0),
+                item.get("quantity", 1),
+            )
+            jobs.append({**item, "order_id": order_id, "estimate": estimate})
+        jobs.sort(key=lambda j: j["estimate"], reverse=True)
+
+        with self._lock:
+            floor = self._floor(store_id, now)
+            ready_at = now
+            for job in jobs:
+                station = floor.pop_earliest()
+                if not station.live:
+                    station.started_at = now
+                job["station"] = station.station_id
+                job["queued_at"] = now
+                job["slot"] = _fenwick_append(station.tree, job["estimate"])
+                station.queue.append(job)
+                station.live += 1
+                station.free_at = station.drain_at(now)
+                floor.items[job["order_item_id"]] = job
+                floor.queued.append((now, job["order_item_id"]))
+                floor.push(station)
+                ready_at = max(ready_at, station.ready_at(job, now))
+            if jobs:
+                floor.orders[order_id] = {j["order_item_id"] for j in jobs}
+        return ready_at
+
+    def complete(self, order_item_id, store_id=DEFAULT_STORE_ID):
+        """Mark a drink done. Returns the finished item, or ``None`` if unknown."""
+        now = self.clock()
+        with self._lock:
+            item = self._floor(store_id, now).remove(order_item_id, now)
+        if item is None:
+            return None
+        # Taps that clear a backlog at once say nothing about prep time
+        if "prep_seconds" in item and (
+            0.2 * item["estimate"] <= item["prep_seconds"] <= 5 * item["estimate"]
+        ):
+            self.model.observe(
+                item.get("category"),
+                item.get("size", "normal"),
+                item.get("mods", 0),
+                item.get("quantity", 1),
+                item["prep_seconds"],
+            )
+        return item
+
+    def order_eta(self, order_id, store_id=DEFAULT_STORE_ID):
+        """Estimated ready time of an order still in the queue, else ``None``."""
+        now = self.clock()
+        with self._lock:
+            floor = self._floor(store_id, now)
+            ids = floor.orders.get(order_id)
+            if not ids:
+                return None
+            return max(
+                floor.stations[floor.items[i]["station"]].ready_at(floor.items[i], now)
+                for i in ids
+            )
+
+    def _station_view(self, station, now):
+        items = []
+        if station.live:
+            t = station.started_at + station.overdue(now)
+            for item in station.queue:
+                if item.get("done"):
+                    continue
+                t += item["estimate"]
+                items.append(
+                    {
+                        "order_id": item["order_id"],
+                        "order_item_id": item["order_item_id"],
+                        "product_name": item.get("product_name"),
+                        "size": item.get("size"),
+                        "quantity": item.get("quantity", 1),
+                        "estimate_seconds": round(item["estimate"], 1),
+                        "ready_in_seconds": round(max(0.0, t - now), 1),
+                    }
+                )
+        return {
+            "station": station.station_id,
+            "free_in_seconds": round(max(0.0, station.drain_at(now) - now), 1),
+            "items": items,
+        }
+
+    def queue_view(self, store_id=DEFAULT_STORE_ID):
+        now = self.clock()
+        with self._lock:
+            floor = self._floor(store_id, now)
+            stations = [self._station_view(s, now) for s in floor.stations]
+            in_flight = len(floor.items)
+            orders = len(floor.orders)
+        return {
+            "store_id": store_id,
+            "in_flight_items": in_flight,
+            "open_orders": orders,
+            "stations": stations,
+            "model": self.model.snapshot(),
+        }
@@ -0,0 +1,145 @@
+"""Cashier latency while kiosk traffic spikes, with and without admission control.
+
+Runs the app in-process against the configured database (PSQL_* variables or
+a .env) and drives it from threads, the way a gthread worker would:
+
+    python bench/admission_load.py                  # admission control on
+    python bench/admission_load.py --no-admission   # baseline
+
+A few cashier threads post orders at a steady pace for the whole run. Halfway
+through, ``--kiosk-threads`` kiosk clients start posting as fast as they can,
+and a manager polls the sales report throughout. The pool is kept small so the
+spike saturates it. Writes real orders; point it at a scratch database.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+def percentile(values, q):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--cashier-threads", type=int, default=3)
+    parser.add_argument("--cashier-interval", type=float, default=0.05)
+    parser.add_argument("--kiosk-threads", type=int, default=40)
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--no-admission", action="store_true")
+    args = parser.parse_args()
+
+    import app as app_module
+    from sqlalchemy import text
+
+    application = app_module.create_app(
+        {
+            "DB_POOL_SIZE": args.pool_size,
+            "DB_MAX_OVERFLOW": 2,
+            "SQLALCHEMY_ENGINE_OPTIONS": {
+                "pool_size": args.pool_size,
+                "max_overflow": 2,
+                "pool_timeout": 30,
+            },
+            "ADMISSION_ENABLED": not args.no_admission,
+        }
+    )
+    with application.app_context():
+        product_id, price = app_module.db.session.execute(
+            text("SELECT product_id, unit_price FROM products ORDER BY product_id LIMIT 1")
+        ).first()
+        employee_id = app_module.db.session.execute(
+            text("SELECT employee_id FROM employees ORDER BY employee_id LIMIT 1")
+        ).scalar()
+        app_module.db.session.remove()
+
+    def order(**who):
+        return {
+            **who,
+            "total_amount": float(price),
+            "items": [
+                {
+                    "product_id": product_id,
+                    "quantity": 1,
+                    "unit_price_at_sale": float(price),
+                }
+            ],
+        }
+
+    results = {"cashier": [], "cashier_spike": [], "kiosk": [], "report": []}
+    statuses = {"cashier": {}, "kiosk": {}, "report": {}}
+    lock = threading.Lock()
+    start = time.monotonic()
+    stop_at = start + args.seconds
+    spike_at = start + args.seconds / 2
+
+    def record(kind, elapsed, status, spike=False):
+        with lock:
+            results[kind + ("_spike" if spike and kind == "cashier" else "")].append(
+                elapsed
+            )
+            statuses[kind][status] = statuses[kind].get(status, 0) + 1
+
+    def cashier():
+        client = application.test_client()
+        while time.monotonic() < stop_at:
+            t0 = time.monotonic()
+            r = client.post("/api/postOrder", json=order(employee_id=employee_id))
+            record("cashier", time.monotonic() - t0, r.status_code, t0 >= spike_at)
+            time.sleep(args.cashier_interval)
+
+    def kiosk(n):
+        client = application.test_client()
+        while time.monotonic() < spike_at:
+            time.sleep(0.01)
+        while time.monotonic() < stop_at:
+            t0 = time.monotonic()
+            r = client.post("/api/postOrder", json=order(clerk_user_id=f"bench-kiosk-{n}"))
+            record("kiosk", time.monotonic() - t0, r.status_code)
+
+    def manager():
+        client = application.test_client()
+        today = date.today()
+        params = {
+            "start_date": (today - timedelta(days=30)).isoformat(),
+            "end_date": today.isoformat(),
+        }
+        while time.monotonic() < stop_at:
+            t0 = time.monotonic()
+            r = client.get("/api/reports/sales", query_string=params)
+            record("report", time.monotonic() - t0, r.status_code)
+            time.sleep(0.2)
+
+    threads = [threading.Thread(target=cashier) for _ in range(args.cashier_threads)]
+    threads += [threading.Thread(target=kiosk, args=(n,)) for n in range(args.kiosk_threads)]
+    threads.append(threading.Thread(target=manager))
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    print(f"admission control: {'off' if args.no_admission else 'on'}")
+    for kind in ("cashier", "cashier_spike", "kiosk", "report"):
+        values = [v * 1000 for v in results[kind]]
+        if not values:
+            continue
+        print(
+            f"{kind:14s} n={len(values):5d}  p50 {statistics.median(values):8.1f} ms"
+            f"  p99 {percentile(values, 0.99):8.1f} ms"
+        )
+    print("status codes:", statuses)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""Concurrent logins and receipts: sync gunicorn workers against async_app.py.
+
+Starts a stand-in for Google's token and userinfo endpoints and for
+SendGrid that answers after ``--latency-ms``, then the Flask app under
+gunicorn and async_app.py under uvicorn, each with ``--workers``
+processes, both pointed at the stand-in. Uses the configured database
+(PSQL_* variables or a .env) and FLASK_KEY:
+
+    python bench/async_io.py
+    python bench/async_io.py --concurrency 2000 --requests 5000 --latency-ms 300
+
+``--concurrency`` clients send ``--requests`` OAuth callbacks to each
+server between them, and the script reports throughput, the median and p99
+latency and failures. It then queues ``--requests`` signed receipts on the
+async service and times how long the stand-in takes to receive them all.
+Callbacks sign in ``--users`` stand-in users, created on the first pass;
+point it at a scratch database.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, HERE)
+
+
+class StandIn:
+    """Google's OAuth endpoints and SendGrid's mail/send, with a fixed delay."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.mails = 0
+        self.server = None
+        self.port = None
+        self._writers = set()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve, "127.0.0.1", 0, backlog=4096)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        self.server.close()
+        # Ends the connections the servers left open, so their handlers return
+        for writer in list(self._writers):
+            writer.transport.abort()
+        await asyncio.sleep(0.1)
+
+    async def _serve(self, reader, writer):
+        self._writers.add(writer)
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                lines = head.decode("latin-1").split("\r\n")
+                method, path, _ = lines[0].split(" ", 2)
+                headers = dict(
+                    line.split(": ", 1) for line in lines[1:] if ": " in line
+                )
+                headers = {k.lower(): v for k, v in headers.items()}
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                await asyncio.sleep(self.latency)
+                status, payload = self._answer(method, path, headers, body)
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} X\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n\r\n".encode()
+                    + data
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    def _answer(self, method, path, headers, body):
+        if path == "/token":
+            # The code is the user's name; it comes back as the access token
+            form = dict(pair.split("=", 1) for pair in body.decode().split("&"))
+            return 200, {"access_token": form["code"]}
+        if path == "/userinfo":
+            user = headers["authorization"].split(" ", 1)[1]
+            return 200, {"sub": user, "email": f"{user}@example.com", "name": user}
+        if path == "/mail":
+            self.mails += 1
+            return 202, {}
+        return 404, {}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(command, port, env):
+    process = subprocess.Popen(
+        command, cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise SystemExit(f"{command[0]} did not start on port {port}")
+
+
+async def load(client, url, count, concurrency, expected):
+    """Send ``count`` GETs with ``concurrency`` in flight; return timings, failures."""
+    timings, failures = [], 0
+    queue = asyncio.Queue()
+    for i in range(count):
+        queue.put_nowait(i)
+
+    async def worker():
+        nonlocal failures
+        while not queue.empty():
+            i = queue.get_nowait()
+            t0 = time.perf_counter()
+            try:
+                async with client.get(url(i), allow_redirects=False) as r:
+                    ok = r.status == expected
+            except Exception:
+                ok = False
+            timings.append((time.perf_counter() - t0) * 1000)
+            failures += not ok
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return timings, failures
+
+
+async def run(args):
+    import aiohttp
+    from dotenv import load_dotenv
+
+    load_dotenv(os.path.join(HERE, "..", ".env"))
+    stand_in = StandIn(args.latency_ms / 1000.0)
+    await stand_in.start()
+    base = f"http://127.0.0.1:{stand_in.port}"
+    env = {
+        **os.environ,
+        "GOOGLE_TOKEN_URL": f"{base}/token",
+        "GOOGLE_USERINFO_URL": f"{base}/userinfo",
+        "SENDGRID_API_URL": f"{base}/mail",
+        "SENDGRID_API_KEY": "bench",
+        "SENDER_EMAIL": "bench@example.com",
+        "GOOGLE_CLIENT_ID": "bench",
+        "CLIENT_SECRET": "bench",
+        "REACT_APP_FRONTEND_URL": "http://127.0.0.1/",
+        "LOG_LEVEL": "WARNING",
+    }
+    sync_port, async_port = free_port(), free_port()
+    servers = {
+        "sync": (
+            ["gunicorn", "-w", str(args.workers), "-b", f"127.0.0.1:{sync_port}", "app:app"],
+            sync_port,
+        ),
+        "async": (
+            [sys.executable, "-m", "uvicorn", "async_app:app", "--port", str(async_port)]
+            + ["--workers", str(args.workers), "--log-level", "warning", "--backlog", "4096"],
+            async_port,
+        ),
+    }
+
+    def session():
+        return aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=args.concurrency),
+            timeout=aiohttp.ClientTimeout(total=120),
+        )
+
+    users = [f"bench-user-{n}" for n in range(args.users)]
+    print(
+        f"{args.workers} workers per server, stand-in latency {args.latency_ms:.0f} ms, "
+        f"{args.requests} requests, {args.concurrency} concurrent"
+    )
+    for mode, (command, port) in servers.items():
+        process = start_server(command, port, env)
+        try:
+            async with session() as client:
+
+                def url(i):
+                    code = users[i % len(users)]
+                    return f"http://127.0.0.1:{port}/api/oauth2/callback?code={code}"
+
+                # One at a time first, so each stand-in user exists
+                await load(client, url, len(users), 1, 302)
+                t0 = time.perf_counter()
+                timings, failures = await load(
+                    client, url, args.requests, args.concurrency, 302
+                )
+                elapsed = time.perf_counter() - t0
+            timings.sort()
+            print(
+                f"login  {mode:5s} {args.requests / elapsed:8.1f} req/s"
+                f"  p50 {statistics.median(timings):8.1f} ms"
+                f"  p99 {timings[int(0.99 * (len(timings) - 1))]:8.1f} ms"
+                f"  failed {failures}"
+            )
+            if mode == "async":
+                async with session() as client:
+                    await receipts(args, client, port, stand_in)
+        finally:
+            process.terminate()
+            process.wait()
+    await stand_in.close()
+
+
+async def receipts(args, client, port, stand_in):
+    from config import load_config
+    from receipts import sign_receipt
+
+    secret = load_config()["SECRET_KEY"]
+    token = sign_receipt(
+        secret, {"to": "bench@example.com", "order_id": 1, "html": "<p>bench</p>"}
+    )
+    before = stand_in.mails
+    t0 = time.perf_counter()
+    sem = asyncio.Semaphore(args.concurrency)
+
+    async def post():
+        async with sem:
+            async with client.post(
+                f"http://127.0.0.1:{port}/internal/receipts", data=token
+            ) as r:
+                return r.status == 202
+
+    accepted = sum(await asyncio.gather(*(post() for _ in range(args.requests))))
+    queued = time.perf_counter() - t0
+    while stand_in.mails - before < accepted and time.perf_counter() - t0 < 120:
+        await asyncio.sleep(0.05)
+    print(
+        f"receipt async {accepted / queued:8.1f} req/s queued, {stand_in.mails - before}"
+        f"/{args.requests} delivered in {time.perf_counter() - t0:.1f} s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=100)
+    parser.add_argument("--users", type=int, default=50)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
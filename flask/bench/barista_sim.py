@@ -0,0 +1,152 @@
+"""Simulate a rush through the barista scheduler.
+
+No database is needed. Orders arrive as a Poisson process on a simulated clock.
+Every drink has a hidden "true" prep time drawn around a per-category mean, and
+baristas finish the drink at the head of their station when it is done. The
+benchmark reports how far the ETA given at order time was from the actual
+ready time, before and after the estimator has learned. It also reports how
+long ``submit`` and ``complete`` take with hundreds of drinks in flight.
+
+    python bench/barista_sim.py                          # ~80% busy stations
+    python bench/barista_sim.py --orders-per-minute 3    # overloaded, ~1000 in flight
+"""
+
+import argparse
+import heapq
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from barista import SIZE_FACTORS, BaristaScheduler  # noqa: E402
+from models import DEFAULT_STORE_ID  # noqa: E402
+
+TRUE_SECONDS = {"Milk Tea": 70, "Fruit Tea": 110, "Slush": 150, "Special": 95}
+TRUE_SECONDS_PER_MOD = 12
+
+
+class SimClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stations", type=int, default=4)
+    parser.add_argument("--orders-per-minute", type=float, default=0.7)
+    parser.add_argument("--minutes", type=float, default=240)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    clock = SimClock()
+    # Every drink is finished eventually, however long the backlog
+    scheduler = BaristaScheduler(
+        stations=args.stations, clock=clock, item_ttl=float("inf")
+    )
+    # The simulated shop's stations, which the loop below plays barista at
+    floor = scheduler._floor(DEFAULT_STORE_ID, clock.now)
+    categories = list(TRUE_SECONDS)
+
+    # Event heap: (time, kind, payload); kinds sort arrivals after completions
+    events = []
+    t = 0.0
+    order_id = 0
+    while t < args.minutes * 60:
+        t += rng.expovariate(args.orders_per_minute / 60.0)
+        order_id += 1
+        heapq.heappush(events, (t, 1, order_id))
+
+    true_prep = {}
+    promised = {}
+    items_of = {}
+    finished_at = {}
+    next_item = 1
+    submit_us = []
+    complete_us = []
+    peak_in_flight = 0
+
+    def start_head(station):
+        queue = floor.stations[station].queue
+        if queue:
+            item = queue[0]
+            done = clock.now + true_prep[item["order_item_id"]]
+            heapq.heappush(events, (done, 0, item["order_item_id"]))
+
+    while events:
+        clock.now, kind, payload = heapq.heappop(events)
+        if kind == 1:
+            items = []
+            for _ in range(rng.choice((1, 1, 1, 2, 2, 3, 4))):
+                category = rng.choice(categories)
+                size = rng.choice(tuple(SIZE_FACTORS))
+                mods = rng.choice((0, 0, 1, 2))
+                quantity = rng.choice((1, 1, 1, 2))
+                seconds = (
+                    TRUE_SECONDS[category] * SIZE_FACTORS[size]
+                    + TRUE_SECONDS_PER_MOD * mods
+                ) * (1 + 0.6 * (quantity - 1))
+                true_prep[next_item] = max(10.0, rng.gauss(seconds, seconds * 0.15))
+                items.append(
+                    {
+                        "order_item_id": next_item,
+                        "category": category,
+                        "size": size,
+                        "mods": mods,
+                        "quantity": quantity,
+                    }
+                )
+                next_item += 1
+            idle = [s.station_id for s in floor.stations if not s.queue]
+            t0 = time.perf_counter()
+            promised[payload] = scheduler.submit(payload, items)
+            submit_us.append((time.perf_counter() - t0) * 1e6)
+            items_of[payload] = {i["order_item_id"] for i in items}
+            for station in idle:
+                start_head(station)
+            peak_in_flight = max(peak_in_flight, len(floor.items))
+        else:
+            t0 = time.perf_counter()
+            item = scheduler.complete(payload)
+            complete_us.append((time.perf_counter() - t0) * 1e6)
+            remaining = items_of[item["order_id"]]
+            remaining.discard(payload)
+            if not remaining:
+                finished_at[item["order_id"]] = clock.now
+            start_head(item["station"])
+
+    errors = [
+        (order, finished_at[order] - promised[order]) for order in sorted(finished_at)
+    ]
+    half = len(errors) // 2
+    for label, chunk in (("first half", errors[:half]), ("second half", errors[half:])):
+        abs_err = [abs(e) for _, e in chunk]
+        print(
+            f"ETA error, {label:11s}: mean |err| {statistics.mean(abs_err):6.1f} s"
+            f"   median err {statistics.median(e for _, e in chunk):+6.1f} s"
+        )
+    total_work = sum(true_prep.values())
+    print(f"orders {len(finished_at)}, drinks {len(true_prep)}, peak in flight {peak_in_flight}")
+    print(
+        f"station utilisation {total_work / (args.stations * clock.now):.0%}, "
+        f"last drink at {clock.now / 60:.1f} min"
+    )
+    print(
+        f"submit: median {statistics.median(submit_us):.1f} us, "
+        f"max {max(submit_us):.1f} us"
+    )
+    print(
+        f"complete: median {statistics.median(complete_us):.1f} us, "
+        f"max {max(complete_us):.1f} us"
+    )
+    print("learned:", scheduler.model.snapshot())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""Checkout latency against round-trip time: ORM on psycopg2, ORM on psycopg 3, pipelined.
+
+Runs the app in-process against the configured database (PSQL_* variables or
+a .env), through a local TCP proxy that delays every packet by half the
+chosen round-trip time in each direction:
+
+    python bench/checkout_rtt.py
+    python bench/checkout_rtt.py --rtt-ms 0 2 10 --orders 50
+
+For each RTT and mode it posts ``--orders`` employee orders of two drinks
+with one add-on and reports the median ``/api/postOrder`` time. It also
+reports how many times per checkout the app sent to Postgres, which is the
+number of round trips it waited for. Writes real orders; point it at a
+scratch database.
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+MODES = {
+    "orm/psycopg2": {"DB_DRIVER": "", "CHECKOUT_PIPELINE": "0"},
+    "orm/psycopg3": {"DB_DRIVER": "psycopg", "CHECKOUT_PIPELINE": "0"},
+    "pipeline": {"DB_DRIVER": "psycopg", "CHECKOUT_PIPELINE": "1"},
+}
+
+
+class LatencyProxy:
+    """Forwards TCP connections to ``target``, delaying each packet by ``delay``."""
+
+    def __init__(self, target):
+        self.target = target
+        self.delay = 0.0
+        self.sends = 0
+        self._lock = threading.Lock()
+        self._server = socket.create_server(("127.0.0.1", 0))
+        self.port = self._server.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            client, _ = self._server.accept()
+            upstream = socket.create_connection(self.target)
+            for sock in (client, upstream):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self._pump, args=(client, upstream, True), daemon=True).start()
+            threading.Thread(target=self._pump, args=(upstream, client, False), daemon=True).start()
+
+    def _pump(self, src, dst, to_server):
+        try:
+            while True:
+                data = src.recv(65536)
+                if not data:
+                    break
+                if to_server:
+                    with self._lock:
+                        self.sends += 1
+                if self.delay:
+                    time.sleep(self.delay)
+                dst.sendall(data)
+        except OSError:
+            pass
+        finally:
+            for sock in (src, dst):
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rtt-ms", type=float, nargs="+", default=[0, 1, 5])
+    parser.add_argument("--orders", type=int, default=30)
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+
+    load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", ".env"))
+    proxy = LatencyProxy((os.getenv("PSQL_HOST"), int(os.getenv("PSQL_PORT") or 5432)))
+    os.environ.update(
+        {
+            "PSQL_HOST": "127.0.0.1",
+            "PSQL_PORT": str(proxy.port),
+            "AVAILABILITY_ENFORCE": "0",
+            "LOG_LEVEL": "WARNING",
+        }
+    )
+
+    import app as app_module
+    from sqlalchemy import text
+
+    results = []
+    for mode, env in MODES.items():
+        os.environ.update(env)
+        proxy.delay = 0.0
+        application = app_module.create_app()
+        with application.app_context():
+            products = app_module.db.session.execute(
+                text("SELECT product_id, unit_price FROM products ORDER BY product_id LIMIT 2")
+            ).all()
+            employee_id = app_module.db.session.execute(
+                text("SELECT employee_id FROM employees ORDER BY employee_id LIMIT 1")
+            ).scalar()
+            add_on = app_module.db.session.execute(
+                text("SELECT ingredient_id FROM inventory WHERE is_add_on LIMIT 1")
+            ).scalar()
+            app_module.db.session.remove()
+        items = [
+            {"product_id": pid, "quantity": 1, "unit_price_at_sale": float(price)}
+            for pid, price in products
+        ]
+        if add_on is not None:
+            items[0]["modifications"] = [
+                {"ingredient_id": add_on, "possible_modification": "ADD", "quantity_change": 1}
+            ]
+        order = {
+            "employee_id": employee_id,
+            "total_amount": sum(i["unit_price_at_sale"] for i in items),
+            "items": items,
+        }
+        client = application.test_client()
+        # Warm the pool, the caches and the prepared statements
+        for _ in range(3):
+            client.post("/api/postOrder", json=order)
+
+        for rtt in args.rtt_ms:
+            proxy.delay = rtt / 2000.0
+            timings = []
+            sends = proxy.sends
+            for _ in range(args.orders):
+                t0 = time.perf_counter()
+                r = client.post("/api/postOrder", json=order)
+                timings.append((time.perf_counter() - t0) * 1000)
+                if r.status_code != 201:
+                    raise SystemExit(f"{mode}: postOrder returned {r.status_code}")
+            trips = (proxy.sends - sends) / args.orders
+            results.append((rtt, mode, statistics.median(timings), trips))
+        with application.app_context():
+            for engine in app_module.db.engines.values():
+                engine.dispose()
+
+    print(f"{args.orders} checkouts per cell, median ms (sends to Postgres per checkout)")
+    print(f"{'rtt ms':>7s}  " + "  ".join(f"{mode:>20s}" for mode in MODES))
+    for rtt in args.rtt_ms:
+        cells = {mode: (ms, trips) for r, mode, ms, trips in results if r == rtt}
+        print(
+            f"{rtt:7.1f}  "
+            + "  ".join(
+                f"{cells[mode][0]:12.1f} ({cells[mode][1]:4.1f})" for mode in MODES
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
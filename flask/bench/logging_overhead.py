@@ -0,0 +1,130 @@
+"""postOrder latency with the queued JSON logs, synchronous logs, and logging off.
+
+Runs the app in-process against the configured database (PSQL_* variables or
+a .env) and posts orders one after another in each mode:
+
+    python bench/logging_overhead.py
+    python bench/logging_overhead.py --orders 500 --write-latency-us 500
+
+Log output goes to a sink that sleeps ``--write-latency-us`` per line, standing
+in for a stdout pipe that a log shipper drains slowly. In ``sync`` mode that
+sleep lands on the request thread; in ``queue`` mode only the listener thread
+pays it. The first block also times a single ``log.info`` call with request
+context. Writes real orders; point it at a scratch database.
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+MODES = {
+    # Request records are INFO, so WARNING turns them off
+    "off": {"LOG_LEVEL": "WARNING", "LOG_QUEUE": True},
+    "queue": {"LOG_LEVEL": "INFO", "LOG_QUEUE": True},
+    "sync": {"LOG_LEVEL": "INFO", "LOG_QUEUE": False},
+}
+
+
+class SlowSink:
+    """A text stream whose every write takes ``latency`` seconds."""
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def write(self, text):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def flush(self):
+        pass
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--write-latency-us", type=float, default=200)
+    args = parser.parse_args()
+
+    import app as app_module
+    from sqlalchemy import text
+
+    sink = SlowSink(args.write_latency_us / 1e6)
+    logs = app_module.logs
+    logs.stream = sink
+    application = app_module.create_app({"AVAILABILITY_ENFORCE": False})
+    with application.app_context():
+        product_id, price = app_module.db.session.execute(
+            text("SELECT product_id, unit_price FROM products ORDER BY product_id LIMIT 1")
+        ).first()
+        employee_id = app_module.db.session.execute(
+            text("SELECT employee_id FROM employees ORDER BY employee_id LIMIT 1")
+        ).scalar()
+        app_module.db.session.remove()
+    order = {
+        "employee_id": employee_id,
+        "total_amount": float(price),
+        "items": [
+            {"product_id": product_id, "quantity": 1, "unit_price_at_sale": float(price)}
+        ],
+    }
+
+    def use(mode):
+        logs.stop()
+        logs.level = logging.getLevelName(MODES[mode]["LOG_LEVEL"])
+        logs.use_queue = MODES[mode]["LOG_QUEUE"]
+        logs.install()
+
+    # Cost of one call on the request thread
+    log = logging.getLogger("bench")
+    per_call_us = {}
+    for mode in MODES:
+        use(mode)
+        with application.test_request_context("/api/postOrder", method="POST"):
+            t0 = time.perf_counter()
+            for i in range(args.calls):
+                log.info("bench", extra={"event": "bench", "order_id": i})
+            per_call_us[mode] = (time.perf_counter() - t0) / args.calls * 1e6
+
+    # Modes take turns, in rotating order, so table growth and cache state
+    # hit all of them alike
+    client = application.test_client()
+    client.post("/api/postOrder", json=order)
+    latencies = {mode: [] for mode in MODES}
+    per_round = max(1, args.orders // args.rounds)
+    names = list(MODES)
+    for n in range(args.rounds):
+        for mode in names[n % len(names) :] + names[: n % len(names)]:
+            use(mode)
+            for _ in range(per_round):
+                t0 = time.perf_counter()
+                r = client.post("/api/postOrder", json=order)
+                latencies[mode].append((time.perf_counter() - t0) * 1000)
+                if r.status_code != 201:
+                    raise SystemExit(f"{mode}: postOrder returned {r.status_code}")
+    logs.stop()
+    results = {mode: (per_call_us[mode], latencies[mode]) for mode in MODES}
+
+    base = statistics.median(results["off"][1])
+    print(f"write latency {args.write_latency_us:.0f} us/line, {args.orders} orders per mode")
+    for mode, (per_call_us, latencies) in results.items():
+        p50 = statistics.median(latencies)
+        print(
+            f"{mode:6s} log.info {per_call_us:7.1f} us   postOrder p50 {p50:7.2f} ms"
+            f" (+{p50 - base:5.2f})  p99 {percentile(latencies, 0.99):7.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Per-keystroke latency of the in-memory search index.
+
+No database is needed. A synthetic menu of ``--products`` drinks and
+``--ingredients`` ingredients is built from word lists. Each query is then
+typed one character at a time, with a typo in some of them, the way a
+cashier would:
+
+    python bench/search_keystrokes.py
+    python bench/search_keystrokes.py --products 20000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from search import SearchIndex  # noqa: E402
+
+FLAVOURS = [
+    "brown sugar", "taro", "matcha", "jasmine", "oolong", "mango", "passion fruit",
+    "lychee", "strawberry", "honeydew", "coconut", "thai", "wintermelon", "peach",
+    "grapefruit", "lavender", "rose", "hokkaido", "okinawa", "almond", "sesame",
+]
+STYLES = ["milk tea", "green tea", "black tea", "slush", "smoothie", "latte", "yakult", "fresh milk"]
+TOPPINGS = ["boba", "pudding", "grass jelly", "aloe", "red bean", "cheese foam", "crystal boba"]
+CATEGORIES = ["Milk Series", "Fruity", "Fresh Brew", "Slush", "Seasonal", "Specials"]
+
+
+def typo(word, rng):
+    if len(word) < 4:
+        return word
+    i = rng.randrange(1, len(word) - 1)
+    return word[:i] + word[i + 1] + word[i] + word[i + 2 :]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--ingredients", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    products = []
+    for pid in range(1, args.products + 1):
+        name = f"{rng.choice(FLAVOURS)} {rng.choice(STYLES)}".title()
+        if rng.random() < 0.4:
+            name += f" with {rng.choice(TOPPINGS)}".title()
+        products.append((pid, f"{name} {pid}", rng.choice(CATEGORIES)))
+    ingredients = [
+        (iid, f"{rng.choice(FLAVOURS + TOPPINGS)} {rng.choice(['syrup', 'powder', 'puree', 'base'])} {iid}".title())
+        for iid in range(1, args.ingredients + 1)
+    ]
+    popularity = {pid: int(rng.paretovariate(1.2)) for pid, _, _ in products}
+
+    index = SearchIndex()
+    t0 = time.perf_counter()
+    index.build(products, ingredients, popularity)
+    build_ms = (time.perf_counter() - t0) * 1000
+
+    latencies = []
+    for _ in range(args.queries):
+        words = rng.choice(FLAVOURS).split() + rng.choice(STYLES).split()[:1]
+        if rng.random() < 0.3:
+            words[0] = typo(words[0], rng)
+        query = " ".join(words)
+        for end in range(1, len(query) + 1):
+            t0 = time.perf_counter()
+            index.search(query[:end])
+            latencies.append((time.perf_counter() - t0) * 1e6)
+
+    latencies.sort()
+    print(f"{args.products} products, {args.ingredients} ingredients, {index.status()['terms']} terms")
+    print(f"build {build_ms:.0f} ms")
+    print(
+        f"keystroke queries n={len(latencies)}: median {statistics.median(latencies):.0f} us, "
+        f"p99 {latencies[int(0.99 * len(latencies))]:.0f} us, max {latencies[-1]:.0f} us"
+    )
+    for query in ("taro milk", "brwon sugar", "matcha lat", "boba"):
+        top = index.search(query, limit=3)
+        print(f"{query!r:14s} -> {[r['name'] for r in top]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Measure backend startup time.
+
+Each sample runs in a fresh interpreter so module imports are not cached:
+
+    python bench/startup.py            # import + create_app, 10 runs
+    python bench/startup.py --warm-up  # also open pool connections and load the catalog
+
+Set the usual PSQL_* variables (or a .env) when using --warm-up.
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import os
+
+SNIPPET = """
+import time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+application = app.create_app({config})
+t2 = time.perf_counter()
+if {warm_up}:
+    app.warm_up(application)
+t3 = time.perf_counter()
+print(t1 - t0, t2 - t1, t3 - t2)
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--warm-up", action="store_true")
+    args = parser.parse_args()
+
+    config = {}
+    if not args.warm_up:
+        # No connection is opened, so any well-formed URI will do
+        config["SQLALCHEMY_DATABASE_URI"] = "postgresql://bench@localhost/bench"
+    code = SNIPPET.format(config=repr(config), warm_up=args.warm_up)
+    here = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+    samples = []
+    for _ in range(args.runs):
+        out = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=here,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        samples.append([float(x) for x in out.split()])
+
+    for i, label in enumerate(("import app", "create_app()", "warm_up()")):
+        values = [s[i] * 1000 for s in samples]
+        print(
+            f"{label:14s} median {statistics.median(values):8.2f} ms"
+            f"   max {max(values):8.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""Bulk inventory adjustments for delivery receipts and stocktakes.
+
+A batch is a list of rows, each either a ``delta`` (restock, waste) or an
+absolute ``on_hand_quantity`` (a stocktake count). Rows may carry the
+``version`` the client last saw. The whole batch is applied with a single
+``UPDATE ... FROM (VALUES ...)`` statement, and a row whose version no longer
+matches is left untouched and reported as stale.
+"""
+
+import csv
+import io
+from decimal import Decimal, InvalidOperation
+
+from sqlalchemy import bindparam, text
+
+from models import DEFAULT_STORE_ID
+
+# Rows per UPDATE statement; keeps bind parameters well under Postgres' limit
+CHUNK_SIZE = 1000
+
+
+class BulkInventoryError(ValueError):
+    """A row in the batch is malformed; nothing has been written."""
+
+
+def _decimal(value, field, index):
+    try:
+        number = Decimal(str(value).strip())
+    except (InvalidOperation, ValueError):
+        raise BulkInventoryError(f"row {index}: {field} must be a number")
+    # NaN and Infinity parse, but would be written into NUMERIC as is
+    if not number.is_finite():
+        raise BulkInventoryError(f"row {index}: {field} must be a number")
+    return number
+
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def parse_rows(raw_rows):
+    """Validate raw dict rows into ``(ingredient_id, delta, absolute, version)``."""
+    if not isinstance(raw_rows, list):
+        raise BulkInventoryError("items must be a list of rows")
+    rows = []
+    seen = set()
+    for index, raw in enumerate(raw_rows):
+        if not isinstance(raw, dict):
+            raise BulkInventoryError(f"row {index}: must be an object")
+        if _blank(raw.get("ingredient_id")):
+            raise BulkInventoryError(f"row {index}: ingredient_id is required")
+        try:
+            ingredient_id = int(str(raw["ingredient_id"]).strip())
+        except ValueError:
+            raise BulkInventoryError(f"row {index}: ingredient_id must be an integer")
+        if ingredient_id in seen:
+            raise BulkInventoryError(
+                f"row {index}: ingredient {ingredient_id} appears more than once"
+            )
+        seen.add(ingredient_id)
+
+        has_delta = not _blank(raw.get("delta"))
+        has_absolute = not _blank(raw.get("on_hand_quantity"))
+        if has_delta == has_absolute:
+            raise BulkInventoryError(
+                f"row {index}: give exactly one of delta or on_hand_quantity"
+            )
+        delta = _decimal(raw["delta"], "delta", index) if has_delta else None
+        absolute = None
+        if has_absolute:
+            absolute = _decimal(raw["on_hand_quantity"], "on_hand_quantity", index)
+            if absolute < 0:
+                raise BulkInventoryError(
+                    f"row {index}: on_hand_quantity cannot be negative"
+                )
+
+        version = None
+        if not _blank(raw.get("version")):
+            try:
+                version = int(str(raw["version"]).strip())
+            except ValueError:
+                raise BulkInventoryError(f"row {index}: version must be an integer")
+
+        rows.append((ingredient_id, delta, absolute, version))
+    if not rows:
+        raise BulkInventoryError("no rows given")
+    return rows
+
+
+def rows_from_csv(stream):
+    """Read rows from CSV with a header of ingredient_id and delta and/or
+    on_hand_quantity, plus an optional version column."""
+    if isinstance(stream, bytes):
+        stream = stream.decode("utf-8-sig")
+    if isinstance(stream, str):
+        stream = io.StringIO(stream)
+    reader = csv.DictReader(stream)
+    if not reader.fieldnames or "ingredient_id" not in reader.fieldnames:
+        raise BulkInventoryError("CSV needs a header row with ingredient_id")
+    return list(reader)
+
+
+def _update_sql(count):
+    values = ",\n".join(
+        f"(CAST(:id{i} AS INTEGER), CAST(:d{i} AS NUMERIC), "
+        f"CAST(:a{i} AS NUMERIC), CAST(:v{i} AS INTEGER))"
+        for i in range(count)
+    )
+    return f"""
+        UPDATE inventory AS i
+        SET on_hand_quantity = COALESCE(v.absolute, i.on_hand_quantity + v.delta)
+        FROM (VALUES
+            {values}
+        ) AS v(ingredient_id, delta, absolute, expected_version)
+        WHERE i.store_id = :store_id
+          AND i.ingredient_id = v.ingredient_id
+          AND (v.expected_version IS NULL OR i.version = v.expected_version)
+        RETURNING i.ingredient_id, i.on_hand_quantity, i.version
+    """
+
+
+def apply_rows(session, rows, store_id=DEFAULT_STORE_ID):
+    """Apply parsed rows to ``store_id``'s stock in the caller's transaction.
+
+    Each result has ``status`` "ok", "stale" (version mismatch, with the
+    current version) or "not_found".
+    """
+    updated = {}
+    for start in range(0, len(rows), CHUNK_SIZE):
+        chunk = rows[start : start + CHUNK_SIZE]
+        params = {"store_id": store_id}
+        for i, (ingredient_id, delta, absolute, version) in enumerate(chunk):
+            params[f"id{i}"] = ingredient_id
+            params[f"d{i}"] = delta
+            params[f"a{i}"] = absolute
+            params[f"v{i}"] = version
+        for row in session.execute(text(_update_sql(len(chunk))), params):
+            updated[row[0]] = row
+
+    missing = [r[0] for r in rows if r[0] not in updated]
+    current_versions = {}
+    if missing:
+        current_versions = dict(
+            session.execute(
+                text(
+                    "SELECT ingredient_id, version FROM inventory "
+                    "WHERE store_id = :store_id AND ingredient_id IN :ids"
+                ).bindparams(bindparam("ids", expanding=True)),
+                {"store_id": store_id, "ids": missing},
+            ).all()
+        )
+
+    results = []
+    for ingredient_id, delta, absolute, version in rows:
+        result = {"ingredient_id": ingredient_id}
+        if delta is not None:
+            result["delta"] = float(delta)
+        else:
+            result["on_hand_quantity"] = float(absolute)
+        if ingredient_id in updated:
+            row = updated[ingredient_id]
+            result.update(
+                status="ok", new_quantity=float(row[1]), version=row[2]
+            )
+        elif ingredient_id in current_versions:
+            result.update(
+                status="stale",
+                expected_version=version,
+                current_version=current_versions[ingredient_id],
+            )
+        else:
+            result["status"] = "not_found"
+        results.append(result)
+    return results
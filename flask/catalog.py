@@ -0,0 +1,101 @@
+"""Per-worker cache of the menu catalog.
+
+Products, add-on modifications and product categories change rarely but are
+polled by every kiosk and register. ``Catalog`` keeps them in memory for
+``CATALOG_TTL_SECONDS`` and is invalidated by the endpoints that edit the
+menu, so this worker never serves its own stale writes.
+
+The menu is shared by every store; add-ons and their prices are read from
+the default store's inventory rows.
+"""
+
+import threading
+import time
+
+from sqlalchemy import text
+
+from models import DEFAULT_STORE_ID
+
+
+class Catalog:
+    def __init__(self):
+        self.ttl_seconds = 30.0
+        self.version = 0
+        self._lock = threading.Lock()
+        self._data = None
+        self._loaded_at = 0.0
+
+    def init_app(self, app):
+        self.ttl_seconds = float(app.config.get("CATALOG_TTL_SECONDS", 30))
+
+    def load(self, session):
+        products = (
+            session.execute(
+                text(
+                    """
+                SELECT product_id, product_name, unit_price, vegan, category
+                FROM products
+                WHERE is_active
+                ORDER BY product_id
+            """
+                )
+            )
+            .mappings()
+            .all()
+        )
+        modifications = (
+            session.execute(
+                text(
+                    """
+                SELECT ingredient_id, ingredient_name, price_per_unit
+                FROM inventory
+                WHERE is_add_on = TRUE AND store_id = :store_id
+                ORDER BY ingredient_id
+            """
+                ),
+                {"store_id": DEFAULT_STORE_ID},
+            )
+            .mappings()
+            .all()
+        )
+        categories = [
+            r[0]
+            for r in session.execute(
+                text("SELECT DISTINCT category FROM products WHERE is_active")
+            )
+        ]
+        return {
+            "products": [dict(r) for r in products],
+            "modifications": [
+                {
+                    "ingredient_id": m["ingredient_id"],
+                    "ingredient_name": m["ingredient_name"],
+                    "price_per_unit": (
+                        float(m["price_per_unit"]) if m["price_per_unit"] else 0.0
+                    ),
+                    "possible_modification": "ADD",
+                }
+                for m in modifications
+            ],
+            "categories": categories,
+        }
+
+    def get(self, session):
+        """Return the cached catalog dict, reloading it once the TTL expires."""
+        with self._lock:
+            if self._data is not None and (
+                time.monotonic() - self._loaded_at < self.ttl_seconds
+            ):
+                return self._data
+        data = self.load(session)
+        with self._lock:
+            if data != self._data:
+                self.version += 1
+            self._data = data
+            self._loaded_at = time.monotonic()
+        return data
+
+    def invalidate(self):
+        with self._lock:
+            self._data = None
+            self.version += 1
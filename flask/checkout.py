@@ -0,0 +1,191 @@
+"""Checkout writes in one pipelined round trip on psycopg 3.
+
+With ``DB_DRIVER=psycopg`` and ``CHECKOUT_PIPELINE`` on, ``post_order``
+writes through ``write_order_pipelined`` instead of the ORM. Every statement
+of the order is queued in a psycopg pipeline and sent together; the client
+waits for the replies once, at the sync at the end of the block:
+
+* the order insert,
+* each line's insert, followed by its modifications,
+* one ``UPDATE ... FROM`` taking the whole order's stock out of inventory
+  (recipes and cups are resolved by the server),
+* the product names and categories for the receipt and barista queue.
+
+Items refer to the order, and modifications to their item, through
+``currval`` of the id sequences. This works because a pipeline runs its
+statements in order on one session. The SQLAlchemy session still owns the
+transaction, so the caller commits or rolls back as before.
+
+The statement texts never change, so psycopg prepares them server-side once
+they have run ``DB_PREPARE_THRESHOLD`` times on a connection (see
+``pooling.engine_options``). Prepared statements are off in
+``PGBOUNCER_MODE``, where consecutive transactions may use different server
+connections; pipelining still applies there.
+"""
+
+from decimal import Decimal
+
+from sqlalchemy.exc import DBAPIError
+
+from models import CUP_INGREDIENTS
+
+INSERT_ORDER_SQL = """
+    INSERT INTO orders (order_date, total_amount, employee_id, user_id, store_id)
+    VALUES (%s, %s, %s, %s, %s)
+    RETURNING order_id
+"""
+
+INSERT_ITEM_SQL = """
+    INSERT INTO order_items
+        (order_id, product_id, quantity, unit_price_at_sale,
+         sugar_level, size_level, ice_level)
+    VALUES (currval(pg_get_serial_sequence('orders', 'order_id')), %s, %s, %s,
+            CAST(%s AS sugar_level), CAST(%s AS size_level), CAST(%s AS ice_level))
+    RETURNING order_item_id
+"""
+
+INSERT_MODIFICATION_SQL = """
+    INSERT INTO modifications
+        (order_item_id, ingredient_id, modification_type, quantity_change, price_change)
+    VALUES (currval(pg_get_serial_sequence('order_items', 'order_item_id')), %s,
+            CAST(%s AS modification_type), %s, %s)
+"""
+
+# Recipe usage and cups are expanded from the lines; modification deltas are
+# signed by the client. Ingredients with a zero delta are still returned so
+# the receipt can name them.
+UPDATE_STOCK_SQL = """
+    UPDATE inventory inv
+    SET on_hand_quantity = inv.on_hand_quantity - d.qty
+    FROM (
+        SELECT u.ingredient_id, SUM(u.qty) AS qty
+        FROM (
+            SELECT pr.ingredient_id, pr.quantity_per_unit * l.quantity AS qty
+            FROM unnest(CAST(%(products)s AS INTEGER[]), CAST(%(quantities)s AS INTEGER[]))
+                 AS l(product_id, quantity)
+            JOIN product_recipe pr ON pr.product_id = l.product_id
+            UNION ALL
+            SELECT c.ingredient_id, l.quantity
+            FROM unnest(CAST(%(cups)s AS TEXT[]), CAST(%(quantities)s AS INTEGER[]))
+                 AS l(cup, quantity)
+            JOIN inventory c ON c.store_id = %(store_id)s AND c.ingredient_name = l.cup
+            UNION ALL
+            SELECT m.ingredient_id, m.qty
+            FROM unnest(CAST(%(mod_ids)s AS INTEGER[]), CAST(%(mod_qtys)s AS NUMERIC[]))
+                 AS m(ingredient_id, qty)
+        ) u
+        GROUP BY u.ingredient_id
+    ) d
+    WHERE inv.store_id = %(store_id)s AND inv.ingredient_id = d.ingredient_id
+    RETURNING inv.ingredient_id, inv.ingredient_name, inv.on_hand_quantity
+"""
+
+PRODUCTS_SQL = """
+    SELECT product_id, product_name, category
+    FROM products
+    WHERE product_id = ANY(CAST(%s AS INTEGER[]))
+"""
+
+
+def pipelined(session):
+    """Whether ``session``'s connection can take the pipelined checkout."""
+    dbapi = session.connection().connection.driver_connection
+    return hasattr(dbapi, "pipeline")
+
+
+def _mod_type(mod):
+    return (mod.get("modification_type") or mod.get("possible_modification", "ADD")).upper()
+
+
+def write_order_pipelined(session, order, items, store_id):
+    """Insert ``order`` with its ``items`` and take the stock, in one round trip.
+
+    ``order`` holds the ``orders`` columns and ``items`` are lines as posted
+    to ``/api/postOrder``. Returns ``(order_id, item_ids, products,
+    stock)``: the new ids, ``{product_id: (name, category)}`` and
+    ``{ingredient_id: (name, on_hand_quantity)}`` of every ingredient the
+    order touched.
+    """
+    conn = session.connection()
+    dbapi = conn.connection.driver_connection
+    driver = conn.dialect.loaded_dbapi
+    mod_ids, mod_qtys = [], []
+    for item in items:
+        for mod in item.get("modifications", []):
+            sign = {"ADD": 1, "EXTRA": 1, "REMOVE": -1, "LESS": -1}.get(_mod_type(mod), 0)
+            mod_ids.append(int(mod["ingredient_id"]))
+            mod_qtys.append(
+                sign * Decimal(str(mod.get("quantity_change", 0))) * Decimal(item["quantity"])
+            )
+    stock_params = {
+        "store_id": store_id,
+        "products": [int(i["product_id"]) for i in items],
+        "quantities": [int(i["quantity"]) for i in items],
+        "cups": [
+            CUP_INGREDIENTS.get(i.get("size_level", "normal"), CUP_INGREDIENTS["normal"])
+            for i in items
+        ],
+        "mod_ids": mod_ids,
+        "mod_qtys": mod_qtys,
+    }
+
+    cursors = []
+
+    def cursor():
+        cursors.append(dbapi.cursor())
+        return cursors[-1]
+
+    try:
+        with dbapi.pipeline():
+            order_cur = cursor()
+            order_cur.execute(
+                INSERT_ORDER_SQL,
+                (
+                    order["order_date"],
+                    order["total_amount"],
+                    order["employee_id"],
+                    order["user_id"],
+                    store_id,
+                ),
+            )
+            mod_cur = cursor()
+            item_curs = []
+            for item in items:
+                item_curs.append(cursor())
+                item_curs[-1].execute(
+                    INSERT_ITEM_SQL,
+                    (
+                        item["product_id"],
+                        item["quantity"],
+                        Decimal(str(item["unit_price_at_sale"])),
+                        item.get("sugar_level", "100%"),
+                        item.get("size_level", "normal"),
+                        item.get("ice_level", "regular"),
+                    ),
+                )
+                for mod in item.get("modifications", []):
+                    mod_cur.execute(
+                        INSERT_MODIFICATION_SQL,
+                        (
+                            mod["ingredient_id"],
+                            _mod_type(mod),
+                            Decimal(str(mod.get("quantity_change", 0))),
+                            Decimal(str(mod.get("price_change", 0))),
+                        ),
+                    )
+            stock_cur = cursor()
+            stock_cur.execute(UPDATE_STOCK_SQL, stock_params)
+            product_cur = cursor()
+            product_cur.execute(PRODUCTS_SQL, (stock_params["products"],))
+        # The block synced the pipeline: every reply is in
+        order_id = order_cur.fetchone()[0]
+        item_ids = [cur.fetchone()[0] for cur in item_curs]
+        stock = {iid: (name, qty) for iid, name, qty in stock_cur.fetchall()}
+        products = {pid: (name, category) for pid, name, category in product_cur.fetchall()}
+    except driver.Error as e:
+        # Raised as SQLAlchemy errors, like the ORM path's
+        raise DBAPIError.instance(None, None, e, driver.Error) from e
+    finally:
+        for cur in cursors:
+            cur.close()
+    return order_id, item_ids, products, stock
@@ -0,0 +1,198 @@
+"""Environment-driven configuration for the Flask backend.
+
+``load_config()`` reads the project ``.env`` file and the process environment
+into a plain dict that ``create_app`` applies on top of Flask's defaults.
+Nothing here connects to the database or imports a client library.
+"""
+
+import os
+
+from sqlalchemy.engine import URL
+
+
+def _env_float(name, default):
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else default
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_bool(name, default=False):
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_map(name):
+    """Parse ``"key:value,key:value"`` into a dict; empty when unset."""
+    pairs = (item.split(":", 1) for item in os.getenv(name, "").split(",") if item.strip())
+    return {key.strip(): value.strip() for key, value in pairs}
+
+
+def database_uri(prefix="PSQL", fallback_prefix=None, driver=None):
+    """Build a Postgres URI from ``<prefix>_HOST``/``_PORT``/... variables.
+
+    Unset fields fall back to ``<fallback_prefix>_*``. ``driver`` picks the
+    DBAPI (``"psycopg"`` for psycopg 3; psycopg2 by default). Returns ``None``
+    when no host is configured, instead of failing on a missing variable.
+    """
+
+    def get(field):
+        value = os.getenv(f"{prefix}_{field}")
+        if value in (None, "") and fallback_prefix:
+            value = os.getenv(f"{fallback_prefix}_{field}")
+        return value or None
+
+    host = os.getenv(f"{prefix}_HOST")
+    if not host:
+        return None
+    port = get("PORT")
+    return URL.create(
+        f"postgresql+{driver}" if driver else "postgresql",
+        username=get("USER"),
+        password=get("PASSWORD"),
+        host=host,
+        port=int(port) if port else None,
+        database=get("DATABASE"),
+    ).render_as_string(hide_password=False)
+
+
+def load_config():
+    # Load .env from parent directory
+    from dotenv import load_dotenv
+
+    load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env"))
+
+    # "psycopg" switches every engine to psycopg 3 (prepared statements and
+    # the pipelined checkout, see checkout.py)
+    driver = os.getenv("DB_DRIVER") or None
+
+    api_base_url = os.getenv(
+        "REACT_APP_BACKEND_URL", "https://project-3-group-11.onrender.com"
+    )
+    config = {
+        "SECRET_KEY": os.getenv("FLASK_KEY"),
+        "SESSION_COOKIE_SAMESITE": "None",
+        "SESSION_COOKIE_SECURE": True,
+        "SESSION_COOKIE_HTTPONLY": True,
+        "FRONTEND_URL": os.getenv("REACT_APP_FRONTEND_URL"),
+        "API_BASE_URL": api_base_url,
+        "GOOGLE_CLIENT_ID": os.getenv("GOOGLE_CLIENT_ID"),
+        "GOOGLE_CLIENT_SECRET": os.getenv("CLIENT_SECRET"),
+        "GOOGLE_REDIRECT_URI": f"{api_base_url}/api/oauth2/callback",
+        "SENDGRID_API_KEY": os.getenv("SENDGRID_API_KEY"),
+        "SENDER_EMAIL": os.getenv("SENDER_EMAIL"),
+        # Overridable so load tests can stand in for Google and SendGrid
+        "GOOGLE_TOKEN_URL": os.getenv(
+            "GOOGLE_TOKEN_URL", "https://oauth2.googleapis.com/token"
+        ),
+        "GOOGLE_USERINFO_URL": os.getenv(
+            "GOOGLE_USERINFO_URL", "https://openidconnect.googleapis.com/v1/userinfo"
+        ),
+        "SENDGRID_API_URL": os.getenv(
+            "SENDGRID_API_URL", "https://api.sendgrid.com/v3/mail/send"
+        ),
+        "EXTERNAL_HTTP_TIMEOUT": _env_float("EXTERNAL_HTTP_TIMEOUT", 10.0),
+        "SQLALCHEMY_DATABASE_URI": database_uri("PSQL", driver=driver),
+        "DB_DRIVER": driver or "psycopg2",
+        # psycopg 3 prepares a statement once it has run this often on a connection
+        "DB_PREPARE_THRESHOLD": _env_int("DB_PREPARE_THRESHOLD", 1),
+        "CHECKOUT_PIPELINE": _env_bool("CHECKOUT_PIPELINE", True),
+        "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+        "REPLICA_MAX_LAG_SECONDS": _env_float("REPLICA_MAX_LAG_SECONDS", 5.0),
+        "REPLICA_LAG_CHECK_INTERVAL": _env_float("REPLICA_LAG_CHECK_INTERVAL", 2.0),
+        "READ_YOUR_WRITES_SECONDS": _env_float("READ_YOUR_WRITES_SECONDS", 10.0),
+        "CATALOG_TTL_SECONDS": _env_float("CATALOG_TTL_SECONDS", 30.0),
+        "WARM_UP_CONNECTIONS": _env_int("WARM_UP_CONNECTIONS", 2),
+        "DB_POOL_SIZE": _env_int("DB_POOL_SIZE", 0),
+        "DB_MAX_OVERFLOW": _env_int("DB_MAX_OVERFLOW", 10),
+        "DB_POOL_TIMEOUT": _env_float("DB_POOL_TIMEOUT", 10.0),
+        "DB_POOL_RECYCLE": _env_int("DB_POOL_RECYCLE", 1800),
+        "DB_POOL_PRE_PING": _env_bool("DB_POOL_PRE_PING", True),
+        # Transaction-pooling pgbouncer in front of Postgres: no session state
+        "PGBOUNCER_MODE": _env_bool("PGBOUNCER_MODE"),
+        "STATEMENT_TIMEOUTS_MS": {
+            "checkout": _env_int("STATEMENT_TIMEOUT_CHECKOUT_MS", 5000),
+            "report": _env_int("STATEMENT_TIMEOUT_REPORT_MS", 60000),
+            "default": _env_int("STATEMENT_TIMEOUT_DEFAULT_MS", 15000),
+        },
+        "HEALTH_CHECK_INTERVAL": _env_float("HEALTH_CHECK_INTERVAL", 5.0),
+        "REPORT_CACHE_MAX_ENTRIES": _env_int("REPORT_CACHE_MAX_ENTRIES", 5000),
+        "REPORT_CACHE_LRU_SECONDS": _env_float("REPORT_CACHE_LRU_SECONDS", 300.0),
+        "REPORT_CACHE_PERSIST": _env_bool("REPORT_CACHE_PERSIST", True),
+        "FORECAST_HISTORY_DAYS": _env_int("FORECAST_HISTORY_DAYS", 400),
+        "FORECAST_REFRESH_SECONDS": _env_float("FORECAST_REFRESH_SECONDS", 300.0),
+        # Per-worker admission control (admission.py); 0 sizes it to the pool
+        "ADMISSION_ENABLED": _env_bool("ADMISSION_ENABLED", True),
+        "ADMISSION_CAPACITY": _env_int("ADMISSION_CAPACITY", 0),
+        "ADMISSION_SHED_WAIT_MS": _env_float("ADMISSION_SHED_WAIT_MS", 250.0),
+        "BARISTA_STATIONS": _env_int("BARISTA_STATIONS", 2),
+        "BARISTA_SECONDS_PER_MOD": _env_float("BARISTA_SECONDS_PER_MOD", 10.0),
+        # Drinks never marked done leave the queue this long after they were queued
+        "BARISTA_ITEM_TTL_SECONDS": _env_float("BARISTA_ITEM_TTL_SECONDS", 4 * 3600.0),
+        "COST_MODEL_TTL_SECONDS": _env_float("COST_MODEL_TTL_SECONDS", 300.0),
+        "SEARCH_INDEX_TTL_SECONDS": _env_float("SEARCH_INDEX_TTL_SECONDS", 300.0),
+        "AVAILABILITY_TTL_SECONDS": _env_float("AVAILABILITY_TTL_SECONDS", 5.0),
+        "AVAILABILITY_ENFORCE": _env_bool("AVAILABILITY_ENFORCE", True),
+        "USUALS_TOP_K": _env_int("USUALS_TOP_K", 5),
+        "USUALS_HALF_LIFE_DAYS": _env_float("USUALS_HALF_LIFE_DAYS", 90.0),
+        # JSON logs via a queue and listener thread (request_log.py)
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "INFO"),
+        "LOG_QUEUE": _env_bool("LOG_QUEUE", True),
+        "LOG_QUEUE_SIZE": _env_int("LOG_QUEUE_SIZE", 10000),
+        # Fraction of records kept per event, e.g. "request:0.1"
+        "LOG_SAMPLE_RATES": _env_map("LOG_SAMPLE_RATES"),
+        # Parquet archive of closed days (archive.py, archive_query.py)
+        "ARCHIVE_DIR": os.getenv("ARCHIVE_DIR")
+        or os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive"),
+        "Z_REPORT_AUTO_CLOSE": _env_bool("Z_REPORT_AUTO_CLOSE", False),
+        "Z_REPORT_AUTO_CLOSE_INTERVAL": _env_float("Z_REPORT_AUTO_CLOSE_INTERVAL", 900.0),
+        "Z_REPORT_LOOKBACK_DAYS": _env_int("Z_REPORT_LOOKBACK_DAYS", 35),
+        # ETags, 304s and compressed bodies on polled endpoints (http_cache.py)
+        "HTTP_CACHE": _env_bool("HTTP_CACHE", True),
+        "HTTP_COMPRESS_MIN_BYTES": _env_int("HTTP_COMPRESS_MIN_BYTES", 1024),
+        "HTTP_CACHE_MAX_ENTRIES": _env_int("HTTP_CACHE_MAX_ENTRIES", 256),
+        # Async service for OAuth and receipts (async_app.py); when set, orders
+        # hand their receipt to it instead of calling SendGrid themselves
+        "RECEIPT_SERVICE_URL": os.getenv("RECEIPT_SERVICE_URL"),
+        "RECEIPT_HANDOFF_TIMEOUT": _env_float("RECEIPT_HANDOFF_TIMEOUT", 2.0),
+        "ASYNC_HTTP_MAX_CONNECTIONS": _env_int("ASYNC_HTTP_MAX_CONNECTIONS", 1000),
+        "ASYNC_DB_POOL_SIZE": _env_int("ASYNC_DB_POOL_SIZE", 5),
+        "ASYNC_DB_POOL_TIMEOUT": _env_float("ASYNC_DB_POOL_TIMEOUT", 10.0),
+        # Sampled request capture for replay.py (traffic_capture.py)
+        "CAPTURE_ENABLED": _env_bool("CAPTURE_ENABLED", False),
+        "CAPTURE_DIR": os.getenv("CAPTURE_DIR")
+        or os.path.join(os.path.dirname(os.path.abspath(__file__)), "capture"),
+        "CAPTURE_SAMPLE_RATE": _env_float("CAPTURE_SAMPLE_RATE", 1.0),
+        "CAPTURE_MAX_BYTES": _env_int("CAPTURE_MAX_BYTES", 64 * 1024 * 1024),
+        "CAPTURE_BACKUPS": _env_int("CAPTURE_BACKUPS", 20),
+        "CAPTURE_PSEUDONYM_KEY": os.getenv("CAPTURE_PSEUDONYM_KEY"),
+        # Today's orders in memory for the X and Z reports (order_book.py)
+        "ORDER_BOOK": _env_bool("ORDER_BOOK", True),
+        "ORDER_BOOK_SYNC_SECONDS": _env_float("ORDER_BOOK_SYNC_SECONDS", 2.0),
+        "ORDER_BOOK_RESCAN_IDS": _env_int("ORDER_BOOK_RESCAN_IDS", 200),
+    }
+
+    # Optional read replica for reports and order history; writes stay on the primary
+    replica_uri = database_uri("PSQL_REPLICA", fallback_prefix="PSQL", driver=driver)
+    if replica_uri:
+        config["SQLALCHEMY_BINDS"] = {"replica": replica_uri}
+
+    # Multi-store: STORE_SHARDS="2:east,3:east" puts stores 2 and 3 on the
+    # database configured by PSQL_SHARD_EAST_* (unset fields fall back to PSQL_*)
+    config["STORE_SHARDS"] = {int(k): v for k, v in _env_map("STORE_SHARDS").items()}
+    # Cross-store summaries re-read the stores tables this often
+    config["SHARD_STORES_TTL_SECONDS"] = _env_float("SHARD_STORES_TTL_SECONDS", 60.0)
+    config["SHARD_DATABASES"] = {}
+    for shard in sorted(set(config["STORE_SHARDS"].values()) - {"default"}):
+        uri = database_uri(
+            f"PSQL_SHARD_{shard.upper()}", fallback_prefix="PSQL", driver=driver
+        )
+        if uri:
+            config["SHARD_DATABASES"][shard] = uri
+
+    return config
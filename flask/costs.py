@@ -0,0 +1,262 @@
+"""Recipe cost (COGS) per drink and gross margins.
+
+The recipe table is held as a dense ``products x ingredients`` matrix ``R``
+and each store's ingredient prices as a vector ``p`` (``price_per_unit`` of
+its inventory rows). The cost of a drink before its cup is ``R @ p``, and the
+cup of each size is added on top. Add-ons are costed from the modifications
+actually recorded on orders.
+
+A store's costs are loaded once and kept for ``COST_MODEL_TTL_SECONDS``.
+Writes in this worker patch them in place rather than reloading: a price
+change is a rank-one update of the cost vector, and a recipe change
+recomputes only that product's row. Other workers pick the change up when
+their copy expires.
+
+Realised margins over a date range use per-day partials of volume by product
+and size, and add-on quantities by product and ingredient. Cost is applied
+at merge time at current prices, so margins are on a replacement-cost basis.
+"""
+
+import threading
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+import numpy as np
+from sqlalchemy import bindparam, text
+
+from models import CUP_INGREDIENTS, DEFAULT_STORE_ID
+from report_cache import day_span
+
+SIZES = tuple(CUP_INGREDIENTS)
+
+SOLD_BY_DAY_SQL = """
+    SELECT DATE(o.order_date) AS day, oi.product_id, oi.size_level,
+           SUM(oi.quantity) AS qty,
+           SUM(oi.quantity * oi.unit_price_at_sale) AS revenue
+    FROM orders o
+    JOIN order_items oi ON oi.order_id = o.order_id
+    WHERE o.store_id = :store_id
+      AND o.order_date >= :since AND o.order_date < :until
+    GROUP BY DATE(o.order_date), oi.product_id, oi.size_level
+"""
+
+# Net ingredient added per product, signed the way post_order moves stock
+MODS_BY_DAY_SQL = """
+    SELECT DATE(o.order_date) AS day, oi.product_id, m.ingredient_id,
+           SUM(
+               CASE
+                   WHEN m.modification_type IN ('ADD', 'EXTRA') THEN 1
+                   WHEN m.modification_type IN ('REMOVE', 'LESS') THEN -1
+                   ELSE 0
+               END * m.quantity_change * oi.quantity
+           ) AS qty
+    FROM orders o
+    JOIN order_items oi ON oi.order_id = o.order_id
+    JOIN modifications m ON m.order_item_id = oi.order_item_id
+    WHERE o.store_id = :store_id
+      AND o.order_date >= :since AND o.order_date < :until
+    GROUP BY DATE(o.order_date), oi.product_id, m.ingredient_id
+"""
+
+
+def _size(value):
+    return value if value in CUP_INGREDIENTS else "normal"
+
+
+def compute_partials(conn, days, store_id=DEFAULT_STORE_ID):
+    """``{day: {"sold": {pid: {size: [qty, revenue]}}, "mods": {pid: {iid: qty}}}}``."""
+    since, until = day_span(days)
+    params = {"since": since, "until": until, "store_id": store_id}
+    partials = {day: {"sold": {}, "mods": {}} for day in days}
+    for day, pid, size, qty, revenue in conn.execute(text(SOLD_BY_DAY_SQL), params):
+        if day in partials:
+            sizes = partials[day]["sold"].setdefault(str(pid), {})
+            # Lines without a size count as "normal"
+            q, r = sizes.get(_size(size), ("0", "0"))
+            sizes[_size(size)] = [str(Decimal(q) + qty), str(Decimal(r) + revenue)]
+    for day, pid, iid, qty in conn.execute(text(MODS_BY_DAY_SQL), params):
+        if day in partials and qty:
+            partials[day]["mods"].setdefault(str(pid), {})[str(iid)] = str(qty)
+    return partials
+
+
+class _StoreCosts:
+    __slots__ = ("prices", "by_id", "cups", "base", "loaded_at")
+
+    def __init__(self, prices, by_id, cups, base):
+        # Price vector aligned with the recipe matrix columns
+        self.prices = prices
+        # Every ingredient's price, including ones no recipe uses (add-ons)
+        self.by_id = by_id
+        self.cups = cups
+        self.base = base
+        self.loaded_at = time.monotonic()
+
+
+class CostModel:
+    def __init__(self, ttl_seconds=300.0):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._products = None
+        self._ingredients = None
+        self._matrix = None
+        self._loaded_at = 0.0
+        self._stores = {}
+
+    def init_app(self, app):
+        self.ttl_seconds = float(app.config.get("COST_MODEL_TTL_SECONDS", 300))
+
+    def _load_recipes(self, conn):
+        products = [
+            r[0]
+            for r in conn.execute(text("SELECT product_id FROM products ORDER BY product_id"))
+        ]
+        rows = conn.execute(
+            text("SELECT product_id, ingredient_id, quantity_per_unit FROM product_recipe")
+        ).all()
+        ingredients = sorted({iid for _, iid, _ in rows})
+        p_index = {pid: i for i, pid in enumerate(products)}
+        i_index = {iid: j for j, iid in enumerate(ingredients)}
+        matrix = np.zeros((len(products), len(ingredients)))
+        for pid, iid, qty in rows:
+            if pid in p_index:
+                matrix[p_index[pid], i_index[iid]] = float(qty)
+        self._products = p_index
+        self._ingredients = i_index
+        self._matrix = matrix
+        self._loaded_at = time.monotonic()
+        self._stores = {}
+
+    def _load_store(self, conn, store_id):
+        by_id, names = {}, {}
+        for iid, name, price in conn.execute(
+            text(
+                "SELECT ingredient_id, ingredient_name, price_per_unit "
+                "FROM inventory WHERE store_id = :store_id"
+            ),
+            {"store_id": store_id},
+        ):
+            by_id[iid] = float(price or 0)
+            names[name] = iid
+        prices = np.zeros(len(self._ingredients))
+        for iid, j in self._ingredients.items():
+            prices[j] = by_id.get(iid, 0.0)
+        cups = {size: names.get(cup) for size, cup in CUP_INGREDIENTS.items()}
+        return _StoreCosts(prices, by_id, cups, self._matrix @ prices)
+
+    def _state(self, conn, store_id):
+        now = time.monotonic()
+        with self._lock:
+            if self._matrix is None or now - self._loaded_at > self.ttl_seconds:
+                self._load_recipes(conn)
+            state = self._stores.get(store_id)
+            if state is None or now - state.loaded_at > self.ttl_seconds:
+                state = self._stores[store_id] = self._load_store(conn, store_id)
+            return state
+
+    def size_costs(self, conn, store_id=DEFAULT_STORE_ID):
+        """``(product_ids, costs)`` where ``costs`` is ``products x SIZES``."""
+        state = self._state(conn, store_id)
+        with self._lock:
+            cups = np.array(
+                [state.by_id.get(state.cups[size], 0.0) for size in SIZES]
+            )
+            costs = state.base[:, None] + cups[None, :]
+            return list(self._products), costs
+
+    def ingredient_prices(self, conn, store_id=DEFAULT_STORE_ID):
+        return dict(self._state(conn, store_id).by_id)
+
+    def price_changed(self, store_id, ingredient_id, price):
+        """Apply a new ``price_per_unit`` of one store's ingredient."""
+        price = float(price or 0)
+        with self._lock:
+            state = self._stores.get(store_id)
+            if state is None:
+                return
+            state.by_id[ingredient_id] = price
+            j = self._ingredients.get(ingredient_id)
+            if j is not None:
+                state.base += self._matrix[:, j] * (price - state.prices[j])
+                state.prices[j] = price
+
+    def recipe_changed(self, session, product_ids):
+        """Recompute the cost rows of ``product_ids`` from their recipes."""
+        if self._matrix is None or not product_ids:
+            return
+        rows = session.execute(
+            text(
+                "SELECT product_id, ingredient_id, quantity_per_unit "
+                "FROM product_recipe WHERE product_id IN :ids"
+            ).bindparams(bindparam("ids", expanding=True)),
+            {"ids": list(product_ids)},
+        ).all()
+        with self._lock:
+            if any(pid not in self._products for pid in product_ids) or any(
+                iid not in self._ingredients for _, iid, _ in rows
+            ):
+                # New product or ingredient: the matrix changes shape
+                self._matrix = None
+                self._stores = {}
+                return
+            recipes = defaultdict(dict)
+            for pid, iid, qty in rows:
+                recipes[pid][iid] = float(qty)
+            for pid in product_ids:
+                i = self._products[pid]
+                self._matrix[i, :] = 0.0
+                for iid, qty in recipes[pid].items():
+                    self._matrix[i, self._ingredients[iid]] = qty
+                for state in self._stores.values():
+                    state.base[i] = self._matrix[i] @ state.prices
+
+    def invalidate(self):
+        with self._lock:
+            self._matrix = None
+            self._stores = {}
+
+
+def merge_margins(product_ids, costs, ingredient_prices, partials):
+    """Realised volume, revenue, COGS and margin per product over ``partials``."""
+    p_index = {pid: i for i, pid in enumerate(product_ids)}
+    s_index = {size: k for k, size in enumerate(SIZES)}
+    qty = np.zeros((len(product_ids), len(SIZES)))
+    revenue = np.zeros(len(product_ids))
+    addons = np.zeros(len(product_ids))
+    for partial in partials:
+        for pid, sizes in partial["sold"].items():
+            i = p_index.get(int(pid))
+            if i is None:
+                continue
+            for size, (q, r) in sizes.items():
+                qty[i, s_index[size]] += float(q)
+                revenue[i] += float(r)
+        for pid, mods in partial["mods"].items():
+            i = p_index.get(int(pid))
+            if i is None:
+                continue
+            addons[i] += sum(
+                float(q) * ingredient_prices.get(int(iid), 0.0) for iid, q in mods.items()
+            )
+    cogs = (qty * costs).sum(axis=1) + addons
+    sold = qty.sum(axis=1)
+    rows = []
+    for i in np.flatnonzero(sold):
+        margin = revenue[i] - cogs[i]
+        rows.append(
+            {
+                "product_id": product_ids[i],
+                "qty": int(sold[i]),
+                "revenue": round(float(revenue[i]), 2),
+                "avg_price": round(float(revenue[i] / sold[i]), 2),
+                "cogs": round(float(cogs[i]), 2),
+                "addon_cost": round(float(addons[i]), 2),
+                "gross_margin": round(float(margin), 2),
+                "margin_pct": (
+                    round(float(margin / revenue[i] * 100), 1) if revenue[i] else None
+                ),
+            }
+        )
+    rows.sort(key=lambda r: r["gross_margin"], reverse=True)
+    return rows
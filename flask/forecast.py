@@ -0,0 +1,256 @@
+"""Ingredient depletion forecast.
+
+Hourly consumption per ingredient is read from order lines expanded through
+``product_recipe``, the cup for the drink size and any modifications, into a
+dense ``hours x ingredients`` array. The forecast is a seasonal baseline
+(a recency-weighted day-of-week x hour profile over the last few weeks)
+scaled by a per-ingredient linear trend over recent daily totals. Projecting
+it forward and comparing the running total against ``on_hand_quantity``
+gives days until stockout.
+
+The array is cached per worker and refreshed incrementally: only hours after
+the last load (plus a one-day overlap for late-arriving orders) are queried.
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import text
+
+from models import CUP_INGREDIENTS, DEFAULT_STORE_ID
+
+HOURS_PER_WEEK = 7 * 24
+
+# Hourly consumption per ingredient between :since and :until
+USAGE_BY_HOUR_SQL = """
+    WITH lines AS (
+        SELECT DATE_TRUNC('hour', o.order_date) AS hour,
+               oi.order_item_id, oi.product_id, oi.quantity, oi.size_level
+        FROM orders o
+        JOIN order_items oi ON oi.order_id = o.order_id
+        WHERE o.store_id = :store_id
+          AND o.order_date >= :since AND o.order_date < :until
+    ),
+    usage AS (
+        SELECT l.hour, pr.ingredient_id, l.quantity * pr.quantity_per_unit AS qty
+        FROM lines l
+        JOIN product_recipe pr ON pr.product_id = l.product_id
+        UNION ALL
+        SELECT l.hour, i.ingredient_id, l.quantity AS qty
+        FROM lines l
+        JOIN inventory i ON i.store_id = :store_id AND i.ingredient_name = CASE l.size_level::text
+            WHEN 'small' THEN :cup_small
+            WHEN 'large' THEN :cup_large
+            ELSE :cup_normal
+        END
+        UNION ALL
+        SELECT l.hour, m.ingredient_id,
+               l.quantity * COALESCE(m.quantity_change, 0)
+               * CASE WHEN m.modification_type IN ('ADD', 'EXTRA') THEN 1 ELSE -1 END AS qty
+        FROM lines l
+        JOIN modifications m ON m.order_item_id = l.order_item_id
+    )
+    SELECT hour, ingredient_id, SUM(qty) AS qty
+    FROM usage
+    GROUP BY hour, ingredient_id
+"""
+
+CUP_PARAMS = {
+    "cup_small": CUP_INGREDIENTS["small"],
+    "cup_normal": CUP_INGREDIENTS["normal"],
+    "cup_large": CUP_INGREDIENTS["large"],
+}
+
+
+def _hour_floor(dt):
+    return dt.replace(minute=0, second=0, microsecond=0)
+
+
+def seasonal_profile(usage, start_slot, weeks, decay=0.8):
+    """Recency-weighted ``168 x ingredients`` profile from the last ``weeks``.
+
+    ``usage`` is ``hours x ingredients`` ending at a closed hour; row ``k``
+    falls in weekly slot ``(start_slot + k) % 168`` where slot 0 is Monday
+    00:00.
+    """
+    n_ingredients = usage.shape[1]
+    if usage.shape[0] < HOURS_PER_WEEK:
+        # Less than a week of history: fall back to the hour-of-day mean
+        slots = (start_slot + np.arange(usage.shape[0])) % 24
+        sums = np.zeros((24, n_ingredients))
+        np.add.at(sums, slots, usage)
+        counts = np.bincount(slots, minlength=24)[:, None]
+        hourly = np.divide(sums, counts, out=np.zeros_like(sums), where=counts > 0)
+        return np.tile(hourly, (7, 1))
+
+    weeks = max(1, min(weeks, usage.shape[0] // HOURS_PER_WEEK))
+    window = usage[-weeks * HOURS_PER_WEEK :]
+
+    # Every row of the reshaped window shares its weekly slot across weeks
+    weights = decay ** np.arange(weeks - 1, -1, -1, dtype=float)
+    weights /= weights.sum()
+    stacked = window.reshape(weeks, HOURS_PER_WEEK, n_ingredients)
+    mean = np.tensordot(weights, stacked, axes=1)
+    first_slot = (start_slot + usage.shape[0] - window.shape[0]) % HOURS_PER_WEEK
+    return np.roll(mean, first_slot, axis=0)
+
+
+def trend_factors(usage, horizon_hours, days=28, clip=(0.5, 2.0)):
+    """Per-ingredient multiplier for each future hour from a linear trend.
+
+    Fits ``daily_total = a + b * day`` over the last ``days`` whole days for
+    all ingredients at once, and returns ``horizon_hours x ingredients``
+    factors relative to the fitted level over that window.
+    """
+    n_days = min(days, usage.shape[0] // 24)
+    n_ingredients = usage.shape[1]
+    if n_days < 7:
+        return np.ones((horizon_hours, n_ingredients))
+    daily = usage[-n_days * 24 :].reshape(n_days, 24, n_ingredients).sum(axis=1)
+    t = np.arange(n_days, dtype=float)
+    t_centered = t - t.mean()
+    mean = daily.mean(axis=0)
+    slope = (t_centered @ (daily - mean)) / (t_centered @ t_centered)
+    future_days = n_days - 1 - t.mean() + (np.arange(horizon_hours) + 1) / 24.0
+    level = mean + np.outer(future_days, slope)
+    factors = np.divide(level, mean, out=np.ones_like(level), where=mean > 0)
+    return np.clip(factors, *clip)
+
+
+class ForecastModel:
+    """Cached hourly usage history of one store plus the forecast computed from it."""
+
+    def __init__(self, history_days=400, refresh_seconds=300, store_id=DEFAULT_STORE_ID):
+        self.store_id = store_id
+        self.history_days = history_days
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self.start = None
+        self.until = None
+        self.ingredient_ids = []
+        self.usage = np.zeros((0, 0))
+        self._refreshed_at = 0.0
+
+    def _load(self, conn, since, until):
+        return conn.execute(
+            text(USAGE_BY_HOUR_SQL),
+            {"since": since, "until": until, "store_id": self.store_id, **CUP_PARAMS},
+        ).all()
+
+    def _ingest(self, rows, since, until, ingredient_ids):
+        """Place ``rows`` into the dense array, growing it as needed."""
+        index = {iid: i for i, iid in enumerate(self.ingredient_ids)}
+        for iid in ingredient_ids:
+            if iid not in index:
+                index[iid] = len(self.ingredient_ids)
+                self.ingredient_ids.append(iid)
+        n_ingredients = len(self.ingredient_ids)
+        n_hours = int((until - self.start).total_seconds() // 3600)
+
+        usage = np.zeros((n_hours, n_ingredients))
+        keep = min(self.usage.shape[0], n_hours)
+        usage[:keep, : self.usage.shape[1]] = self.usage[:keep]
+        # The re-read window replaces whatever was cached for those hours
+        first = int((since - self.start).total_seconds() // 3600)
+        usage[first:] = 0.0
+
+        if rows:
+            hours = np.fromiter(
+                ((r[0] - self.start).total_seconds() // 3600 for r in rows),
+                dtype=np.int64,
+                count=len(rows),
+            )
+            cols = np.fromiter(
+                (index.get(r[1], -1) for r in rows), dtype=np.int64, count=len(rows)
+            )
+            qty = np.fromiter((float(r[2]) for r in rows), dtype=float, count=len(rows))
+            ok = (cols >= 0) & (hours >= 0) & (hours < n_hours)
+            np.add.at(usage, (hours[ok], cols[ok]), qty[ok])
+
+        # Drop history older than history_days, in whole days
+        excess = n_hours - self.history_days * 24
+        if excess > 0:
+            drop = (excess // 24) * 24
+            usage = usage[drop:]
+            self.start += timedelta(hours=int(drop))
+        self.usage = usage
+        self.until = until
+
+    def refresh(self, conn, now=None, force=False):
+        """Bring the cached array up to the last closed hour."""
+        now = now or datetime.now()
+        until = _hour_floor(now)
+        with self._lock:
+            if (
+                not force
+                and self.until is not None
+                and time.monotonic() - self._refreshed_at < self.refresh_seconds
+            ):
+                return
+            ingredient_ids = [
+                r[0]
+                for r in conn.execute(
+                    text(
+                        "SELECT ingredient_id FROM inventory "
+                        "WHERE store_id = :store_id ORDER BY ingredient_id"
+                    ),
+                    {"store_id": self.store_id},
+                )
+            ]
+            if self.start is None:
+                self.start = (until - timedelta(days=self.history_days)).replace(hour=0)
+                since = self.start
+            else:
+                since = max(self.start, min(self.until, until) - timedelta(days=1))
+            rows = self._load(conn, since, until)
+            self._ingest(rows, since, until, ingredient_ids)
+            self._refreshed_at = time.monotonic()
+
+    def forecast(self, stock, days=14, weeks=8):
+        """Project usage for ``days`` and find stockouts.
+
+        ``stock`` maps ingredient_id to on-hand quantity. Returns a dict per
+        ingredient with the projected daily usage and hours until stockout.
+        """
+        with self._lock:
+            usage = self.usage
+            ids = list(self.ingredient_ids)
+            until = self.until
+            start = self.start
+        horizon = days * 24
+        n = len(ids)
+        if n == 0 or usage.shape[0] == 0:
+            return {}
+
+        start_slot = start.weekday() * 24 + start.hour
+        profile = seasonal_profile(usage, start_slot, weeks)
+        first_future_slot = (start_slot + usage.shape[0]) % HOURS_PER_WEEK
+        slots = (first_future_slot + np.arange(horizon)) % HOURS_PER_WEEK
+        projected = np.clip(profile[slots] * trend_factors(usage, horizon), 0, None)
+
+        on_hand = np.array([float(stock.get(iid, 0.0)) for iid in ids])
+        cumulative = np.cumsum(projected, axis=0)
+        runs_out = cumulative >= on_hand
+        stockout_hour = np.where(runs_out.any(axis=0), runs_out.argmax(axis=0), -1)
+        daily = projected.reshape(days, 24, n).sum(axis=1)
+        recent = usage[-7 * 24 :].sum(axis=0) / max(1, min(7, usage.shape[0] / 24))
+
+        results = {}
+        for col, iid in enumerate(ids):
+            hours_left = int(stockout_hour[col])
+            if on_hand[col] <= 0:
+                days_left, stockout_at = 0.0, until.isoformat()
+            elif hours_left >= 0:
+                days_left = round((hours_left + 1) / 24.0, 2)
+                stockout_at = (until + timedelta(hours=hours_left + 1)).isoformat()
+            else:
+                days_left, stockout_at = None, None
+            results[iid] = {
+                "avg_daily_usage_7d": float(recent[col]),
+                "projected_daily_usage": [round(float(x), 2) for x in daily[:, col]],
+                "days_until_stockout": days_left,
+                "stockout_at": stockout_at,
+            }
+        return results
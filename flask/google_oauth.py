@@ -0,0 +1,52 @@
+"""Google sign-in pieces shared by the sync and async OAuth callbacks.
+
+The callback trades the authorization code for an access token, reads the
+user's profile with it, then finds or creates the ``users`` row and puts it
+in the session. ``/api/oauth2/callback`` in app.py does this with blocking
+calls; async_app.py does the same without holding a worker while Google
+answers. The endpoints come from ``GOOGLE_TOKEN_URL`` and
+``GOOGLE_USERINFO_URL`` so both can be pointed at a stand-in.
+"""
+
+FIND_USER_SQL = (
+    "SELECT user_id, google_sub, email, name, role FROM users WHERE google_sub = :sub"
+)
+
+CREATE_USER_SQL = """
+    WITH next AS (
+        SELECT COALESCE(MAX(user_id), 0) + 1 AS id FROM users
+    )
+    INSERT INTO users (user_id, google_sub, email, name, role)
+    SELECT next.id, :sub, :email, :name, :role FROM next
+    RETURNING user_id, google_sub, email, name, role
+"""
+
+
+def token_form(config, code):
+    """Form body exchanging ``code`` for an access token."""
+    return {
+        "code": code,
+        "client_id": config["GOOGLE_CLIENT_ID"],
+        "client_secret": config["GOOGLE_CLIENT_SECRET"],
+        "redirect_uri": config["GOOGLE_REDIRECT_URI"],
+        "grant_type": "authorization_code",
+    }
+
+
+def new_user_params(userinfo):
+    return {
+        "sub": userinfo["sub"],
+        "email": userinfo.get("email"),
+        "name": userinfo.get("name"),
+        "role": "Customer",
+    }
+
+
+def session_fields(user):
+    """Session keys of a signed-in ``users`` row."""
+    return {
+        "google_sub": user[1],
+        "user_id": user[0],
+        "role": user[4],
+        "name": user[3],
+    }
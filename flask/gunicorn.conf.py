@@ -0,0 +1,25 @@
+# Gunicorn settings picked up automatically when started from this directory.
+#
+#   GUNICORN_PRELOAD=1  import the app once in the master and fork workers from it
+#   WARM_UP=1           open pool connections and load the catalog in each worker
+#                       before it accepts requests
+#   GUNICORN_THREADS=N  serve N requests per worker with gthread workers; the
+#                       admission control in admission.py decides which of
+#                       them get a DB connection first
+#
+# Pooled DB connections never cross the fork: create_app registers an
+# after-fork hook that disposes the inherited engine pools in every worker.
+
+import os
+
+preload_app = os.getenv("GUNICORN_PRELOAD", "").lower() in ("1", "true", "yes")
+threads = int(os.getenv("GUNICORN_THREADS", "1"))
+if threads > 1:
+    worker_class = "gthread"
+
+
+def post_worker_init(worker):
+    if os.getenv("WARM_UP", "").lower() in ("1", "true", "yes"):
+        from app import warm_up
+
+        warm_up(worker.wsgi)
@@ -0,0 +1,109 @@
+"""Day-of-week x hour heatmap of orders, drinks and revenue for staffing.
+
+Each closed day is rolled up once into an hourly partial and cached like the
+other range reports (report_cache.py), so a year of history is a merge of 364
+small dicts rather than a scan of the orders table. A partial holds the
+store's per-hour totals, plus the same numbers per product so a product or
+category filter reads the same rollup.
+
+The merge lays the days out as a ``weeks x 7 x 24`` array. The mean and the
+percentile bands of every weekday/hour cell are then taken over the weeks.
+Items in flight come from Little's law: drinks per hour times the average
+prep time, divided by 3600.
+"""
+
+from decimal import Decimal
+
+import numpy as np
+from sqlalchemy import text
+
+from models import DEFAULT_STORE_ID
+from report_cache import day_span
+
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+METRICS = ("orders", "drinks", "revenue")
+PERCENTILES = (10, 50, 90)
+
+# One row per (day, hour, product) plus the (day, hour) total; product_id is
+# NULL on the totals, whose order count is exact
+HOURLY_SQL = """
+    SELECT DATE(o.order_date) AS day,
+           CAST(EXTRACT(HOUR FROM o.order_date) AS INTEGER) AS hour,
+           oi.product_id,
+           COUNT(DISTINCT o.order_id) AS orders,
+           SUM(oi.quantity) AS drinks,
+           SUM(oi.quantity * oi.unit_price_at_sale) AS revenue
+    FROM orders o
+    JOIN order_items oi ON oi.order_id = o.order_id
+    WHERE o.store_id = :store_id
+      AND o.order_date >= :since AND o.order_date < :until
+    GROUP BY GROUPING SETS (
+        (DATE(o.order_date), EXTRACT(HOUR FROM o.order_date), oi.product_id),
+        (DATE(o.order_date), EXTRACT(HOUR FROM o.order_date))
+    )
+"""
+
+
+def compute_partials(conn, days, store_id=DEFAULT_STORE_ID):
+    """``{day: {"hours": {hour: [orders, drinks, revenue]}, "products": {...}}}``.
+
+    ``products`` maps product ids to the same per-hour triples.
+    """
+    since, until = day_span(days)
+    partials = {day: {"hours": {}, "products": {}} for day in days}
+    params = {"since": since, "until": until, "store_id": store_id}
+    for day, hour, product_id, orders, drinks, revenue in conn.execute(
+        text(HOURLY_SQL), params
+    ):
+        if day not in partials:
+            continue
+        entry = [int(orders), int(drinks), str(revenue)]
+        if product_id is None:
+            partials[day]["hours"][str(hour)] = entry
+        else:
+            partials[day]["products"].setdefault(str(product_id), {})[str(hour)] = entry
+    return partials
+
+
+def merge_partials(days, partials, product_ids=None):
+    """``{metric: array(weeks, 7, 24)}`` from the partials of ``days``.
+
+    ``days`` must be whole weeks. With ``product_ids`` only those products
+    count, and an order holding two of them counts once for each.
+    """
+    weeks = len(days) // 7
+    grids = {m: np.zeros((weeks, 7, 24)) for m in METRICS}
+    first = days[0]
+    for day, partial in zip(days, partials):
+        week = (day - first).days // 7
+        if week >= weeks:
+            continue
+        if product_ids is None:
+            hourly = [partial["hours"]]
+        else:
+            hourly = [partial["products"].get(str(pid), {}) for pid in product_ids]
+        weekday = day.weekday()
+        for hours in hourly:
+            for hour, (orders, drinks, revenue) in hours.items():
+                h = int(hour)
+                grids["orders"][week, weekday, h] += orders
+                grids["drinks"][week, weekday, h] += drinks
+                grids["revenue"][week, weekday, h] += float(Decimal(revenue))
+    return grids
+
+
+def _bands(grid, decimals):
+    bands = {"mean": np.round(grid.mean(axis=0), decimals).tolist()}
+    for q, band in zip(PERCENTILES, np.percentile(grid, PERCENTILES, axis=0)):
+        bands[f"p{q}"] = np.round(band, decimals).tolist()
+    return bands
+
+
+def heatmap(grids, prep_seconds):
+    """Means and percentile bands per weekday/hour cell, plus items in flight."""
+    result = {
+        metric: _bands(grids[metric], 2 if metric == "revenue" else 1)
+        for metric in METRICS
+    }
+    result["items_in_flight"] = _bands(grids["drinks"] * prep_seconds / 3600.0, 2)
+    return result
@@ -0,0 +1,192 @@
+"""Conditional GET and compressed bodies for the large, polled read endpoints.
+
+``ResponseCache.conditional(version)`` wraps a GET view. ``version`` is
+called with the view's arguments and returns anything hashable that changes
+whenever the response would (catalog and stock counters, an md5 computed by
+the database), or ``None`` when the endpoint cannot tell cheaply:
+
+* With a version, the ETag is derived from it and the request's path and
+  query. A matching ``If-None-Match`` is answered ``304`` before the view
+  runs, and a body cached for that ETag is sent without running it either.
+* Without one, the view runs and the ETag is a hash of its JSON, so a ``304``
+  only saves the transfer.
+
+Versions are per-worker counters, so their ETags carry a token unique to the
+process: two workers at the same number may hold different data. Payload
+ETags are equal on every worker.
+
+Bodies of at least ``HTTP_COMPRESS_MIN_BYTES`` go out brotli- or
+gzip-encoded to clients that accept it (brotli only when the ``brotli``
+package is installed). Encoded bodies are kept in an LRU of
+``HTTP_CACHE_MAX_ENTRIES`` per worker, keyed by ETag and encoding, so each
+version is serialized and compressed once. Each encoding has its own ETag
+suffix, as a strong ETag names one exact representation. Only ``200``
+responses are cached; errors pass through untouched.
+"""
+
+import functools
+import gzip
+import hashlib
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# ETag suffix of each encoding
+SUFFIXES = {"identity": "", "gzip": "-gz", "br": "-br"}
+
+
+def _digest(data):
+    return hashlib.blake2b(data, digest_size=12).hexdigest()
+
+
+def _encode(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        # mtime=0 keeps the bytes, and so the ETag, stable across workers
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return body
+
+
+class ResponseCache:
+    def __init__(self, min_size=1024, max_entries=256):
+        self.enabled = True
+        self.min_size = min_size
+        self.max_entries = max_entries
+        self._token = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._counts = {"not_modified": 0, "hits": 0, "misses": 0}
+
+    def init_app(self, app):
+        self.enabled = bool(app.config.get("HTTP_CACHE", True))
+        self.min_size = int(app.config.get("HTTP_COMPRESS_MIN_BYTES", 1024))
+        self.max_entries = int(app.config.get("HTTP_CACHE_MAX_ENTRIES", 256))
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # Each worker numbers its versions on its own
+        self._token = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def _encoding(self, size):
+        if size < self.min_size:
+            return "identity"
+        accept = request.accept_encodings
+        if brotli is not None and accept["br"]:
+            return "br"
+        if accept["gzip"]:
+            return "gzip"
+        return "identity"
+
+    def _get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def _put(self, key, body):
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def _not_modified(self, tag):
+        if not request.if_none_match:
+            return False
+        return any(request.if_none_match.contains_weak(tag + s) for s in SUFFIXES.values())
+
+    def _respond(self, tag, body, encoding, status=200):
+        response = current_app.response_class(
+            body, status=status, mimetype="application/json"
+        )
+        response.set_etag(tag + SUFFIXES[encoding])
+        response.vary.add("Accept-Encoding")
+        # Cacheable, but revalidated on every poll
+        response.cache_control.no_cache = True
+        if encoding != "identity":
+            response.content_encoding = encoding
+        return response
+
+    def _encoded(self, tag, body):
+        """``(bytes, encoding)`` of ``body`` for this request, compressed once."""
+        encoding = self._encoding(len(body))
+        if encoding == "identity":
+            return body, encoding
+        encoded = self._get((tag, encoding))
+        if encoded is None:
+            encoded = _encode(body, encoding)
+            self._put((tag, encoding), encoded)
+        return encoded, encoding
+
+    def conditional(self, version=None):
+        """Decorate a JSON GET view with ETags, ``304`` and compressed bodies."""
+
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.enabled or request.method not in ("GET", "HEAD"):
+                    return view(*args, **kwargs)
+                tag = None
+                if version is not None:
+                    try:
+                        current = version(**kwargs)
+                    except Exception:
+                        # Let the view report it
+                        current = None
+                    if current is not None:
+                        tag = f"{self._token}-" + _digest(
+                            repr((request.full_path, current)).encode()
+                        )
+                        if self._not_modified(tag):
+                            self._count("not_modified")
+                            return self._respond(tag, b"", "identity", status=304)
+                        body = self._get((tag, "identity"))
+                        if body is not None:
+                            self._count("hits")
+                            return self._respond(tag, *self._encoded(tag, body))
+
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.direct_passthrough:
+                    return response
+                self._count("misses")
+                body = response.get_data()
+                if tag is None:
+                    tag = _digest(body)
+                    if self._not_modified(tag):
+                        self._count("not_modified")
+                        return self._respond(tag, b"", "identity", status=304)
+                else:
+                    self._put((tag, "identity"), body)
+                return self._respond(tag, *self._encoded(tag, body))
+
+            return wrapper
+
+        return decorator
+
+    def status(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "brotli": brotli is not None,
+                **self._counts,
+            }
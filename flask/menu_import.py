@@ -0,0 +1,337 @@
+"""Bulk menu import: products plus their recipes in one transaction.
+
+An import is the full menu (or a seasonal slice of it). It is validated up
+front, including every ingredient reference in a single query, and then
+diffed against the current products. Added and changed products are written
+with one multi-row upsert, and changed recipes with one delete and one
+multi-row insert. Products missing from the import can optionally be retired.
+
+Products are matched by ``product_id`` when given, otherwise by name.
+"""
+
+import csv
+import io
+import json
+from decimal import Decimal, InvalidOperation
+
+from sqlalchemy import bindparam, text
+
+
+class MenuImportError(ValueError):
+    """The import is malformed or references unknown ingredients."""
+
+
+def _decimal(value, field, where):
+    try:
+        number = Decimal(str(value).strip())
+        # NaN would fail the comparison below and Infinity pass it
+        if not number.is_finite():
+            raise ValueError(value)
+    except (InvalidOperation, ValueError):
+        raise MenuImportError(f"{where}: {field} must be a number")
+    if number <= 0:
+        raise MenuImportError(f"{where}: {field} must be positive")
+    return number
+
+
+def _bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "y")
+    return bool(value)
+
+
+def products_from_csv(stream):
+    """Read long-format CSV: one row per recipe line, product columns repeated.
+
+    Columns: product_name, unit_price, category, vegan, ingredient_id,
+    quantity_per_unit, and optionally product_id.
+    """
+    if isinstance(stream, bytes):
+        stream = stream.decode("utf-8-sig")
+    reader = csv.DictReader(io.StringIO(stream) if isinstance(stream, str) else stream)
+    if not reader.fieldnames or "product_name" not in reader.fieldnames:
+        raise MenuImportError("CSV needs a header row with product_name")
+    products = {}
+    for row in reader:
+        name = (row.get("product_name") or "").strip()
+        product = products.setdefault(
+            name,
+            {
+                "product_id": row.get("product_id") or None,
+                "product_name": name,
+                "unit_price": row.get("unit_price"),
+                "category": row.get("category") or None,
+                "vegan": row.get("vegan", ""),
+                "recipe": [],
+            },
+        )
+        if (row.get("ingredient_id") or "").strip():
+            product["recipe"].append(
+                {
+                    "ingredient_id": row["ingredient_id"],
+                    "quantity_per_unit": row.get("quantity_per_unit"),
+                }
+            )
+    return list(products.values())
+
+
+def parse_products(raw_products):
+    """Validate raw product dicts; returns normalised products."""
+    if not raw_products:
+        raise MenuImportError("no products given")
+    if not isinstance(raw_products, list):
+        raise MenuImportError("products must be a list")
+    products = []
+    names = set()
+    ids = set()
+    for index, raw in enumerate(raw_products):
+        where = f"product {index}"
+        if not isinstance(raw, dict):
+            raise MenuImportError(f"{where}: must be an object")
+        name = (raw.get("product_name") or "").strip()
+        if not name:
+            raise MenuImportError(f"{where}: product_name is required")
+        if name.lower() in names:
+            raise MenuImportError(f"{where}: duplicate product_name {name!r}")
+        names.add(name.lower())
+        where = f"product {name!r}"
+
+        product_id = raw.get("product_id")
+        try:
+            product_id = int(product_id) if product_id not in (None, "") else None
+        except (TypeError, ValueError):
+            raise MenuImportError(f"{where}: product_id must be an integer")
+        if product_id is not None:
+            if product_id in ids:
+                raise MenuImportError(f"{where}: duplicate product_id {product_id}")
+            ids.add(product_id)
+
+        recipe = {}
+        for line in raw.get("recipe") or []:
+            if not isinstance(line, dict):
+                raise MenuImportError(f"{where}: recipe lines must be objects")
+            try:
+                ingredient_id = int(line["ingredient_id"])
+            except (KeyError, TypeError, ValueError):
+                raise MenuImportError(f"{where}: recipe needs integer ingredient_ids")
+            if ingredient_id in recipe:
+                raise MenuImportError(
+                    f"{where}: ingredient {ingredient_id} listed twice"
+                )
+            recipe[ingredient_id] = _decimal(
+                line.get("quantity_per_unit"), "quantity_per_unit", where
+            )
+
+        products.append(
+            {
+                "product_id": product_id,
+                "product_name": name,
+                "unit_price": _decimal(raw.get("unit_price"), "unit_price", where),
+                "vegan": _bool(raw.get("vegan", False)),
+                "category": (raw.get("category") or "Uncategorized").strip(),
+                "recipe": recipe,
+            }
+        )
+    return products
+
+
+def load_import(body=None, csv_data=None):
+    """Parse a JSON body (``{"products": [...]}``) or CSV text into products."""
+    if csv_data is not None:
+        return parse_products(products_from_csv(csv_data))
+    if isinstance(body, (str, bytes)):
+        body = json.loads(body)
+    if isinstance(body, list):
+        body = {"products": body}
+    if body is not None and not isinstance(body, dict):
+        raise MenuImportError('expected {"products": [...]}')
+    return parse_products((body or {}).get("products"))
+
+
+def _check_ingredients(session, products):
+    wanted = {iid for p in products for iid in p["recipe"]}
+    if not wanted:
+        return
+    found = {
+        r[0]
+        for r in session.execute(
+            text(
+                "SELECT ingredient_id FROM inventory WHERE ingredient_id IN :ids"
+            ).bindparams(bindparam("ids", expanding=True)),
+            {"ids": sorted(wanted)},
+        )
+    }
+    missing = sorted(wanted - found)
+    if missing:
+        raise MenuImportError(f"unknown ingredient_ids: {missing}")
+
+
+def _current_menu(session):
+    products = {
+        r["product_id"]: dict(r)
+        for r in session.execute(
+            text(
+                """
+                SELECT product_id, product_name, unit_price, vegan, category, is_active
+                FROM products
+            """
+            )
+        ).mappings()
+    }
+    for product in products.values():
+        product["recipe"] = {}
+    for pid, iid, qty in session.execute(
+        text("SELECT product_id, ingredient_id, quantity_per_unit FROM product_recipe")
+    ):
+        if pid in products:
+            products[pid]["recipe"][iid] = qty
+    return products
+
+
+def diff_menu(current, products):
+    """Match imported products to current ones and assign ids to new ones.
+
+    Returns ``(added, updated, recipe_changed, unchanged_ids)``; every
+    imported product has its ``product_id`` filled in afterwards. New ids go
+    above every current and imported id; two products matching the same one
+    (say one renames it by id and another names it) are refused.
+    """
+    by_name = {p["product_name"].lower(): pid for pid, p in current.items()}
+    explicit = [p["product_id"] for p in products if p["product_id"] is not None]
+    next_id = max([*current, *explicit], default=0) + 1
+    added, updated, recipe_changed, unchanged = [], [], [], []
+    resolved = {}
+    for product in products:
+        pid = product["product_id"]
+        if pid is None:
+            pid = by_name.get(product["product_name"].lower())
+        if pid is not None and pid in resolved:
+            raise MenuImportError(
+                f"products {resolved[pid]!r} and {product['product_name']!r} "
+                f"are both product {pid}"
+            )
+        existing = current.get(pid) if pid is not None else None
+        if existing is None:
+            if pid is None:
+                pid = next_id
+                next_id += 1
+            product["product_id"] = pid
+            resolved[pid] = product["product_name"]
+            added.append(product)
+            recipe_changed.append(product)
+            continue
+        product["product_id"] = pid
+        resolved[pid] = product["product_name"]
+        fields_changed = (
+            existing["product_name"] != product["product_name"]
+            or existing["unit_price"] != product["unit_price"]
+            or existing["vegan"] != product["vegan"]
+            or existing["category"] != product["category"]
+            or not existing["is_active"]
+        )
+        if fields_changed:
+            updated.append(product)
+        if existing["recipe"] != product["recipe"]:
+            recipe_changed.append(product)
+        if not fields_changed and existing["recipe"] == product["recipe"]:
+            unchanged.append(pid)
+    return added, updated, recipe_changed, unchanged
+
+
+def _upsert_products(session, products):
+    params = {}
+    values = []
+    for i, p in enumerate(products):
+        values.append(f"(:id{i}, :name{i}, :price{i}, :vegan{i}, :cat{i}, TRUE)")
+        params.update(
+            {
+                f"id{i}": p["product_id"],
+                f"name{i}": p["product_name"],
+                f"price{i}": p["unit_price"],
+                f"vegan{i}": p["vegan"],
+                f"cat{i}": p["category"],
+            }
+        )
+    session.execute(
+        text(
+            f"""
+            INSERT INTO products (product_id, product_name, unit_price, vegan, category, is_active)
+            VALUES {", ".join(values)}
+            ON CONFLICT (product_id) DO UPDATE SET
+                product_name = EXCLUDED.product_name,
+                unit_price = EXCLUDED.unit_price,
+                vegan = EXCLUDED.vegan,
+                category = EXCLUDED.category,
+                is_active = TRUE
+        """
+        ),
+        params,
+    )
+
+
+def _replace_recipes(session, products):
+    session.execute(
+        text("DELETE FROM product_recipe WHERE product_id IN :ids").bindparams(
+            bindparam("ids", expanding=True)
+        ),
+        {"ids": [p["product_id"] for p in products]},
+    )
+    params = {}
+    values = []
+    for p in products:
+        for iid, qty in p["recipe"].items():
+            i = len(values)
+            values.append(f"(:p{i}, :i{i}, :q{i})")
+            params.update({f"p{i}": p["product_id"], f"i{i}": iid, f"q{i}": qty})
+    if values:
+        session.execute(
+            text(
+                "INSERT INTO product_recipe (product_id, ingredient_id, quantity_per_unit) "
+                f"VALUES {', '.join(values)}"
+            ),
+            params,
+        )
+
+
+def import_menu(session, products, retire_missing=False, dry_run=False):
+    """Validate, diff and apply ``products`` in the caller's transaction.
+
+    The caller commits (or rolls back for ``dry_run``) and invalidates the
+    catalog. Returns a summary of what was added, updated and retired.
+    """
+    # Serialise imports and MAX+1 inserts so new product ids can't collide
+    session.execute(text("LOCK TABLE products IN SHARE ROW EXCLUSIVE MODE"))
+    _check_ingredients(session, products)
+    current = _current_menu(session)
+    added, updated, recipe_changed, unchanged = diff_menu(current, products)
+
+    imported_ids = {p["product_id"] for p in products}
+    retired = []
+    if retire_missing:
+        retired = sorted(
+            pid
+            for pid, p in current.items()
+            if p["is_active"] and pid not in imported_ids
+        )
+
+    if not dry_run:
+        if added or updated:
+            _upsert_products(session, added + updated)
+        if recipe_changed:
+            _replace_recipes(session, recipe_changed)
+        if retired:
+            session.execute(
+                text(
+                    "UPDATE products SET is_active = FALSE WHERE product_id IN :ids"
+                ).bindparams(bindparam("ids", expanding=True)),
+                {"ids": retired},
+            )
+
+    return {
+        "added": [p["product_id"] for p in added],
+        "updated": [p["product_id"] for p in updated],
+        "recipes_replaced": [p["product_id"] for p in recipe_changed],
+        "unchanged": unchanged,
+        "retired": retired,
+        "dry_run": dry_run,
+    }
@@ -0,0 +1,21 @@
+-- Adds an optimistic-locking version to inventory rows. Any change to
+-- on_hand_quantity bumps the version, whichever endpoint or order made it,
+-- so a stocktake counted before a sale can be detected as stale.
+
+ALTER TABLE inventory
+ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1;
+
+CREATE OR REPLACE FUNCTION bump_inventory_version() RETURNS trigger AS $$
+BEGIN
+    IF NEW.on_hand_quantity IS DISTINCT FROM OLD.on_hand_quantity THEN
+        NEW.version := OLD.version + 1;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_inventory_version ON inventory;
+
+CREATE TRIGGER trg_inventory_version
+BEFORE UPDATE ON inventory
+FOR EACH ROW EXECUTE FUNCTION bump_inventory_version();
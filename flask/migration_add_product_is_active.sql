@@ -0,0 +1,5 @@
+-- Lets a menu import retire products without deleting them, since past
+-- order_items still reference them. Retired products drop out of the catalog.
+
+ALTER TABLE products
+ADD COLUMN IF NOT EXISTS is_active BOOLEAN NOT NULL DEFAULT TRUE;
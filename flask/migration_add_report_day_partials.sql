@@ -0,0 +1,33 @@
+-- Stores per-day partial aggregates for range reports (report_cache.py).
+-- Closed days never change, so their partials are computed once; an order
+-- inserted, moved or deleted on a closed day drops that day's partials.
+
+CREATE TABLE IF NOT EXISTS report_day_partials (
+    report VARCHAR(64) NOT NULL,
+    day DATE NOT NULL,
+    payload JSONB NOT NULL,
+    computed_at TIMESTAMP NOT NULL DEFAULT now(),
+    PRIMARY KEY (report, day)
+);
+
+CREATE INDEX IF NOT EXISTS idx_report_day_partials_day ON report_day_partials(day);
+
+CREATE OR REPLACE FUNCTION invalidate_report_day_partials() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND DATE(OLD.order_date) < CURRENT_DATE THEN
+        DELETE FROM report_day_partials WHERE day = DATE(OLD.order_date);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND DATE(NEW.order_date) < CURRENT_DATE THEN
+        DELETE FROM report_day_partials WHERE day = DATE(NEW.order_date);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_orders_invalidate_partials ON orders;
+
+-- Deferred to commit so the order's items are in place before the day is dropped
+CREATE CONSTRAINT TRIGGER trg_orders_invalidate_partials
+AFTER INSERT OR UPDATE OR DELETE ON orders
+DEFERRABLE INITIALLY DEFERRED
+FOR EACH ROW EXECUTE FUNCTION invalidate_report_day_partials();
@@ -0,0 +1,59 @@
+-- Store dimension for multi-store deployments (shards.py).
+-- Every existing row belongs to store 1. Run on every shard database; each
+-- shard only ever holds rows of the stores mapped to it.
+
+CREATE TABLE IF NOT EXISTS stores (
+    store_id INTEGER PRIMARY KEY,
+    name VARCHAR NOT NULL
+);
+
+INSERT INTO stores (store_id, name) VALUES (1, 'Main')
+ON CONFLICT (store_id) DO NOTHING;
+
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS store_id INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE employees ADD COLUMN IF NOT EXISTS store_id INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE inventory ADD COLUMN IF NOT EXISTS store_id INTEGER NOT NULL DEFAULT 1;
+
+CREATE INDEX IF NOT EXISTS idx_orders_store_date ON orders(store_id, order_date);
+CREATE INDEX IF NOT EXISTS idx_employees_store ON employees(store_id);
+
+-- Inventory is per store, so ingredient_id alone no longer identifies a row.
+-- Recipes and modifications keep referring to the shared ingredient id.
+DO $$
+DECLARE r record;
+BEGIN
+    FOR r IN
+        SELECT conrelid::regclass AS tbl, conname
+        FROM pg_constraint
+        WHERE confrelid = 'inventory'::regclass AND contype = 'f'
+    LOOP
+        EXECUTE format('ALTER TABLE %s DROP CONSTRAINT %I', r.tbl, r.conname);
+    END LOOP;
+END $$;
+
+ALTER TABLE inventory DROP CONSTRAINT IF EXISTS inventory_pkey;
+ALTER TABLE inventory ADD CONSTRAINT inventory_pkey PRIMARY KEY (store_id, ingredient_id);
+
+-- Rollups are per store too
+ALTER TABLE report_day_partials ADD COLUMN IF NOT EXISTS store_id INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE report_day_partials DROP CONSTRAINT IF EXISTS report_day_partials_pkey;
+ALTER TABLE report_day_partials
+    ADD CONSTRAINT report_day_partials_pkey PRIMARY KEY (report, store_id, day);
+
+CREATE OR REPLACE FUNCTION invalidate_report_day_partials() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND DATE(OLD.order_date) < CURRENT_DATE THEN
+        DELETE FROM report_day_partials
+        WHERE day = DATE(OLD.order_date) AND store_id = OLD.store_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND DATE(NEW.order_date) < CURRENT_DATE THEN
+        DELETE FROM report_day_partials
+        WHERE day = DATE(NEW.order_date) AND store_id = NEW.store_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+ALTER TABLE z_reports ADD COLUMN IF NOT EXISTS store_id INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE z_reports DROP CONSTRAINT IF EXISTS z_reports_pkey;
+ALTER TABLE z_reports ADD CONSTRAINT z_reports_pkey PRIMARY KEY (store_id, business_date);
@@ -0,0 +1,16 @@
+-- Precomputed "usuals" of signed-in customers (usuals.py).
+-- One row per user: their top drink configurations and product pairs, with
+-- recency-decayed scores. Rebuilt by `flask refresh-usuals` and updated
+-- after each of the user's orders. Lives on every shard next to its users.
+
+CREATE TABLE IF NOT EXISTS user_usuals (
+    user_id INTEGER PRIMARY KEY REFERENCES users(user_id) ON DELETE CASCADE,
+    order_count INTEGER NOT NULL DEFAULT 0,
+    -- Newest order folded in; older order ids are skipped
+    last_order_id INTEGER NOT NULL DEFAULT 0,
+    -- Time every score is decayed to
+    as_of TIMESTAMP NOT NULL,
+    configs JSONB NOT NULL DEFAULT '[]',
+    pairs JSONB NOT NULL DEFAULT '[]',
+    updated_at TIMESTAMP NOT NULL DEFAULT now()
+);
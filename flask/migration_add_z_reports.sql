@@ -0,0 +1,24 @@
+-- Persisted end-of-day Z reports. A row is written once when the business
+-- day is closed and never changes afterwards.
+
+CREATE TABLE IF NOT EXISTS z_reports (
+    business_date DATE PRIMARY KEY,
+    closed_at TIMESTAMP NOT NULL DEFAULT now(),
+    closed_by INTEGER REFERENCES employees(employee_id),
+    order_count INTEGER NOT NULL,
+    items_sold INTEGER NOT NULL,
+    total_revenue NUMERIC(12, 2) NOT NULL,
+    report JSONB NOT NULL
+);
+
+CREATE OR REPLACE FUNCTION reject_z_report_change() RETURNS trigger AS $$
+BEGIN
+    RAISE EXCEPTION 'z_reports rows are immutable';
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_z_reports_immutable ON z_reports;
+
+CREATE TRIGGER trg_z_reports_immutable
+BEFORE UPDATE OR DELETE ON z_reports
+FOR EACH ROW EXECUTE FUNCTION reject_z_report_change();
@@ -0,0 +1,176 @@
+"""Database handle and ORM models for the POS schema."""
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import (
+    Boolean,
+    Column,
+    Integer,
+    String,
+    DateTime,
+    Numeric,
+    ForeignKey,
+    PrimaryKeyConstraint,
+    Enum as SAEnum,
+)
+from sqlalchemy.orm import declarative_base, relationship
+
+db = SQLAlchemy()
+
+Base = declarative_base()
+
+EmployeeRole = SAEnum("Cashier", "Manager", name="employee_role", native_enum=True)
+ModificationType = SAEnum(
+    "ADD", "REMOVE", "LESS", "EXTRA", name="modification_type", native_enum=True
+)
+SugarLevel = SAEnum(
+    "200%",
+    "150%",
+    "100%",
+    "80%",
+    "50%",
+    "30%",
+    "0%",
+    name="sugar_level",
+    native_enum=True,
+)
+SizeLevel = SAEnum("small", "normal", "large", name="size_level", native_enum=True)
+IceLevel = SAEnum(
+    "no_ice", "less", "regular", "hot", name="ice_level", native_enum=True
+)
+
+# Inventory item consumed as the cup for each drink size
+CUP_INGREDIENTS = {"small": "Small Cup", "normal": "Medium Cup", "large": "Large Cup"}
+
+# Store of every row written before stores existed (migration_add_store_id.sql)
+DEFAULT_STORE_ID = 1
+
+
+class Store(Base):
+    __tablename__ = "stores"
+
+    store_id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+
+
+class Employee(Base):
+    __tablename__ = "employees"
+
+    employee_id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    role = Column("role", EmployeeRole, nullable=False)
+    email = Column(String, nullable=True)
+    store_id = Column(Integer, nullable=False, server_default=str(DEFAULT_STORE_ID))
+
+    orders = relationship("Order", back_populates="employee")
+
+
+class Order(Base):
+    __tablename__ = "orders"
+
+    order_id = Column(Integer, primary_key=True)
+    order_date = Column(DateTime, nullable=False)
+    total_amount = Column(Numeric(10, 2), nullable=False)
+    employee_id = Column(Integer, ForeignKey("employees.employee_id"), nullable=True)
+    user_id = Column(Integer, ForeignKey("users.user_id"), nullable=True)
+    store_id = Column(Integer, nullable=False, server_default=str(DEFAULT_STORE_ID))
+
+    employee = relationship("Employee", back_populates="orders")
+    user = relationship("User", back_populates="orders")
+    items = relationship(
+        "OrderItem", back_populates="order", cascade="all, delete-orphan"
+    )
+
+
+class Product(Base):
+    __tablename__ = "products"
+
+    product_id = Column(Integer, primary_key=True)
+    product_name = Column(String, nullable=False)
+    unit_price = Column(Numeric(10, 2), nullable=False)
+    vegan = Column(Boolean, nullable=False, default=True)
+    category = Column(String, nullable=True)
+    # Retired by a menu import rather than deleted (migration_add_product_is_active.sql)
+    is_active = Column(Boolean, nullable=False, server_default="true")
+
+    recipe = relationship("ProductRecipe", back_populates="product")
+    order_items = relationship("OrderItem", back_populates="product")
+
+
+class Inventory(Base):
+    __tablename__ = "inventory"
+
+    # Every store keeps its own stock of the shared ingredient ids
+    store_id = Column(
+        Integer, primary_key=True, server_default=str(DEFAULT_STORE_ID)
+    )
+    ingredient_id = Column(Integer, primary_key=True, autoincrement=False)
+    ingredient_name = Column(String, nullable=False)
+    on_hand_quantity = Column(Numeric(10, 1), nullable=False)
+    is_add_on = Column(Boolean, nullable=False, default=False)
+    price_per_unit = Column(Numeric(10, 2), nullable=True)
+    # Bumped by a trigger on every quantity change (migration_add_inventory_version.sql)
+    version = Column(Integer, nullable=False, server_default="1")
+
+
+class ProductRecipe(Base):
+    __tablename__ = "product_recipe"
+
+    product_id = Column(Integer, ForeignKey("products.product_id"), nullable=False)
+    # Not a foreign key: inventory is keyed by (store_id, ingredient_id)
+    ingredient_id = Column(Integer, nullable=False)
+    quantity_per_unit = Column(Numeric(10, 1), nullable=False)
+
+    __table_args__ = (
+        PrimaryKeyConstraint("product_id", "ingredient_id", name="pk_product_recipe"),
+    )
+
+    product = relationship("Product", back_populates="recipe")
+
+
+class OrderItem(Base):
+    __tablename__ = "order_items"
+
+    order_item_id = Column(Integer, primary_key=True)
+    order_id = Column(Integer, ForeignKey("orders.order_id"), nullable=False)
+    product_id = Column(Integer, ForeignKey("products.product_id"), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    unit_price_at_sale = Column(Numeric(10, 2), nullable=False)
+    sugar_level = Column(SugarLevel, nullable=False, default="100%")
+    size_level = Column(SizeLevel, nullable=False, default="normal")
+    ice_level = Column(IceLevel, nullable=False, default="regular")
+
+    order = relationship("Order", back_populates="items")
+    product = relationship("Product", back_populates="order_items")
+    modifications = relationship(
+        "Modification", back_populates="order_item", cascade="all, delete-orphan"
+    )
+
+
+class Modification(Base):
+    __tablename__ = "modifications"
+
+    modification_id = Column(Integer, primary_key=True)
+    order_item_id = Column(
+        Integer, ForeignKey("order_items.order_item_id"), nullable=False
+    )
+    ingredient_id = Column(Integer, nullable=False)
+    modification_type = Column(ModificationType, nullable=False)
+    quantity_change = Column(Numeric(10, 1), nullable=True)
+    price_change = Column(Numeric(10, 2), nullable=True)
+
+    order_item = relationship("OrderItem", back_populates="modifications")
+
+
+class User(Base):
+    __tablename__ = "users"
+
+    user_id = Column(Integer, primary_key=True)
+    google_sub = Column(
+        String, unique=True, nullable=True
+    )  # Made nullable for Clerk users
+    clerk_user_id = Column(String, unique=True, nullable=True)  # New Clerk ID
+    email = Column(String, nullable=True)
+    name = Column(String, nullable=True)
+    role = Column(String, nullable=False, default="Customer")
+
+    orders = relationship("Order", back_populates="user")
@@ -0,0 +1,242 @@
+"""Per-worker book of today's committed orders, for the X and Z reports.
+
+Each store's book holds one day. For every order it keeps the id, the
+seconds since midnight and the total in cents, and for every order line the
+product and quantity, all in typed arrays (about 20 bytes an order and 8 a
+line). A set of the ids answers whether an order is already held. Running
+totals per hour and per product are kept beside them, so a report reads a
+few dozen numbers and runs no query.
+
+* A store's book is built from the store's primary on first use, and again
+  when the date changes. ``warm_up`` builds every known store's.
+* ``record`` appends an order this worker committed.
+* Orders committed by other workers are fetched at most every
+  ``ORDER_BOOK_SYNC_SECONDS``. The catch-up reads ids above the book's
+  high-water mark less ``ORDER_BOOK_RESCAN_IDS``, and skips ids it already
+  holds. Ids come from a sequence when the insert runs, so an order committed
+  after a higher id is still found if it is within that window.
+* An order committed later than that window allows is missing until the
+  next rebuild.
+
+Orders are only ever added to a day, so the books never shrink during it.
+Product names are those of the products table when the product was first
+seen today.
+"""
+
+import threading
+import time
+from array import array
+from datetime import date, datetime, time as day_time
+from decimal import Decimal
+
+from sqlalchemy import text
+
+from models import DEFAULT_STORE_ID
+
+
+def _cents(amount):
+    return int((Decimal(str(amount)) * 100).to_integral_value())
+
+
+def _seconds(moment):
+    return moment.hour * 3600 + moment.minute * 60 + moment.second
+
+
+class _Day:
+    __slots__ = (
+        "day",
+        "order_ids",
+        "ids",
+        "seconds",
+        "cents",
+        "products",
+        "quantities",
+        "hourly",
+        "sold",
+        "revenue",
+        "high_water",
+        "synced_at",
+    )
+
+    def __init__(self, day):
+        self.day = day
+        self.order_ids = array("q")
+        # The same ids, for membership tests under the lock
+        self.ids = set()
+        self.seconds = array("l")
+        self.cents = array("q")
+        self.products = array("l")
+        self.quantities = array("l")
+        self.hourly = array("q", [0] * 24)
+        self.sold = {}
+        self.revenue = 0
+        self.high_water = 0
+        self.synced_at = time.monotonic()
+
+    def add(self, order_id, moment, cents, lines):
+        self.order_ids.append(order_id)
+        self.ids.add(order_id)
+        self.seconds.append(_seconds(moment))
+        self.cents.append(cents)
+        self.hourly[moment.hour] += cents
+        self.revenue += cents
+        self.high_water = max(self.high_water, order_id)
+        for product_id, quantity in lines:
+            self.products.append(product_id)
+            self.quantities.append(quantity)
+            self.sold[product_id] = self.sold.get(product_id, 0) + quantity
+
+
+class OrderBook:
+    def __init__(self, db=None, shards=None, sync_seconds=2.0, rescan_ids=200):
+        self.db = db
+        self.shards = shards
+        self.enabled = True
+        self.sync_seconds = sync_seconds
+        self.rescan_ids = rescan_ids
+        self._lock = threading.Lock()
+        self._days = {}
+        self._names = {}
+
+    def init_app(self, app):
+        self.enabled = bool(app.config.get("ORDER_BOOK", True))
+        self.sync_seconds = float(app.config.get("ORDER_BOOK_SYNC_SECONDS", 2.0))
+        self.rescan_ids = int(app.config.get("ORDER_BOOK_RESCAN_IDS", 200))
+
+    def _engine(self, store_id):
+        if self.shards is None:
+            return self.db.engine
+        return self.shards.engine(self.shards.shard_of(store_id))
+
+    def _fetch(self, store_id, day, above=None):
+        """``[(order_id, order_date, cents, lines)]`` of ``day``, ids above ``above``."""
+        where = (
+            "o.store_id = :store_id AND o.order_date >= CAST(:day AS DATE)"
+            " AND o.order_date < CAST(:day AS DATE) + 1"
+        )
+        params = {"store_id": store_id, "day": day}
+        if above is not None:
+            where += " AND o.order_id > :above"
+            params["above"] = above
+        with self._engine(store_id).connect() as conn:
+            orders = conn.execute(
+                text(
+                    f"SELECT o.order_id, o.order_date, o.total_amount FROM orders o "
+                    f"WHERE {where} ORDER BY o.order_id"
+                ),
+                params,
+            ).all()
+            if not orders:
+                return []
+            # Lines of orders committed since the first query are ignored
+            lines = conn.execute(
+                text(
+                    f"""
+                    SELECT oi.order_id, p.product_id, p.product_name, SUM(oi.quantity)
+                    FROM orders o
+                    JOIN order_items oi ON oi.order_id = o.order_id
+                    JOIN products p ON p.product_id = oi.product_id
+                    WHERE {where}
+                    GROUP BY oi.order_id, p.product_id, p.product_name
+                """
+                ),
+                params,
+            ).all()
+        by_order = {}
+        for order_id, product_id, name, quantity in lines:
+            self._names.setdefault(product_id, name)
+            by_order.setdefault(order_id, []).append((product_id, int(quantity)))
+        return [
+            (order_id, order_date, _cents(total or 0), by_order.get(order_id, []))
+            for order_id, order_date, total in orders
+        ]
+
+    def _book(self, store_id):
+        """The store's book of today, built or caught up as needed."""
+        today = date.today()
+        with self._lock:
+            book = self._days.get(store_id)
+            if book is not None and book.day == today:
+                if time.monotonic() - book.synced_at < self.sync_seconds:
+                    return book
+                # Requests arriving during the catch-up read the book as it is
+                book.synced_at = time.monotonic()
+                above = max(0, book.high_water - self.rescan_ids)
+            else:
+                book, above = None, None
+        rows = self._fetch(store_id, today, above)
+        with self._lock:
+            if book is None:
+                book = _Day(today)
+                for row in rows:
+                    book.add(*row)
+                current = self._days.get(store_id)
+                # Another request built it meanwhile; either copy will do
+                if current is None or current.day != today:
+                    self._days[store_id] = book
+                return self._days[store_id]
+            for order_id, moment, cents, lines in rows:
+                if order_id not in book.ids:
+                    book.add(order_id, moment, cents, lines)
+            return book
+
+    def record(self, store_id, order_id, order_date, total_amount, lines):
+        """Add an order committed here; ``lines`` are ``(product_id, quantity, name)``."""
+        with self._lock:
+            book = self._days.get(store_id)
+            if book is None or book.day != order_date.date():
+                return
+            if order_id in book.ids:
+                return
+            for product_id, _, name in lines:
+                self._names.setdefault(product_id, name)
+            book.add(
+                order_id,
+                order_date,
+                _cents(total_amount),
+                [(product_id, int(quantity)) for product_id, quantity, _ in lines],
+            )
+
+    def x_report(self, store_id=DEFAULT_STORE_ID):
+        """``[{"hour", "sales"}]`` for each hour of today with sales, like the query."""
+        book = self._book(store_id)
+        with self._lock:
+            return [
+                {
+                    "hour": datetime.combine(book.day, day_time(hour)).isoformat(),
+                    "sales": cents / 100.0,
+                }
+                for hour, cents in enumerate(book.hourly)
+                if cents
+            ]
+
+    def z_report(self, store_id=DEFAULT_STORE_ID):
+        """``(total_revenue, items)`` of today, items by quantity sold."""
+        book = self._book(store_id)
+        with self._lock:
+            items = [
+                {
+                    "product_id": product_id,
+                    "product_name": self._names.get(product_id),
+                    "qty_sold": quantity,
+                }
+                for product_id, quantity in book.sold.items()
+            ]
+            revenue = book.revenue / 100.0
+        items.sort(key=lambda item: (-item["qty_sold"], item["product_id"]))
+        return revenue, items
+
+    def status(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "stores": {
+                    str(store_id): {
+                        "day": book.day.isoformat(),
+                        "orders": len(book.order_ids),
+                        "lines": len(book.products),
+                        "high_water": book.high_water,
+                    }
+                    for store_id, book in sorted(self._days.items())
+                },
+            }
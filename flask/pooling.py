@@ -0,0 +1,160 @@
+"""Connection pool settings, per-route statement timeouts and the health probe.
+
+Every view belongs to a timeout class ("checkout", "report" or "default",
+see ``statement_timeout``). Each transaction gets that class's
+``statement_timeout``, so a runaway report query is cancelled by Postgres
+instead of holding a pooled connection forever.
+
+With ``PGBOUNCER_MODE`` set the timeout is applied with ``SET LOCAL`` at the
+start of every transaction and no session-level state is left on the server
+connection, which is what pgbouncer's transaction pooling requires. Otherwise
+a session-level ``SET`` is issued only when a pooled connection's current
+timeout differs from the one the request needs.
+"""
+
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.pool import NullPool
+
+TIMEOUT_CLASSES = ("checkout", "report", "default")
+
+
+def engine_options(config):
+    """``SQLALCHEMY_ENGINE_OPTIONS`` for the primary and any other binds."""
+    if config["PGBOUNCER_MODE"] and not config["DB_POOL_SIZE"]:
+        # pgbouncer already pools server connections; holding idle ones here
+        # would only pin pgbouncer slots.
+        options = {"poolclass": NullPool}
+    else:
+        options = {
+            "pool_size": config["DB_POOL_SIZE"] or 5,
+            "max_overflow": config["DB_MAX_OVERFLOW"],
+            "pool_timeout": config["DB_POOL_TIMEOUT"],
+            "pool_recycle": config["DB_POOL_RECYCLE"],
+            "pool_pre_ping": config["DB_POOL_PRE_PING"],
+        }
+    if config.get("DB_DRIVER") == "psycopg":
+        # Server-side prepared statements belong to one server connection,
+        # which transaction pooling does not keep; None turns them off
+        options["connect_args"] = {
+            "prepare_threshold": (
+                None if config["PGBOUNCER_MODE"] else config["DB_PREPARE_THRESHOLD"]
+            )
+        }
+    return options
+
+
+def statement_timeout(timeout_class):
+    """Mark a view as belonging to ``timeout_class``."""
+    if timeout_class not in TIMEOUT_CLASSES:
+        raise ValueError(f"unknown statement timeout class {timeout_class!r}")
+
+    def decorator(view):
+        view.statement_timeout_class = timeout_class
+        return view
+
+    return decorator
+
+
+def _timeout_ms(config):
+    timeout_class = "default"
+    if has_request_context():
+        timeout_class = g.get("statement_timeout_class", "default")
+    return int(config["STATEMENT_TIMEOUTS_MS"].get(timeout_class, 0))
+
+
+def _forget_timeout(dbapi_connection, connection_record, reset_state):
+    # A rolled back transaction also rolls back a session-level SET
+    connection_record.info.pop("statement_timeout", None)
+
+
+class StatementTimeouts:
+    def __init__(self, db):
+        self.db = db
+
+    def init_app(self, app):
+        app.before_request(self._tag_request)
+        pgbouncer = app.config.get("PGBOUNCER_MODE", False)
+        with app.app_context():
+            for engine in self.db.engines.values():
+                event.listen(engine, "begin", self._make_listener(app, pgbouncer))
+                if not pgbouncer:
+                    event.listen(
+                        engine,
+                        "rollback",
+                        lambda conn: conn.connection.info.pop(
+                            "statement_timeout", None
+                        ),
+                    )
+                    event.listen(engine.pool, "reset", _forget_timeout)
+
+    @staticmethod
+    def _tag_request():
+        view = current_app.view_functions.get(request.endpoint)
+        g.statement_timeout_class = getattr(
+            view, "statement_timeout_class", "default"
+        )
+
+    @staticmethod
+    def _make_listener(app, pgbouncer):
+        def on_begin(conn):
+            timeout_ms = _timeout_ms(app.config)
+            # Run on the DBAPI connection directly so SQLAlchemy doesn't
+            # re-enter its own begin handling.
+            dbapi_conn = conn.connection.dbapi_connection
+            if pgbouncer:
+                with dbapi_conn.cursor() as cur:
+                    cur.execute(f"SET LOCAL statement_timeout = {timeout_ms}")
+                return
+            info = conn.connection.info
+            if info.get("statement_timeout") != timeout_ms:
+                with dbapi_conn.cursor() as cur:
+                    cur.execute(f"SET statement_timeout = {timeout_ms}")
+                info["statement_timeout"] = timeout_ms
+
+        return on_begin
+
+
+class PoolHealth:
+    """Health probe that touches the database at most once per interval."""
+
+    def __init__(self, db):
+        self.db = db
+        self.interval = 5.0
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._error = None
+
+    def init_app(self, app):
+        self.interval = float(app.config.get("HEALTH_CHECK_INTERVAL", 5))
+
+    def pool_status(self):
+        pool = self.db.engine.pool
+        if isinstance(pool, NullPool):
+            return {"pool": "null"}
+        return {
+            "pool_size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "idle": pool.checkedin(),
+        }
+
+    def check(self):
+        """Return ``(ok, error)``, reusing the last result within the interval."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked_at < self.interval:
+                return self._error is None, self._error
+            self._checked_at = now
+        try:
+            with self.db.engine.connect() as conn:
+                conn.exec_driver_sql("SELECT 1")
+            error = None
+        except Exception as e:
+            error = str(e)
+        with self._lock:
+            self._error = error
+        return error is None, error
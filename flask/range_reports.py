@@ -0,0 +1,113 @@
+"""Per-day partials and merges for the sales and usage-chart reports.
+
+Partials hold ids and numbers only; names and current stock are joined in at
+merge time so a renamed product never shows a stale name. Money and
+quantities are kept as decimal strings so merged totals are exact.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from sqlalchemy import text
+
+from models import DEFAULT_STORE_ID
+from report_cache import day_span
+
+SALES_BY_DAY_SQL = """
+    SELECT DATE(o.order_date) AS day, oi.product_id,
+           SUM(oi.quantity) AS qty,
+           SUM(oi.quantity * oi.unit_price_at_sale) AS revenue
+    FROM orders o
+    JOIN order_items oi ON oi.order_id = o.order_id
+    WHERE o.store_id = :store_id
+      AND o.order_date >= :since AND o.order_date < :until
+    GROUP BY DATE(o.order_date), oi.product_id
+"""
+
+USAGE_BY_DAY_SQL = """
+    SELECT DATE(o.order_date) AS day, pr.ingredient_id,
+           SUM(oi.quantity * pr.quantity_per_unit) AS total_used,
+           COUNT(DISTINCT o.order_id) AS orders_count
+    FROM orders o
+    JOIN order_items oi ON oi.order_id = o.order_id
+    JOIN product_recipe pr ON pr.product_id = oi.product_id
+    WHERE o.store_id = :store_id
+      AND o.order_date >= :since AND o.order_date < :until
+    GROUP BY DATE(o.order_date), pr.ingredient_id
+"""
+
+
+def _by_day(conn, sql, days, store_id):
+    since, until = day_span(days)
+    partials = {day: {} for day in days}
+    params = {"since": since, "until": until, "store_id": store_id}
+    for day, key, a, b in conn.execute(text(sql), params):
+        if day in partials:
+            partials[day][str(key)] = [str(a), str(b)]
+    return partials
+
+
+def sales_partials(conn, days, store_id=DEFAULT_STORE_ID):
+    """``{day: {product_id: [qty, revenue]}}`` for ``days``."""
+    return _by_day(conn, SALES_BY_DAY_SQL, days, store_id)
+
+
+def usage_partials(conn, days, store_id=DEFAULT_STORE_ID):
+    """``{day: {ingredient_id: [total_used, orders_count]}}`` for ``days``."""
+    return _by_day(conn, USAGE_BY_DAY_SQL, days, store_id)
+
+
+def _merge(partials):
+    totals = defaultdict(lambda: [Decimal(0), Decimal(0)])
+    for partial in partials:
+        for key, (a, b) in partial.items():
+            entry = totals[int(key)]
+            entry[0] += Decimal(a)
+            entry[1] += Decimal(b)
+    return totals
+
+
+def merge_sales(conn, partials):
+    """Rows shaped like the original sales report, by revenue descending."""
+    totals = _merge(partials)
+    if not totals:
+        return []
+    names = dict(
+        conn.execute(text("SELECT product_id, product_name FROM products")).all()
+    )
+    rows = [
+        {
+            "product_id": pid,
+            "product_name": names.get(pid),
+            "qty": int(qty),
+            "revenue": float(revenue),
+        }
+        for pid, (qty, revenue) in totals.items()
+    ]
+    rows.sort(key=lambda r: r["revenue"], reverse=True)
+    return rows
+
+
+def merge_usage(conn, partials, store_id=DEFAULT_STORE_ID):
+    """Every ingredient with its usage in range and the store's current stock."""
+    totals = _merge(partials)
+    rows = []
+    for iid, name, stock in conn.execute(
+        text(
+            "SELECT ingredient_id, ingredient_name, on_hand_quantity "
+            "FROM inventory WHERE store_id = :store_id"
+        ),
+        {"store_id": store_id},
+    ):
+        used, orders_count = totals.get(iid, (Decimal(0), Decimal(0)))
+        rows.append(
+            {
+                "ingredient_id": iid,
+                "ingredient_name": name,
+                "total_used": float(used),
+                "current_stock": float(stock),
+                "orders_count": int(orders_count),
+            }
+        )
+    rows.sort(key=lambda r: r["total_used"], reverse=True)
+    return rows
@@ -0,0 +1,122 @@
+"""Order receipt emails: the HTML body, and the handoff to the async sender.
+
+``send_order_receipt`` in app.py either calls SendGrid itself or, with
+``RECEIPT_SERVICE_URL`` set, posts the receipt to async_app.py and returns
+as soon as it is queued there. The receipt travels signed with the app's
+``SECRET_KEY``, so the internal endpoint cannot be used to send mail by
+anyone without the key.
+"""
+
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+SUBJECT = "Order Confirmation - #{order_id}"
+# A queued receipt is refused once it is older than this
+MAX_AGE_SECONDS = 300
+
+
+def receipt_html(user_name, order_id, items, total_amount):
+    html_content = f"""
+    <html>
+        <body style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
+            <div style="background-color: #f8f9fa; padding: 20px; border-radius: 10px;">
+                <h2 style="color: #333;">Order Confirmation</h2>
+                <p>Hi {user_name},</p>
+                <p>Thank you for your order! Here are your order details:</p>
+                
+                <div style="background-color: white; padding: 15px; border-radius: 5px; margin: 20px 0;">
+                    <h3 style="color: #666; margin-top: 0;">Order #{order_id}</h3>
+                    <table style="width: 100%; border-collapse: collapse;">
+                        <thead>
+                            <tr style="border-bottom: 2px solid #ddd;">
+                                <th style="text-align: left; padding: 10px;">Item</th>
+                                <th style="text-align: center; padding: 10px;">Qty</th>
+                                <th style="text-align: right; padding: 10px;">Price</th>
+                            </tr>
+                        </thead>
+                        <tbody>
+    """
+
+    for item in items:
+        item_total = float(item["quantity"]) * float(item["unit_price_at_sale"])
+        html_content += f"""
+            <tr style="border-bottom: 1px solid #eee;">
+                <td style="padding: 10px;">{item.get('product_name', 'Item')}</td>
+                <td style="text-align: center; padding: 10px;">{item['quantity']}</td>
+                <td style="text-align: right; padding: 10px;">${item_total:.2f}</td>
+            </tr>
+        """
+
+        # Add customizations if any
+        customizations = []
+        if item.get("sugar_level"):
+            customizations.append(f"Sugar: {item['sugar_level']}")
+        if item.get("size_level"):
+            customizations.append(f"Size: {item['size_level']}")
+        if item.get("ice_level"):
+            customizations.append(f"Ice: {item['ice_level']}")
+
+        if customizations:
+            for customization in customizations:
+                html_content += f"""
+                            <tr>
+                                <td colspan="3" style="padding: 5px 10px 5px 30px; font-size: 0.9em; color: #666;">
+                                    • {customization}
+                                </td>
+                            </tr>
+        """
+
+        # Add modifications if any
+        if item.get("modifications"):
+            for mod in item["modifications"]:
+                html_content += f"""
+                    <tr>
+                        <td colspan="3" style="padding: 5px 10px 5px 30px; font-size: 0.9em; color: #666;">
+                            • {mod.get('modification_type', '')}: {mod.get('ingredient_name', '')}
+                        </td>
+                    </tr>
+                """
+
+    html_content += f"""
+                        </tbody>
+                    </table>
+
+                    <div style="margin-top: 20px; padding-top: 15px; border-top: 2px solid #333;">
+                        <h3 style="text-align: right; margin: 0;">Total: ${float(total_amount):.2f}</h3>
+                    </div>
+                </div>
+                
+                <p style="color: #666; font-size: 0.9em;">
+                    Thank you for your business! If you have any questions about your order,
+                    please don't hesitate to contact us.
+                </p>
+            </div>
+        </body>
+    </html>
+    """
+    return html_content
+
+
+def mail_payload(sender_email, to_email, order_id, html_content):
+    """SendGrid v3 ``mail/send`` body for one receipt."""
+    return {
+        "personalizations": [{"to": [{"email": to_email}]}],
+        "from": {"email": sender_email},
+        "subject": SUBJECT.format(order_id=order_id),
+        "content": [{"type": "text/html", "value": html_content}],
+    }
+
+
+def _serializer(secret_key):
+    return URLSafeTimedSerializer(secret_key, salt="receipt")
+
+
+def sign_receipt(secret_key, receipt):
+    return _serializer(secret_key).dumps(receipt)
+
+
+def load_receipt(secret_key, token):
+    """The receipt in ``token``, or ``None`` if forged or expired."""
+    try:
+        return _serializer(secret_key).loads(token, max_age=MAX_AGE_SECONDS)
+    except BadSignature:
+        return None
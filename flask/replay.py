@@ -0,0 +1,293 @@
+"""Replay captured traffic (traffic_capture.py) against a staging app.
+
+Replay the same capture against two builds, then compare them::
+
+    python replay.py run capture/ --target http://staging:5000 --out build-a.jsonl
+    python replay.py run capture/ --target http://staging:5000 --out build-b.jsonl
+    python replay.py compare build-a.jsonl build-b.jsonl
+
+``run`` reads the given capture files, or every ``capture-*`` file in a
+given directory, gzipped or not. It sorts the requests by arrival and
+re-issues them on the captured schedule, ``--speed`` times faster. Requests
+whose arrivals overlap are in flight together, as they were in production.
+The run is deterministic: the same capture and speed give the same
+requests at the same offsets.
+
+Ids in the capture belong to the production database. When a replayed
+``POST`` creates something the capture has an id for (a new order's
+``order_id``), later requests that use the old id in their path, query or
+body get the new one. A request that needs an id still being created waits
+for it. Other ids are sent unchanged, so restore staging from a snapshot
+taken when the capture started. Requests whose bodies were not captured
+(file uploads) are skipped. So are requests that depend on a signed-in
+session, because the capture never includes one.
+
+``run`` writes one line per request to ``--out``: endpoint, status and
+latency, next to the captured status and latency. It prints a per-endpoint
+summary, and how far sending fell behind schedule. ``compare`` prints the
+p50 and p95 of each endpoint in two runs and the change between them.
+"""
+
+import argparse
+import asyncio
+import glob
+import gzip
+import json
+import os
+import re
+import statistics
+import sys
+import time
+from urllib.parse import quote
+
+import aiohttp
+
+from traffic_capture import REMAP_KEYS
+
+RULE_ARG = re.compile(r"<(?:[^:<>]+:)?([^<>]+)>")
+
+
+def read_captures(paths):
+    """Captured requests from ``paths`` (files or directories), by arrival."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "capture-*.jsonl*"))))
+        else:
+            files.append(path)
+    records = []
+    for name in files:
+        opener = gzip.open if name.endswith(".gz") else open
+        with opener(name, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # The last line of a file cut off by a crash
+                    continue
+    records.sort(key=lambda r: r["t"])
+    return records
+
+
+def build_path(rule, view_args):
+    return RULE_ARG.sub(lambda m: quote(str(view_args[m.group(1)]), safe=""), rule)
+
+
+def endpoint(record):
+    return f"{record['m']} {record['r']}"
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class IdMap:
+    """Captured ids to the ids the replayed writes got, as they come in."""
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self._ids = {}
+
+    def expect(self, key, old):
+        self._ids[(key, old)] = asyncio.get_running_loop().create_future()
+
+    def resolve(self, key, old, new):
+        future = self._ids.get((key, old))
+        if future is not None and not future.done():
+            future.set_result(new)
+
+    async def _get(self, key, old):
+        future = self._ids.get((key, int(old)))
+        if future is None:
+            return old
+        try:
+            new = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            return old
+        # A write that failed on replay leaves the old id in place
+        if new is None:
+            return old
+        return new if isinstance(old, int) else str(new)
+
+    async def remap(self, value, key=None):
+        if isinstance(value, dict):
+            return {k: await self.remap(v, k) for k, v in value.items()}
+        if isinstance(value, list):
+            return [await self.remap(v, key) for v in value]
+        if key in REMAP_KEYS and (
+            isinstance(value, int) or (isinstance(value, str) and value.isdigit())
+        ):
+            return await self._get(key, value)
+        return value
+
+
+async def replay(records, target, speed=1.0, concurrency=200, timeout=30.0):
+    """Send ``records`` to ``target`` on their schedule; returns results and max lag."""
+    ids = IdMap(timeout)
+    loop = asyncio.get_running_loop()
+    session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=concurrency),
+        timeout=aiohttp.ClientTimeout(total=timeout),
+    )
+
+    async def send(record):
+        result = {
+            "endpoint": endpoint(record),
+            "captured_status": record.get("s"),
+            "captured_ms": record.get("ms"),
+        }
+        if "ct" in record:
+            return {**result, "status": "skipped"}
+        path = build_path(record["r"], await ids.remap(record.get("v", {})))
+        query = await ids.remap(record.get("q", {}))
+        body = await ids.remap(record["b"]) if "b" in record else None
+        t0 = time.perf_counter()
+        data = None
+        try:
+            async with session.request(
+                record["m"],
+                target.rstrip("/") + path,
+                params=query,
+                json=body,
+                allow_redirects=False,
+            ) as response:
+                status = response.status
+                if record.get("ids") and 200 <= status < 300:
+                    data = await response.json(content_type=None)
+                else:
+                    await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            status = None
+        ms = (time.perf_counter() - t0) * 1000.0
+        for key, old in (record.get("ids") or {}).items():
+            ids.resolve(key, old, data.get(key) if isinstance(data, dict) else None)
+        return {**result, "status": status, "ms": round(ms, 2)}
+
+    tasks = []
+    lag = 0.0
+    try:
+        start, first = loop.time(), records[0]["t"]
+        for record in records:
+            delay = start + (record["t"] - first) / speed - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            lag = max(lag, -delay)
+            # Registered at send time, so only later requests wait for it
+            for key, old in (record.get("ids") or {}).items():
+                ids.expect(key, old)
+            tasks.append(asyncio.create_task(send(record)))
+        results = await asyncio.gather(*tasks)
+    finally:
+        await session.close()
+    return results, lag
+
+
+def summarize(results):
+    """``{endpoint: {...}}`` with counts, failures and latency percentiles."""
+    by_endpoint = {}
+    for r in results:
+        by_endpoint.setdefault(r["endpoint"], []).append(r)
+    summary = {}
+    for name, rows in by_endpoint.items():
+        sent = [r for r in rows if r["status"] != "skipped"]
+        timed = [r["ms"] for r in sent if r["status"] is not None]
+        captured = [r["captured_ms"] for r in sent if r["captured_ms"] is not None]
+        summary[name] = {
+            "count": len(rows),
+            "skipped": len(rows) - len(sent),
+            "errors": sum(1 for r in sent if r["status"] is None or r["status"] >= 500),
+            "status_changed": sum(1 for r in sent if r["status"] != r["captured_status"]),
+            "p50": statistics.median(timed) if timed else None,
+            "p95": percentile(timed, 0.95) if timed else None,
+            "captured_p50": statistics.median(captured) if captured else None,
+        }
+    return dict(sorted(summary.items(), key=lambda kv: -kv[1]["count"]))
+
+
+def _ms(value):
+    return f"{value:9.1f}" if value is not None else f"{'-':>9s}"
+
+
+def print_summary(summary):
+    print(
+        f"{'endpoint':50s} {'count':>6s} {'err':>5s} {'status':>6s}"
+        f" {'p50':>9s} {'p95':>9s} {'prod p50':>9s}"
+    )
+    for name, s in summary.items():
+        print(
+            f"{name[:50]:50s} {s['count']:6d} {s['errors']:5d} {s['status_changed']:6d}"
+            f" {_ms(s['p50'])} {_ms(s['p95'])} {_ms(s['captured_p50'])}"
+        )
+
+
+def _change(a, b):
+    if a is None or b is None or not a:
+        return f"{'-':>7s}"
+    return f"{(b - a) / a * 100:+6.1f}%"
+
+
+def compare(base_path, candidate_path):
+    def load(path):
+        with open(path, encoding="utf-8") as f:
+            return summarize([json.loads(line) for line in f if line.strip()])
+
+    base, candidate = load(base_path), load(candidate_path)
+    print(
+        f"{'endpoint':50s} {'count':>6s} {'p50 a':>9s} {'p50 b':>9s} {'p50':>7s}"
+        f" {'p95 a':>9s} {'p95 b':>9s} {'p95':>7s}"
+    )
+    for name, a in base.items():
+        b = candidate.get(name)
+        if b is None:
+            continue
+        print(
+            f"{name[:50]:50s} {a['count']:6d} {_ms(a['p50'])} {_ms(b['p50'])}"
+            f" {_change(a['p50'], b['p50'])} {_ms(a['p95'])} {_ms(b['p95'])}"
+            f" {_change(a['p95'], b['p95'])}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="Replay a capture against a target")
+    run.add_argument("captures", nargs="+", help="Capture files or directories")
+    run.add_argument("--target", required=True, help="Base URL of the app under test")
+    run.add_argument("--speed", type=float, default=1.0, help="N times the captured rate")
+    run.add_argument("--concurrency", type=int, default=200)
+    run.add_argument("--timeout", type=float, default=30.0)
+    run.add_argument("--routes", nargs="*", help="Only URL rules starting with these")
+    run.add_argument("--limit", type=int, help="Only the first N requests")
+    run.add_argument("--out", help="Write per-request results here (JSON lines)")
+    diff = commands.add_parser("compare", help="Per-endpoint latency of two runs")
+    diff.add_argument("base")
+    diff.add_argument("candidate")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        compare(args.base, args.candidate)
+        return
+
+    records = read_captures(args.captures)
+    if args.routes:
+        records = [r for r in records if r["r"].startswith(tuple(args.routes))]
+    if args.limit:
+        records = records[: args.limit]
+    if not records:
+        sys.exit("no captured requests")
+    span = (records[-1]["t"] - records[0]["t"]) / args.speed
+    print(f"replaying {len(records)} requests over {span:.1f} s at {args.speed:g}x")
+    results, lag = asyncio.run(
+        replay(records, args.target, args.speed, args.concurrency, args.timeout)
+    )
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            for r in results:
+                f.write(json.dumps(r) + "\n")
+    print_summary(summarize(results))
+    print(f"sending fell behind schedule by at most {lag * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
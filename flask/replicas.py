@@ -0,0 +1,139 @@
+"""Routing of read-only queries to a Postgres read replica.
+
+Writes always go through ``db.session`` on the primary. Read-only endpoints
+(reports, order history) open their queries through ``ReplicaRouter.reader``,
+which hands out a replica connection when a replica is configured and healthy,
+and falls back to the primary session otherwise.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app, session as flask_session
+from sqlalchemy import text
+
+REPLICA_BIND = "replica"
+
+# Seconds of replay lag on the replica. A replica that has received and
+# replayed all WAL it knows about is treated as fully caught up, even if the
+# primary has simply been idle since its last commit.
+REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+class ReplicaRouter:
+    """Chooses between the replica bind and the primary for read queries."""
+
+    def __init__(self, db):
+        self.db = db
+        self.max_lag_seconds = 5.0
+        self.lag_check_interval = 2.0
+        self.read_your_writes_seconds = 10.0
+        self._lock = threading.Lock()
+        self._pins = {}
+        self._lag = None
+        self._lag_checked_at = 0.0
+
+    def init_app(self, app):
+        self.max_lag_seconds = float(app.config.get("REPLICA_MAX_LAG_SECONDS", 5))
+        self.lag_check_interval = float(
+            app.config.get("REPLICA_LAG_CHECK_INTERVAL", 2)
+        )
+        self.read_your_writes_seconds = float(
+            app.config.get("READ_YOUR_WRITES_SECONDS", 10)
+        )
+
+    @property
+    def engine(self):
+        return self.db.engines.get(REPLICA_BIND)
+
+    def pin(self, key):
+        """Send reads for ``key`` to the primary for the read-your-writes window.
+
+        The pin is kept in this worker and in the caller's session cookie, so a
+        follow-up request served by another worker still reads its own write.
+        Without a replica nothing is pinned, and without a secret key only this
+        worker's pin is kept.
+        """
+        if key is None or self.engine is None or self.read_your_writes_seconds <= 0:
+            return
+        until = time.time() + self.read_your_writes_seconds
+        with self._lock:
+            self._pins[key] = until
+            if len(self._pins) > 10000:
+                now = time.time()
+                self._pins = {k: v for k, v in self._pins.items() if v > now}
+        if not current_app.secret_key:
+            return
+        pinned = dict(flask_session.get("read_primary", {}))
+        pinned[str(key)] = until
+        flask_session["read_primary"] = {
+            k: v for k, v in pinned.items() if v > time.time()
+        }
+
+    def is_pinned(self, key):
+        if key is None:
+            return False
+        now = time.time()
+        with self._lock:
+            if self._pins.get(key, 0) > now:
+                return True
+        return flask_session.get("read_primary", {}).get(str(key), 0) > now
+
+    def replica_lag(self):
+        """Replica lag in seconds, cached for ``lag_check_interval``.
+
+        Returns ``None`` when no replica is configured or it cannot be reached.
+        """
+        engine = self.engine
+        if engine is None:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            if now - self._lag_checked_at < self.lag_check_interval:
+                return self._lag
+            self._lag_checked_at = now
+        try:
+            with engine.connect() as conn:
+                lag = float(conn.execute(text(REPLICA_LAG_SQL)).scalar() or 0)
+        except Exception:
+            lag = None
+        with self._lock:
+            self._lag = lag
+        return lag
+
+    def use_replica(self, pin_key=None):
+        if self.engine is None or self.is_pinned(pin_key):
+            return False
+        lag = self.replica_lag()
+        return lag is not None and lag <= self.max_lag_seconds
+
+    def status(self):
+        if self.engine is None:
+            return {"configured": False}
+        lag = self.replica_lag()
+        return {
+            "configured": True,
+            "reachable": lag is not None,
+            "lag_seconds": lag,
+            "in_use": lag is not None and lag <= self.max_lag_seconds,
+        }
+
+    @contextmanager
+    def reader(self, pin_key=None):
+        """Yield something with ``.execute()`` for read-only queries.
+
+        That is a replica connection when the replica is usable for
+        ``pin_key``, and ``db.session`` (the primary) otherwise.
+        """
+        if not self.use_replica(pin_key):
+            yield self.db.session
+            return
+        with self.engine.connect() as conn:
+            yield conn
@@ -0,0 +1,189 @@
+"""Per-day partial aggregates for range reports.
+
+A report over ``[start, end]`` is split into whole days. Every day before
+today is closed (see ``split_days``): its partial never changes, so it is computed once, stored in
+the ``report_day_partials`` table and kept in an in-process LRU keyed by
+``(report, day)``. Only today is aggregated live, and the report merges the
+partials.
+
+A trigger on ``orders`` deletes the stored partials of a closed day when an
+order lands on it late (migration_add_report_day_partials.sql). Other workers
+notice once their LRU entry for that day is older than ``lru_seconds``.
+
+Partials are per store and stored on that store's shard.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import bindparam, text
+
+from models import DEFAULT_STORE_ID
+
+
+def parse_day(value):
+    return value if isinstance(value, date) else date.fromisoformat(str(value)[:10])
+
+
+def split_days(start, end, now=None, grace_minutes=10):
+    """Return ``(closed_days, live_days)`` for the inclusive range.
+
+    A day only counts as closed ``grace_minutes`` after midnight, so orders
+    committed just before midnight (or still replaying on a replica) are in
+    its partial before it is cached.
+    """
+    now = now or datetime.now()
+    first_open = (now - timedelta(minutes=grace_minutes)).date()
+    start, end = parse_day(start), parse_day(end)
+    closed, live = [], []
+    day = start
+    while day <= end and day <= now.date():
+        (closed if day < first_open else live).append(day)
+        day += timedelta(days=1)
+    return closed, live
+
+
+def day_span(days):
+    """``(since, until)`` bounds covering every day in ``days``."""
+    return min(days), max(days) + timedelta(days=1)
+
+
+class DayPartialCache:
+    """Closed-day partials: in-process LRU in front of a table on the primary."""
+
+    def __init__(self, db=None, shards=None, max_entries=5000, lru_seconds=300.0):
+        self.db = db
+        self.shards = shards
+        self.max_entries = max_entries
+        self.lru_seconds = lru_seconds
+        self.persist = True
+        # Bumped by every invalidation, for callers keying on closed days
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def init_app(self, app):
+        self.max_entries = int(app.config.get("REPORT_CACHE_MAX_ENTRIES", 5000))
+        self.lru_seconds = float(app.config.get("REPORT_CACHE_LRU_SECONDS", 300))
+        self.persist = bool(app.config.get("REPORT_CACHE_PERSIST", True))
+
+    def _engine(self, store_id):
+        if self.shards is None:
+            return self.db.engine
+        return self.shards.engine(self.shards.shard_of(store_id))
+
+    def _lru_get_many(self, report, store_id, days):
+        found = {}
+        now = time.monotonic()
+        with self._lock:
+            for day in days:
+                key = (report, store_id, day)
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if now - entry[0] > self.lru_seconds:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                found[day] = entry[1]
+        return found
+
+    def _lru_put(self, report, store_id, day, partial):
+        key = (report, store_id, day)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), partial)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _store_get_many(self, report, store_id, days):
+        with self._engine(store_id).connect() as conn:
+            rows = conn.execute(
+                text(
+                    "SELECT day, payload FROM report_day_partials "
+                    "WHERE report = :report AND store_id = :store_id AND day IN :days"
+                ).bindparams(bindparam("days", expanding=True)),
+                {"report": report, "store_id": store_id, "days": days},
+            ).all()
+        return {day: payload for day, payload in rows}
+
+    def _store_put_many(self, report, store_id, partials):
+        params = [
+            {
+                "report": report,
+                "store_id": store_id,
+                "day": day,
+                "payload": json.dumps(partial),
+            }
+            for day, partial in partials.items()
+        ]
+        # Never overwrite: a stored partial is only replaced after the
+        # orders trigger deleted it.
+        with self._engine(store_id).begin() as conn:
+            conn.execute(
+                text(
+                    """
+                    INSERT INTO report_day_partials (report, store_id, day, payload)
+                    VALUES (:report, :store_id, :day, CAST(:payload AS JSONB))
+                    ON CONFLICT (report, store_id, day) DO NOTHING
+                """
+                ),
+                params,
+            )
+
+    def closed_partials(self, report, days, compute_missing, store_id=DEFAULT_STORE_ID):
+        """Partials for closed ``days``, computing the uncached ones at once.
+
+        ``compute_missing(days)`` must return ``{day: partial}`` covering every
+        day it was given, with an empty partial for days without orders so
+        those are cached too. Partials must be JSON-serialisable.
+        """
+        found = self._lru_get_many(report, store_id, days)
+        missing = [d for d in days if d not in found]
+        if missing and self.persist:
+            stored = self._store_get_many(report, store_id, missing)
+            for day, partial in stored.items():
+                self._lru_put(report, store_id, day, partial)
+                found[day] = partial
+            missing = [d for d in missing if d not in found]
+        if missing:
+            computed = compute_missing(missing)
+            for day in missing:
+                self._lru_put(report, store_id, day, computed[day])
+                found[day] = computed[day]
+            if self.persist:
+                self._store_put_many(
+                    report, store_id, {d: computed[d] for d in missing}
+                )
+        return [found[d] for d in days]
+
+    def invalidate(self, day, report=None, store_id=None):
+        """Drop a closed day's partials here and in the table."""
+        day = parse_day(day)
+        with self._lock:
+            self.generation += 1
+            for key in [k for k in self._entries if k[2] == day]:
+                if (report is None or key[0] == report) and (
+                    store_id is None or key[1] == store_id
+                ):
+                    del self._entries[key]
+        if self.persist:
+            sql = "DELETE FROM report_day_partials WHERE day = :day"
+            params = {"day": day}
+            if report is not None:
+                sql += " AND report = :report"
+                params["report"] = report
+            if store_id is not None:
+                sql += " AND store_id = :store_id"
+                params["store_id"] = store_id
+                engines = [self._engine(store_id)]
+            elif self.shards is not None:
+                engines = self.shards.engines()
+            else:
+                engines = [self.db.engine]
+            for engine in engines:
+                with engine.begin() as conn:
+                    conn.execute(text(sql), params)
@@ -0,0 +1,235 @@
+"""JSON logs written off the request thread, tagged with the request they came from.
+
+``init_app`` points the root logger at a ``QueueHandler``. Emitting a record
+only tags it with the current request's context and puts it on a
+bounded queue; a ``QueueListener`` thread formats it as one JSON line and
+writes it to stdout. When the queue is full the record is dropped and
+counted, so a slow stdout pipe never stalls a checkout.
+
+Every request gets an id (the incoming ``X-Request-ID`` or a fresh one, echoed
+back in the response) and one ``request`` record with its route, status and
+duration. Views add fields such as ``order_id`` with ``bind``, and these then
+appear on every later record of the request.
+
+High-volume events are sampled with ``LOG_SAMPLE_RATES``, e.g.
+``"request:0.1"`` keeps a tenth of the access records. The decision is made
+from the request id, so a request's records are kept or dropped together.
+Warnings and errors are always kept.
+
+The listener thread does not survive a fork, so it is restarted in each
+gunicorn worker with a fresh queue.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timezone
+
+from flask import g, has_request_context, request
+
+# Attributes every LogRecord has; anything else came in through ``extra``
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+def bind(**fields):
+    """Attach ``fields`` to every later log record of the current request."""
+    if has_request_context():
+        _context().update({k: v for k, v in fields.items() if v is not None})
+
+
+def _context():
+    """The current request's log fields, built once per request."""
+    if not has_request_context():
+        return {}
+    fields = g.get("log_fields")
+    if fields is None:
+        fields = g.log_fields = {
+            "request_id": g.get("request_id"),
+            "method": request.method,
+            "route": request.url_rule.rule if request.url_rule else request.path,
+        }
+    return fields
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and value is not None:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _ContextQueueHandler(logging.handlers.QueueHandler):
+    """Tags, samples and enqueues records without formatting them."""
+
+    def __init__(self, pipeline):
+        super().__init__(pipeline.queue)
+        self.pipeline = pipeline
+
+    def prepare(self, record):
+        # This is the root's only handler, so the record is ours to change.
+        # Arguments may not be safe to format later on another thread
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        for key, value in _context().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.pipeline.count("dropped")
+
+    def emit(self, record):
+        if not self.pipeline.sampled(record):
+            self.pipeline.count("sampled_out")
+            return
+        super().emit(record)
+
+
+class LogPipeline:
+    def __init__(self):
+        self.level = logging.INFO
+        self.queue_size = 10000
+        self.sample_rates = {}
+        self.use_queue = True
+        self.stream = sys.stdout
+        self.queue = None
+        self._handler = None
+        self._listener = None
+        self._lock = threading.Lock()
+        self._counts = {"dropped": 0, "sampled_out": 0}
+
+    def init_app(self, app):
+        self.level = logging.getLevelName(str(app.config.get("LOG_LEVEL", "INFO")).upper())
+        self.queue_size = int(app.config.get("LOG_QUEUE_SIZE", 10000))
+        self.sample_rates = {
+            event: float(rate)
+            for event, rate in (app.config.get("LOG_SAMPLE_RATES") or {}).items()
+        }
+        self.use_queue = bool(app.config.get("LOG_QUEUE", True))
+        self.install()
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        atexit.register(self.stop)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # The parent's listener thread and lock state did not come along
+        self._lock = threading.Lock()
+        self._listener = None
+        self.install()
+
+    def install(self):
+        """(Re)attach the root handler, starting a listener thread if queued."""
+        with self._lock:
+            if self._listener is not None:
+                self._listener.stop()
+                self._listener = None
+            root = logging.getLogger()
+            if self._handler is not None:
+                root.removeHandler(self._handler)
+            output = logging.StreamHandler(self.stream)
+            output.setFormatter(JsonFormatter())
+            if self.use_queue:
+                self.queue = queue.Queue(self.queue_size)
+                self._handler = _ContextQueueHandler(self)
+                self._listener = logging.handlers.QueueListener(self.queue, output)
+                self._listener.start()
+            else:
+                # Synchronous: format and write on the calling thread
+                output.addFilter(self._tag)
+                self._handler = output
+            root.addHandler(self._handler)
+            root.setLevel(self.level)
+
+    def _tag(self, record):
+        if not self.sampled(record):
+            self.count("sampled_out")
+            return False
+        for key, value in _context().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+    def stop(self):
+        """Flush what is queued and stop the listener thread."""
+        with self._lock:
+            if self._listener is not None:
+                self._listener.stop()
+                self._listener = None
+
+    def sampled(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.sample_rates.get(getattr(record, "event", None))
+        if rate is None or rate >= 1.0:
+            return True
+        key = getattr(record, "request_id", None) or (
+            g.get("request_id") if has_request_context() else None
+        )
+        if key is None:
+            return random.random() < rate
+        return zlib.crc32(key.encode()) < rate * 2**32
+
+    def count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def status(self):
+        with self._lock:
+            return {
+                "queued": self.queue.qsize() if self.use_queue and self.queue else 0,
+                "queue_size": self.queue_size if self.use_queue else 0,
+                **self._counts,
+            }
+
+    def _start_request(self):
+        g.request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+        g.request_started = time.perf_counter()
+
+    def _finish_request(self, response):
+        request_id = g.get("request_id")
+        if request_id is None:
+            return response
+        response.headers["X-Request-ID"] = request_id
+        duration_ms = (time.perf_counter() - g.request_started) * 1000.0
+        logging.getLogger("request").info(
+            "%s %s %s",
+            request.method,
+            request.path,
+            response.status_code,
+            extra={
+                "event": "request",
+                "status": response.status_code,
+                "duration_ms": round(duration_ms, 2),
+            },
+        )
+        return response
@@ -0,0 +1,327 @@
+"""Per-worker fuzzy search over products, categories and ingredients.
+
+Every word of a product name, its category or an ingredient name is a term.
+Terms are kept in a sorted list for prefix lookups (bisect) and in a trigram
+index for typo tolerance. A short word with a typo shares few trigrams with
+the real one ("mlik" and "milk" share none), so terms are also indexed by
+each of their one-letter deletions, which finds every term one
+Damerau-Levenshtein edit away from a query token. A query token matches
+terms by prefix, by one edit or by trigram similarity.
+
+A document's score is the weighted mean over the query tokens of its best
+matching term. A token is weighted by how few documents it matches (IDF),
+so in "grene tea" the hit on "green" counts for more than the hit on "tea"
+that every drink shares. Ranking then boosts documents by recent sales, so
+"mi" offers the milk tea people actually order first.
+
+Each term's postings are also held as NumPy arrays, so scoring a term that
+every drink carries ("tea") is one vectorised max over the document scores
+instead of a Python loop. A short prefix expands to at most
+``MAX_EXPANSIONS`` terms (the most common ones), which keeps the first
+keystrokes as cheap as the later ones.
+
+Queries never touch the database. The index is loaded like the catalog:
+built on first use, rebuilt after ``SEARCH_INDEX_TTL_SECONDS`` to pick up
+other workers' writes and fresh popularity, and patched in place by this
+worker's own inserts and edits. An edited document is tombstoned and
+re-added, so postings only ever grow until the next rebuild.
+
+Ingredient names are read from the default store's inventory; ingredient ids
+are shared by every store.
+"""
+
+import bisect
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+
+import numpy as np
+from sqlalchemy import text
+
+from models import DEFAULT_STORE_ID
+
+# Field weights: a hit on the name beats a hit on the category
+NAME_WEIGHT = 1.0
+CATEGORY_WEIGHT = 0.6
+MIN_SIMILARITY = 0.3
+# One-edit matches for tokens this long or longer; below a prefix hit
+EDIT_MIN_LENGTH = 4
+EDIT_SCORE = 0.7
+POPULARITY_BOOST = 0.25
+MAX_EXPANSIONS = 50
+
+
+def normalize(value):
+    value = unicodedata.normalize("NFKD", value or "")
+    return "".join(c for c in value if not unicodedata.combining(c)).lower()
+
+
+def tokenize(value):
+    return re.findall(r"[a-z0-9]+", normalize(value))
+
+
+def trigrams(term):
+    padded = f"  {term} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def deletions(term):
+    """Every string one letter shorter than ``term``."""
+    return {term[:i] + term[i + 1 :] for i in range(len(term))}
+
+
+def within_one_edit(a, b):
+    """Whether ``a`` and ``b`` are at most one insertion, deletion,
+    substitution or swap of adjacent letters apart."""
+    if abs(len(a) - len(b)) > 1:
+        return False
+    i = 0
+    while i < len(a) and i < len(b) and a[i] == b[i]:
+        i += 1
+    if len(a) < len(b):
+        return a[i:] == b[i + 1 :]
+    if len(a) > len(b):
+        return a[i + 1 :] == b[i:]
+    return a[i + 1 :] == b[i + 1 :] or (
+        a[i : i + 2] == b[i : i + 2][::-1] and a[i + 2 :] == b[i + 2 :]
+    )
+
+
+class SearchIndex:
+    def __init__(self, ttl_seconds=300.0):
+        self.ttl_seconds = ttl_seconds
+        self.popularity_days = 30
+        self._lock = threading.Lock()
+        self._loaded_at = 0.0
+        self._reset()
+
+    def init_app(self, app):
+        self.ttl_seconds = float(app.config.get("SEARCH_INDEX_TTL_SECONDS", 300))
+
+    def _reset(self):
+        self._docs = []
+        # (kind, id) -> index of the live document; replaced ones are dead
+        self._live = {}
+        self._dead = set()
+        self._terms = []
+        self._postings = {}
+        self._term_grams = {}
+        self._gram_terms = {}
+        # One-letter deletion -> the terms it came from
+        self._deletion_terms = {}
+        # NumPy views, rebuilt lazily after the lists above change
+        self._term_arrays = {}
+        self._doc_arrays = None
+        self.ready = False
+
+    def _add_term(self, term, doc, weight):
+        postings = self._postings.get(term)
+        if postings is None:
+            postings = self._postings[term] = []
+            bisect.insort(self._terms, term)
+            grams = trigrams(term)
+            self._term_grams[term] = len(grams)
+            for gram in grams:
+                self._gram_terms.setdefault(gram, []).append(term)
+            for deleted in deletions(term):
+                self._deletion_terms.setdefault(deleted, []).append(term)
+        postings.append((doc, weight))
+        self._term_arrays.pop(term, None)
+
+    def _add(self, kind, doc_id, name, category=None, popularity=0):
+        old = self._live.get((kind, doc_id))
+        if old is not None:
+            self._dead.add(old)
+        doc = len(self._docs)
+        self._docs.append(
+            {
+                "kind": kind,
+                "id": doc_id,
+                "name": name,
+                "category": category,
+                "popularity": popularity,
+            }
+        )
+        self._live[(kind, doc_id)] = doc
+        self._doc_arrays = None
+        for term in set(tokenize(name)):
+            self._add_term(term, doc, NAME_WEIGHT)
+        for term in set(tokenize(category)) - set(tokenize(name)):
+            self._add_term(term, doc, CATEGORY_WEIGHT)
+
+    def load(self, session):
+        products = session.execute(
+            text(
+                "SELECT product_id, product_name, category FROM products WHERE is_active"
+            )
+        ).all()
+        ingredients = session.execute(
+            text(
+                "SELECT ingredient_id, ingredient_name FROM inventory "
+                "WHERE store_id = :store_id"
+            ),
+            {"store_id": DEFAULT_STORE_ID},
+        ).all()
+        popularity = dict(
+            session.execute(
+                text(
+                    """
+                SELECT oi.product_id, SUM(oi.quantity)
+                FROM orders o
+                JOIN order_items oi ON oi.order_id = o.order_id
+                WHERE o.store_id = :store_id
+                  AND o.order_date >= CURRENT_DATE - CAST(:days AS INTEGER)
+                GROUP BY oi.product_id
+            """
+                ),
+                {"store_id": DEFAULT_STORE_ID, "days": self.popularity_days},
+            ).all()
+        )
+        return products, ingredients, popularity
+
+    def build(self, products, ingredients, popularity):
+        with self._lock:
+            self._reset()
+            for pid, name, category in products:
+                self._add("product", pid, name, category, int(popularity.get(pid, 0)))
+            for iid, name in ingredients:
+                self._add("ingredient", iid, name)
+            # Convert everything now rather than on the first keystrokes
+            self._docs_of()
+            for term in self._terms:
+                self._postings_of(term)
+            self._loaded_at = time.monotonic()
+            self.ready = True
+
+    def ensure(self, session):
+        """Build the index on first use and again once the TTL expires."""
+        with self._lock:
+            fresh = self.ready and time.monotonic() - self._loaded_at < self.ttl_seconds
+        if not fresh:
+            self.build(*self.load(session))
+
+    def add_product(self, product_id, name, category=None):
+        with self._lock:
+            if not self.ready:
+                return
+            old = self._live.get(("product", product_id))
+            popularity = self._docs[old]["popularity"] if old is not None else 0
+            self._add("product", product_id, name, category, popularity)
+
+    def add_ingredient(self, ingredient_id, name):
+        with self._lock:
+            if self.ready:
+                self._add("ingredient", ingredient_id, name)
+
+    def remove_product(self, product_id):
+        with self._lock:
+            doc = self._live.pop(("product", product_id), None)
+            if doc is not None:
+                self._dead.add(doc)
+                self._doc_arrays = None
+
+    def _postings_of(self, term):
+        arrays = self._term_arrays.get(term)
+        if arrays is None:
+            docs, weights = zip(*self._postings[term])
+            arrays = self._term_arrays[term] = (
+                np.fromiter(docs, dtype=np.int64, count=len(docs)),
+                np.fromiter(weights, dtype=np.float64, count=len(weights)),
+            )
+        return arrays
+
+    def _docs_of(self):
+        """``(boost, products)`` per document; dead documents get ``boost`` -1."""
+        if self._doc_arrays is None:
+            popularity = np.array([d["popularity"] for d in self._docs], dtype=np.float64)
+            top = math.log1p(popularity.max()) if len(popularity) else 0.0
+            boost = POPULARITY_BOOST * np.log1p(popularity) / (top or 1.0)
+            if self._dead:
+                boost[list(self._dead)] = -1.0
+            products = np.array([d["kind"] == "product" for d in self._docs], dtype=bool)
+            self._doc_arrays = (boost, products)
+        return self._doc_arrays
+
+    def _matches(self, token):
+        """``{term: score}`` of the terms one query token matches."""
+        lo = bisect.bisect_left(self._terms, token)
+        hi = bisect.bisect_left(self._terms, token + "\uffff", lo)
+        prefixed = self._terms[lo:hi]
+        if len(prefixed) > MAX_EXPANSIONS:
+            prefixed = sorted(prefixed, key=lambda t: len(self._postings[t]), reverse=True)
+            prefixed = prefixed[:MAX_EXPANSIONS]
+        matches = {
+            term: 1.0 if term == token else 0.8 + 0.2 * len(token) / len(term)
+            for term in prefixed
+        }
+        if len(token) >= 3:
+            grams = trigrams(token)
+            shared = Counter()
+            for gram in grams:
+                shared.update(self._gram_terms.get(gram, ()))
+            for term, n in shared.items():
+                similarity = n / (len(grams) + self._term_grams[term] - n)
+                # A fuzzy hit never outranks a prefix hit
+                if similarity >= MIN_SIMILARITY and term not in matches:
+                    matches[term] = 0.75 * similarity
+        if len(token) >= EDIT_MIN_LENGTH:
+            # Terms sharing a deletion with the token, or equal to one of its
+            # deletions; a shared deletion can hide two edits, so check
+            shorter = deletions(token)
+            candidates = {t for t in shorter if t in self._postings}
+            for variant in shorter | {token}:
+                candidates.update(self._deletion_terms.get(variant, ()))
+            for term in candidates:
+                if matches.get(term, 0.0) < EDIT_SCORE and within_one_edit(token, term):
+                    matches[term] = EDIT_SCORE
+        return matches
+
+    def search(self, query, limit=10, kind=None):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        with self._lock:
+            if not self._docs:
+                return []
+            boost, products = self._docs_of()
+            total = np.zeros(len(self._docs))
+            best = np.empty(len(self._docs))
+            live = len(self._live) or 1
+            weight_sum = 0.0
+            for token in tokens:
+                best.fill(0.0)
+                for term, score in self._matches(token).items():
+                    docs, weights = self._postings_of(term)
+                    best[docs] = np.maximum(best[docs], score * weights)
+                # A token that matches nothing counts as the rarest
+                weight = math.log1p(live / max(np.count_nonzero(best), 1))
+                total += weight * best
+                weight_sum += weight
+            match = total / weight_sum
+            rank = match * (1.0 + boost)
+            rank[boost < 0] = 0.0
+            if kind is not None:
+                rank[products != (kind == "product")] = 0.0
+            hits = np.flatnonzero(rank)
+            if len(hits) > limit:
+                hits = hits[np.argpartition(-rank[hits], limit)[:limit]]
+            hits = hits[np.argsort(-rank[hits], kind="stable")]
+            return [
+                {
+                    **self._docs[doc],
+                    "score": round(float(rank[doc]), 3),
+                    "match": round(float(match[doc]), 3),
+                }
+                for doc in hits
+            ]
+
+    def status(self):
+        with self._lock:
+            return {
+                "documents": len(self._live),
+                "terms": len(self._terms),
+                "age_seconds": round(time.monotonic() - self._loaded_at, 1),
+            }
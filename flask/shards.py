@@ -0,0 +1,205 @@
+"""Store-scoped sharding of orders, inventory, employees and report rollups.
+
+Every store's rows live on exactly one shard database. ``STORE_SHARDS`` maps
+store ids to shard names and ``SHARD_DATABASES`` maps shard names to URIs.
+Each extra shard is registered as a Flask-SQLAlchemy bind named
+``shard:<name>`` (see ``shard_binds``). The ``default`` shard is the primary
+database, and stores missing from the map live there, so a single-shop
+deployment needs no configuration at all.
+
+Per-store endpoints only ever open a connection to their store's shard. Reads
+on the default shard still go through the replica router. Cross-store
+summaries run one query per shard in parallel (``fan_out``) and merge the
+results. They cover every store in the ``stores`` table of any shard, plus the
+stores named in ``STORE_SHARDS``. The store list is cached for
+``SHARD_STORES_TTL_SECONDS``.
+
+Products and recipes are reference data: every shard carries the same copy,
+kept in sync by whatever replicates the menu (e.g. logical replication of
+``products`` and ``product_recipe`` from the primary).
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from flask import current_app, g, jsonify, request
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from models import DEFAULT_STORE_ID
+
+DEFAULT_SHARD = "default"
+
+
+def shard_binds(config):
+    """``SQLALCHEMY_BINDS`` entries for the configured non-default shards."""
+    return {
+        f"shard:{name}": uri
+        for name, uri in (config.get("SHARD_DATABASES") or {}).items()
+        if name != DEFAULT_SHARD
+    }
+
+
+def request_store_id(store_id=None):
+    """Store a request is about: URL, ``store_id`` arg or body field, else the default.
+
+    Raises ``ValueError`` for a value that is not an integer; ``ShardRouter``
+    answers such requests with a 400 before any view runs.
+    """
+    if store_id is None:
+        store_id = request.args.get("store_id")
+    if store_id is None and request.is_json:
+        body = request.get_json(silent=True)
+        if isinstance(body, dict):
+            store_id = body.get("store_id")
+    if store_id is None:
+        return DEFAULT_STORE_ID
+    if isinstance(store_id, bool) or not isinstance(store_id, (int, str)):
+        raise ValueError(f"store_id must be an integer, not {store_id!r}")
+    return int(store_id)
+
+
+class ShardRouter:
+    def __init__(self, db, replicas=None, stores_ttl=60.0):
+        self.db = db
+        self.replicas = replicas
+        self.store_shards = {}
+        self.stores_ttl = stores_ttl
+        self._lock = threading.Lock()
+        self._stores = None
+        self._stores_at = 0.0
+
+    def init_app(self, app):
+        self.stores_ttl = float(app.config.get("SHARD_STORES_TTL_SECONDS", 60.0))
+        self.store_shards = {
+            int(store): shard
+            for store, shard in (app.config.get("STORE_SHARDS") or {}).items()
+        }
+        known = {DEFAULT_SHARD, *(app.config.get("SHARD_DATABASES") or {})}
+        unknown = set(self.store_shards.values()) - known
+        if unknown:
+            raise ValueError(f"STORE_SHARDS refers to unknown shards: {sorted(unknown)}")
+        app.before_request(self._check_store_id)
+        app.teardown_appcontext(self._close_sessions)
+
+    @staticmethod
+    def _check_store_id():
+        try:
+            request_store_id()
+        except ValueError:
+            return jsonify({"error": "store_id must be an integer"}), 400
+        return None
+
+    @property
+    def sharded(self):
+        """Whether any store lives off the default shard."""
+        return any(shard != DEFAULT_SHARD for shard in self.store_shards.values())
+
+    def shard_of(self, store_id):
+        return self.store_shards.get(int(store_id), DEFAULT_SHARD)
+
+    def engine(self, shard):
+        if shard == DEFAULT_SHARD:
+            return self.db.engine
+        return self.db.engines[f"shard:{shard}"]
+
+    def read_engine(self, store_id):
+        """Engine ``reader`` would read ``store_id`` from right now."""
+        shard = self.shard_of(store_id)
+        if (
+            shard == DEFAULT_SHARD
+            and self.replicas is not None
+            and self.replicas.use_replica()
+        ):
+            return self.replicas.engine
+        return self.engine(shard)
+
+    def known_stores(self):
+        """Every store id in a shard's ``stores`` table or in ``STORE_SHARDS``."""
+        with self._lock:
+            if (
+                self._stores is not None
+                and time.monotonic() - self._stores_at < self.stores_ttl
+            ):
+                return self._stores
+        stores = {DEFAULT_STORE_ID, *self.store_shards}
+        for engine in self.engines():
+            with engine.connect() as conn:
+                rows = conn.execute(text("SELECT store_id FROM stores"))
+                stores.update(rows.scalars())
+        stores = sorted(stores)
+        with self._lock:
+            self._stores, self._stores_at = stores, time.monotonic()
+        return stores
+
+    def stores_by_shard(self, stores=None):
+        """``{shard: [store_id, ...]}`` for ``stores`` (default: every known store)."""
+        if stores is None:
+            stores = self.known_stores()
+        grouped = {}
+        for store_id in stores:
+            grouped.setdefault(self.shard_of(store_id), []).append(int(store_id))
+        return grouped
+
+    def engines(self):
+        """Writable engine of every shard."""
+        shards = {DEFAULT_SHARD, *self.store_shards.values()}
+        return [self.engine(shard) for shard in sorted(shards)]
+
+    def session(self, store_id):
+        """Session for writes to ``store_id``'s shard, closed with the app context."""
+        shard = self.shard_of(store_id)
+        if shard == DEFAULT_SHARD:
+            return self.db.session
+        sessions = g.setdefault("shard_sessions", {})
+        if shard not in sessions:
+            sessions[shard] = Session(bind=self.engine(shard))
+        return sessions[shard]
+
+    @staticmethod
+    def _close_sessions(exc):
+        for session in g.pop("shard_sessions", {}).values():
+            session.close()
+
+    @contextmanager
+    def reader(self, store_id, pin_key=None):
+        """Read connection for ``store_id``: the replica router on the default shard."""
+        shard = self.shard_of(store_id)
+        if shard == DEFAULT_SHARD and self.replicas is not None:
+            with self.replicas.reader(pin_key=pin_key) as conn:
+                yield conn
+            return
+        with self.engine(shard).connect() as conn:
+            yield conn
+
+    def fan_out(self, fn, stores=None):
+        """Run ``fn(conn, store_ids)`` on every shard in parallel.
+
+        Returns ``{shard: result}``. Each call gets its own connection and app
+        context, so ``fn`` may use anything a view could.
+        """
+        grouped = self.stores_by_shard(stores)
+        app = current_app._get_current_object()
+
+        def run(shard, store_ids):
+            with app.app_context():
+                with self.engine(shard).connect() as conn:
+                    return fn(conn, store_ids)
+
+        if len(grouped) == 1:
+            ((shard, store_ids),) = grouped.items()
+            return {shard: run(shard, store_ids)}
+        with ThreadPoolExecutor(max_workers=len(grouped)) as pool:
+            futures = {
+                shard: pool.submit(run, shard, store_ids)
+                for shard, store_ids in grouped.items()
+            }
+            return {shard: future.result() for shard, future in futures.items()}
+
+    def status(self):
+        return {
+            "shards": sorted({DEFAULT_SHARD, *self.store_shards.values()}),
+            "stores": {str(s): shard for s, shard in sorted(self.store_shards.items())},
+        }
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Modules import each other by name, as the app and scripts run from flask/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
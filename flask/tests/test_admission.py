@@ -0,0 +1,124 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+
+from admission import AdmissionControl, AdmissionRejected, admission_class
+
+
+class Pool:
+    def __init__(self, checked_out=0):
+        self.checked_out = checked_out
+
+    def checkedout(self):
+        return self.checked_out
+
+
+def engine(checked_out=0):
+    return SimpleNamespace(pool=Pool(checked_out))
+
+
+class Shards:
+    def __init__(self, engines):
+        self.engines = engines
+
+    def read_engine(self, store_id):
+        return self.engines[store_id]
+
+
+def control(capacity=3, primary=None, shards=None):
+    admission = AdmissionControl(SimpleNamespace(engine=primary or engine()), shards)
+    admission.capacity = admission.pool_capacity = capacity
+    admission.limits = {"cashier": capacity, "kiosk": 2, "report": 1}
+    admission.queue_timeouts = {"cashier": 1.0, "kiosk": 0.05, "report": 0.05}
+    return admission
+
+
+def test_reports_are_shed_when_their_pool_is_saturated():
+    admission = control()
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.acquire("report", engine(checked_out=3))
+    assert rejected.value.status == 429
+    # The same report on an idle pool goes through
+    admission.acquire("report", engine(checked_out=0))
+
+
+def test_orders_are_not_shed_by_a_busy_pool():
+    admission = control(primary=engine(checked_out=3))
+    admission.acquire("cashier")
+    admission.acquire("kiosk")
+
+
+def test_class_limits_time_out_with_503():
+    admission = control()
+    admission.acquire("kiosk")
+    admission.acquire("kiosk")
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.acquire("kiosk")
+    assert rejected.value.status == 503
+    assert rejected.value.retry_after >= 1
+
+
+def test_cashiers_get_the_next_free_slot_before_kiosks():
+    admission = control(capacity=1)
+    admission.queue_timeouts["kiosk"] = 1.0
+    admission.acquire("kiosk")
+    order = []
+
+    def wait(traffic_class):
+        admission.acquire(traffic_class)
+        order.append(traffic_class)
+        admission.release(traffic_class)
+
+    kiosk = threading.Thread(target=wait, args=("kiosk",))
+    kiosk.start()
+    time.sleep(0.05)
+    cashier = threading.Thread(target=wait, args=("cashier",))
+    cashier.start()
+    time.sleep(0.05)
+    admission.release("kiosk")
+    kiosk.join()
+    cashier.join()
+    assert order == ["cashier", "kiosk"]
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+
+    @app.route("/reports/<int:store_id>")
+    @admission_class("report")
+    def report(store_id):
+        return "ok"
+
+    @app.route("/order", methods=["POST"])
+    @admission_class("order")
+    def order():
+        return "ok"
+
+    return app
+
+
+def test_requests_check_the_pool_of_their_store(app):
+    shards = Shards({1: engine(0), 2: engine(3)})
+    admission = control(shards=shards)
+    admission.init_app(app)
+    admission.capacity = admission.pool_capacity = 3
+    client = app.test_client()
+    assert client.get("/reports/1").status_code == 200
+    busy = client.get("/reports/2")
+    assert busy.status_code == 429
+    assert busy.headers["Retry-After"]
+    assert admission.status()["classes"]["report"]["rejected"] == 1
+
+
+def test_orders_are_classed_by_who_rings_them_up(app):
+    admission = control()
+    with app.test_request_context("/order", method="POST", json={"employee_id": 1}):
+        assert admission.classify() == "cashier"
+    with app.test_request_context("/order", method="POST", json={"clerk_user_id": "u"}):
+        assert admission.classify() == "kiosk"
+    with app.test_request_context("/order", method="POST", json=[1]):
+        assert admission.classify() == "kiosk"
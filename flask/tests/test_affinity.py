@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+from affinity import build_partial, empty_partial, merge_partials, top_pairs
+
+# Four orders: milk tea with boba twice, milk tea alone, lemonade with boba
+DAY_ONE = [
+    (1, "p:1"),
+    (1, "a:9"),
+    (2, "p:1"),
+    (2, "a:9"),
+    (2, "p:1"),
+    (3, "p:1"),
+    (4, "p:2"),
+    (4, "a:9"),
+]
+
+
+def pairs_of(partial):
+    keys = partial["keys"]
+    return {
+        (keys[i], keys[j]): n
+        for i, j, n in zip(partial["pair_i"], partial["pair_j"], partial["pair_n"])
+    }
+
+
+def test_partial_counts_each_order_once_per_item():
+    partial = build_partial(DAY_ONE)
+    assert partial["orders"] == 4
+    assert pairs_of(partial) == {
+        ("a:9", "a:9"): 3,
+        ("a:9", "p:1"): 2,
+        ("a:9", "p:2"): 1,
+        ("p:1", "p:1"): 3,
+        ("p:2", "p:2"): 1,
+    }
+
+
+def test_partial_is_json_serialisable():
+    partial = build_partial(DAY_ONE)
+    assert json.loads(json.dumps(partial)) == partial
+
+
+def test_empty_day():
+    assert build_partial([]) == empty_partial()
+
+
+def test_merging_days_with_different_keys_sums_their_counts():
+    # The second day knows the items in another order, so indexes differ
+    day_two = build_partial([(5, "p:2"), (5, "p:1"), (6, "p:1"), (6, "a:9")])
+    keys, orders, counts = merge_partials(
+        [build_partial(DAY_ONE), empty_partial(), day_two]
+    )
+    assert orders == 6
+    at = {k: n for n, k in enumerate(keys)}
+
+    def count(a, b):
+        i, j = sorted((at[a], at[b]))
+        return counts[i, j]
+
+    assert count("p:1", "a:9") == 3
+    assert count("p:1", "p:2") == 1
+    assert count("p:1", "p:1") == 5
+
+
+def test_top_pairs_metrics():
+    (pair,) = top_pairs(*merge_partials([build_partial(DAY_ONE)]), min_count=2)
+    assert {pair["a"], pair["b"]} == {"p:1", "a:9"}
+    assert pair["count"] == 2
+    assert pair["support"] == 0.5
+    assert pair["lift"] == pytest.approx(2 * 4 / (3 * 3), abs=1e-4)
+    assert pair["confidence_a_to_b"] == pytest.approx(2 / 3, abs=1e-4)
+
+
+def test_add_ons_can_be_left_out():
+    merged = merge_partials([build_partial(DAY_ONE)])
+    assert top_pairs(*merged, min_count=1, include_addons=False) == []
+    assert len(top_pairs(*merged, min_count=1, sort="count")) == 2
+
+
+def test_no_orders():
+    assert top_pairs(*merge_partials([])) == []
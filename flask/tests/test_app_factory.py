@@ -0,0 +1,19 @@
+import app as app_module
+
+# Nothing listens here; building the app must not try to connect
+UNREACHABLE = "postgresql://nobody@127.0.0.1:1/none"
+
+
+def test_create_app_opens_no_connection():
+    app = app_module.create_app(
+        {"SQLALCHEMY_DATABASE_URI": UNREACHABLE, "WARM_UP": False}
+    )
+    assert app.test_client().get("/").get_json()["status"] == "ok"
+
+
+def test_config_overrides_environment():
+    app = app_module.create_app(
+        {"SQLALCHEMY_DATABASE_URI": UNREACHABLE, "CATALOG_TTL_SECONDS": 1}
+    )
+    assert app.config["CATALOG_TTL_SECONDS"] == 1
+    assert "pool_size" in app.config["SQLALCHEMY_ENGINE_OPTIONS"]
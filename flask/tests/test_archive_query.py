@@ -0,0 +1,134 @@
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+from archive import _write_day
+from archive_query import hourly, sales_by_product, trend, usage_by_ingredient
+
+
+def order(order_id, when, total):
+    return (order_id, when, Decimal(total), None, None)
+
+
+def item(order_id, when, product_id, quantity, price, name="Milk Tea"):
+    return (
+        *(order_id * 10, order_id, when, product_id, name, "Tea", quantity),
+        *(Decimal(price), "normal", "100%", "regular"),
+    )
+
+
+def usage(order_id, when, ingredient_id, used):
+    name = f"i{ingredient_id}"
+    return (order_id * 10, order_id, when, ingredient_id, name, Decimal(used))
+
+
+def write(root, dataset, store_id, rows):
+    by_day = {}
+    for row in rows:
+        when = row[1] if dataset == "orders" else row[2]
+        by_day.setdefault(when.date(), []).append(row)
+    for day, day_rows in by_day.items():
+        _write_day(str(root), dataset, store_id, day, day_rows)
+
+
+@pytest.fixture
+def archive(tmp_path):
+    # Store 2 lives on another shard, whose order ids overlap store 1's
+    write(
+        tmp_path,
+        "orders",
+        1,
+        [
+            order(1, datetime(2024, 3, 10, 9), "10.00"),
+            order(2, datetime(2024, 12, 5, 9), "20.00"),
+            order(3, datetime(2025, 3, 10, 9), "15.00"),
+            order(4, datetime(2025, 3, 11, 14), "5.00"),
+        ],
+    )
+    write(tmp_path, "orders", 2, [order(3, datetime(2025, 3, 10, 9), "30.00")])
+    write(
+        tmp_path,
+        "order_items",
+        1,
+        [
+            item(3, datetime(2025, 3, 10, 9), 1, 3, "5.00"),
+            item(4, datetime(2025, 3, 11, 14), 2, 1, "5.00", "Lemonade"),
+        ],
+    )
+    write(tmp_path, "order_items", 2, [item(3, datetime(2025, 3, 10, 9), 1, 6, "5.00")])
+    write(
+        tmp_path,
+        "ingredient_usage",
+        1,
+        [
+            usage(3, datetime(2025, 3, 10, 9), 7, "3"),
+            usage(4, datetime(2025, 3, 11, 14), 7, "1"),
+        ],
+    )
+    write(
+        tmp_path, "ingredient_usage", 2, [usage(3, datetime(2025, 3, 10, 9), 7, "6")]
+    )
+    return str(tmp_path)
+
+
+def test_year_over_year_reads_the_year_before_start(archive):
+    rows = trend(archive, "2025-03-01", "2025-03-31", store_id=1)
+    assert rows == [
+        {
+            "period": "2025-03",
+            "orders": 2,
+            "drinks": 4,
+            "revenue": 20.0,
+            "revenue_last_year": 10.0,
+            "revenue_change_pct": 100.0,
+        }
+    ]
+
+
+def test_year_over_year_compares_the_same_days(archive):
+    # 2024-03-10 is outside 2024-03-11..2024-03-31
+    (row,) = trend(archive, "2025-03-11", "2025-03-31", store_id=1)
+    assert row["revenue"] == 5.0
+    assert row["revenue_last_year"] is None
+
+
+def test_periods_before_start_are_not_reported(archive):
+    rows = trend(archive, "2024-06-01", "2025-12-31", period="year")
+    assert [(r["period"], r["orders"], r["revenue"]) for r in rows] == [
+        ("2024", 1, 20.0),
+        ("2025", 3, 50.0),
+    ]
+    # 2024 from June is compared with 2023 from June; all of 2025 with 2024
+    assert rows[0]["revenue_last_year"] is None
+    assert rows[1]["revenue_last_year"] == 30.0
+
+
+def test_trend_of_an_empty_range(archive, tmp_path):
+    assert trend(archive, "2026-01-01", "2026-01-31") == []
+    assert trend(str(tmp_path / "missing"), "2025-01-01", "2025-01-31") == []
+    with pytest.raises(ValueError):
+        trend(archive, "2025-01-01", "2025-01-31", period="week")
+
+
+def test_orders_with_the_same_id_in_two_stores_count_twice(archive):
+    (row,) = usage_by_ingredient(archive, "2025-03-01", "2025-03-31")
+    assert row == {
+        "ingredient_id": 7,
+        "ingredient_name": "i7",
+        "total_used": 10.0,
+        "orders_count": 3,
+    }
+    (row,) = usage_by_ingredient(archive, "2025-03-01", "2025-03-31", store_id=2)
+    assert row["orders_count"] == 1
+
+
+def test_sales_and_hourly(archive):
+    sales = sales_by_product(archive, "2025-03-01", "2025-03-31")
+    assert [(r["product_name"], r["qty"], r["revenue"]) for r in sales] == [
+        ("Milk Tea", 9, 45.0),
+        ("Lemonade", 1, 5.0),
+    ]
+    rows = {r["hour"]: r for r in hourly(archive, "2025-03-10", "2025-03-11", 1)}
+    assert rows[9]["orders"] == 1
+    assert rows[14]["avg_revenue"] == 2.5
@@ -0,0 +1,132 @@
+import pytest
+
+from availability import Availability
+
+# Milk tea (1): 0.5 tea + 1 milk; lemonade (2): 2 lemon. 10-12 are the cups
+RECIPES = [(1, 100, 0.5), (1, 101, 1), (2, 102, 2), (3, 103, 0)]
+INVENTORY = [
+    (100, "Black Tea", 10.0),
+    (101, "Milk", 3.0),
+    (102, "Lemon", 5.0),
+    (103, "Boba", 0.0),
+    (10, "Small Cup", 100.0),
+    (11, "Medium Cup", 2.0),
+    (12, "Large Cup", 0.0),
+]
+
+
+class Session:
+    def __init__(self):
+        self.queries = 0
+
+    def execute(self, statement, params=None):
+        self.queries += 1
+        if "FROM product_recipe" in str(statement):
+            return iter(RECIPES)
+        return iter(INVENTORY)
+
+
+@pytest.fixture
+def availability():
+    return Availability(ttl_seconds=60)
+
+
+def product(pid):
+    return {"product_id": pid, "product_name": str(pid)}
+
+
+def test_sizes_are_capped_by_recipe_and_cup(availability):
+    milk_tea, lemonade, plain = availability.annotate_products(
+        Session(), [product(1), product(2), product(9)]
+    )
+    assert milk_tea["max_quantity"] == {"small": 3, "normal": 2, "large": 0}
+    assert not milk_tea["sold_out"]
+    assert lemonade["max_quantity"]["small"] == 2
+    # No recipe: only the cups limit it
+    assert plain["max_quantity"] == {"small": 100, "normal": 2, "large": 0}
+
+
+def test_apply_recomputes_the_products_using_the_ingredient(availability):
+    session = Session()
+    version = availability.version(session)
+    availability.apply(1, {101: 0})
+    (milk_tea,) = availability.annotate_products(session, [product(1)])
+    assert milk_tea["sold_out"]
+    assert availability.version(session) != version
+    assert session.queries == 2
+
+
+def test_add_ons_are_sold_out_without_stock(availability):
+    mods = [{"ingredient_id": 103}, {"ingredient_id": 102}]
+    assert [m["sold_out"] for m in availability.annotate_add_ons(Session(), mods)] == [
+        True,
+        False,
+    ]
+
+
+def test_check_reports_what_an_order_lacks(availability):
+    items = [
+        {"product_id": 1, "quantity": 2, "size_level": "normal"},
+        {
+            "product_id": 2,
+            "quantity": 1,
+            "size_level": "small",
+            "modifications": [
+                {"ingredient_id": 103, "modification_type": "add", "quantity_change": 0}
+            ],
+        },
+    ]
+    assert availability.check(Session(), items) == [
+        {"ingredient_id": 103, "needed": 0.0, "on_hand": 0.0}
+    ]
+    items[0]["quantity"] = 4
+    short = {r["ingredient_id"] for r in availability.check(Session(), items)}
+    assert short == {101, 11, 103}
+
+
+def test_check_survives_a_concurrent_recipe_reload(availability, monkeypatch):
+    session = Session()
+    state_of = availability._state
+
+    def reload_after_lookup(session, store_id):
+        state = state_of(session, store_id)
+        # Another thread saves a recipe between the lookup and the check
+        availability.recipes_changed()
+        return state
+
+    monkeypatch.setattr(availability, "_state", reload_after_lookup)
+    items = [{"product_id": 1, "quantity": 4, "size_level": "small"}]
+    assert availability.check(session, items) == [
+        {"ingredient_id": 101, "needed": 4.0, "on_hand": 3.0}
+    ]
+
+
+def test_reloads_query_outside_the_lock_and_keep_an_unchanged_version(availability):
+    session = Session()
+    execute = session.execute
+
+    def unlocked_execute(statement, params=None):
+        assert not availability._lock.locked()
+        return execute(statement, params)
+
+    session.execute = unlocked_execute
+    version = availability.version(session)
+    availability.ttl_seconds = 0
+    assert availability.version(session) == version
+    assert session.queries == 3
+
+
+def test_a_reload_folds_in_only_what_changed(availability, monkeypatch):
+    session = Session()
+    version = availability.version(session)
+    milk_tea = availability._stores[1].makeable[1]
+    # Another worker sold lemons, and the boba row was deleted
+    inventory = [row for row in INVENTORY if row[0] != 103]
+    inventory[2] = (102, "Lemon", 1.0)
+    monkeypatch.setitem(globals(), "INVENTORY", inventory)
+    availability.ttl_seconds = 0
+    (lemonade,) = availability.annotate_products(session, [product(2)])
+    assert lemonade["sold_out"]
+    assert availability.version(session) != version
+    assert 103 not in availability._stores[1].stock
+    assert availability._stores[1].makeable[1] == milk_tea
@@ -0,0 +1,158 @@
+import pytest
+
+from barista import DEFAULT_PREP_SECONDS, BaristaScheduler, PrepTimeModel
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def drink(order_item_id, category="tea", **extra):
+    return {"order_item_id": order_item_id, "category": category, **extra}
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+def scheduler(clock, stations=1, ttl=3600.0):
+    return BaristaScheduler(
+        stations=stations, model=PrepTimeModel(), clock=clock, item_ttl=ttl
+    )
+
+
+def test_model_falls_back_to_the_overall_mean_by_size():
+    model = PrepTimeModel()
+    assert model.estimate("tea", "normal") == DEFAULT_PREP_SECONDS
+    assert model.estimate("tea", "large") == pytest.approx(DEFAULT_PREP_SECONDS * 1.2)
+    assert model.estimate("tea", "normal", mods=2) == DEFAULT_PREP_SECONDS + 20
+    # The second cup costs 0.6 of the first
+    assert model.estimate("tea", "normal", quantity=2) == DEFAULT_PREP_SECONDS * 1.6
+
+
+def test_model_learns_per_category_and_size():
+    model = PrepTimeModel(alpha=0.5)
+    model.observe("tea", "normal", 0, 1, 60.0)
+    assert model.base_seconds("tea", "normal") == 60.0
+    model.observe("tea", "normal", 0, 1, 40.0)
+    assert model.base_seconds("tea", "normal") == 50.0
+    # Other sizes scale the category mean
+    assert model.base_seconds("tea", "large") == pytest.approx(50.0 * 1.2)
+    assert model.snapshot()["samples"] == 2
+
+
+def test_drinks_queue_back_to_back_on_one_station(clock):
+    s = scheduler(clock)
+    assert s.submit(1, [drink(10)]) == 1090.0
+    assert s.submit(2, [drink(20), drink(21)]) == 1270.0
+    assert s.order_eta(1) == 1090.0
+    assert s.order_eta(3) is None
+
+
+def test_an_order_spreads_over_free_stations(clock):
+    s = scheduler(clock, stations=2)
+    assert s.submit(1, [drink(10), drink(11)]) == 1090.0
+    view = s.queue_view()
+    assert [len(station["items"]) for station in view["stations"]] == [1, 1]
+
+
+def test_completing_the_head_retimes_the_queue_from_now(clock):
+    s = scheduler(clock)
+    s.submit(1, [drink(10)])
+    s.submit(2, [drink(20)])
+    clock.now += 60
+    item = s.complete(10)
+    assert item["prep_seconds"] == 60.0
+    assert s.order_eta(1) is None
+    assert s.order_eta(2) == 1060.0 + 90.0
+
+
+def test_completing_out_of_order_pulls_later_drinks_forward(clock):
+    s = scheduler(clock)
+    s.submit(1, [drink(10)])
+    s.submit(2, [drink(20)])
+    s.submit(3, [drink(30)])
+    assert s.order_eta(3) == 1270.0
+    item = s.complete(20)
+    # Not the head drink, so nothing is learned from it
+    assert "prep_seconds" not in item
+    assert s.order_eta(3) == 1180.0
+    clock.now += 90
+    s.complete(10)
+    assert s.order_eta(3) == 1180.0
+    assert [i["order_item_id"] for i in s.queue_view()["stations"][0]["items"]] == [30]
+
+
+def test_an_overdue_head_delays_the_queue(clock):
+    s = scheduler(clock)
+    s.submit(1, [drink(10)])
+    s.submit(2, [drink(20)])
+    clock.now += 120
+    assert s.order_eta(2) == 1120.0 + 90.0
+
+
+def test_unknown_or_repeated_completions_return_none(clock):
+    s = scheduler(clock)
+    s.submit(1, [drink(10)])
+    assert s.complete(10) is not None
+    assert s.complete(10) is None
+    assert s.complete(99) is None
+    assert s.queue_view()["in_flight_items"] == 0
+
+
+def test_completed_drinks_behind_the_head_are_compacted(clock):
+    s = scheduler(clock)
+    s.submit(0, [drink(0)])
+    for i in range(1, 300):
+        s.submit(i, [drink(i)])
+    for i in range(1, 299):
+        s.complete(i)
+    station = s._floors[1].stations[0]
+    assert len(station.queue) < 100
+    assert s.order_eta(299) == 1000.0 + 2 * 90.0
+
+
+def test_drinks_never_completed_expire(clock):
+    s = scheduler(clock, ttl=600.0)
+    s.submit(1, [drink(10)])
+    clock.now += 300
+    s.submit(2, [drink(20)])
+    clock.now += 301
+    view = s.queue_view()
+    assert view["in_flight_items"] == 1
+    assert view["open_orders"] == 1
+    assert s.order_eta(1) is None
+    assert s.complete(10) is None
+    clock.now += 300
+    assert s.queue_view()["in_flight_items"] == 0
+    assert not s._floors[1].stations[0].queue
+
+
+def test_learning_skips_implausible_prep_times(clock):
+    s = scheduler(clock)
+    s.submit(1, [drink(10)])
+    clock.now += 1
+    s.complete(10)
+    assert s.model.samples == 0
+    s.submit(2, [drink(20)])
+    clock.now += 80
+    s.complete(20)
+    assert s.model.samples == 1
+
+
+def test_stores_have_their_own_stations_and_ids(clock):
+    # Order and item ids are per shard, so two stores can both have order 1
+    s = scheduler(clock)
+    assert s.submit(1, [drink(10)]) == 1090.0
+    assert s.submit(1, [drink(10)], store_id=2) == 1090.0
+    assert s.submit(2, [drink(20)], store_id=2) == 1180.0
+    assert s.complete(10, store_id=2)["order_id"] == 1
+    assert s.order_eta(1) == 1090.0
+    assert s.order_eta(1, store_id=2) is None
+    assert s.queue_view()["in_flight_items"] == 1
+    assert s.queue_view(2)["open_orders"] == 1
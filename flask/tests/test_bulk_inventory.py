@@ -0,0 +1,53 @@
+from decimal import Decimal
+
+import pytest
+
+from bulk_inventory import BulkInventoryError, parse_rows, rows_from_csv
+
+
+def test_parses_deltas_and_counts():
+    rows = parse_rows(
+        [
+            {"ingredient_id": "3", "delta": "-1.5", "version": "7"},
+            {"ingredient_id": 4, "on_hand_quantity": 12},
+        ]
+    )
+    assert rows == [(3, Decimal("-1.5"), None, 7), (4, None, Decimal("12"), None)]
+
+
+@pytest.mark.parametrize("value", ["nan", "NaN", "Infinity", "-inf", "sNaN", "abc"])
+@pytest.mark.parametrize("field", ["delta", "on_hand_quantity"])
+def test_rejects_values_that_are_not_finite_numbers(field, value):
+    with pytest.raises(BulkInventoryError, match=field):
+        parse_rows([{"ingredient_id": 1, field: value}])
+
+
+@pytest.mark.parametrize(
+    "rows",
+    [
+        [],
+        ["x"],
+        [None],
+        {"ingredient_id": 1, "delta": 1},
+        [{"delta": 1}],
+        [{"ingredient_id": "one", "delta": 1}],
+        [{"ingredient_id": 1}],
+        [{"ingredient_id": 1, "delta": 1, "on_hand_quantity": 2}],
+        [{"ingredient_id": 1, "on_hand_quantity": -1}],
+        [{"ingredient_id": 1, "delta": 1}, {"ingredient_id": 1, "delta": 2}],
+        [{"ingredient_id": 1, "delta": 1, "version": "v2"}],
+    ],
+)
+def test_rejects_malformed_batches(rows):
+    with pytest.raises(BulkInventoryError):
+        parse_rows(rows)
+
+
+def test_reads_csv_with_bom_and_blank_columns():
+    raw = rows_from_csv(b"\xef\xbb\xbfingredient_id,delta,on_hand_quantity\n1,2,\n2,,5\n")
+    assert parse_rows(raw) == [(1, Decimal("2"), None, None), (2, None, Decimal("5"), None)]
+
+
+def test_csv_needs_ingredient_id_header():
+    with pytest.raises(BulkInventoryError):
+        rows_from_csv("id,delta\n1,2\n")
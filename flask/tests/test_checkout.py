@@ -0,0 +1,154 @@
+from contextlib import contextmanager
+from datetime import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.exc import DBAPIError
+
+from checkout import (
+    INSERT_ITEM_SQL,
+    INSERT_MODIFICATION_SQL,
+    INSERT_ORDER_SQL,
+    PRODUCTS_SQL,
+    UPDATE_STOCK_SQL,
+    pipelined,
+    write_order_pipelined,
+)
+
+
+class DriverError(Exception):
+    pass
+
+
+class Cursor:
+    def __init__(self, dbapi):
+        self.dbapi = dbapi
+        self.rows = []
+        self.closed = False
+
+    def execute(self, sql, params):
+        if self.dbapi.fail_on == sql:
+            raise DriverError("boom")
+        self.dbapi.executed.append((sql, params))
+        self.rows = list(self.dbapi.replies.get(sql, []))
+
+    def fetchone(self):
+        return self.rows.pop(0)
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        self.closed = True
+
+
+class Dbapi:
+    def __init__(self, replies, fail_on=None):
+        self.replies = replies
+        self.fail_on = fail_on
+        self.executed = []
+        self.cursors = []
+        self.synced = False
+
+    @contextmanager
+    def pipeline(self):
+        yield
+        self.synced = True
+
+    def cursor(self):
+        self.cursors.append(Cursor(self))
+        return self.cursors[-1]
+
+
+def session_for(dbapi):
+    conn = SimpleNamespace(
+        connection=SimpleNamespace(driver_connection=dbapi),
+        dialect=SimpleNamespace(loaded_dbapi=SimpleNamespace(Error=DriverError)),
+    )
+    return SimpleNamespace(connection=lambda: conn)
+
+
+ORDER = {
+    "order_date": datetime(2026, 3, 2, 9),
+    "total_amount": Decimal("11.50"),
+    "employee_id": 3,
+    "user_id": None,
+}
+ITEMS = [
+    {
+        "product_id": 1,
+        "quantity": 2,
+        "unit_price_at_sale": 4.5,
+        "size_level": "large",
+        "modifications": [
+            {"ingredient_id": 9, "modification_type": "extra", "quantity_change": 0.5},
+            # Posted straight from the menu's possible modifications
+            {"ingredient_id": 8, "possible_modification": "remove", "quantity_change": 1},
+        ],
+    },
+    {"product_id": 2, "quantity": 1, "unit_price_at_sale": "2.50"},
+]
+
+
+def replies():
+    return {
+        INSERT_ORDER_SQL: [(41,)],
+        INSERT_ITEM_SQL: [(7,)],
+        UPDATE_STOCK_SQL: [(9, "Boba", Decimal("3"))],
+        PRODUCTS_SQL: [(1, "Milk Tea", "Tea"), (2, "Lemonade", "Fruit")],
+    }
+
+
+def test_pipelined_needs_a_psycopg3_connection():
+    assert pipelined(session_for(Dbapi({})))
+    plain = SimpleNamespace(
+        connection=lambda: SimpleNamespace(
+            connection=SimpleNamespace(driver_connection=object())
+        )
+    )
+    assert not pipelined(plain)
+
+
+def test_order_is_written_in_one_pipeline():
+    dbapi = Dbapi(replies())
+    order_id, item_ids, products, stock = write_order_pipelined(
+        session_for(dbapi), ORDER, ITEMS, store_id=2
+    )
+    assert dbapi.synced
+    assert order_id == 41
+    assert item_ids == [7, 7]
+    assert products == {1: ("Milk Tea", "Tea"), 2: ("Lemonade", "Fruit")}
+    assert stock == {9: ("Boba", Decimal("3"))}
+    assert [sql for sql, _ in dbapi.executed] == [
+        INSERT_ORDER_SQL,
+        INSERT_ITEM_SQL,
+        INSERT_MODIFICATION_SQL,
+        INSERT_MODIFICATION_SQL,
+        INSERT_ITEM_SQL,
+        UPDATE_STOCK_SQL,
+        PRODUCTS_SQL,
+    ]
+    assert all(cursor.closed for cursor in dbapi.cursors)
+
+
+def test_stock_deltas_are_signed_and_scaled_by_quantity():
+    dbapi = Dbapi(replies())
+    write_order_pipelined(session_for(dbapi), ORDER, ITEMS, store_id=2)
+    params = dict(dbapi.executed)[UPDATE_STOCK_SQL]
+    assert params["store_id"] == 2
+    assert params["products"] == [1, 2]
+    assert params["quantities"] == [2, 1]
+    assert params["cups"] == ["Large Cup", "Medium Cup"]
+    assert params["mod_ids"] == [9, 8]
+    assert params["mod_qtys"] == [Decimal("1.0"), Decimal("-2")]
+    item_params = [p for sql, p in dbapi.executed if sql == INSERT_ITEM_SQL]
+    assert item_params[1] == (2, 1, Decimal("2.50"), "100%", "normal", "regular")
+
+
+def test_driver_errors_surface_as_sqlalchemy_errors():
+    dbapi = Dbapi(replies(), fail_on=UPDATE_STOCK_SQL)
+    with pytest.raises(DBAPIError) as raised:
+        write_order_pipelined(session_for(dbapi), ORDER, ITEMS, store_id=2)
+    assert isinstance(raised.value.orig, DriverError)
+    assert all(cursor.closed for cursor in dbapi.cursors)
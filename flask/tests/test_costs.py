@@ -0,0 +1,153 @@
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from costs import SIZES, CostModel, compute_partials, merge_margins
+
+DAY = date(2026, 3, 2)
+
+# Milk tea (1): 2 tea + 1 milk; lemonade (2): 3 lemon. Cups are 10, 11 and 12
+RECIPES = [(1, 100, 2), (1, 101, 1), (2, 102, 3)]
+INVENTORY = [
+    (100, "Black Tea", 0.5),
+    (101, "Milk", 0.25),
+    (102, "Lemon", 0.1),
+    (103, "Boba", 0.4),
+    (10, "Small Cup", 0.05),
+    (11, "Medium Cup", 0.1),
+    (12, "Large Cup", 0.15),
+]
+
+
+class Result(list):
+    def all(self):
+        return list(self)
+
+
+class Conn:
+    def __init__(self, recipes=RECIPES, inventory=INVENTORY, sold=(), mods=()):
+        self.recipes = list(recipes)
+        self.inventory = list(inventory)
+        self.sold = list(sold)
+        self.mods = list(mods)
+        self.queries = []
+
+    def execute(self, statement, params=None):
+        sql = str(statement)
+        self.queries.append(sql)
+        if "FROM products" in sql:
+            return Result([(1,), (2,)])
+        if "FROM product_recipe" in sql:
+            if params and "ids" in params:
+                return Result(r for r in self.recipes if r[0] in params["ids"])
+            return Result(self.recipes)
+        if "FROM inventory" in sql:
+            return Result(self.inventory)
+        if "modifications" in sql:
+            return Result(self.mods)
+        return Result(self.sold)
+
+
+def costs_of(model, conn):
+    product_ids, costs = model.size_costs(conn)
+    return dict(zip(product_ids, costs.tolist()))
+
+
+def test_size_costs_are_recipe_cost_plus_cup():
+    costs = costs_of(CostModel(), Conn())
+    assert dict(zip(SIZES, costs[1])) == pytest.approx(
+        {"small": 1.3, "normal": 1.35, "large": 1.4}
+    )
+    assert costs[2] == pytest.approx([0.35, 0.4, 0.45])
+
+
+def test_costs_are_loaded_once_per_ttl():
+    model, conn = CostModel(ttl_seconds=60), Conn()
+    model.size_costs(conn)
+    model.size_costs(conn)
+    assert len(conn.queries) == 3
+    model.ttl_seconds = -1
+    model.size_costs(conn)
+    assert len(conn.queries) == 6
+
+
+def test_price_change_matches_a_reload():
+    model, conn = CostModel(), Conn()
+    model.size_costs(conn)
+    model.price_changed(1, 100, Decimal("0.75"))
+    model.price_changed(1, 10, "0.2")
+    changed = costs_of(model, conn)
+    conn.inventory = [
+        (100, "Black Tea", 0.75) if row[0] == 100 else row for row in conn.inventory
+    ]
+    conn.inventory = [
+        (10, "Small Cup", 0.2) if row[0] == 10 else row for row in conn.inventory
+    ]
+    model.invalidate()
+    assert changed == pytest.approx(costs_of(model, conn))
+    assert model.ingredient_prices(conn)[100] == 0.75
+
+
+def test_price_change_of_an_unloaded_store_is_ignored():
+    model = CostModel()
+    model.price_changed(9, 100, 1.0)
+    assert costs_of(model, Conn())[1][1] == pytest.approx(1.35)
+
+
+def test_recipe_change_recomputes_only_that_row():
+    model, conn = CostModel(), Conn()
+    model.size_costs(conn)
+    conn.recipes = [(1, 100, 1), (1, 101, 1), (2, 102, 3)]
+    model.recipe_changed(conn, [1])
+    assert costs_of(model, conn)[1][1] == pytest.approx(0.85)
+
+
+def test_recipe_change_with_a_new_ingredient_reloads():
+    model, conn = CostModel(), Conn()
+    model.size_costs(conn)
+    conn.recipes = RECIPES + [(2, 103, 1)]
+    model.recipe_changed(conn, [2])
+    assert costs_of(model, conn)[2][1] == pytest.approx(0.8)
+
+
+def test_partials_default_sizes_and_sum_sizeless_lines():
+    conn = Conn(
+        sold=[
+            (DAY, 1, "large", Decimal(2), Decimal("9.00")),
+            (DAY, 1, None, Decimal(1), Decimal("4.00")),
+            (DAY, 1, "normal", Decimal(1), Decimal("4.00")),
+        ],
+        mods=[(DAY, 1, 103, Decimal(2)), (DAY, 2, 102, Decimal(0))],
+    )
+    assert compute_partials(conn, [DAY]) == {
+        DAY: {
+            "sold": {"1": {"large": ["2", "9.00"], "normal": ["2", "8.00"]}},
+            "mods": {"1": {"103": "2"}},
+        }
+    }
+
+
+def test_margins_apply_costs_and_add_ons():
+    product_ids = [1, 2]
+    costs = np.array([[1.3, 1.35, 1.4], [0.35, 0.4, 0.45]])
+    partials = [
+        {
+            "sold": {"1": {"large": ["2", "9.00"], "normal": ["2", "8.00"]}},
+            "mods": {"1": {"103": "2"}},
+        },
+        # Product 9 is no longer on the menu
+        {
+            "sold": {"1": {"small": ["1", "3.50"]}, "9": {"normal": ["1", "1"]}},
+            "mods": {},
+        },
+    ]
+    (row,) = merge_margins(product_ids, costs, {103: 0.4}, partials)
+    assert row["product_id"] == 1
+    assert row["qty"] == 5
+    assert row["revenue"] == 20.5
+    assert row["addon_cost"] == 0.8
+    assert row["cogs"] == pytest.approx(1.3 + 2 * 1.35 + 2 * 1.4 + 0.8)
+    assert row["gross_margin"] == pytest.approx(20.5 - row["cogs"], abs=0.01)
+    assert row["avg_price"] == 4.1
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from forecast import HOURS_PER_WEEK, ForecastModel, seasonal_profile, trend_factors
+
+# A Monday, so weekly slot 0 is the first row
+MONDAY = datetime(2026, 1, 5)
+
+
+def test_profile_repeats_a_weekly_pattern_in_slot_order():
+    week = np.arange(HOURS_PER_WEEK, dtype=float)[:, None]
+    usage = np.tile(week, (3, 1))
+    # Start the history two hours into the week
+    profile = seasonal_profile(usage[2:], start_slot=2, weeks=2)
+    assert profile.shape == (HOURS_PER_WEEK, 1)
+    np.testing.assert_allclose(profile[:, 0], week[:, 0])
+
+
+def test_profile_weights_recent_weeks_more():
+    usage = np.concatenate(
+        [np.full((HOURS_PER_WEEK, 1), 1.0), np.full((HOURS_PER_WEEK, 1), 3.0)]
+    )
+    profile = seasonal_profile(usage, start_slot=0, weeks=2, decay=0.5)
+    # Weights 1/3 and 2/3
+    np.testing.assert_allclose(profile, 1 / 3 + 2.0)
+
+
+def test_profile_falls_back_to_hour_of_day_under_a_week():
+    usage = np.tile(np.arange(24, dtype=float)[:, None], (3, 1))
+    profile = seasonal_profile(usage, start_slot=0, weeks=8)
+    np.testing.assert_allclose(profile[:, 0], np.tile(np.arange(24.0), 7))
+
+
+def test_flat_history_has_no_trend():
+    usage = np.ones((28 * 24, 2))
+    np.testing.assert_allclose(trend_factors(usage, 48), 1.0)
+
+
+def test_growth_raises_factors_within_the_clip():
+    days = np.repeat(np.arange(1.0, 29.0), 24)[:, None]
+    factors = trend_factors(days, 24 * 14)
+    assert factors[0, 0] > 1.0
+    assert np.all(np.diff(factors[:, 0]) >= 0)
+    assert factors.max() <= 2.0
+
+
+def test_short_history_has_no_trend():
+    np.testing.assert_allclose(trend_factors(np.ones((6 * 24, 1)), 24), 1.0)
+
+
+def model_with(hourly, days):
+    model = ForecastModel(history_days=days)
+    model.start = MONDAY
+    until = MONDAY + timedelta(days=days)
+    rows = [
+        (MONDAY + timedelta(hours=h), iid, qty)
+        for h in range(days * 24)
+        for iid, qty in hourly.items()
+    ]
+    model._ingest(rows, MONDAY, until, sorted(hourly))
+    return model
+
+
+def test_ingest_places_rows_by_hour_and_ingredient():
+    model = model_with({10: 1.0, 20: 0.5}, days=2)
+    assert model.ingredient_ids == [10, 20]
+    assert model.usage.shape == (48, 2)
+    np.testing.assert_allclose(model.usage.sum(axis=0), [48.0, 24.0])
+
+
+def test_ingest_drops_history_beyond_the_limit_in_whole_days():
+    model = model_with({10: 1.0}, days=3)
+    model.history_days = 2
+    until = model.until + timedelta(hours=5)
+    model._ingest([], model.until, until, [10])
+    assert model.usage.shape[0] == 2 * 24 + 5
+    assert model.start == MONDAY + timedelta(days=1)
+
+
+def test_forecast_finds_the_stockout_hour():
+    model = model_with({10: 1.0, 20: 1.0}, days=14)
+    result = model.forecast({10: 48, 20: 0}, days=7)
+    assert result[10]["days_until_stockout"] == 2.0
+    assert result[10]["stockout_at"] == (model.until + timedelta(hours=48)).isoformat()
+    assert result[10]["projected_daily_usage"] == [24.0] * 7
+    assert result[10]["avg_daily_usage_7d"] == 24.0
+    assert result[20]["days_until_stockout"] == 0.0
+
+
+def test_forecast_without_usage_never_runs_out():
+    model = model_with({10: 0.0}, days=14)
+    assert model.forecast({10: 5}, days=7)[10]["days_until_stockout"] is None
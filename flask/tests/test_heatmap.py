@@ -0,0 +1,91 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from heatmap import compute_partials, heatmap, merge_partials
+
+# A Monday, so weekday index 0 is the first day
+MONDAY = date(2026, 1, 5)
+
+
+def days(weeks):
+    return [MONDAY + timedelta(days=i) for i in range(7 * weeks)]
+
+
+def partial(hours=None, products=None):
+    return {"hours": hours or {}, "products": products or {}}
+
+
+class Conn:
+    def __init__(self, rows):
+        self.rows = rows
+        self.params = None
+
+    def execute(self, statement, params):
+        self.params = params
+        return iter(self.rows)
+
+
+def test_partials_split_totals_from_products_and_skip_other_days():
+    conn = Conn(
+        [
+            (MONDAY, 9, None, 3, 5, "20.50"),
+            (MONDAY, 9, 4, 2, 3, "12.00"),
+            (MONDAY - timedelta(days=1), 9, None, 1, 1, "4.00"),
+        ]
+    )
+    result = compute_partials(conn, [MONDAY], store_id=2)
+    assert conn.params["store_id"] == 2
+    assert result == {
+        MONDAY: {
+            "hours": {"9": [3, 5, "20.50"]},
+            "products": {"4": {"9": [2, 3, "12.00"]}},
+        }
+    }
+
+
+def test_merge_lays_days_out_by_week_weekday_and_hour():
+    span = days(2)
+    partials = [partial() for _ in span]
+    partials[0] = partial({"8": [2, 3, "9.50"]})
+    # Wednesday of the second week
+    partials[9] = partial({"17": [1, 1, "4.00"]})
+    grids = merge_partials(span, partials)
+    assert grids["orders"].shape == (2, 7, 24)
+    assert grids["orders"][0, 0, 8] == 2
+    assert grids["drinks"][0, 0, 8] == 3
+    assert grids["revenue"][0, 0, 8] == 9.5
+    assert grids["orders"][1, 2, 17] == 1
+    assert grids["orders"].sum() == 3
+
+
+def test_merge_ignores_a_partial_week():
+    span = days(1) + [MONDAY + timedelta(days=7)]
+    partials = [partial({"8": [1, 1, "1"]}) for _ in span]
+    assert merge_partials(span, partials)["orders"].sum() == 7
+
+
+def test_merge_filters_products_and_counts_each_listed_product():
+    span = days(1)
+    partials = [partial() for _ in span]
+    partials[0] = partial(
+        {"8": [1, 3, "12"]},
+        {"4": {"8": [1, 2, "8"]}, "5": {"8": [1, 1, "4"]}},
+    )
+    grids = merge_partials(span, partials, product_ids=[4, 5])
+    assert grids["orders"][0, 0, 8] == 2
+    assert grids["drinks"][0, 0, 8] == 3
+    assert merge_partials(span, partials, product_ids=[6])["orders"].sum() == 0
+
+
+def test_heatmap_bands_and_items_in_flight():
+    grids = {m: np.zeros((4, 7, 24)) for m in ("orders", "drinks", "revenue")}
+    grids["drinks"][:, 0, 8] = [10, 20, 30, 40]
+    result = heatmap(grids, prep_seconds=90)
+    assert result["drinks"]["mean"][0][8] == 25.0
+    assert result["drinks"]["p50"][0][8] == 25.0
+    assert result["drinks"]["p10"][0][8] == pytest.approx(13.0)
+    # Little's law: 25 drinks an hour at 90 s each
+    assert result["items_in_flight"]["mean"][0][8] == pytest.approx(0.62, abs=0.01)
+    assert result["orders"]["p90"][6][23] == 0.0
@@ -0,0 +1,110 @@
+import gzip
+import json
+
+import pytest
+from flask import Flask, jsonify
+
+from http_cache import ResponseCache
+
+ROWS = [{"product_id": i, "product_name": f"Drink {i}"} for i in range(100)]
+
+
+@pytest.fixture
+def setup():
+    app = Flask(__name__)
+    cache = ResponseCache(min_size=512, max_entries=4)
+    state = {"version": 1, "calls": 0}
+
+    @app.route("/menu")
+    @cache.conditional(lambda: state["version"])
+    def menu():
+        state["calls"] += 1
+        return jsonify(ROWS)
+
+    @app.route("/small")
+    @cache.conditional()
+    def small():
+        state["calls"] += 1
+        return jsonify({"ok": True})
+
+    @app.route("/missing")
+    @cache.conditional(lambda: 1)
+    def missing():
+        return jsonify({"error": "nope"}), 404
+
+    return app.test_client(), cache, state
+
+
+def test_versioned_bodies_are_served_from_the_cache(setup):
+    client, cache, state = setup
+    first = client.get("/menu")
+    second = client.get("/menu")
+    assert first.get_json() == second.get_json() == ROWS
+    assert first.headers["ETag"] == second.headers["ETag"]
+    assert "no-cache" in first.headers["Cache-Control"]
+    assert state["calls"] == 1
+    assert cache.status()["hits"] == 1
+
+
+def test_a_matching_etag_is_answered_before_the_view_runs(setup):
+    client, cache, state = setup
+    etag = client.get("/menu").headers["ETag"]
+    response = client.get("/menu", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+    assert state["calls"] == 1
+    state["version"] = 2
+    assert client.get("/menu", headers={"If-None-Match": etag}).status_code == 200
+    assert state["calls"] == 2
+
+
+def test_etags_depend_on_the_query(setup):
+    client, _, _ = setup
+    assert client.get("/menu").headers["ETag"] != client.get("/menu?x=1").headers["ETag"]
+
+
+def test_large_bodies_are_compressed_once_per_encoding(setup):
+    client, cache, _ = setup
+    plain = client.get("/menu")
+    zipped = client.get("/menu", headers={"Accept-Encoding": "gzip"})
+    assert zipped.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in zipped.headers["Vary"]
+    assert json.loads(gzip.decompress(zipped.data)) == ROWS
+    assert zipped.headers["ETag"] == plain.headers["ETag"][:-1] + '-gz"'
+    # Either representation's tag revalidates
+    headers = {"If-None-Match": plain.headers["ETag"], "Accept-Encoding": "gzip"}
+    assert client.get("/menu", headers=headers).status_code == 304
+    assert cache.status()["entries"] == 2
+
+
+def test_without_a_version_the_etag_is_a_payload_hash(setup):
+    client, cache, state = setup
+    first = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in first.headers
+    again = client.get("/small", headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
+    # The view still ran; only the transfer was saved
+    assert state["calls"] == 2
+    assert cache.status()["entries"] == 0
+
+
+def test_errors_pass_through_uncached(setup):
+    client, cache, _ = setup
+    response = client.get("/missing")
+    assert response.status_code == 404
+    assert "ETag" not in response.headers
+    assert cache.status()["entries"] == 0
+
+
+def test_lru_keeps_at_most_max_entries(setup):
+    client, cache, state = setup
+    for version in range(10):
+        state["version"] = version
+        client.get("/menu")
+    assert cache.status()["entries"] == 4
+
+
+def test_disabled_cache_is_a_no_op(setup):
+    client, cache, _ = setup
+    cache.enabled = False
+    assert "ETag" not in client.get("/menu").headers
@@ -0,0 +1,146 @@
+from decimal import Decimal
+
+import pytest
+
+from menu_import import MenuImportError, diff_menu, load_import, parse_products
+
+
+def product(**fields):
+    return {
+        "product_name": "Taro Milk Tea",
+        "unit_price": "5.50",
+        "recipe": [{"ingredient_id": 1, "quantity_per_unit": "0.2"}],
+        **fields,
+    }
+
+
+def test_parses_json_products():
+    (parsed,) = load_import({"products": [product(vegan="yes")]})
+    assert parsed == {
+        "product_id": None,
+        "product_name": "Taro Milk Tea",
+        "unit_price": Decimal("5.50"),
+        "vegan": True,
+        "category": "Uncategorized",
+        "recipe": {1: Decimal("0.2")},
+    }
+
+
+def test_groups_csv_recipe_lines_by_product():
+    parsed = load_import(
+        csv_data=(
+            "product_name,unit_price,category,vegan,ingredient_id,quantity_per_unit\n"
+            "Taro Milk Tea,5.50,Milk Tea,no,1,0.2\n"
+            "Taro Milk Tea,5.50,Milk Tea,no,2,1\n"
+            "Lemonade,3,Fruit,yes,,\n"
+        )
+    )
+    assert [p["product_name"] for p in parsed] == ["Taro Milk Tea", "Lemonade"]
+    assert parsed[0]["recipe"] == {1: Decimal("0.2"), 2: Decimal("1")}
+    assert parsed[1]["recipe"] == {}
+
+
+@pytest.mark.parametrize("value", ["nan", "Infinity", "-Infinity", "0", "-1", "x", None])
+def test_rejects_prices_that_are_not_positive_finite_numbers(value):
+    with pytest.raises(MenuImportError, match="unit_price"):
+        parse_products([product(unit_price=value)])
+
+
+@pytest.mark.parametrize("value", ["nan", "Infinity", "0"])
+def test_rejects_bad_recipe_quantities(value):
+    with pytest.raises(MenuImportError, match="quantity_per_unit"):
+        parse_products(
+            [product(recipe=[{"ingredient_id": 1, "quantity_per_unit": value}])]
+        )
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        {},
+        {"products": []},
+        {"products": "x"},
+        {"products": ["x"]},
+        "[1]",
+        {"products": [product(recipe=["x"])]},
+        {"products": [product(), product()]},
+        {"products": [product(product_id="one")]},
+        {"products": [product(product_id=3), product(product_name="X", product_id=3)]},
+        {"products": [product(product_name=" ")]},
+    ],
+)
+def test_rejects_malformed_imports(body):
+    with pytest.raises(MenuImportError):
+        load_import(body)
+
+
+def test_diff_matches_by_id_then_name_and_numbers_new_products():
+    current = {
+        4: {
+            "product_name": "Taro Milk Tea",
+            "unit_price": Decimal("5.50"),
+            "vegan": False,
+            "category": "Uncategorized",
+            "is_active": True,
+            "recipe": {1: Decimal("0.2")},
+        },
+        7: {
+            "product_name": "Lemonade",
+            "unit_price": Decimal("3"),
+            "vegan": True,
+            "category": "Fruit",
+            "is_active": True,
+            "recipe": {},
+        },
+    }
+    products = parse_products(
+        [
+            product(),
+            product(
+                product_name="Lemonade",
+                product_id=7,
+                unit_price="3.25",
+                recipe=[],
+                vegan=True,
+                category="Fruit",
+            ),
+            product(product_name="Mango Green Tea"),
+        ]
+    )
+    added, updated, recipe_changed, unchanged = diff_menu(current, products)
+    assert [p["product_id"] for p in products] == [4, 7, 8]
+    assert [p["product_id"] for p in added] == [8]
+    assert [p["product_id"] for p in updated] == [7]
+    assert [p["product_id"] for p in recipe_changed] == [8]
+    assert unchanged == [4]
+
+
+def test_new_ids_go_above_ids_claimed_later_in_the_import():
+    products = parse_products(
+        [product(product_name="New"), product(product_name="Other", product_id=2)]
+    )
+    added, _, _, _ = diff_menu({1: {"product_name": "Taro Milk Tea"}}, products)
+    assert [p["product_id"] for p in added] == [3, 2]
+
+
+def test_a_product_renamed_by_id_and_matched_by_name_is_refused():
+    current = {
+        1: {
+            "product_name": "Taro",
+            "unit_price": Decimal("5.50"),
+            "vegan": False,
+            "category": "Uncategorized",
+            "is_active": True,
+            "recipe": {1: Decimal("0.2")},
+        }
+    }
+    products = parse_products(
+        [
+            product(product_name="New"),
+            product(product_name="Other", product_id=2),
+            product(product_name="X", product_id=1),
+            product(product_name="Taro"),
+        ]
+    )
+    with pytest.raises(MenuImportError, match="'X' and 'Taro' are both product 1"):
+        diff_menu(current, products)
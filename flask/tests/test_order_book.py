@@ -0,0 +1,96 @@
+from datetime import date, datetime, time
+
+import pytest
+
+from order_book import OrderBook, _cents
+
+
+class Book(OrderBook):
+    """An order book over a list of orders instead of a database."""
+
+    def __init__(self, orders, **kwargs):
+        super().__init__(**kwargs)
+        self.orders = orders
+        self.fetches = []
+
+    def _fetch(self, store_id, day, above=None):
+        self.fetches.append((store_id, above))
+        return [
+            row
+            for row in self.orders.get(store_id, [])
+            if above is None or row[0] > above
+        ]
+
+
+def at(hour, minute=0):
+    return datetime.combine(date.today(), time(hour, minute))
+
+
+@pytest.fixture
+def book():
+    book = Book(
+        {
+            1: [
+                (10, at(9, 5), 450, [(1, 1)]),
+                (11, at(9, 40), 900, [(1, 2)]),
+                (12, at(14), 250, [(2, 1)]),
+            ],
+            2: [(10, at(8), 300, [(2, 3)])],
+        },
+        sync_seconds=0,
+        rescan_ids=5,
+    )
+    book._names.update({1: "Milk Tea", 2: "Lemonade"})
+    return book
+
+
+def test_cents_is_exact_for_floats_and_decimals():
+    assert _cents("4.50") == 450
+    assert _cents(0.29) == 29
+    assert _cents(3) == 300
+
+
+def test_reports_aggregate_by_hour_and_product(book):
+    assert book.x_report(1) == [
+        {"hour": at(9).isoformat(), "sales": 13.5},
+        {"hour": at(14).isoformat(), "sales": 2.5},
+    ]
+    assert book.z_report(1) == (
+        16.0,
+        [
+            {"product_id": 1, "product_name": "Milk Tea", "qty_sold": 3},
+            {"product_id": 2, "product_name": "Lemonade", "qty_sold": 1},
+        ],
+    )
+    # Order ids overlap across shards; each store has its own book
+    assert book.z_report(2)[0] == 3.0
+
+
+def test_catch_up_skips_orders_already_held(book):
+    book.x_report(1)
+    book.orders[1].append((13, at(15), 100, [(2, 1)]))
+    revenue, _ = book.z_report(1)
+    assert revenue == 17.0
+    # Rescans the last ``rescan_ids`` ids below the high-water mark
+    assert book.fetches[-1] == (1, 7)
+    assert book.status()["stores"]["1"]["orders"] == 4
+
+
+def test_record_adds_an_order_once(book):
+    book.sync_seconds = 60
+    book.x_report(1)
+    book.record(1, 20, at(16), "3.25", [(3, 2, "Taro")])
+    book.record(1, 20, at(16), "3.25", [(3, 2, "Taro")])
+    revenue, items = book.z_report(1)
+    assert revenue == 19.25
+    assert items[0] == {"product_id": 1, "product_name": "Milk Tea", "qty_sold": 3}
+    assert {"product_id": 3, "product_name": "Taro", "qty_sold": 2} in items
+    assert book.status()["stores"]["1"]["high_water"] == 20
+
+
+def test_record_ignores_books_not_yet_built_or_of_another_day(book):
+    book.record(1, 20, at(16), "3.25", [])
+    assert book.status()["stores"] == {}
+    book.x_report(1)
+    book.record(1, 21, datetime(2000, 1, 1, 9), "3.25", [])
+    assert book.status()["stores"]["1"]["orders"] == 3
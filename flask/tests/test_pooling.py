@@ -0,0 +1,52 @@
+import pytest
+from flask import Flask, g
+from sqlalchemy.pool import NullPool
+
+from pooling import _timeout_ms, engine_options, statement_timeout
+
+
+def config(**overrides):
+    return {
+        "PGBOUNCER_MODE": False,
+        "DB_POOL_SIZE": 0,
+        "DB_MAX_OVERFLOW": 10,
+        "DB_POOL_TIMEOUT": 10.0,
+        "DB_POOL_RECYCLE": 1800,
+        "DB_POOL_PRE_PING": True,
+        "DB_PREPARE_THRESHOLD": 1,
+        "STATEMENT_TIMEOUTS_MS": {"checkout": 2000, "report": 30000, "default": 5000},
+        **overrides,
+    }
+
+
+def test_pooled_by_default():
+    options = engine_options(config())
+    assert options["pool_size"] == 5
+    assert options["max_overflow"] == 10
+    assert "connect_args" not in options
+
+
+def test_pgbouncer_without_a_pool_size_does_not_pool():
+    assert engine_options(config(PGBOUNCER_MODE=True)) == {"poolclass": NullPool}
+
+
+@pytest.mark.parametrize("pgbouncer, threshold", [(False, 1), (True, None)])
+def test_psycopg_prepares_statements_except_behind_pgbouncer(pgbouncer, threshold):
+    options = engine_options(
+        config(PGBOUNCER_MODE=pgbouncer, DB_POOL_SIZE=3, DB_DRIVER="psycopg")
+    )
+    assert options["connect_args"] == {"prepare_threshold": threshold}
+
+
+def test_timeout_follows_the_view_class():
+    app = Flask(__name__)
+    cfg = config()
+    assert _timeout_ms(cfg) == 5000
+    with app.test_request_context():
+        g.statement_timeout_class = "report"
+        assert _timeout_ms(cfg) == 30000
+
+
+def test_unknown_timeout_class_is_rejected():
+    with pytest.raises(ValueError):
+        statement_timeout("slow")
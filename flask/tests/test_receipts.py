@@ -0,0 +1,86 @@
+from itsdangerous import URLSafeTimedSerializer
+
+import receipts
+from google_oauth import new_user_params, session_fields, token_form
+from receipts import load_receipt, mail_payload, receipt_html, sign_receipt
+
+RECEIPT = {"order_id": 12, "to": "a@example.com", "html": "<p>hi</p>"}
+
+
+def test_signed_receipts_round_trip():
+    token = sign_receipt("key", RECEIPT)
+    assert load_receipt("key", token) == RECEIPT
+
+
+def test_forged_or_foreign_receipts_are_refused():
+    token = sign_receipt("key", RECEIPT)
+    assert load_receipt("other key", token) is None
+    assert load_receipt("key", token[:-2] + "xx") is None
+    # Signed with the right key but for another purpose
+    other = URLSafeTimedSerializer("key", salt="session").dumps(RECEIPT)
+    assert load_receipt("key", other) is None
+
+
+def test_expired_receipts_are_refused(monkeypatch):
+    token = sign_receipt("key", RECEIPT)
+    monkeypatch.setattr(receipts, "MAX_AGE_SECONDS", -1)
+    assert load_receipt("key", token) is None
+
+
+def test_receipt_lists_lines_options_and_total():
+    html = receipt_html(
+        "Ana",
+        12,
+        [
+            {
+                "product_name": "Milk Tea",
+                "quantity": 2,
+                "unit_price_at_sale": "4.50",
+                "size_level": "large",
+                "modifications": [
+                    {"modification_type": "ADD", "ingredient_name": "Boba"}
+                ],
+            }
+        ],
+        9,
+    )
+    assert "Hi Ana," in html
+    assert "Order #12" in html
+    assert "$9.00" in html
+    assert "Size: large" in html
+    assert "ADD: Boba" in html
+    assert "Sugar:" not in html
+
+
+def test_mail_payload():
+    payload = mail_payload("shop@example.com", "a@example.com", 12, "<p>hi</p>")
+    assert payload["subject"] == "Order Confirmation - #12"
+    assert payload["personalizations"] == [{"to": [{"email": "a@example.com"}]}]
+    assert payload["content"][0] == {"type": "text/html", "value": "<p>hi</p>"}
+
+
+def test_oauth_helpers():
+    config = {
+        "GOOGLE_CLIENT_ID": "id",
+        "GOOGLE_CLIENT_SECRET": "secret",
+        "GOOGLE_REDIRECT_URI": "https://shop/cb",
+    }
+    assert token_form(config, "abc") == {
+        "code": "abc",
+        "client_id": "id",
+        "client_secret": "secret",
+        "redirect_uri": "https://shop/cb",
+        "grant_type": "authorization_code",
+    }
+    assert new_user_params({"sub": "g1", "email": "a@example.com"}) == {
+        "sub": "g1",
+        "email": "a@example.com",
+        "name": None,
+        "role": "Customer",
+    }
+    assert session_fields((4, "g1", "a@example.com", "Ana", "Customer")) == {
+        "google_sub": "g1",
+        "user_id": 4,
+        "role": "Customer",
+        "name": "Ana",
+    }
@@ -0,0 +1,77 @@
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask, session
+
+from replicas import ReplicaRouter
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.secret_key = "test"
+    return app
+
+
+def router(engines):
+    return ReplicaRouter(SimpleNamespace(engines=engines))
+
+
+def test_without_a_replica_reads_stay_on_the_primary(app):
+    replicas = router({})
+    with app.test_request_context():
+        assert not replicas.use_replica()
+        assert replicas.status() == {"configured": False}
+
+
+@pytest.mark.parametrize(
+    "lag, expected", [(0.0, True), (5.0, True), (5.1, False), (None, False)]
+)
+def test_replica_is_used_only_within_the_lag_limit(app, monkeypatch, lag, expected):
+    replicas = router({"replica": object()})
+    monkeypatch.setattr(replicas, "replica_lag", lambda: lag)
+    with app.test_request_context():
+        assert replicas.use_replica() is expected
+
+
+def test_pinned_keys_read_from_the_primary(app, monkeypatch):
+    replicas = router({"replica": object()})
+    monkeypatch.setattr(replicas, "replica_lag", lambda: 0.0)
+    with app.test_request_context():
+        replicas.pin("user_1")
+        assert not replicas.use_replica("user_1")
+        assert replicas.use_replica("user_2")
+
+
+def test_pins_are_carried_in_the_session_to_other_workers(app):
+    first, other = router({"replica": object()}), router({"replica": object()})
+    with app.test_request_context():
+        first.pin("user_1")
+        carried = dict(session)
+    with app.test_request_context():
+        session.update(carried)
+        assert other.is_pinned("user_1")
+        assert not other.is_pinned("user_2")
+
+
+def test_pinning_can_be_turned_off(app):
+    replicas = router({})
+    replicas.read_your_writes_seconds = 0
+    with app.test_request_context():
+        replicas.pin("user_1")
+        assert not replicas.is_pinned("user_1")
+
+
+def test_without_a_replica_nothing_is_pinned(app):
+    replicas = router({})
+    with app.test_request_context():
+        replicas.pin("user_1")
+        assert not replicas.is_pinned("user_1")
+        assert "read_primary" not in session
+
+
+def test_without_a_secret_key_pins_stay_in_the_worker():
+    replicas = router({"replica": object()})
+    with Flask(__name__).test_request_context():
+        replicas.pin("user_1")
+        assert replicas.is_pinned("user_1")
@@ -0,0 +1,123 @@
+from datetime import date, datetime
+
+from range_reports import _by_day, merge_sales
+from report_cache import DayPartialCache, day_span, split_days
+
+NOW = datetime(2026, 3, 10, 14, 0)
+
+
+def test_days_before_today_are_closed():
+    closed, live = split_days("2026-03-08", "2026-03-10", now=NOW)
+    assert closed == [date(2026, 3, 8), date(2026, 3, 9)]
+    assert live == [date(2026, 3, 10)]
+
+
+def test_yesterday_stays_live_during_the_grace_period():
+    closed, live = split_days(
+        date(2026, 3, 9), date(2026, 3, 10), now=datetime(2026, 3, 10, 0, 5)
+    )
+    assert closed == []
+    assert live == [date(2026, 3, 9), date(2026, 3, 10)]
+
+
+def test_future_days_and_empty_ranges():
+    today = [date(2026, 3, 10)]
+    assert split_days("2026-03-10", "2026-03-20", now=NOW) == ([], today)
+    assert split_days("2026-03-09", "2026-03-08", now=NOW) == ([], [])
+
+
+def test_timestamps_are_cut_to_their_day():
+    assert split_days("2026-03-09T08:00:00", "2026-03-09", now=NOW)[0] == [
+        date(2026, 3, 9)
+    ]
+
+
+def test_day_span_covers_the_last_day():
+    assert day_span([date(2026, 3, 9), date(2026, 3, 7)]) == (
+        date(2026, 3, 7),
+        date(2026, 3, 10),
+    )
+
+
+def cache():
+    partials = DayPartialCache()
+    partials.persist = False
+    return partials
+
+
+def test_missing_days_are_computed_together_then_cached():
+    partials = cache()
+    calls = []
+
+    def compute(days):
+        calls.append(list(days))
+        return {day: {"day": day.isoformat()} for day in days}
+
+    days = [date(2026, 3, 1), date(2026, 3, 2)]
+    first = partials.closed_partials("sales", days, compute)
+    again = partials.closed_partials("sales", days + [date(2026, 3, 3)], compute)
+    assert calls == [days, [date(2026, 3, 3)]]
+    assert first == again[:2]
+
+
+def test_entries_are_per_report_and_store():
+    partials = cache()
+    partials.closed_partials("sales", [date(2026, 3, 1)], lambda d: {d[0]: 1}, 1)
+    day = [date(2026, 3, 1)]
+    computed = partials.closed_partials("sales", day, lambda d: {d[0]: 2}, 2)
+    usage = partials.closed_partials("usage", day, lambda d: {d[0]: 3}, 1)
+    assert (computed, usage) == ([2], [3])
+
+
+def test_invalidate_drops_the_day_and_bumps_the_generation():
+    partials = cache()
+    day = date(2026, 3, 1)
+    partials.closed_partials("sales", [day], lambda d: {day: "old"})
+    partials.invalidate(day)
+    assert partials.generation == 1
+    assert partials.closed_partials("sales", [day], lambda d: {day: "new"}) == ["new"]
+
+
+def test_expired_entries_are_recomputed():
+    partials = cache()
+    partials.lru_seconds = 0.0
+    day = date(2026, 3, 1)
+    partials.closed_partials("sales", [day], lambda d: {day: "old"})
+    assert partials.closed_partials("sales", [day], lambda d: {day: "new"}) == ["new"]
+
+
+def test_lru_is_bounded():
+    partials = cache()
+    partials.max_entries = 2
+    days = [date(2026, 3, d) for d in (1, 2, 3)]
+    partials.closed_partials("sales", days, lambda ds: {d: d.day for d in ds})
+    assert len(partials._entries) == 2
+
+
+class FakeConn:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute(self, *args):
+        return self
+
+    def all(self):
+        return self.rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+def test_partials_keep_exact_decimals_and_merge_exactly():
+    day = date(2026, 3, 1)
+    rows = FakeConn([(day, 1, 3, "0.10"), (day, 2, 1, "5.5")])
+    partial = _by_day(rows, "", [day], 1)
+    assert partial == {day: {"1": ["3", "0.10"], "2": ["1", "5.5"]}}
+    rows = merge_sales(
+        FakeConn([(1, "Milk Tea"), (2, "Lemonade")]),
+        [partial[day]] * 3 + [{"1": ["1", "0.20"]}],
+    )
+    assert rows == [
+        {"product_id": 2, "product_name": "Lemonade", "qty": 3, "revenue": 16.5},
+        {"product_id": 1, "product_name": "Milk Tea", "qty": 10, "revenue": 0.5},
+    ]
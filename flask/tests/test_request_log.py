@@ -0,0 +1,126 @@
+import io
+import json
+import logging
+import queue
+import sys
+
+import pytest
+from flask import Flask, jsonify
+
+from request_log import JsonFormatter, LogPipeline, _ContextQueueHandler, bind
+
+
+@pytest.fixture
+def root_logger():
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    yield root
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+
+def make_app(use_queue, **config):
+    app = Flask(__name__)
+    app.config.update(LOG_QUEUE=use_queue, **config)
+    pipeline = LogPipeline()
+    pipeline.stream = io.StringIO()
+
+    @app.route("/orders/<int:order_id>")
+    def order(order_id):
+        bind(order_id=order_id, skipped=None)
+        logging.getLogger("orders").info("looked up", extra={"event": "lookup"})
+        return jsonify({"ok": True})
+
+    pipeline.init_app(app)
+    return app, pipeline
+
+
+def lines(pipeline):
+    pipeline.stop()
+    return [json.loads(line) for line in pipeline.stream.getvalue().splitlines()]
+
+
+def record(level=logging.INFO, **extra):
+    entry = logging.makeLogRecord({"levelno": level, "levelname": "INFO", "msg": "x"})
+    entry.__dict__.update(extra)
+    return entry
+
+
+def test_formatter_writes_extra_fields_and_exceptions():
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        entry = logging.getLogger("t").makeRecord(
+            "t", logging.ERROR, "f", 1, "hi %s", ("there",), sys.exc_info()
+        )
+    entry.order_id = 7
+    entry.empty = None
+    out = json.loads(JsonFormatter().format(entry))
+    assert out["msg"] == "hi there"
+    assert out["level"] == "ERROR"
+    assert out["order_id"] == 7
+    assert "empty" not in out
+    assert "ValueError: boom" in out["exc"]
+
+
+@pytest.mark.parametrize("use_queue", [True, False])
+def test_request_records_share_the_request_context(root_logger, use_queue):
+    app, pipeline = make_app(use_queue)
+    response = app.test_client().get("/orders/5", headers={"X-Request-ID": "abc"})
+    assert response.headers["X-Request-ID"] == "abc"
+    lookup, access = lines(pipeline)
+    assert lookup["event"] == "lookup"
+    assert lookup["order_id"] == access["order_id"] == 5
+    assert lookup["request_id"] == access["request_id"] == "abc"
+    assert access["route"] == "/orders/<int:order_id>"
+    assert access["status"] == 200
+    assert "skipped" not in access
+
+
+def test_a_fresh_request_id_is_made_when_none_is_sent(root_logger):
+    app, pipeline = make_app(False)
+    first = app.test_client().get("/orders/1").headers["X-Request-ID"]
+    second = app.test_client().get("/orders/1").headers["X-Request-ID"]
+    assert first and second and first != second
+    pipeline.stop()
+
+
+def test_sampling_keeps_or_drops_a_request_as_a_whole():
+    pipeline = LogPipeline()
+    pipeline.sample_rates = {"request": 0.5, "lookup": 0.5}
+    kept = 0
+    for n in range(200):
+        request_id = f"req-{n}"
+        a = pipeline.sampled(record(event="request", request_id=request_id))
+        b = pipeline.sampled(record(event="lookup", request_id=request_id))
+        assert a == b
+        kept += a
+    assert 60 < kept < 140
+
+
+def test_warnings_and_unsampled_events_are_always_kept():
+    pipeline = LogPipeline()
+    pipeline.sample_rates = {"request": 0.0}
+    assert not pipeline.sampled(record(event="request", request_id="r"))
+    assert pipeline.sampled(record(logging.WARNING, event="request", request_id="r"))
+    assert pipeline.sampled(record(event="other", request_id="r"))
+
+
+def test_sampled_out_records_are_counted(root_logger):
+    app, pipeline = make_app(True, LOG_SAMPLE_RATES={"request": 0.0})
+    app.test_client().get("/orders/5")
+    assert [line["event"] for line in lines(pipeline)] == ["lookup"]
+    assert pipeline.status()["sampled_out"] == 1
+
+
+def test_a_full_queue_drops_and_counts_records():
+    pipeline = LogPipeline()
+    pipeline.queue = queue.Queue(1)
+    handler = _ContextQueueHandler(pipeline)
+    handler.handle(record())
+    handler.handle(record())
+    assert pipeline.queue.qsize() == 1
+    assert pipeline.status()["dropped"] == 1
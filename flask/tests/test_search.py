@@ -0,0 +1,109 @@
+import pytest
+
+from search import SearchIndex, deletions, tokenize, trigrams, within_one_edit
+
+PRODUCTS = [
+    (1, "Classic Milk Tea", "Milk Tea"),
+    (2, "Mango Green Tea", "Fruit Tea"),
+    (3, "Taro Milk Tea", "Milk Tea"),
+    (4, "Matcha Latte", "Specialty"),
+    (5, "Brown Sugar Boba", "Specialty"),
+]
+INGREDIENTS = [(1, "Whole Milk"), (2, "Tapioca Pearls")]
+# Classic Milk Tea outsells everything else by far
+POPULARITY = {1: 500, 2: 20, 3: 40, 4: 10}
+
+
+@pytest.fixture
+def index():
+    index = SearchIndex()
+    index.build(PRODUCTS, INGREDIENTS, POPULARITY)
+    return index
+
+
+def names(results):
+    return [r["name"] for r in results]
+
+
+def test_tokens_are_lowercased_and_accents_dropped():
+    assert tokenize("Crème Brûlée  Latte!") == ["creme", "brulee", "latte"]
+    assert tokenize(None) == []
+    assert trigrams("tea") == {"  t", " te", "tea", "ea "}
+
+
+@pytest.mark.parametrize(
+    "a, b, expected",
+    [
+        ("milk", "milk", True),
+        ("mlik", "milk", True),
+        ("mathca", "matcha", True),
+        ("mnago", "mango", True),
+        ("taor", "taro", True),
+        ("mik", "milk", True),
+        ("millk", "milk", True),
+        ("mulk", "milk", True),
+        ("klim", "milk", False),
+        ("mlk", "milky", False),
+        ("abx", "xab", False),
+    ],
+)
+def test_within_one_edit(a, b, expected):
+    assert within_one_edit(a, b) is expected
+    assert within_one_edit(b, a) is expected
+
+
+def test_deletions():
+    assert deletions("tea") == {"ea", "ta", "te"}
+
+
+def test_prefix_matches_rank_popular_products_first(index):
+    assert names(index.search("mi"))[:3] == [
+        "Classic Milk Tea",
+        "Taro Milk Tea",
+        "Whole Milk",
+    ]
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        ("mlik", "Classic Milk Tea"),
+        ("taor", "Taro Milk Tea"),
+        ("mnago", "Mango Green Tea"),
+        ("mathca", "Matcha Latte"),
+    ],
+)
+def test_short_tokens_with_one_typo_still_match(index, query, expected):
+    assert names(index.search(query))[0] == expected
+
+
+def test_one_edit_never_beats_a_prefix_hit(index):
+    results = {r["name"]: r["match"] for r in index.search("milk")}
+    assert results["Classic Milk Tea"] == 1.0
+
+
+def test_a_rare_token_outweighs_a_common_one(index):
+    results = index.search("grene tea")
+    assert names(results)[0] == "Mango Green Tea"
+    scores = {r["name"]: r["score"] for r in results}
+    assert scores["Mango Green Tea"] > scores["Classic Milk Tea"]
+
+
+def test_nothing_matches_gibberish(index):
+    assert index.search("zzzz") == []
+    assert index.search("  ") == []
+
+
+def test_kind_filter(index):
+    assert names(index.search("milk", kind="ingredient")) == ["Whole Milk"]
+    assert "Whole Milk" not in names(index.search("milk", kind="product"))
+
+
+def test_edits_and_removals_patch_the_index(index):
+    index.add_product(6, "Mango Slush", "Slush")
+    assert names(index.search("slush")) == ["Mango Slush"]
+    index.add_product(6, "Peach Slush", "Slush")
+    assert names(index.search("slush")) == ["Peach Slush"]
+    index.remove_product(6)
+    assert index.search("slush") == []
+    assert index.status()["documents"] == len(PRODUCTS) + len(INGREDIENTS)
@@ -0,0 +1,127 @@
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+
+from shards import DEFAULT_SHARD, ShardRouter, request_store_id, shard_binds
+
+
+class Engine:
+    def __init__(self, stores):
+        self.stores = stores
+        self.queries = 0
+
+    def connect(self):
+        return Conn(self)
+
+
+class Conn:
+    def __init__(self, engine):
+        self.engine = engine
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, statement):
+        assert "FROM stores" in str(statement)
+        self.engine.queries += 1
+        return SimpleNamespace(scalars=lambda: iter(self.engine.stores))
+
+
+@pytest.fixture
+def app():
+    return Flask(__name__)
+
+
+def router(app, stores_by_shard, store_shards=None, ttl=60.0):
+    engines = {f"shard:{name}": Engine(ids) for name, ids in stores_by_shard.items()}
+    db = SimpleNamespace(
+        engine=Engine(stores_by_shard.get(DEFAULT_SHARD, [])), engines=engines
+    )
+    app.config.update(
+        STORE_SHARDS=store_shards or {},
+        SHARD_DATABASES={name: "postgresql://" for name in stores_by_shard},
+        SHARD_STORES_TTL_SECONDS=ttl,
+    )
+    shards = ShardRouter(db)
+    shards.init_app(app)
+    return shards
+
+
+def test_binds_skip_the_default_shard():
+    config = {"SHARD_DATABASES": {"default": "a", "east": "b"}}
+    assert shard_binds(config) == {"shard:east": "b"}
+    assert shard_binds({}) == {}
+
+
+def test_unknown_shards_are_rejected(app):
+    app.config.update(STORE_SHARDS={2: "west"}, SHARD_DATABASES={})
+    with pytest.raises(ValueError, match="west"):
+        ShardRouter(SimpleNamespace()).init_app(app)
+
+
+def test_unmapped_stores_live_on_the_default_shard(app):
+    shards = router(app, {"default": [1], "east": []}, {2: "east"})
+    assert shards.shard_of(2) == "east"
+    assert shards.shard_of("2") == "east"
+    assert shards.shard_of(7) == DEFAULT_SHARD
+
+
+def test_stores_come_from_every_shards_stores_table(app):
+    # Store 1 is seeded on every shard by the migration; store 4 is unmapped
+    shards = router(
+        app, {"default": [1, 4], "east": [1, 2, 3]}, {2: "east", 3: "east"}
+    )
+    assert shards.known_stores() == [1, 2, 3, 4]
+    assert shards.stores_by_shard() == {"default": [1, 4], "east": [2, 3]}
+    assert shards.stores_by_shard([3]) == {"east": [3]}
+
+
+def test_configured_stores_are_known_before_they_have_a_row(app):
+    shards = router(app, {"default": [1], "east": []}, {5: "east"})
+    assert shards.stores_by_shard() == {"default": [1], "east": [5]}
+
+
+def test_store_list_is_cached_for_the_ttl(app):
+    shards = router(app, {"default": [1]})
+    shards.known_stores()
+    shards.known_stores()
+    assert shards.db.engine.queries == 1
+    shards.stores_ttl = 0.0
+    shards.known_stores()
+    assert shards.db.engine.queries == 2
+
+
+def test_request_store_id_prefers_the_url_then_args_then_body(app):
+    with app.test_request_context("/?store_id=3", json={"store_id": 4}):
+        assert request_store_id(2) == 2
+        assert request_store_id() == 3
+    with app.test_request_context("/", json={"store_id": "4"}):
+        assert request_store_id() == 4
+    with app.test_request_context("/", json=[{"store_id": 4}]):
+        assert request_store_id() == 1
+    with app.test_request_context("/"):
+        assert request_store_id() == 1
+
+
+@pytest.mark.parametrize(
+    "query, body", [("?store_id=x", None), ("", {"store_id": "2a"})]
+)
+def test_non_integer_store_ids_get_a_400(app, query, body):
+    shards = router(app, {"default": [1]})
+    app.add_url_rule("/orders", "orders", lambda: "ok", methods=["POST"])
+    response = app.test_client().post("/orders" + query, json=body)
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "store_id must be an integer"}
+    with app.test_request_context("/", json={"store_id": [2]}):
+        with pytest.raises(ValueError):
+            request_store_id()
+    assert not shards.sharded
+
+
+def test_sharded_once_a_store_lives_off_the_default_shard(app):
+    assert router(app, {"default": [1], "east": []}, {2: "east"}).sharded
+    assert not router(app, {"default": [1]}, {2: "default"}).sharded
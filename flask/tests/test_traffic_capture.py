@@ -0,0 +1,131 @@
+import asyncio
+import glob
+import json
+
+import pytest
+from flask import Flask, jsonify, request
+
+from replay import IdMap, build_path
+from traffic_capture import REDACTED, TrafficCapture, pseudonym, redact
+
+KEY = b"capture key"
+
+
+def test_redact_replaces_personal_fields_at_any_depth():
+    body = {
+        "email": "a@example.com",
+        "name": None,
+        "items": [{"product_id": 1, "user_name": "Ana"}],
+        "token": {"nested": "secret"},
+    }
+    assert redact(body, KEY) == {
+        "email": REDACTED,
+        "name": None,
+        "items": [{"product_id": 1, "user_name": REDACTED}],
+        "token": REDACTED,
+    }
+
+
+def test_clerk_ids_get_a_stable_keyed_pseudonym():
+    first = redact({"clerk_user_id": "user_2abc"}, KEY)["clerk_user_id"]
+    again = redact([{"clerk_id": "user_2abc"}], KEY)[0]["clerk_id"]
+    assert first == again == pseudonym("user_2abc", KEY)
+    assert first.startswith("anon_") and "2abc" not in first
+    assert pseudonym("user_2abd", KEY) != first
+    assert pseudonym("user_2abc", b"other key") != first
+
+
+def make_app(tmp_path, **config):
+    app = Flask(__name__)
+    app.config.update(
+        CAPTURE_ENABLED=True, CAPTURE_DIR=str(tmp_path), SECRET_KEY="s", **config
+    )
+    capture = TrafficCapture()
+
+    @app.route("/api/users/<clerk_id>/reorder", methods=["POST"])
+    def reorder(clerk_id):
+        return jsonify({"order_id": 77, "clerk_id": clerk_id}), 201
+
+    @app.route("/api/orders")
+    def orders():
+        return jsonify(request.args)
+
+    @app.route("/api/login", methods=["POST"])
+    def login():
+        return jsonify({})
+
+    capture.init_app(app)
+    return app, capture
+
+
+def captured(capture, tmp_path):
+    capture.stop()
+    (name,) = glob.glob(str(tmp_path / "capture-*.jsonl"))
+    with open(name, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_captured_lines_link_a_user_without_naming_them(tmp_path):
+    app, capture = make_app(tmp_path, CAPTURE_PSEUDONYM_KEY="k")
+    client = app.test_client()
+    client.post(
+        "/api/users/user_9/reorder",
+        json={"clerk_user_id": "user_9", "email": "a@example.com"},
+    )
+    client.get("/api/orders?clerk_user_id=user_9&limit=5")
+    client.post("/api/login", json={"password": "x"})
+    post, get = captured(capture, tmp_path)
+    alias = pseudonym("user_9", b"k")
+    assert post["r"] == "/api/users/<clerk_id>/reorder"
+    assert post["v"] == {"clerk_id": alias}
+    assert post["b"] == {"clerk_user_id": alias, "email": REDACTED}
+    assert post["ids"] == {"order_id": 77}
+    assert post["s"] == 201
+    assert get["q"] == {"clerk_user_id": alias, "limit": "5"}
+    assert "user_9" not in json.dumps([post, get])
+
+
+def test_secret_key_is_the_default_pseudonym_key(tmp_path):
+    app, capture = make_app(tmp_path)
+    app.test_client().get("/api/orders?clerk_user_id=user_9")
+    (line,) = captured(capture, tmp_path)
+    assert line["q"]["clerk_user_id"] == pseudonym("user_9", b"s")
+
+
+def test_build_path_quotes_arguments():
+    assert build_path("/api/users/<clerk_id>/reorder", {"clerk_id": "a/b"}) == (
+        "/api/users/a%2Fb/reorder"
+    )
+    assert build_path("/api/orders/<int:order_id>", {"order_id": 5}) == "/api/orders/5"
+
+
+@pytest.mark.parametrize("new, order_id", [(901, 901), (None, 5)])
+def test_id_map_waits_for_the_replayed_write(new, order_id):
+    async def run():
+        ids = IdMap(timeout=1.0)
+        ids.expect("order_id", 5)
+        pending = asyncio.ensure_future(
+            ids.remap(
+                {"order_id": 5, "items": [{"order_id": "5"}], "employee_id": 3, "n": 5}
+            )
+        )
+        await asyncio.sleep(0)
+        # None is a write that failed on replay: the captured id stays
+        ids.resolve("order_id", 5, new)
+        return await pending
+
+    assert asyncio.run(run()) == {
+        "order_id": order_id,
+        "items": [{"order_id": str(order_id)}],
+        "employee_id": 3,
+        "n": 5,
+    }
+
+
+def test_id_map_gives_up_after_the_timeout():
+    async def run():
+        ids = IdMap(timeout=0.01)
+        ids.expect("order_id", 5)
+        return await ids.remap({"order_id": "5"})
+
+    assert asyncio.run(run()) == {"order_id": "5"}
@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from usuals import Usuals, _parse_mods, config_key, empty_state, line_from_item
+
+MONDAY = datetime(2026, 3, 2, 12)
+
+
+def line(product_id, **extra):
+    return line_from_item({"product_id": product_id, **extra})
+
+
+@pytest.fixture
+def usuals():
+    return Usuals(top_k=2, half_life_days=10)
+
+
+def test_posted_and_stored_modifications_give_the_same_key():
+    posted = line(
+        1,
+        modifications=[
+            {"ingredient_id": 7, "modification_type": "remove"},
+            {"ingredient_id": 3, "possible_modification": "EXTRA"},
+            {"ingredient_id": 7, "modification_type": "ADD"},
+        ],
+    )
+    # As string_agg orders them: ingredient id, then type name
+    stored = {**posted, "modifications": _parse_mods("3:EXTRA,7:ADD,7:REMOVE")}
+    assert posted["modifications"] == [[3, "EXTRA"], [7, "ADD"], [7, "REMOVE"]]
+    assert config_key(posted) == config_key(stored)
+    assert config_key(posted) == "1|normal|100%|regular|3:EXTRA,7:ADD,7:REMOVE"
+
+
+def test_fold_counts_a_drink_once_per_order(usuals):
+    lines = [line(1), line(1, quantity=2), line(2)]
+    state = usuals.fold(empty_state(), 1, MONDAY, lines)
+    (milk_tea, lemonade) = sorted(state["configs"], key=lambda c: c["product_id"])
+    assert milk_tea["count"] == 1
+    assert milk_tea["quantity"] == 2
+    assert state["pairs"] == [{"a": 1, "b": 2, "score": 1.0, "count": 1}]
+    assert state["order_count"] == 1
+
+
+def test_older_scores_decay_by_the_half_life(usuals):
+    state = usuals.fold(empty_state(), 1, MONDAY, [line(1)])
+    usuals.fold(state, 2, MONDAY + timedelta(days=10), [line(2)])
+    scores = {c["product_id"]: c["score"] for c in state["configs"]}
+    assert scores == pytest.approx({1: 0.5, 2: 1.0})
+    # An order dated before as_of is weighted down instead
+    usuals.fold(state, 3, MONDAY, [line(2)])
+    assert {c["product_id"]: c["score"] for c in state["configs"]}[2] == 1.5
+
+
+def test_orders_already_folded_are_skipped(usuals):
+    state = usuals.fold(empty_state(), 5, MONDAY, [line(1)])
+    usuals.fold(state, 5, MONDAY, [line(1)])
+    usuals.fold(state, 4, MONDAY, [line(1)])
+    assert state["order_count"] == 1
+
+
+def test_only_a_few_candidates_are_kept(usuals):
+    state = empty_state()
+    for order_id in range(1, 10):
+        usuals.fold(state, order_id, MONDAY, [line(order_id)])
+    assert len(state["configs"]) == 6
+
+
+class Session:
+    def __init__(self, row):
+        self.row = row
+        self.statements = []
+        self.committed = False
+
+    def execute(self, statement, params=None):
+        self.statements.append((" ".join(str(statement).split()), params))
+        return self
+
+    def mappings(self):
+        return self
+
+    def first(self):
+        return self.row
+
+    def commit(self):
+        self.committed = True
+
+
+def test_record_order_locks_a_row_even_for_a_first_order(usuals):
+    # The row is there by the time it is locked, so a concurrent first
+    # order waits on it instead of inserting its own
+    placeholder = {**empty_state(), "as_of": MONDAY}
+    session = Session(placeholder)
+    usuals.record_order(session, 9, 1, MONDAY, [{"product_id": 1}])
+    insert, select, upsert = [sql for sql, _ in session.statements]
+    assert insert.startswith("INSERT INTO user_usuals (user_id, as_of)")
+    assert "ON CONFLICT (user_id) DO NOTHING" in insert
+    assert select.endswith("FOR UPDATE")
+    assert "ON CONFLICT (user_id) DO UPDATE" in upsert
+    assert session.statements[2][1]["order_count"] == 1
+    assert session.committed
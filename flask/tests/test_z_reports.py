@@ -0,0 +1,106 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+from z_reports import (
+    EMPLOYEES_SQL,
+    HOURLY_SQL,
+    ITEMS_SQL,
+    SOURCES_SQL,
+    TOTALS_SQL,
+    _row_to_report,
+    build_report,
+)
+
+
+class Result:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def mappings(self):
+        return self
+
+    def first(self):
+        return self.rows[0] if self.rows else None
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+class FakeConn:
+    """Answers each report query with canned rows."""
+
+    def __init__(self, answers):
+        self.answers = answers
+        self.params = []
+
+    def execute(self, clause, params):
+        self.params.append(params)
+        return Result(self.answers[str(clause)])
+
+
+def item(product_id, name, qty, revenue):
+    return {
+        "product_id": product_id,
+        "product_name": name,
+        "qty_sold": qty,
+        "revenue": Decimal(revenue),
+    }
+
+
+def test_build_report_shapes_every_section():
+    conn = FakeConn(
+        {
+            TOTALS_SQL: [{"order_count": 3, "total_revenue": Decimal("17.50")}],
+            ITEMS_SQL: [item(1, "Milk Tea", 4, "14"), item(2, "Lemonade", 1, "3.5")],
+            EMPLOYEES_SQL: [
+                {"employee_id": 7, "name": "Sam", "orders": 2, "revenue": Decimal("10")}
+            ],
+            SOURCES_SQL: [{"source": "employee", "orders": 2, "revenue": Decimal("10")}],
+            HOURLY_SQL: [{"hour": 9, "orders": 3, "revenue": Decimal("17.50")}],
+        }
+    )
+    report = build_report(conn, date(2026, 3, 1), store_id=2)
+    assert conn.params[0] == {
+        "since": date(2026, 3, 1),
+        "until": date(2026, 3, 2),
+        "store_id": 2,
+    }
+    assert report["order_count"] == 3
+    assert report["items_sold"] == 5
+    assert report["total_revenue"] == 17.5
+    assert report["items"][1] == {
+        "product_id": 2,
+        "product_name": "Lemonade",
+        "qty_sold": 1,
+        "revenue": 3.5,
+    }
+    # A source without orders is still listed
+    assert report["sources"] == {
+        "employee": {"orders": 2, "revenue": 10.0},
+        "customer": {"orders": 0, "revenue": 0.0},
+    }
+    assert report["hourly"] == [{"hour": 9, "orders": 3, "revenue": 17.5}]
+
+
+def test_stored_row_becomes_the_api_shape():
+    row = {
+        "store_id": 1,
+        "business_date": date(2026, 3, 1),
+        "closed_at": datetime(2026, 3, 2, 0, 15),
+        "closed_by": None,
+        "order_count": 3,
+        "items_sold": 5,
+        "total_revenue": Decimal("17.50"),
+        "report": {"items": [], "hourly": []},
+    }
+    assert _row_to_report(row) == {
+        "items": [],
+        "hourly": [],
+        "store_id": 1,
+        "date": "2026-03-01",
+        "closed_at": "2026-03-02T00:15:00",
+        "closed_by": None,
+        "order_count": 3,
+        "items_sold": 5,
+        "total_revenue": 17.5,
+    }
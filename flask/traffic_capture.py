@@ -0,0 +1,235 @@
+"""Opt-in capture of sampled production requests, for replay.py.
+
+With ``CAPTURE_ENABLED`` on, a share ``CAPTURE_SAMPLE_RATE`` of API requests
+is written out as one compact JSON line each::
+
+    {"t":1760870400.123,"m":"POST","r":"/api/postOrder","b":{...},"s":201,
+     "ms":12.4,"ids":{"order_id":4412}}
+
+* ``t`` is the arrival time and ``ms`` the time the app took.
+* ``r`` is the URL rule and ``v`` its arguments, so a replay can rebuild the
+  path with its own ids.
+* ``q`` holds the query args and ``b`` the JSON body. Values under
+  ``REDACT_KEYS`` (emails, names, secrets) are replaced wherever they appear.
+  Clerk user ids (``PSEUDONYM_KEYS``, in ``v`` too) become a keyed hash, so
+  a replay still sees one user's requests under one id without the real
+  one. The key is ``CAPTURE_PSEUDONYM_KEY``, else ``SECRET_KEY``; with
+  neither set, each worker picks a random key and pseudonyms only match
+  within its own file.
+  Other bodies, such as CSV uploads, are not kept; only their content type
+  (``ct``) is recorded.
+* ``ids`` are the ids a ``POST`` created: the ``REMAP_KEYS`` at the top level
+  of its JSON response.
+
+Sign-in, session, health and admin routes are never captured. Whether a
+request is sampled is decided from its request id (request_log.py).
+
+Lines are queued and written by a background thread, like the logs; when
+the queue is full the line is dropped and counted. Each worker writes its
+own ``capture-<pid>.jsonl`` under ``CAPTURE_DIR``. The file is rotated into
+gzip files at ``CAPTURE_MAX_BYTES`` and ``CAPTURE_BACKUPS`` of them are kept.
+"""
+
+import atexit
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import threading
+import time
+import uuid
+import zlib
+
+from flask import g, request
+
+DEFAULT_CAPTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "capture")
+
+REDACT_KEYS = frozenset(
+    {"email", "name", "user_email", "user_name", "password", "token", "access_token", "code"}
+)
+REDACTED = "[redacted]"
+# Replaced by a stable pseudonym rather than redacted
+PSEUDONYM_KEYS = frozenset({"clerk_user_id", "clerk_id"})
+
+# Ids replay.py maps from the captured database to the replayed one
+REMAP_KEYS = ("order_id", "order_item_id", "employee_id", "product_id")
+
+SKIP_PREFIXES = (
+    "/api/login",
+    "/api/logout",
+    "/api/oauth2",
+    "/api/me",
+    "/api/health",
+    "/api/admin",
+)
+
+
+def pseudonym(value, key):
+    digest = hmac.new(key, str(value).encode(), hashlib.sha256).hexdigest()
+    return "anon_" + digest[:24]
+
+
+def redact(value, key=b""):
+    """``value`` with everything under ``REDACT_KEYS`` replaced, at any depth.
+
+    Values under ``PSEUDONYM_KEYS`` are replaced by their ``pseudonym``.
+    """
+    if isinstance(value, dict):
+        redacted = {}
+        for k, v in value.items():
+            if v is not None and k in REDACT_KEYS:
+                redacted[k] = REDACTED
+            elif k in PSEUDONYM_KEYS and isinstance(v, (str, int)):
+                redacted[k] = pseudonym(v, key)
+            else:
+                redacted[k] = redact(v, key)
+        return redacted
+    if isinstance(value, list):
+        return [redact(v, key) for v in value]
+    return value
+
+
+def _gz_name(name):
+    return name + ".gz"
+
+
+def _gzip_rotate(source, dest):
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+class _LineFormatter(logging.Formatter):
+    def format(self, record):
+        return json.dumps(record.capture, separators=(",", ":"), default=str)
+
+
+class TrafficCapture:
+    def __init__(self):
+        self.enabled = False
+        self.directory = DEFAULT_CAPTURE_DIR
+        self.sample_rate = 1.0
+        self.max_bytes = 64 * 1024 * 1024
+        self.backups = 20
+        self.queue_size = 10000
+        self.pseudonym_key = uuid.uuid4().bytes
+        self.queue = None
+        self._listener = None
+        self._lock = threading.Lock()
+        self._counts = {"captured": 0, "dropped": 0}
+
+    def init_app(self, app):
+        self.enabled = bool(app.config.get("CAPTURE_ENABLED", False))
+        if not self.enabled:
+            return
+        self.directory = app.config.get("CAPTURE_DIR") or DEFAULT_CAPTURE_DIR
+        self.sample_rate = float(app.config.get("CAPTURE_SAMPLE_RATE", 1.0))
+        self.max_bytes = int(app.config.get("CAPTURE_MAX_BYTES", 64 * 1024 * 1024))
+        self.backups = int(app.config.get("CAPTURE_BACKUPS", 20))
+        key = app.config.get("CAPTURE_PSEUDONYM_KEY") or app.config.get("SECRET_KEY")
+        if key:
+            self.pseudonym_key = key.encode() if isinstance(key, str) else key
+        self.start()
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        atexit.register(self.stop)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # A worker writes its own file, with its own thread
+        self._lock = threading.Lock()
+        self._listener = None
+        self.start()
+
+    def start(self):
+        with self._lock:
+            if self._listener is not None:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            output = logging.handlers.RotatingFileHandler(
+                os.path.join(self.directory, f"capture-{os.getpid()}.jsonl"),
+                maxBytes=self.max_bytes,
+                backupCount=self.backups,
+                encoding="utf-8",
+                delay=True,
+            )
+            output.namer = _gz_name
+            output.rotator = _gzip_rotate
+            output.setFormatter(_LineFormatter())
+            self.queue = queue.Queue(self.queue_size)
+            self._listener = logging.handlers.QueueListener(self.queue, output)
+            self._listener.start()
+
+    def stop(self):
+        """Write out what is queued and stop the writer thread."""
+        with self._lock:
+            if self._listener is not None:
+                self._listener.stop()
+                for handler in self._listener.handlers:
+                    handler.close()
+                self._listener = None
+
+    def _sampled(self):
+        if self.sample_rate >= 1.0:
+            return True
+        request_id = g.get("request_id") or ""
+        return zlib.crc32(request_id.encode()) < self.sample_rate * 2**32
+
+    def _start_request(self):
+        g.capture_arrived = time.time()
+        g.capture_started = time.perf_counter()
+
+    def _finish_request(self, response):
+        if (
+            request.url_rule is None
+            or not request.path.startswith("/api/")
+            or request.path.startswith(SKIP_PREFIXES)
+            or "capture_started" not in g
+            or not self._sampled()
+        ):
+            return response
+        entry = {
+            "t": round(g.capture_arrived, 3),
+            "m": request.method,
+            "r": request.url_rule.rule,
+        }
+        if request.view_args:
+            entry["v"] = redact(request.view_args, self.pseudonym_key)
+        if request.args:
+            entry["q"] = redact(request.args.to_dict(), self.pseudonym_key)
+        if request.is_json:
+            entry["b"] = redact(request.get_json(silent=True), self.pseudonym_key)
+        elif request.content_length:
+            entry["ct"] = request.mimetype
+        entry["s"] = response.status_code
+        entry["ms"] = round((time.perf_counter() - g.capture_started) * 1000.0, 2)
+        if request.method == "POST" and 200 <= response.status_code < 300 and response.is_json:
+            data = response.get_json(silent=True)
+            if isinstance(data, dict):
+                ids = {k: data[k] for k in REMAP_KEYS if isinstance(data.get(k), int)}
+                if ids:
+                    entry["ids"] = ids
+        try:
+            self.queue.put_nowait(logging.makeLogRecord({"capture": entry}))
+            self.count("captured")
+        except queue.Full:
+            self.count("dropped")
+        return response
+
+    def count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def status(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "queued": self.queue.qsize() if self.queue else 0,
+                **self._counts,
+            }
@@ -0,0 +1,304 @@
+"""Signed-in customers' usual drinks and the products they pair.
+
+A drink configuration is a product with its size, sugar, ice and set of
+modifications. For every user, ``user_usuals`` keeps the few configurations
+and product pairs they order most. Scores decay with a half-life, so last
+month's habit beats last year's. Each order adds 1 to every configuration
+(and every pair of distinct products) it contains.
+
+The table is filled two ways:
+
+* ``rebuild`` streams all order lines of a shard, user by user, and rewrites
+  the rows. It runs as ``flask refresh-usuals``.
+* ``record_order`` folds one new order into its user's row after checkout.
+  It first inserts an empty row if the user has none, so that even a
+  user's first two orders lock the same row and are folded one after the
+  other. It skips orders at or below ``last_order_id``. A rebuild never
+  overwrites a row that a live order has moved past, so the two can run
+  at the same time.
+
+Modifications are ordered by ingredient id, then by type name, in both the
+SQL and the Python paths, so the two build the same configuration keys.
+
+Only ``KEEP_FACTOR * top_k`` candidates are kept per user. A configuration
+that drops off can come back, but it starts from zero.
+"""
+
+import json
+from datetime import datetime
+from itertools import combinations, groupby
+
+from sqlalchemy import bindparam, text
+
+KEEP_FACTOR = 3
+MAX_PAIRS = 10
+
+LINES_SQL = """
+    SELECT o.user_id, o.order_id, o.order_date, oi.product_id, oi.quantity,
+           oi.size_level, oi.sugar_level, oi.ice_level,
+           COALESCE(
+               (SELECT string_agg(m.ingredient_id || ':' || m.modification_type, ','
+                                  ORDER BY m.ingredient_id,
+                                           CAST(m.modification_type AS TEXT))
+                FROM modifications m
+                WHERE m.order_item_id = oi.order_item_id),
+               ''
+           ) AS mods
+    FROM orders o
+    JOIN order_items oi ON oi.order_id = o.order_id
+    WHERE o.user_id IS NOT NULL {users}
+    ORDER BY o.user_id, o.order_id, oi.order_item_id
+"""
+
+UPSERT_SQL = """
+    INSERT INTO user_usuals
+        (user_id, order_count, last_order_id, as_of, configs, pairs, updated_at)
+    VALUES (:user_id, :order_count, :last_order_id, :as_of,
+            CAST(:configs AS JSONB), CAST(:pairs AS JSONB), now())
+    ON CONFLICT (user_id) DO UPDATE SET
+        order_count = EXCLUDED.order_count,
+        last_order_id = EXCLUDED.last_order_id,
+        as_of = EXCLUDED.as_of,
+        configs = EXCLUDED.configs,
+        pairs = EXCLUDED.pairs,
+        updated_at = now()
+    WHERE user_usuals.last_order_id <= EXCLUDED.last_order_id
+"""
+
+# An empty row to lock; a missing row cannot be locked
+PLACEHOLDER_SQL = """
+    INSERT INTO user_usuals (user_id, as_of) VALUES (:user_id, :as_of)
+    ON CONFLICT (user_id) DO NOTHING
+"""
+
+
+def config_key(line):
+    mods = ",".join(f"{iid}:{kind}" for iid, kind in line["modifications"])
+    return "|".join(
+        str(v)
+        for v in (
+            line["product_id"],
+            line["size_level"],
+            line["sugar_level"],
+            line["ice_level"],
+            mods,
+        )
+    )
+
+
+def line_from_item(item):
+    """A configuration from an order line as posted to ``/api/postOrder``."""
+    mods = sorted(
+        (
+            int(m["ingredient_id"]),
+            (
+                m.get("modification_type") or m.get("possible_modification", "ADD")
+            ).upper(),
+        )
+        for m in item.get("modifications", [])
+    )
+    return {
+        "product_id": int(item["product_id"]),
+        "quantity": int(item.get("quantity", 1)),
+        "size_level": item.get("size_level", "normal"),
+        "sugar_level": item.get("sugar_level", "100%"),
+        "ice_level": item.get("ice_level", "regular"),
+        "modifications": [list(m) for m in mods],
+    }
+
+
+def _parse_mods(value):
+    mods = []
+    for part in filter(None, value.split(",")):
+        iid, kind = part.split(":", 1)
+        mods.append([int(iid), kind])
+    return mods
+
+
+def empty_state():
+    return {
+        "order_count": 0,
+        "last_order_id": 0,
+        "as_of": None,
+        "configs": [],
+        "pairs": [],
+    }
+
+
+class Usuals:
+    def __init__(self, top_k=5, half_life_days=90.0):
+        self.top_k = top_k
+        self.half_life_days = half_life_days
+
+    def init_app(self, app):
+        self.top_k = int(app.config.get("USUALS_TOP_K", 5))
+        self.half_life_days = float(app.config.get("USUALS_HALF_LIFE_DAYS", 90))
+
+    def _weight(self, older, newer):
+        days = (newer - older).total_seconds() / 86400.0
+        return 0.5 ** (days / self.half_life_days)
+
+    def fold(self, state, order_id, when, lines):
+        """Add one order's lines to ``state`` in place."""
+        if order_id <= state["last_order_id"]:
+            return state
+        as_of = state["as_of"]
+        if as_of is None or when > as_of:
+            if as_of is not None:
+                decay = self._weight(as_of, when)
+                for entry in state["configs"] + state["pairs"]:
+                    entry["score"] *= decay
+            state["as_of"] = as_of = when
+        weight = self._weight(when, as_of)
+        last = when.isoformat()
+
+        configs = {config_key(c): c for c in state["configs"]}
+        seen = set()
+        for line in lines:
+            key = config_key(line)
+            entry = configs.get(key)
+            if entry is None:
+                entry = configs[key] = {
+                    **{k: line[k] for k in line if k != "quantity"},
+                    "score": 0.0,
+                    "count": 0,
+                    "last": last,
+                }
+            entry["quantity"] = line["quantity"]
+            # The same drink twice in one order is still one visit
+            if key not in seen:
+                seen.add(key)
+                entry["score"] += weight
+                entry["count"] += 1
+                entry["last"] = max(entry["last"], last)
+        pairs = {(p["a"], p["b"]): p for p in state["pairs"]}
+        products = sorted({line["product_id"] for line in lines})
+        for a, b in combinations(products, 2):
+            entry = pairs.setdefault((a, b), {"a": a, "b": b, "score": 0.0, "count": 0})
+            entry["score"] += weight
+            entry["count"] += 1
+
+        keep = KEEP_FACTOR * self.top_k
+        state["configs"] = sorted(configs.values(), key=lambda c: -c["score"])[:keep]
+        state["pairs"] = sorted(pairs.values(), key=lambda p: -p["score"])[:MAX_PAIRS]
+        state["order_count"] += 1
+        state["last_order_id"] = order_id
+        return state
+
+    @staticmethod
+    def _save(conn, user_id, state):
+        conn.execute(
+            text(UPSERT_SQL),
+            {
+                "user_id": user_id,
+                "order_count": state["order_count"],
+                "last_order_id": state["last_order_id"],
+                "as_of": state["as_of"],
+                "configs": json.dumps(state["configs"]),
+                "pairs": json.dumps(state["pairs"]),
+            },
+        )
+
+    def rebuild(self, engine, user_ids=None, batch_size=500):
+        """Recompute the rows of ``user_ids`` (default: every customer) on one shard.
+
+        Returns the number of users written.
+        """
+        users = "AND o.user_id IN :users" if user_ids is not None else ""
+        sql = text(LINES_SQL.format(users=users))
+        params = {}
+        if user_ids is not None:
+            sql = sql.bindparams(bindparam("users", expanding=True))
+            params["users"] = list(user_ids)
+        written = 0
+        pending = []
+        with engine.connect() as read, engine.connect() as write:
+            rows = read.execution_options(stream_results=True, yield_per=2000).execute(
+                sql, params
+            )
+            for user_id, user_rows in groupby(rows, key=lambda r: r[0]):
+                state = empty_state()
+                for (order_id, when), order_rows in groupby(
+                    user_rows, key=lambda r: (r[1], r[2])
+                ):
+                    lines = [
+                        {
+                            "product_id": r[3],
+                            "quantity": r[4],
+                            "size_level": r[5],
+                            "sugar_level": r[6],
+                            "ice_level": r[7],
+                            "modifications": _parse_mods(r[8]),
+                        }
+                        for r in order_rows
+                    ]
+                    self.fold(state, order_id, when, lines)
+                pending.append((user_id, state))
+                if len(pending) >= batch_size:
+                    written += self._flush(write, pending)
+            written += self._flush(write, pending)
+        return written
+
+    def _flush(self, conn, pending):
+        with conn.begin():
+            for user_id, state in pending:
+                self._save(conn, user_id, state)
+        count = len(pending)
+        pending.clear()
+        return count
+
+    def record_order(self, session, user_id, order_id, when, items):
+        """Fold a just-committed order into its user's row, in its own transaction."""
+        session.execute(text(PLACEHOLDER_SQL), {"user_id": user_id, "as_of": when})
+        row = (
+            session.execute(
+                text(
+                    "SELECT order_count, last_order_id, as_of, configs, pairs "
+                    "FROM user_usuals WHERE user_id = :user_id FOR UPDATE"
+                ),
+                {"user_id": user_id},
+            )
+            .mappings()
+            .first()
+        )
+        state = dict(row)
+        self.fold(state, order_id, when, [line_from_item(i) for i in items])
+        self._save(session, user_id, state)
+        session.commit()
+
+    def get(self, conn, clerk_user_id, now=None):
+        """``(user_id, usuals)`` for a Clerk user in one indexed lookup.
+
+        ``usuals`` is ``None`` when the user has no row yet. Scores are decayed
+        to ``now`` and only the top ``top_k`` configurations are returned.
+        """
+        row = (
+            conn.execute(
+                text(
+                    """
+                    SELECT u.user_id, uu.order_count, uu.as_of, uu.configs, uu.pairs
+                    FROM users u
+                    LEFT JOIN user_usuals uu ON uu.user_id = u.user_id
+                    WHERE u.clerk_user_id = :clerk_id
+                """
+                ),
+                {"clerk_id": clerk_user_id},
+            )
+            .mappings()
+            .first()
+        )
+        if row is None:
+            return None, None
+        if row["as_of"] is None:
+            return row["user_id"], None
+        decay = self._weight(row["as_of"], max(now or datetime.now(), row["as_of"]))
+        configs = [
+            {**c, "score": round(c["score"] * decay, 3)}
+            for c in row["configs"][: self.top_k]
+        ]
+        pairs = [{**p, "score": round(p["score"] * decay, 3)} for p in row["pairs"]]
+        return row["user_id"], {
+            "order_count": row["order_count"],
+            "configs": configs,
+            "pairs": pairs,
+        }
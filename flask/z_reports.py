@@ -0,0 +1,298 @@
+"""Persisted end-of-day Z reports.
+
+Closing a business day snapshots its totals (revenue, items sold, per-employee
+totals, the employee vs. customer order split and the hourly breakdown) into
+an immutable ``z_reports`` row (migration_add_z_reports.sql). A past day's Z
+report is then a primary-key lookup instead of a scan of its orders. Reports
+are per store and stored on the store's shard.
+
+Closing is idempotent: the insert never overwrites, so a day closed by hand
+and again by the auto-closer keeps its first snapshot. ``ZReportCloser`` runs
+in each worker when ``Z_REPORT_AUTO_CLOSE`` is set and closes every store's
+days that ended without a Z report, shard by shard; a Postgres advisory lock
+keeps workers from closing the same days at once.
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from models import DEFAULT_STORE_ID
+from report_cache import parse_day, split_days
+
+# Arbitrary constant shared by every worker that runs the auto-closer
+AUTO_CLOSE_LOCK_KEY = 0x7A5250
+
+TOTALS_SQL = """
+    SELECT COUNT(*) AS order_count, COALESCE(SUM(total_amount), 0) AS total_revenue
+    FROM orders
+    WHERE store_id = :store_id AND order_date >= :since AND order_date < :until
+"""
+
+ITEMS_SQL = """
+    SELECT p.product_id, p.product_name,
+           SUM(oi.quantity) AS qty_sold,
+           SUM(oi.quantity * oi.unit_price_at_sale) AS revenue
+    FROM orders o
+    JOIN order_items oi ON oi.order_id = o.order_id
+    JOIN products p ON p.product_id = oi.product_id
+    WHERE o.store_id = :store_id
+      AND o.order_date >= :since AND o.order_date < :until
+    GROUP BY p.product_id, p.product_name
+    ORDER BY qty_sold DESC, p.product_id
+"""
+
+EMPLOYEES_SQL = """
+    SELECT o.employee_id, e.name, COUNT(*) AS orders,
+           SUM(o.total_amount) AS revenue
+    FROM orders o
+    JOIN employees e ON e.employee_id = o.employee_id
+    WHERE o.store_id = :store_id
+      AND o.order_date >= :since AND o.order_date < :until
+    GROUP BY o.employee_id, e.name
+    ORDER BY o.employee_id
+"""
+
+# Orders rung up by an employee vs. placed by a customer at a kiosk
+SOURCES_SQL = """
+    SELECT CASE WHEN employee_id IS NOT NULL THEN 'employee' ELSE 'customer' END AS source,
+           COUNT(*) AS orders, SUM(total_amount) AS revenue
+    FROM orders
+    WHERE store_id = :store_id AND order_date >= :since AND order_date < :until
+    GROUP BY source
+"""
+
+HOURLY_SQL = """
+    SELECT EXTRACT(HOUR FROM order_date)::int AS hour,
+           COUNT(*) AS orders, SUM(total_amount) AS revenue
+    FROM orders
+    WHERE store_id = :store_id AND order_date >= :since AND order_date < :until
+    GROUP BY hour
+    ORDER BY hour
+"""
+
+REPORT_COLUMNS = (
+    "store_id, business_date, closed_at, closed_by, order_count, items_sold, "
+    "total_revenue, report"
+)
+
+
+def _money(value):
+    return float(value or 0)
+
+
+def build_report(conn, day, store_id=DEFAULT_STORE_ID):
+    """Aggregate ``day``'s orders into the snapshot stored by ``close_day``."""
+    params = {"since": day, "until": day + timedelta(days=1), "store_id": store_id}
+    totals = conn.execute(text(TOTALS_SQL), params).mappings().first()
+    items = [
+        {
+            "product_id": r["product_id"],
+            "product_name": r["product_name"],
+            "qty_sold": int(r["qty_sold"]),
+            "revenue": _money(r["revenue"]),
+        }
+        for r in conn.execute(text(ITEMS_SQL), params).mappings()
+    ]
+    employees = [
+        {
+            "employee_id": r["employee_id"],
+            "name": r["name"],
+            "orders": int(r["orders"]),
+            "revenue": _money(r["revenue"]),
+        }
+        for r in conn.execute(text(EMPLOYEES_SQL), params).mappings()
+    ]
+    sources = {s: {"orders": 0, "revenue": 0.0} for s in ("employee", "customer")}
+    for r in conn.execute(text(SOURCES_SQL), params).mappings():
+        sources[r["source"]] = {"orders": int(r["orders"]), "revenue": _money(r["revenue"])}
+    hourly = [
+        {"hour": r["hour"], "orders": int(r["orders"]), "revenue": _money(r["revenue"])}
+        for r in conn.execute(text(HOURLY_SQL), params).mappings()
+    ]
+    return {
+        "order_count": int(totals["order_count"]),
+        "items_sold": sum(i["qty_sold"] for i in items),
+        "total_revenue": _money(totals["total_revenue"]),
+        "items": items,
+        "employees": employees,
+        "sources": sources,
+        "hourly": hourly,
+    }
+
+
+def _row_to_report(row):
+    report = dict(row["report"])
+    report.update(
+        {
+            "store_id": row["store_id"],
+            "date": row["business_date"].isoformat(),
+            "closed_at": row["closed_at"].isoformat(),
+            "closed_by": row["closed_by"],
+            "order_count": row["order_count"],
+            "items_sold": row["items_sold"],
+            "total_revenue": _money(row["total_revenue"]),
+        }
+    )
+    return report
+
+
+def get_report(conn, day, store_id=DEFAULT_STORE_ID):
+    """The stored Z report for ``day``, or ``None`` if it was never closed."""
+    row = (
+        conn.execute(
+            text(
+                f"SELECT {REPORT_COLUMNS} FROM z_reports "
+                "WHERE store_id = :store_id AND business_date = :day"
+            ),
+            {"store_id": store_id, "day": parse_day(day)},
+        )
+        .mappings()
+        .first()
+    )
+    return _row_to_report(row) if row else None
+
+
+def close_day(conn, day, closed_by=None, store_id=DEFAULT_STORE_ID):
+    """Snapshot ``day`` into ``z_reports`` in the caller's transaction.
+
+    Returns ``(report, created)``; ``created`` is False when the day had
+    already been closed, in which case the stored snapshot is returned.
+    """
+    day = parse_day(day)
+    snapshot = build_report(conn, day, store_id)
+    row = (
+        conn.execute(
+            text(
+                f"""
+                INSERT INTO z_reports (store_id, business_date, closed_by, order_count,
+                                       items_sold, total_revenue, report)
+                VALUES (:store_id, :day, :closed_by, :order_count, :items_sold,
+                        :total_revenue, CAST(:report AS JSONB))
+                ON CONFLICT (store_id, business_date) DO NOTHING
+                RETURNING {REPORT_COLUMNS}
+            """
+            ),
+            {
+                "store_id": store_id,
+                "day": day,
+                "closed_by": closed_by,
+                "order_count": snapshot["order_count"],
+                "items_sold": snapshot["items_sold"],
+                "total_revenue": snapshot["total_revenue"],
+                "report": json.dumps(
+                    {k: snapshot[k] for k in ("items", "employees", "sources", "hourly")}
+                ),
+            },
+        )
+        .mappings()
+        .first()
+    )
+    if row is None:
+        return get_report(conn, day, store_id), False
+    return _row_to_report(row), True
+
+
+def missed_days(conn, lookback_days=35, now=None):
+    """``(store_id, day)`` of finished days with orders but no Z report.
+
+    Only the last ``lookback_days`` are considered, and a day counts as
+    finished once ``split_days`` treats it as closed.
+    """
+    now = now or datetime.now()
+    closed, _ = split_days(now.date() - timedelta(days=lookback_days), now.date(), now)
+    if not closed:
+        return []
+    rows = conn.execute(
+        text(
+            """
+            SELECT DISTINCT o.store_id, DATE(o.order_date) AS day
+            FROM orders o
+            WHERE o.order_date >= :since AND o.order_date < :until
+              AND NOT EXISTS (
+                  SELECT 1 FROM z_reports z
+                  WHERE z.store_id = o.store_id
+                    AND z.business_date = DATE(o.order_date)
+              )
+            ORDER BY day, o.store_id
+        """
+        ),
+        {"since": closed[0], "until": closed[-1] + timedelta(days=1)},
+    )
+    return [(r[0], r[1]) for r in rows]
+
+
+def close_missed_days(engine, lookback_days=35, now=None):
+    """Close every missed day on ``engine`` unless another worker is doing so.
+
+    Returns the ``(store_id, day)`` pairs closed by this call.
+    """
+    with engine.begin() as conn:
+        locked = conn.execute(
+            text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": AUTO_CLOSE_LOCK_KEY}
+        ).scalar()
+        if not locked:
+            return []
+        closed = []
+        for store_id, day in missed_days(conn, lookback_days, now):
+            _, created = close_day(conn, day, store_id=store_id)
+            if created:
+                closed.append((store_id, day))
+        return closed
+
+
+class ZReportCloser:
+    """Background thread that closes missed days in each worker."""
+
+    def __init__(self, db, shards=None):
+        self.db = db
+        self.shards = shards
+        self.enabled = False
+        self.interval = 900.0
+        self.lookback_days = 35
+        self.last_run = None
+        self.last_closed = []
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def init_app(self, app):
+        self.enabled = bool(app.config.get("Z_REPORT_AUTO_CLOSE", False))
+        self.interval = float(app.config.get("Z_REPORT_AUTO_CLOSE_INTERVAL", 900))
+        self.lookback_days = int(app.config.get("Z_REPORT_LOOKBACK_DAYS", 35))
+        if self.enabled:
+            # Started from the first request so the thread lives in the worker
+            # process, not in a --preload master that forks it away
+            app.before_request(lambda: self.start(app))
+
+    def start(self, app):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        thread = threading.Thread(
+            target=self._run, args=(app,), name="z-report-closer", daemon=True
+        )
+        thread.start()
+
+    def run_once(self, app, now=None):
+        closed = []
+        with app.app_context():
+            engines = self.shards.engines() if self.shards else [self.db.engine]
+            for engine in engines:
+                closed.extend(close_missed_days(engine, self.lookback_days, now))
+        self.last_run = datetime.now()
+        self.last_closed = [(store_id, d.isoformat()) for store_id, d in closed]
+        return closed
+
+    def _run(self, app):
+        while True:
+            try:
+                self.run_once(app)
+            except Exception as e:
+                app.logger.warning("Z report auto-close failed: %s", e)
+            time.sleep(self.interval)
+